@@ -5,6 +5,7 @@ from sqlalchemy import text
 
 from core.config import engine
 from core.db import db_ready
+from core.uow import db_conn
 from core.schemas import UIStatuses, UIStatusesPatch
 
 
@@ -64,7 +65,7 @@ def find_apartment_by_chat(chat_id: str) -> int | None:
         return int(row[0]) if row else None
 
 
-def find_apartment_by_contact(telegram_username: str | None, phone: str | None) -> int | None:
+def find_apartment_by_contact(telegram_username: str | None, phone: str | None, *, conn=None) -> int | None:
     """
     Поиск квартиры по контактам (telegram username / phone).
     """
@@ -82,7 +83,7 @@ def find_apartment_by_contact(telegram_username: str | None, phone: str | None)
     if not candidates:
         return None
 
-    with engine.begin() as conn:
+    with db_conn(conn) as conn:
         for kind, value in candidates:
             row = conn.execute(
                 text("""
@@ -99,10 +100,10 @@ def find_apartment_by_contact(telegram_username: str | None, phone: str | None)
     return None
 
 
-def bind_chat(chat_id: str, apartment_id: int) -> None:
+def bind_chat(chat_id: str, apartment_id: int, *, conn=None) -> None:
     if not db_ready():
         return
-    with engine.begin() as conn:
+    with db_conn(conn) as conn:
         conn.execute(
             text("""
                 INSERT INTO chat_bindings(chat_id, apartment_id, is_active, updated_at, created_at)
@@ -137,7 +138,7 @@ def _get_active_contact(apartment_id: int, kind: str) -> Optional[str]:
         return row[0] if row else None
 
 
-def _set_contact(apartment_id: int, kind: str, value: Optional[str]) -> None:
+def _set_contact(apartment_id: int, kind: str, value: Optional[str], *, conn=None) -> None:
     if not db_ready():
         return
 
@@ -147,7 +148,7 @@ def _set_contact(apartment_id: int, kind: str, value: Optional[str]) -> None:
     elif kind == "phone":
         v = norm_phone(v)
 
-    with engine.begin() as conn:
+    with db_conn(conn) as conn:
         # 1) если значение пустое — выключаем активный контакт этого типа у квартиры
         if not v:
             conn.execute(
@@ -204,10 +205,10 @@ def _set_contact(apartment_id: int, kind: str, value: Optional[str]) -> None:
         )
 
 
-def _get_month_statuses(apartment_id: int, ym: str) -> UIStatuses:
+def _get_month_statuses(apartment_id: int, ym: str, *, conn=None) -> UIStatuses:
     if not db_ready():
         return UIStatuses()
-    with engine.begin() as conn:
+    with db_conn(conn) as conn:
         row = conn.execute(
             text("""
                 SELECT rent_paid, meters_photo, meters_paid
@@ -222,16 +223,16 @@ def _get_month_statuses(apartment_id: int, ym: str) -> UIStatuses:
         return UIStatuses(rent_paid=bool(row[0]), meters_photo=bool(row[1]), meters_paid=bool(row[2]))
 
 
-def _upsert_month_statuses(apartment_id: int, ym: str, patch: UIStatusesPatch) -> UIStatuses:
+def _upsert_month_statuses(apartment_id: int, ym: str, patch: UIStatusesPatch, *, conn=None) -> UIStatuses:
     if not db_ready():
         return UIStatuses()
 
-    current = _get_month_statuses(apartment_id, ym)
+    current = _get_month_statuses(apartment_id, ym, conn=conn)
     new_rent = current.rent_paid if patch.rent_paid is None else bool(patch.rent_paid)
     new_photo = current.meters_photo if patch.meters_photo is None else bool(patch.meters_photo)
     new_paid = current.meters_paid if patch.meters_paid is None else bool(patch.meters_paid)
 
-    with engine.begin() as conn:
+    with db_conn(conn) as conn:
         conn.execute(
             text("""
                 INSERT INTO apartment_month_statuses (apartment_id, ym, rent_paid, meters_photo, meters_paid)
@@ -254,7 +255,7 @@ def _upsert_month_statuses(apartment_id: int, ym: str, patch: UIStatusesPatch) -
     return UIStatuses(rent_paid=new_rent, meters_photo=new_photo, meters_paid=new_paid)
 
 
-def update_apartment_statuses(apartment_id: int, data: dict) -> List[str]:
+def update_apartment_statuses(apartment_id: int, data: dict, *, conn=None) -> List[str]:
     """Low-level update for apartment_statuses table."""
     if not db_ready():
         return []
@@ -269,7 +270,7 @@ def update_apartment_statuses(apartment_id: int, data: dict) -> List[str]:
     set_clause = ", ".join([f"{k} = :{k}" for k in data.keys()]) + ", updated_at = now()"
     params = {"aid": apartment_id, **data}
 
-    with engine.begin() as conn:
+    with db_conn(conn) as conn:
         conn.execute(text("""
             INSERT INTO apartment_statuses(apartment_id)
             VALUES (:aid)
@@ -0,0 +1,126 @@
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from core.billing import _missing_photos, is_ym
+from core.schemas import UIApartmentItem, UIContacts, UIStatuses
+
+# Bulk loader for the admin apartment list: a fixed number of set-based queries per page
+# (apartments, contacts, month statuses, chat bindings, current-month readings) instead of
+# ~5 transactions per apartment. Completeness is derived in memory with the billing rules.
+
+
+def _electric_expected(v) -> int:
+    n = int(v) if v is not None else 3
+    return max(1, min(3, n))
+
+
+def fetch_apartment_list_data(conn, ym: str) -> Dict[str, Any]:
+    apartments = conn.execute(
+        text("""
+            SELECT id, title, address, tenant_name, note, ls_account, electric_expected, cold_serial, hot_serial, tenant_since, rent_monthly,
+                   utilities_mode, utilities_fixed_monthly, utilities_advance_amount, utilities_advance_cycle_months,
+                   utilities_advance_anchor_ym, utilities_show_actual_to_tenant
+            FROM apartments
+            ORDER BY id DESC
+        """)
+    ).fetchall()
+    contacts = conn.execute(
+        text("""
+            SELECT DISTINCT ON (apartment_id, kind) apartment_id, kind, value
+            FROM apartment_contacts
+            WHERE is_active=true AND kind IN ('phone', 'telegram')
+            ORDER BY apartment_id, kind, created_at DESC
+        """)
+    ).fetchall()
+    statuses = conn.execute(
+        text("""
+            SELECT apartment_id, rent_paid, meters_photo, meters_paid
+            FROM apartment_month_statuses
+            WHERE ym=:ym
+        """),
+        {"ym": str(ym)},
+    ).fetchall()
+    chats = conn.execute(
+        text("SELECT DISTINCT apartment_id FROM chat_bindings WHERE is_active=true AND apartment_id IS NOT NULL")
+    ).fetchall()
+    readings = conn.execute(
+        text("""
+            SELECT apartment_id, meter_type, meter_index, value, source
+            FROM meter_readings
+            WHERE ym=:ym AND source IN ('ocr','manual')
+        """),
+        {"ym": str(ym)},
+    ).fetchall()
+    return {
+        "apartments": apartments,
+        "contacts": contacts,
+        "statuses": statuses,
+        "chats": chats,
+        "readings": readings,
+    }
+
+
+def build_apartment_list_items(data: Dict[str, Any], ym: str) -> List[Dict[str, Any]]:
+    contacts: Dict[int, Dict[str, Optional[str]]] = {}
+    for aid, kind, value in data.get("contacts") or []:
+        contacts.setdefault(int(aid), {})[str(kind)] = value
+
+    statuses: Dict[int, tuple] = {}
+    for aid, rent_paid, meters_photo, meters_paid in data.get("statuses") or []:
+        statuses[int(aid)] = (bool(rent_paid), bool(meters_photo), bool(meters_paid))
+
+    active_chats = {int(r[0]) for r in (data.get("chats") or [])}
+
+    cur_maps: Dict[int, Dict[str, Dict[int, Optional[float]]]] = {}
+    cur_srcs: Dict[int, Dict[str, Dict[int, Optional[str]]]] = {}
+    for aid, mt, mi, value, source in data.get("readings") or []:
+        cur_maps.setdefault(int(aid), {}).setdefault(str(mt), {})[int(mi or 0)] = value
+        cur_srcs.setdefault(int(aid), {}).setdefault(str(mt), {})[int(mi or 0)] = source or None
+
+    valid_ym = is_ym(ym)
+    items: List[Dict[str, Any]] = []
+    for r in data.get("apartments") or []:
+        aid = int(r[0])
+        electric_expected = _electric_expected(r[6])
+        all_photos_received = valid_ym and not _missing_photos(
+            cur_maps.get(aid, {}),
+            cur_srcs.get(aid, {}),
+            electric_expected,
+        )
+        rent_paid, meters_photo, meters_paid = statuses.get(aid, (False, False, False))
+        c = contacts.get(aid, {})
+        items.append(
+            UIApartmentItem(
+                id=aid,
+                title=r[1],
+                address=r[2],
+                tenant_name=r[3],
+                note=r[4],
+                ls_account=r[5],
+                electric_expected=int(r[6]) if r[6] is not None else 3,
+                cold_serial=r[7],
+                hot_serial=r[8],
+                tenant_since=str(r[9]) if len(r) > 9 and r[9] is not None else None,
+                rent_monthly=float(r[10]) if len(r) > 10 and r[10] is not None else 0.0,
+                utilities_mode=str(r[11] or "by_actual_monthly"),
+                utilities_fixed_monthly=float(r[12]) if len(r) > 12 and r[12] is not None else None,
+                utilities_advance_amount=float(r[13]) if len(r) > 13 and r[13] is not None else None,
+                utilities_advance_cycle_months=int(r[14]) if len(r) > 14 and r[14] is not None else 3,
+                utilities_advance_anchor_ym=str(r[15]) if len(r) > 15 and r[15] is not None else None,
+                utilities_show_actual_to_tenant=bool(r[16]) if len(r) > 16 and r[16] is not None else False,
+                has_active_chat=aid in active_chats,
+                contacts=UIContacts(phone=c.get("phone"), telegram=c.get("telegram")),
+                statuses=UIStatuses(
+                    rent_paid=rent_paid,
+                    meters_photo=meters_photo,
+                    meters_paid=meters_paid,
+                    all_photos_received=bool(all_photos_received),
+                ),
+            ).model_dump()
+        )
+    return items
+
+
+def load_apartment_list(conn, ym: str) -> List[Dict[str, Any]]:
+    return build_apartment_list_items(fetch_apartment_list_data(conn, ym), ym)
@@ -2,11 +2,12 @@ import json
 import re
 from datetime import datetime, date
 from decimal import Decimal
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterable, List, Tuple
 
 from sqlalchemy import text
 
 from core.config import BILL_DIFF_THRESHOLD_RUB
+from core.tariff_timeline import tariff_timeline
 
 # -------------------------
 # YM helpers (YYYY-MM)
@@ -59,39 +60,11 @@ def safe_delta(current: Optional[float], previous: Optional[float]) -> Optional[
 
 
 def _get_tariff_for_month(conn, ym: str) -> Optional[Dict[str, float]]:
-    row = conn.execute(
-        text("""
-            SELECT
-                month_from,
-                cold, hot, sewer,
-                electric,
-                COALESCE(electric_t1, electric) AS electric_t1,
-                COALESCE(electric_t2, electric) AS electric_t2,
-                COALESCE(electric_t3, electric) AS electric_t3
-            FROM tariffs
-            WHERE month_from <= :ym
-            ORDER BY month_from DESC
-            LIMIT 1
-        """),
-        {"ym": ym},
-    ).mappings().fetchone()
-    if not row:
-        return None
-    return {
-        "month_from": str(row["month_from"]),
-        "cold": float(row["cold"]),
-        "hot": float(row["hot"]),
-        "sewer": float(row["sewer"]),
-        "electric": float(row["electric"]),
-        "electric_t1": float(row["electric_t1"]) if row["electric_t1"] is not None else None,
-        "electric_t2": float(row["electric_t2"]) if row["electric_t2"] is not None else None,
-        "electric_t3": float(row["electric_t3"]) if row["electric_t3"] is not None else None,
-    }
+    t = tariff_timeline(conn, verify=True).global_at(ym)
+    return dict(t) if t else None
 
 
-def effective_tariff_for_month(conn, ym: str) -> dict:
-    """Return tariff dict for month. Falls back to the most recent earlier tariff, or defaults."""
-    t = _get_tariff_for_month(conn, ym)
+def _effective_tariff(t: Optional[Dict[str, Any]]) -> dict:
     if not isinstance(t, dict):
         t = {}
 
@@ -110,6 +83,11 @@ def effective_tariff_for_month(conn, ym: str) -> dict:
     }
 
 
+def effective_tariff_for_month(conn, ym: str) -> dict:
+    """Return tariff dict for month. Falls back to the most recent earlier tariff, or defaults."""
+    return _effective_tariff(_get_tariff_for_month(conn, ym))
+
+
 def find_apartment_for_chat(conn, chat_id: str) -> Optional[dict]:
     """Return apartment row (dict) bound to chat_id, or None."""
     try:
@@ -228,6 +206,11 @@ def _get_month_bill_state(conn, apartment_id: int, ym: str) -> Dict[str, Any]:
         ),
         {"aid": int(apartment_id), "ym": str(ym)},
     ).fetchone()
+    return _bill_state_from_row(row)
+
+
+def _bill_state_from_row(row) -> Dict[str, Any]:
+    """row: (bill_pending, bill_last_json, bill_approved_at, bill_sent_at, bill_sent_total) or None."""
     if not row:
         return {"pending": None, "last": None, "approved_at": None, "sent_at": None, "sent_total": None}
     return {
@@ -310,56 +293,22 @@ def _set_month_bill_state(
     conn.execute(text(sql), params)
 
 
-def _calc_month_bill(conn, apartment_id: int, ym: str, *, allow_missing_t3_photo: bool = False) -> Dict[str, Any]:
+def _missing_photos(
+    cur_map: Dict[str, Dict[int, Optional[float]]],
+    cur_src: Dict[str, Dict[int, Optional[str]]],
+    electric_expected: int,
+    *,
+    allow_missing_t3_photo: bool = False,
+) -> List[str]:
     """
-    Возвращает:
-      - is_complete_photos: есть ли все текущие показания, нужные для расчета (cold/hot + electric 1..N)
-      - total_rub: сумма ₽, если можно посчитать (есть прошлый месяц + тарифы) и нет блокировок
-      - missing: что ещё нужно для расчёта
-      - reason: 'ok' | 'missing_photos' | 'no_prev_month' | 'pending_admin'
-      - electric_expected: N (1..3)
-      - extra_pending: есть ли “лишние” электрические показания, требующие решения админа
+    Completeness rules for current-month readings (cur_map/cur_src: meter_type -> meter_index -> value/source).
+    For electricity:
+      - if electric_expected == 1 -> require only T1
+      - if electric_expected == 2 -> require T1 and T2
+      - if electric_expected >= 3 -> require T1/T2/T3
+      - for required T3 we only accept OCR/photo value
+      - exception: allow_missing_t3_photo=True (manual admin override path)
     """
-    ym = (ym or "").strip()
-    if not is_ym(ym):
-        return {
-            "is_complete_photos": False,
-            "total_rub": None,
-            "missing": ["invalid_ym"],
-            "reason": "missing_photos",
-            "electric_expected": 3,
-            "extra_pending": False,
-        }
-
-    electric_expected = _get_apartment_electric_expected(conn, apartment_id)
-    extra_state = _get_month_extra_state(conn, apartment_id, ym)
-    extra_pending = bool(extra_state.get("pending"))
-
-    # текущие показания (ВАЖНО: вода хранится с meter_index=1)
-    cur = conn.execute(
-        text(
-            "SELECT meter_type, meter_index, value, source "
-            "FROM meter_readings "
-            "WHERE apartment_id=:aid AND ym=:ym AND source IN ('ocr','manual')"
-        ),
-        {"aid": apartment_id, "ym": ym},
-    ).mappings().all()
-
-    cur_map: Dict[str, Dict[int, Optional[float]]] = {"cold": {}, "hot": {}, "electric": {}}
-    cur_src: Dict[str, Dict[int, Optional[str]]] = {"cold": {}, "hot": {}, "electric": {}}
-    for r in cur:
-        mt = r["meter_type"]
-        mi = int(r["meter_index"] or 0)
-        cur_map.setdefault(mt, {})[mi] = r["value"]
-        cur_src.setdefault(mt, {})[mi] = (r.get("source") or None)
-
-    # --- completeness rules ---
-    # For electricity:
-    #   - if electric_expected == 1 -> require only T1
-    #   - if electric_expected == 2 -> require T1 and T2
-    #   - if electric_expected >= 3 -> require T1/T2/T3
-    #   - for required T3 we only accept OCR/photo value
-    #   - exception: allow_missing_t3_photo=True (manual admin override path)
     missing: List[str] = []
     if cur_map.get("cold", {}).get(1) is None:
         missing.append("cold")
@@ -377,6 +326,109 @@ def _calc_month_bill(conn, apartment_id: int, ym: str, *, allow_missing_t3_photo
             if (src != "ocr") and (not allow_missing_t3_photo):
                 # T3 is present, but not from photo yet.
                 missing.append("electric_3")
+    return missing
+
+
+# -------------------------
+# Bill engine
+# -------------------------
+# Bills are computed from preloaded inputs: one query per table for the whole apartments x months set
+# (readings for ym, ym-1, ym-2; month statuses; electric_expected) plus the cached tariff timeline,
+# instead of ~18 statements per (apartment, month). _calc_month_bill is the single-cell case of calc_bills.
+
+_BILL_SOURCES = ("ocr", "manual")
+
+
+def _invalid_ym_bill() -> Dict[str, Any]:
+    return {
+        "is_complete_photos": False,
+        "total_rub": None,
+        "missing": ["invalid_ym"],
+        "reason": "missing_photos",
+        "electric_expected": 3,
+        "extra_pending": False,
+    }
+
+
+def _load_bill_inputs(conn, apartment_ids: List[int], yms: List[str]) -> Dict[str, Any]:
+    months = sorted({m for ym in yms for m in (ym, add_months(ym, -1), add_months(ym, -2))})
+    params = {"ids": list(apartment_ids), "yms": months}
+
+    expected: Dict[int, int] = {}
+    for aid, n in conn.execute(
+        text("SELECT id, COALESCE(electric_expected, 3) FROM apartments WHERE id = ANY(:ids)"),
+        params,
+    ).fetchall():
+        expected[int(aid)] = max(1, min(3, int(n) if n is not None else 3))
+
+    statuses: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    for r in conn.execute(
+        text(
+            "SELECT apartment_id, ym, electric_extra_pending, "
+            "bill_pending, bill_last_json, bill_approved_at, bill_sent_at, bill_sent_total "
+            "FROM apartment_month_statuses "
+            "WHERE apartment_id = ANY(:ids) AND ym = ANY(:yms)"
+        ),
+        params,
+    ).fetchall():
+        statuses[(int(r[0]), str(r[1]))] = {
+            "extra_pending": bool(r[2] or False),
+            "bill": _bill_state_from_row(tuple(r[3:8])),
+        }
+
+    # (apartment_id, ym) -> meter_type -> meter_index -> (value, source)
+    readings: Dict[Tuple[int, str], Dict[str, Dict[int, Tuple[Any, Optional[str]]]]] = {}
+    for aid, ym, mt, mi, value, source in conn.execute(
+        text(
+            "SELECT apartment_id, ym, meter_type, meter_index, value, source "
+            "FROM meter_readings "
+            "WHERE apartment_id = ANY(:ids) AND ym = ANY(:yms)"
+        ),
+        params,
+    ).fetchall():
+        readings.setdefault((int(aid), str(ym)), {}).setdefault(str(mt), {})[int(mi or 0)] = (value, source or None)
+
+    return {
+        "electric_expected": expected,
+        "statuses": statuses,
+        "readings": readings,
+        "tariffs": tariff_timeline(conn, verify=True),
+    }
+
+
+def _compute_month_bill(
+    inputs: Dict[str, Any],
+    apartment_id: int,
+    ym: str,
+    *,
+    allow_missing_t3_photo: bool = False,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Pure bill calculation over _load_bill_inputs() data.
+    Returns (bill, state_update); state_update holds _set_month_bill_state kwargs, or None when nothing is stored.
+    """
+    electric_expected = inputs["electric_expected"].get(apartment_id, 3)
+    status = inputs["statuses"].get((apartment_id, ym)) or {}
+    extra_pending = bool(status.get("extra_pending"))
+    month_readings = inputs["readings"]
+
+    def _month_map(ym_: str) -> Dict[str, Dict[int, Optional[float]]]:
+        out: Dict[str, Dict[int, Optional[float]]] = {"cold": {}, "hot": {}, "electric": {}}
+        for mt, by_index in (month_readings.get((apartment_id, ym_)) or {}).items():
+            for mi, (value, source) in by_index.items():
+                if source in _BILL_SOURCES:
+                    out.setdefault(mt, {})[mi] = value
+        return out
+
+    # текущие показания (ВАЖНО: вода хранится с meter_index=1)
+    cur_map = _month_map(ym)
+    cur_src: Dict[str, Dict[int, Optional[str]]] = {"cold": {}, "hot": {}, "electric": {}}
+    for mt, by_index in (month_readings.get((apartment_id, ym)) or {}).items():
+        for mi, (_value, source) in by_index.items():
+            if source in _BILL_SOURCES:
+                cur_src.setdefault(mt, {})[mi] = source
+
+    missing = _missing_photos(cur_map, cur_src, electric_expected, allow_missing_t3_photo=allow_missing_t3_photo)
 
     is_complete_photos = len(missing) == 0
     if not is_complete_photos:
@@ -387,7 +439,7 @@ def _calc_month_bill(conn, apartment_id: int, ym: str, *, allow_missing_t3_photo
             "reason": "missing_photos",
             "electric_expected": electric_expected,
             "extra_pending": extra_pending,
-        }
+        }, None
 
     # --- T3 derive + mismatch check (does not affect rub) ---
     e1_cur_for_t3 = cur_map.get("electric", {}).get(1)
@@ -422,30 +474,12 @@ def _calc_month_bill(conn, apartment_id: int, ym: str, *, allow_missing_t3_photo
                     "message": "Обнаружены одинаковые показания (возможно отправили одно и то же фото). Нужна проверка.",
                 }
             ],
-        }
+        }, None
 
     prev_ym = add_months(ym, -1)
-    prev = conn.execute(
-        text(
-            "SELECT meter_type, meter_index, value "
-            "FROM meter_readings "
-            "WHERE apartment_id=:aid AND ym=:pym AND source IN ('ocr','manual')"
-        ),
-        {"aid": apartment_id, "pym": prev_ym},
-    ).mappings().all()
-
-    prev_map: Dict[str, Dict[int, Optional[float]]] = {"cold": {}, "hot": {}, "electric": {}}
-    for r in prev:
-        mt = r["meter_type"]
-        mi = int(r["meter_index"] or 0)
-        prev_map.setdefault(mt, {})[mi] = r["value"]
-    prev_map: Dict[str, Dict[int, Optional[float]]] = {"cold": {}, "hot": {}, "electric": {}}
-    for r in prev:
-        mt = r["meter_type"]
-        mi = int(r["meter_index"] or 0)
-        prev_map.setdefault(mt, {})[mi] = r["value"]
-
-    tariff = effective_tariff_for_month(conn, ym)
+    prev_map = _month_map(prev_ym)
+
+    tariff = _effective_tariff(inputs["tariffs"].global_at(ym))
 
     dc = safe_delta(cur_map["cold"].get(1), prev_map["cold"].get(1))
     dh = safe_delta(cur_map["hot"].get(1), prev_map["hot"].get(1))
@@ -498,7 +532,7 @@ def _calc_month_bill(conn, apartment_id: int, ym: str, *, allow_missing_t3_photo
             "reason": "no_prev_month",
             "electric_expected": electric_expected,
             "extra_pending": False,
-        }
+        }, None
 
     total = rc + rh + rs + re_sum
 
@@ -522,14 +556,8 @@ def _calc_month_bill(conn, apartment_id: int, ym: str, *, allow_missing_t3_photo
         prevprev_ym_bill = add_months(ym, -2)
 
         def _v(ym_: str, mt: str, idx: int = 1) -> Optional[float]:
-            r = conn.execute(
-                text(
-                    "SELECT value FROM meter_readings "
-                    "WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=:mi "
-                    "LIMIT 1"
-                ),
-                {"aid": apartment_id, "ym": str(ym_), "mt": str(mt), "mi": int(idx)},
-            ).fetchone()
+            # any source here (unlike cur_map/prev_map)
+            r = ((month_readings.get((apartment_id, str(ym_))) or {}).get(str(mt)) or {}).get(int(idx))
             return float(r[0]) if r and r[0] is not None else None
 
         # prev and prevprev month readings (для расчёта предыдущей суммы)
@@ -595,26 +623,23 @@ def _calc_month_bill(conn, apartment_id: int, ym: str, *, allow_missing_t3_photo
         prev_components = None
 
     # --- admin approval gate (per-article diffs) ---
-    bill_state = _get_month_bill_state(conn, int(apartment_id), str(ym))
-    last = bill_state.get("last") if isinstance(bill_state, dict) else None
-    approved_at = bill_state.get("approved_at") if isinstance(bill_state, dict) else None
-    sent_at = bill_state.get("sent_at") if isinstance(bill_state, dict) else None
+    bill_state = status.get("bill") or _bill_state_from_row(None)
+    last = bill_state.get("last")
+    approved_at = bill_state.get("approved_at")
+    sent_at = bill_state.get("sent_at")
+
+    components = {
+        "cold_rub": float(rc),
+        "hot_rub": float(rh),
+        "sewer_rub": float(rs),
+        "electric_rub": float(re_sum),
+        "total_rub": float(total),
+    }
 
     reset_approval = False
     if pending_items and approved_at:
-        try:
-            last_components = (last or {}).get("components") if isinstance(last, dict) else None
-            cur_components = {
-                "cold_rub": float(rc),
-                "hot_rub": float(rh),
-                "sewer_rub": float(rs),
-                "electric_rub": float(re_sum),
-                "total_rub": float(total),
-            }
-            if last_components != cur_components:
-                reset_approval = True
-                approved_at = None
-        except Exception:
+        last_components = (last or {}).get("components") if isinstance(last, dict) else None
+        if last_components != components:
             reset_approval = True
             approved_at = None
 
@@ -624,27 +649,18 @@ def _calc_month_bill(conn, apartment_id: int, ym: str, *, allow_missing_t3_photo
 
     snap = {
         "ym": str(ym),
-        "components": {
-            "cold_rub": float(rc),
-            "hot_rub": float(rh),
-            "sewer_rub": float(rs),
-            "electric_rub": float(re_sum),
-            "total_rub": float(total),
-        },
+        "components": dict(components),
         "prev_components": prev_components,
         "pending_items": pending_items,
-            "pending_flags": pending_flags,
-            "t3": {"expected": t3_expected, "raw": e3_raw_for_t3, "mismatch": bool(t3_mismatch)},
+        "pending_flags": pending_flags,
+        "t3": {"expected": t3_expected, "raw": e3_raw_for_t3, "mismatch": bool(t3_mismatch)},
         "threshold_rub": float(BILL_DIFF_THRESHOLD_RUB),
     }
-    _set_month_bill_state(
-        conn,
-        int(apartment_id),
-        str(ym),
-        pending=(pending_items if reason_override == "pending_admin" else {}),
-        last_json=snap,
-        reset_approval=bool(reset_approval),
-    )
+    state_update = {
+        "pending": (pending_items if reason_override == "pending_admin" else {}),
+        "last_json": snap,
+        "reset_approval": bool(reset_approval),
+    }
 
     return {
         "is_complete_photos": True,
@@ -658,4 +674,75 @@ def _calc_month_bill(conn, apartment_id: int, ym: str, *, allow_missing_t3_photo
         "prev_components": prev_components,
         "approved_at": approved_at,
         "sent_at": sent_at,
-    }
+    }, state_update
+
+
+def _stored_json(v) -> Optional[Any]:
+    # what _set_month_bill_state stores (empty -> NULL), as it reads back from JSONB
+    return json.loads(json.dumps(_json_sanitize(v), ensure_ascii=False)) if v else None
+
+
+def _bill_state_unchanged(status: Optional[Dict[str, Any]], update: Dict[str, Any]) -> bool:
+    if not status or update.get("reset_approval"):
+        return False
+    stored = status.get("bill") or {}
+    return (
+        stored.get("pending") == _stored_json(update.get("pending"))
+        and stored.get("last") == _stored_json(update.get("last_json"))
+    )
+
+
+def calc_bills(
+    conn,
+    apartment_ids: Iterable[int],
+    yms: Iterable[str],
+    *,
+    allow_missing_t3_photo: bool = False,
+) -> Dict[Tuple[int, str], Dict[str, Any]]:
+    """
+    Bills for every (apartment_id, ym) pair of apartment_ids x yms, same schema as _calc_month_bill.
+    Inputs are loaded with a fixed number of queries; bill snapshots are written only when they changed.
+    """
+    ids = list(dict.fromkeys(int(a) for a in apartment_ids))
+    months = list(dict.fromkeys((ym or "").strip() for ym in yms))
+    valid = [m for m in months if is_ym(m)]
+
+    out: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    inputs = _load_bill_inputs(conn, ids, valid) if (ids and valid) else None
+    for aid in ids:
+        for ym in months:
+            if inputs is None or not is_ym(ym):
+                out[(aid, ym)] = _invalid_ym_bill()
+                continue
+            bill, update = _compute_month_bill(inputs, aid, ym, allow_missing_t3_photo=allow_missing_t3_photo)
+            if update is not None and not _bill_state_unchanged(inputs["statuses"].get((aid, ym)), update):
+                _set_month_bill_state(conn, aid, ym, **update)
+            out[(aid, ym)] = bill
+    return out
+
+
+def month_range(ym_from: str, ym_to: str) -> List[str]:
+    """Inclusive list of YYYY-MM months; empty when the range is invalid or reversed."""
+    if not (is_ym(ym_from) and is_ym(ym_to)) or ym_from > ym_to:
+        return []
+    out = [ym_from]
+    while out[-1] < ym_to:
+        out.append(add_months(out[-1], 1))
+    return out
+
+
+def _calc_month_bill(conn, apartment_id: int, ym: str, *, allow_missing_t3_photo: bool = False) -> Dict[str, Any]:
+    """
+    Возвращает:
+      - is_complete_photos: есть ли все текущие показания, нужные для расчета (cold/hot + electric 1..N)
+      - total_rub: сумма ₽, если можно посчитать (есть прошлый месяц + тарифы) и нет блокировок
+      - missing: что ещё нужно для расчёта
+      - reason: 'ok' | 'missing_photos' | 'no_prev_month' | 'pending_admin'
+      - electric_expected: N (1..3)
+      - extra_pending: есть ли “лишние” электрические показания, требующие решения админа
+    """
+    ym = (ym or "").strip()
+    if not is_ym(ym):
+        return _invalid_ym_bill()
+    aid = int(apartment_id)
+    return calc_bills(conn, [aid], [ym], allow_missing_t3_photo=allow_missing_t3_photo)[(aid, ym)]
@@ -0,0 +1,391 @@
+import codecs
+import csv
+import io
+import json
+import math
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from core.billing import is_ym
+from core.ledger import rebuild_ledger
+
+# Bulk CSV/NDJSON import and export (onboarding a building, backfilling history from a management-company
+# export). Import bodies are parsed line by line as they arrive, validated as a whole, then applied in one
+# transaction: the per-reading slotting rules of core/meters.py are replayed in memory per (apartment, month)
+# and only the resulting changes are written, staged with COPY and merged with one upsert + one delete.
+# Exports stream from a server-side cursor in the same column layout, so a file round-trips.
+BULK_IMPORT_MAX_ROWS = max(1, int(os.getenv("BULK_IMPORT_MAX_ROWS", "200000")))
+BULK_IMPORT_MAX_ERRORS = 100
+BULK_EXPORT_BATCH = 2000
+
+READING_COLUMNS = ("apartment_id", "ym", "meter_type", "meter_index", "value", "source")
+_READING_TYPES = ("cold", "hot", "sewer", "electric")
+_READING_SOURCES = ("manual", "ocr")
+
+# (meter_type, meter_index) -> {"value", "source", "ocr_value"}
+MonthState = Dict[Tuple[str, int], Dict[str, Any]]
+# (line, apartment_id, ym, meter_type, meter_index, value, source)
+ReadingRow = Tuple[int, int, str, str, int, float, str]
+
+
+def bulk_format(fmt: Optional[str], content_type: Optional[str] = None) -> str:
+    f = str(fmt or "").strip().lower()
+    if not f:
+        ct = str(content_type or "").lower()
+        f = "ndjson" if ("ndjson" in ct or "jsonl" in ct or "json" in ct) else "csv"
+    if f in ("jsonl", "json"):
+        f = "ndjson"
+    if f not in ("csv", "ndjson"):
+        raise ValueError("format must be csv|ndjson")
+    return f
+
+
+class RecordReader:
+    """Incremental parser: feed() body chunks, get (line_no, record) pairs for every complete line.
+
+    CSV needs a header line; `,` and `;` delimiters are accepted. Quoted fields must not span lines.
+    """
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._tail = ""
+        self._line_no = 0
+        self._header: Optional[List[str]] = None
+        self._delimiter = ","
+
+    def feed(self, chunk: bytes) -> List[Tuple[int, Dict[str, Any]]]:
+        data = self._tail + self._decoder.decode(chunk)
+        lines = data.split("\n")
+        self._tail = lines.pop()
+        return [rec for rec in (self._line(line) for line in lines) if rec is not None]
+
+    def close(self) -> List[Tuple[int, Dict[str, Any]]]:
+        rest = self._tail + self._decoder.decode(b"", final=True)
+        self._tail = ""
+        rec = self._line(rest) if rest else None
+        return [rec] if rec is not None else []
+
+    def _line(self, line: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        self._line_no += 1
+        line = line.rstrip("\r")
+        if not line.strip():
+            return None
+        if self.fmt == "ndjson":
+            try:
+                obj = json.loads(line)
+            except Exception:
+                return self._line_no, {"__error__": "invalid json"}
+            if not isinstance(obj, dict):
+                return self._line_no, {"__error__": "json object expected"}
+            return self._line_no, obj
+        if self._header is None:
+            if ";" in line and "," not in line:
+                self._delimiter = ";"
+            self._header = [h.strip().lower() for h in next(csv.reader([line], delimiter=self._delimiter))]
+            return None
+        values = next(csv.reader([line], delimiter=self._delimiter))
+        return self._line_no, dict(zip(self._header, (v.strip() for v in values)))
+
+
+def _blank(v: Any) -> bool:
+    return v is None or (isinstance(v, str) and not v.strip())
+
+
+def parse_number(v: Any, field: str, *, required: bool = True) -> Optional[float]:
+    if _blank(v):
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    try:
+        f = float(str(v).strip().replace(",", ".")) if isinstance(v, str) else float(v)
+    except Exception:
+        raise ValueError(f"{field} must be a number")
+    if not math.isfinite(f) or f < 0:
+        raise ValueError(f"{field} must be a non-negative number")
+    return f
+
+
+def parse_reading(rec: Dict[str, Any]) -> Tuple[int, str, str, int, float, str]:
+    if rec.get("__error__"):
+        raise ValueError(str(rec["__error__"]))
+    try:
+        aid = int(str(rec.get("apartment_id")).strip())
+    except Exception:
+        raise ValueError("apartment_id must be an integer")
+    ym = str(rec.get("ym") or "").strip()
+    if not is_ym(ym):
+        raise ValueError("ym must be YYYY-MM")
+    mt = str(rec.get("meter_type") or "").strip().lower()
+    if mt not in _READING_TYPES:
+        raise ValueError("meter_type must be cold|hot|sewer|electric")
+    mi = 1
+    if mt == "electric":
+        try:
+            mi = int(str(rec.get("meter_index") if not _blank(rec.get("meter_index")) else 1).strip())
+        except Exception:
+            raise ValueError("meter_index must be 1/2/3")
+        if mi not in (1, 2, 3):
+            raise ValueError("electric meter_index must be 1/2/3")
+    value = parse_number(rec.get("value"), "value")
+    source = str(rec.get("source") or "manual").strip().lower()
+    if source not in _READING_SOURCES:
+        raise ValueError("source must be manual|ocr")
+    return aid, ym, mt, mi, float(value), source
+
+
+def validate_records(
+    records: Iterable[Tuple[int, Dict[str, Any]]],
+    parse: Callable[[Dict[str, Any]], tuple],
+) -> Tuple[List[tuple], List[Dict[str, Any]], int]:
+    """Returns (rows with line number first, first errors, total error count)."""
+    rows: List[tuple] = []
+    errors: List[Dict[str, Any]] = []
+    n_errors = 0
+    for line_no, rec in records:
+        try:
+            rows.append((line_no,) + tuple(parse(rec)))
+        except ValueError as e:
+            n_errors += 1
+            if len(errors) < BULK_IMPORT_MAX_ERRORS:
+                errors.append({"line": int(line_no), "error": str(e)})
+    return rows, errors, n_errors
+
+
+# ---- slotting rules (in-memory replay of core/meters.py writers) ----
+
+def _slot(value: float, source: str, ocr_value: Optional[float]) -> Dict[str, Any]:
+    return {"value": float(value), "source": str(source), "ocr_value": ocr_value}
+
+
+def _normalize_water(state: MonthState) -> None:
+    """_normalize_water_after_manual: min -> hot, max -> cold."""
+    items = [state[k] for k in (("cold", 1), ("hot", 1)) if k in state]
+    if len(items) < 2:
+        return
+    s = sorted(items, key=lambda x: x["value"])
+    state[("hot", 1)], state[("cold", 1)] = s[0], s[-1]
+
+
+def _normalize_electric(state: MonthState, expected: int) -> None:
+    """_normalize_electric_expected3 / _normalize_electric_expected2."""
+    items = [state.pop(("electric", i)) for i in (1, 2, 3) if ("electric", i) in state]
+    if not items:
+        return
+    s = sorted(items, key=lambda x: x["value"])
+    if len(s) == 1:
+        state[("electric", 1)] = s[0]
+    elif expected == 3 and len(s) == 3:
+        state[("electric", 2)], state[("electric", 1)], state[("electric", 3)] = s
+    else:
+        state[("electric", 2)], state[("electric", 1)] = s[0], s[-1]
+
+
+def _auto_fill_t3(state: MonthState) -> None:
+    """_auto_fill_t3_from_t1_t2_if_needed: T3 = T1 + T2 unless T3 came from a photo."""
+    r1, r2, r3 = state.get(("electric", 1)), state.get(("electric", 2)), state.get(("electric", 3))
+    if not r1 or not r2:
+        return
+    if r3 and str(r3.get("source") or "").lower() == "ocr":
+        return
+    state[("electric", 3)] = _slot(r1["value"] + r2["value"], "manual", None)
+
+
+def apply_reading(state: MonthState, meter_type: str, meter_index: int, value: float, source: str, expected: int) -> None:
+    """One reading with the manual admin semantics (water/sewer upsert, electric overwrite-then-sort)."""
+    if meter_type == "electric":
+        state[("electric", int(meter_index))] = _slot(value, source, value)
+        if expected in (2, 3):
+            _normalize_electric(state, expected)
+        if expected == 3 and int(meter_index) in (1, 2):
+            _auto_fill_t3(state)
+        return
+    key = (meter_type, 1)
+    prev = state.get(key)
+    src = source
+    # don't downgrade OCR to manual when the value is unchanged
+    if prev and prev["source"] == "ocr" and src == "manual" and abs(prev["value"] - float(value)) <= 1e-9:
+        src = "ocr"
+    state[key] = _slot(value, src, prev["ocr_value"] if prev else None)
+    if meter_type in ("cold", "hot"):
+        _normalize_water(state)
+
+
+def _same_slot(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    def f(v):
+        return float(v) if v is not None else None
+
+    return (
+        abs(float(a["value"]) - float(b["value"])) <= 1e-9
+        and str(a["source"]) == str(b["source"])
+        and f(a["ocr_value"]) == f(b["ocr_value"])
+    )
+
+
+def diff_month(before: MonthState, after: MonthState) -> Tuple[List[Tuple[Tuple[str, int], Dict[str, Any]]], List[Tuple[str, int]]]:
+    upserts = [(k, v) for k, v in sorted(after.items()) if k not in before or not _same_slot(before[k], v)]
+    deletes = [k for k in sorted(before) if k not in after]
+    return upserts, deletes
+
+
+def plan_reading_import(
+    rows: Sequence[ReadingRow],
+    existing: Dict[Tuple[int, str], MonthState],
+    expected: Dict[int, int],
+) -> Dict[Tuple[int, str], Tuple[List, List]]:
+    """(apartment_id, ym) -> (upserts, deletes); rows are applied in file order."""
+    states: Dict[Tuple[int, str], MonthState] = {}
+    for _line, aid, ym, mt, mi, value, source in rows:
+        key = (int(aid), str(ym))
+        if key not in states:
+            states[key] = {k: dict(v) for k, v in (existing.get(key) or {}).items()}
+        apply_reading(states[key], mt, mi, value, source, int(expected.get(int(aid), 3)))
+    return {key: diff_month(existing.get(key) or {}, state) for key, state in states.items()}
+
+
+# ---- database side ----
+
+def _copy_rows(conn, table: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> None:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for r in rows:
+        w.writerow(["" if v is None else v for v in r])
+    buf.seek(0)
+    cur = conn.connection.cursor()
+    try:
+        cur.copy_expert(f"COPY {table}({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cur.close()
+
+
+def _load_month_states(conn, keys: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], MonthState]:
+    keys = set(keys)
+    rows = conn.execute(
+        text("""
+            SELECT apartment_id, ym, meter_type, meter_index, value, source, ocr_value
+            FROM meter_readings
+            WHERE apartment_id = ANY(:aids) AND ym = ANY(:yms) AND meter_type IN ('cold','hot','sewer','electric')
+        """),
+        {"aids": sorted({k[0] for k in keys}), "yms": sorted({k[1] for k in keys})},
+    ).fetchall()
+    out: Dict[Tuple[int, str], MonthState] = {}
+    for aid, ym, mt, mi, value, source, ocr_value in rows:
+        key = (int(aid), str(ym))
+        if key in keys and value is not None:
+            out.setdefault(key, {})[(str(mt), int(mi))] = _slot(
+                float(value), str(source or "manual"), float(ocr_value) if ocr_value is not None else None
+            )
+    return out
+
+
+def import_readings(conn, rows: Sequence[ReadingRow], *, dry_run: bool = False) -> Dict[str, Any]:
+    """Validate apartments, plan and write in the caller's transaction. Raises ValueError listing unknown ids."""
+    aids = sorted({int(r[1]) for r in rows})
+    found = conn.execute(
+        text("SELECT id, electric_expected FROM apartments WHERE id = ANY(:ids)"),
+        {"ids": aids},
+    ).fetchall()
+    expected = {int(i): max(1, min(3, int(e) if e is not None else 3)) for i, e in found}
+    unknown = [a for a in aids if a not in expected]
+    if unknown:
+        raise ValueError(f"unknown apartment_id: {', '.join(str(a) for a in unknown[:20])}")
+
+    existing = _load_month_states(conn, {(int(r[1]), str(r[2])) for r in rows})
+    plan = plan_reading_import(rows, existing, expected)
+    upserts = [(aid, ym, k[0], k[1], s["value"], s["source"], s["ocr_value"]) for (aid, ym), (ups, _) in plan.items() for k, s in ups]
+    deletes = [(aid, ym, k[0], k[1]) for (aid, ym), (_, dels) in plan.items() for k in dels]
+    summary = {
+        "rows": len(rows),
+        "apartments": len(aids),
+        "months": len(plan),
+        "upserted": len(upserts),
+        "deleted": len(deletes),
+        "dry_run": bool(dry_run),
+    }
+    if dry_run or not (upserts or deletes):
+        return summary
+
+    conn.execute(text("""
+        CREATE TEMP TABLE bulk_readings_stage (
+            op TEXT NOT NULL,
+            apartment_id BIGINT NOT NULL,
+            ym TEXT NOT NULL,
+            meter_type TEXT NOT NULL,
+            meter_index INTEGER NOT NULL,
+            value NUMERIC(12,3) NULL,
+            source TEXT NULL,
+            ocr_value NUMERIC(12,3) NULL
+        ) ON COMMIT DROP
+    """))
+    _copy_rows(
+        conn,
+        "bulk_readings_stage",
+        ("op", "apartment_id", "ym", "meter_type", "meter_index", "value", "source", "ocr_value"),
+        [("upsert",) + r for r in upserts] + [("delete",) + r + (None, None, None) for r in deletes],
+    )
+    conn.execute(text("""
+        DELETE FROM meter_readings m
+        USING bulk_readings_stage s
+        WHERE s.op='delete'
+          AND m.apartment_id=s.apartment_id AND m.ym=s.ym AND m.meter_type=s.meter_type AND m.meter_index=s.meter_index
+    """))
+    conn.execute(text("""
+        INSERT INTO meter_readings(apartment_id, ym, meter_type, meter_index, value, source, ocr_value)
+        SELECT apartment_id, ym, meter_type, meter_index, value, source, ocr_value
+        FROM bulk_readings_stage
+        WHERE op='upsert'
+        ON CONFLICT (apartment_id, ym, meter_type, meter_index) DO UPDATE SET
+            value=EXCLUDED.value,
+            source=EXCLUDED.source,
+            ocr_value=EXCLUDED.ocr_value,
+            updated_at=now()
+    """))
+    # a few months per apartment or years of history: one rebuild per apartment either way
+    for aid in sorted({k[0] for k in plan}):
+        rebuild_ledger(conn, aid)
+    return summary
+
+
+# ---- export ----
+
+def _fmt_number(v: Any) -> str:
+    if v is None:
+        return ""
+    f = float(v)
+    return str(int(f)) if f.is_integer() else repr(f)
+
+
+def _csv_line(values: Sequence[Any]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerow(values)
+    return buf.getvalue()
+
+
+def stream_rows(
+    engine,
+    sql: str,
+    params: Dict[str, Any],
+    columns: Sequence[str],
+    fmt: str,
+    numeric: Sequence[str] = (),
+) -> Iterator[str]:
+    """Yield CSV/NDJSON text in batches from a server-side cursor (nothing is buffered beyond one batch)."""
+    if fmt == "csv":
+        yield _csv_line(columns)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=BULK_EXPORT_BATCH).execute(text(sql), params)
+        for part in result.partitions():
+            out = []
+            for row in part:
+                values = []
+                for col, v in zip(columns, row):
+                    if col in numeric:
+                        v = float(v) if v is not None else None
+                    values.append(v)
+                if fmt == "csv":
+                    out.append(_csv_line([_fmt_number(v) if c in numeric else ("" if v is None else v) for c, v in zip(columns, values)]))
+                else:
+                    out.append(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + "\n")
+            yield "".join(out)
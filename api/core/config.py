@@ -21,4 +21,19 @@ YANDEX_STORAGE_ROOT = os.getenv("YANDEX_STORAGE_ROOT", "tenants")
 
 # DB
 DATABASE_URL = os.getenv("DATABASE_URL", "")
-engine = create_engine(DATABASE_URL) if DATABASE_URL else None
+# Pool size is the DB stage concurrency limit: photo-event executor threads, OCR job workers and
+# sync handlers all share it, and pool_timeout turns saturation into an error instead of a hang.
+DB_POOL_SIZE = max(1, min(64, int(os.getenv("DB_POOL_SIZE", "5"))))
+DB_MAX_OVERFLOW = max(0, min(64, int(os.getenv("DB_MAX_OVERFLOW", "10"))))
+DB_POOL_TIMEOUT_SEC = max(1.0, float(os.getenv("DB_POOL_TIMEOUT_SEC", "30")))
+engine = (
+    create_engine(
+        DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SEC,
+        pool_pre_ping=True,
+    )
+    if DATABASE_URL
+    else None
+)
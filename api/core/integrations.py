@@ -1,5 +1,8 @@
+import os
+import threading
 import requests
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 from xml.etree import ElementTree as ET
 
 from core.config import (
@@ -33,6 +36,17 @@ def _tg_send_message(chat_id: str, text_msg: str) -> bool:
         return False
 
 
+# One keep-alive pool for all WebDAV calls (MKCOL/PUT/GET/...), instead of a new TLS handshake per request.
+YDISK_HTTP_POOL_SIZE = max(1, min(32, int(os.getenv("YDISK_HTTP_POOL_SIZE", "8"))))
+_YDISK_SESSION = requests.Session()
+_YDISK_SESSION.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=YDISK_HTTP_POOL_SIZE))
+_YDISK_SESSION.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=YDISK_HTTP_POOL_SIZE))
+
+# Folders known to exist on the disk (created or confirmed by MKCOL in this process).
+_YDISK_DIRS_LOCK = threading.Lock()
+_YDISK_DIRS_KNOWN: set[str] = set()
+
+
 def ydisk_ready() -> bool:
     return bool(YANDEX_WEBDAV_USERNAME and YANDEX_WEBDAV_PASSWORD and YANDEX_WEBDAV_BASE_URL)
 
@@ -43,7 +57,7 @@ def ydisk_auth():
 
 def ydisk_mkcol(path: str) -> None:
     url = f"{YANDEX_WEBDAV_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
-    r = requests.request("MKCOL", url, auth=ydisk_auth(), timeout=30)
+    r = _YDISK_SESSION.request("MKCOL", url, auth=ydisk_auth(), timeout=30)
     # 201 created, 405 already exists
     if r.status_code not in (201, 405):
         raise RuntimeError(f"MKCOL failed {r.status_code}: {r.text}")
@@ -51,7 +65,7 @@ def ydisk_mkcol(path: str) -> None:
 
 def ydisk_put(path: str, content: bytes) -> None:
     url = f"{YANDEX_WEBDAV_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
-    r = requests.put(
+    r = _YDISK_SESSION.put(
         url,
         data=content,
         auth=ydisk_auth(),
@@ -64,7 +78,7 @@ def ydisk_put(path: str, content: bytes) -> None:
 
 def ydisk_get(path: str) -> bytes:
     url = f"{YANDEX_WEBDAV_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
-    r = requests.get(url, auth=ydisk_auth(), timeout=60)
+    r = _YDISK_SESSION.get(url, auth=ydisk_auth(), timeout=60)
     if r.status_code != 200:
         raise RuntimeError(f"Download failed {r.status_code}: {r.text}")
     return r.content
@@ -72,13 +86,13 @@ def ydisk_get(path: str) -> bytes:
 
 def ydisk_exists(path: str) -> bool:
     url = f"{YANDEX_WEBDAV_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
-    r = requests.head(url, auth=ydisk_auth(), timeout=20)
+    r = _YDISK_SESSION.head(url, auth=ydisk_auth(), timeout=20)
     return r.status_code == 200
 
 
 def ydisk_delete(path: str) -> None:
     url = f"{YANDEX_WEBDAV_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
-    r = requests.request("DELETE", url, auth=ydisk_auth(), timeout=30)
+    r = _YDISK_SESSION.request("DELETE", url, auth=ydisk_auth(), timeout=30)
     if r.status_code not in (200, 204, 404):
         raise RuntimeError(f"Delete failed {r.status_code}: {r.text}")
 
@@ -90,7 +104,7 @@ def ydisk_list(path: str) -> list[str]:
     """
     url = f"{YANDEX_WEBDAV_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
     headers = {"Depth": "1"}
-    r = requests.request("PROPFIND", url, auth=ydisk_auth(), headers=headers, timeout=30)
+    r = _YDISK_SESSION.request("PROPFIND", url, auth=ydisk_auth(), headers=headers, timeout=30)
     if r.status_code not in (207, 200):
         raise RuntimeError(f"List failed {r.status_code}: {r.text}")
 
@@ -124,17 +138,36 @@ def _safe_part(s: str, max_len: int = 40) -> str:
     return s[:max_len]
 
 
-def upload_to_ydisk(
+def ydisk_ensure_dirs(path: str) -> None:
+    """MKCOL every missing parent folder of a file path; folders seen before are skipped."""
+    parts = [p for p in path.strip("/").split("/")[:-1] if p]
+    for i in range(1, len(parts) + 1):
+        folder = "/".join(parts[:i])
+        with _YDISK_DIRS_LOCK:
+            if folder in _YDISK_DIRS_KNOWN:
+                continue
+        ydisk_mkcol(folder)
+        with _YDISK_DIRS_LOCK:
+            _YDISK_DIRS_KNOWN.add(folder)
+
+
+def ydisk_forget_dirs() -> None:
+    with _YDISK_DIRS_LOCK:
+        _YDISK_DIRS_KNOWN.clear()
+
+
+def ydisk_photo_path(
     chat_id: str,
     chat_name: str | None,
     meter_type_label: str | None,
     original_filename: str | None,
-    content: bytes,
+    *,
+    now: datetime | None = None,
 ) -> str:
     """
     Путь: tenants/<chat_id>/<YYYY-MM>/<YYYY.MM.DD-HHMMSS>__<chat>__<meter>.<ext>
     """
-    now = datetime.now()
+    now = now or datetime.now()
     ym = now.strftime("%Y-%m")
     ts = now.strftime("%Y.%m.%d-%H%M%S")
 
@@ -148,11 +181,29 @@ def upload_to_ydisk(
     filename = f"{ts}__{chat_part}__{meter_part}.{ext}"
 
     root = YANDEX_STORAGE_ROOT.strip("/")
+    return f"{root}/{chat_id}/{ym}/{filename}"
 
-    ydisk_mkcol(root)
-    ydisk_mkcol(f"{root}/{chat_id}")
-    ydisk_mkcol(f"{root}/{chat_id}/{ym}")
 
-    disk_path = f"{root}/{chat_id}/{ym}/{filename}"
-    ydisk_put(disk_path, content)
+def ydisk_upload(disk_path: str, content: bytes) -> None:
+    ydisk_ensure_dirs(disk_path)
+    try:
+        ydisk_put(disk_path, content)
+    except RuntimeError as e:
+        # 409 Conflict: a cached folder was removed on the disk side; re-create and retry once.
+        if not str(e).startswith("Upload failed 409"):
+            raise
+        ydisk_forget_dirs()
+        ydisk_ensure_dirs(disk_path)
+        ydisk_put(disk_path, content)
+
+
+def upload_to_ydisk(
+    chat_id: str,
+    chat_name: str | None,
+    meter_type_label: str | None,
+    original_filename: str | None,
+    content: bytes,
+) -> str:
+    disk_path = ydisk_photo_path(str(chat_id), chat_name, meter_type_label, original_filename)
+    ydisk_upload(disk_path, content)
     return disk_path
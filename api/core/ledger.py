@@ -0,0 +1,260 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from core.config import engine
+from core.tariff_timeline import TariffTimeline, _load_timeline, tariff_timeline
+
+# Materialized per-month meter ledger (apartment_month_ledger): one row per apartment and month that has
+# readings, holding current/previous/delta per meter slot plus ruble amounts, so the dashboard and admin
+# history read a single PK range instead of replaying the whole reading history.
+#
+# "previous" is the value from the apartment's previous month *with readings* (not strictly ym-1), which is
+# what those views always showed. A reading write therefore touches at most two rows (ym and the next month
+# with readings): refresh_ledger_month(). Tariff writes reprice rows from month_from on: reprice_ledger().
+# scripts/rebuild_ledger.py rebuilds everything.
+
+LEDGER_SLOTS = ("cold", "hot", "sewer", "e1", "e2", "e3")
+_ELECTRIC_SLOTS = {1: "e1", 2: "e2", 3: "e3"}
+_LEDGER_ADVISORY_LOCK_KEY = 987654322
+
+# slot -> {"current": float|None, "source": str|None}
+MonthSlots = Dict[str, Dict[str, Any]]
+
+
+def _slot_for(meter_type: str, meter_index) -> Optional[str]:
+    mt = str(meter_type)
+    if mt in ("cold", "hot", "sewer"):
+        return mt
+    if mt == "electric":
+        return _ELECTRIC_SLOTS.get(int(meter_index or 1))
+    return None
+
+
+def group_readings(rows: Iterable[Tuple]) -> Dict[int, Dict[str, MonthSlots]]:
+    """rows: (apartment_id, ym, meter_type, meter_index, value, source) ordered by ym, meter_type, meter_index."""
+    out: Dict[int, Dict[str, MonthSlots]] = {}
+    for aid, ym, mt, mi, value, source in rows:
+        month = out.setdefault(int(aid), {}).setdefault(str(ym), {})
+        slot = _slot_for(mt, mi)
+        if slot is None:
+            continue
+        month[slot] = {"current": float(value) if value is not None else None, "source": source}
+    return out
+
+
+def ledger_meters(cur: MonthSlots, prev: Optional[MonthSlots]) -> Dict[str, Dict[str, Any]]:
+    meters: Dict[str, Dict[str, Any]] = {}
+    for slot in LEDGER_SLOTS:
+        c = (cur.get(slot) or {}).get("current")
+        p = ((prev or {}).get(slot) or {}).get("current")
+        m = {"current": c, "previous": None, "delta": None, "source": (cur.get(slot) or {}).get("source")}
+        # sewer has no own previous/delta here: views bill it as cold + hot
+        if slot != "sewer":
+            m["previous"] = p
+            if c is not None and p is not None:
+                m["delta"] = c - p
+        meters[slot] = m
+    return meters
+
+
+def ledger_prices(meters: Dict[str, Dict[str, Any]], global_tariff: Optional[Dict[str, Any]], apt_tariff: Dict[str, float]) -> Dict[str, Any]:
+    g = global_tariff or {}
+    tariff = {
+        "cold": float(g.get("cold") or 0),
+        "hot": float(g.get("hot") or 0),
+        "sewer": float(g.get("sewer") or 0),
+        "e1": float(g.get("electric_t1") or 0),
+        "e2": float(g.get("electric_t2") or 0),
+        "e3": float(g.get("electric_t3") or 0),
+    }
+    d = {slot: meters[slot]["delta"] for slot in LEDGER_SLOTS}
+
+    # dashboard view: global tariff, every slot must be priced for a total
+    rub: Dict[str, Any] = {}
+    for slot in ("cold", "hot", "e1", "e2", "e3"):
+        rub[slot] = float(d[slot]) * float(tariff[slot]) if d[slot] is not None else None
+    rub["sewer"] = None
+    if d["cold"] is not None and d["hot"] is not None:
+        rub["sewer"] = float(d["cold"] + d["hot"]) * float(tariff["sewer"])
+    parts = [rub["cold"], rub["hot"], rub["e1"], rub["e2"], rub["e3"], rub["sewer"]]
+    rub["total"] = float(sum(float(x) for x in parts if x is not None)) if all(x is not None for x in parts) else None
+
+    # admin history view: apartment overrides applied, T3 not billed
+    ds = (d["cold"] or 0) + (d["hot"] or 0)
+    accrual = {
+        "cold": (float(d["cold"]) * apt_tariff["cold"]) if d["cold"] is not None else None,
+        "hot": (float(d["hot"]) * apt_tariff["hot"]) if d["hot"] is not None else None,
+        "e1": (float(d["e1"]) * apt_tariff["e1"]) if d["e1"] is not None else None,
+        "e2": (float(d["e2"]) * apt_tariff["e2"]) if d["e2"] is not None else None,
+        "sewer": float(ds) * apt_tariff["sewer"],
+    }
+    return {"tariff": tariff, "rub": rub, "accrual": accrual}
+
+
+def build_ledger_rows(
+    apartment_id: int,
+    months: Dict[str, MonthSlots],
+    timeline: TariffTimeline,
+    *,
+    seed: Optional[MonthSlots] = None,
+) -> List[Dict[str, Any]]:
+    """Ledger rows for consecutive months-with-readings; seed = slots of the month before the first one."""
+    out: List[Dict[str, Any]] = []
+    prev = seed
+    for ym in sorted(months.keys()):
+        cur = months[ym]
+        meters = ledger_meters(cur, prev)
+        prices = ledger_prices(meters, timeline.global_at(ym), timeline.apartment_at(apartment_id, ym))
+        out.append({"apartment_id": int(apartment_id), "ym": ym, "meters": meters, **prices})
+        prev = cur
+    return out
+
+
+def _params(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "aid": int(row["apartment_id"]),
+        "ym": str(row["ym"]),
+        "meters": json.dumps(row["meters"]),
+        "tariff": json.dumps(row["tariff"]),
+        "rub": json.dumps(row["rub"]),
+        "accrual": json.dumps(row["accrual"]),
+    }
+
+
+def _upsert_rows(conn, rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    conn.execute(
+        text("""
+            INSERT INTO apartment_month_ledger(apartment_id, ym, meters, tariff, rub, accrual, updated_at)
+            VALUES(:aid, :ym, CAST(:meters AS JSONB), CAST(:tariff AS JSONB), CAST(:rub AS JSONB), CAST(:accrual AS JSONB), now())
+            ON CONFLICT (apartment_id, ym) DO UPDATE SET
+                meters=EXCLUDED.meters,
+                tariff=EXCLUDED.tariff,
+                rub=EXCLUDED.rub,
+                accrual=EXCLUDED.accrual,
+                updated_at=now()
+        """),
+        [_params(r) for r in rows],
+    )
+
+
+def _select_readings(conn, where: str, params: Dict[str, Any]) -> List[Tuple]:
+    return conn.execute(
+        text(f"""
+            SELECT apartment_id, ym, meter_type, meter_index, value, source
+            FROM meter_readings
+            WHERE meter_type IN ('cold','hot','electric','sewer') AND {where}
+            ORDER BY apartment_id ASC, ym ASC, meter_type ASC, meter_index ASC
+        """),
+        params,
+    ).fetchall()
+
+
+def _lock_ledger(conn, apartment_id: Optional[int] = None) -> None:
+    """Serialize ledger writers per apartment until commit; without an id every apartment is locked, in id order."""
+    if apartment_id is not None:
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock(:k, :aid)"),
+            {"k": _LEDGER_ADVISORY_LOCK_KEY, "aid": int(apartment_id)},
+        )
+        return
+    conn.execute(
+        text("SELECT count(pg_advisory_xact_lock(:k, CAST(id AS int))) FROM (SELECT id FROM apartments ORDER BY id) a"),
+        {"k": _LEDGER_ADVISORY_LOCK_KEY},
+    )
+
+
+def refresh_ledger_month(conn, apartment_id: int, ym: str) -> None:
+    """Recompute the ledger rows affected by a reading write in (apartment_id, ym), in the caller's transaction."""
+    aid = int(apartment_id)
+    ym = str(ym)
+    # two writers of neighbouring months would otherwise each read the other's month as it was before
+    _lock_ledger(conn, aid)
+    bounds = conn.execute(
+        text("""
+            SELECT
+                (SELECT max(ym) FROM meter_readings
+                 WHERE apartment_id=:aid AND ym < :ym AND meter_type IN ('cold','hot','electric','sewer')),
+                (SELECT min(ym) FROM meter_readings
+                 WHERE apartment_id=:aid AND ym > :ym AND meter_type IN ('cold','hot','electric','sewer'))
+        """),
+        {"aid": aid, "ym": ym},
+    ).fetchone()
+    prev_ym, next_ym = (bounds[0], bounds[1]) if bounds else (None, None)
+    months = [m for m in (prev_ym, ym, next_ym) if m]
+    grouped = group_readings(_select_readings(conn, "apartment_id=:aid AND ym = ANY(:yms)", {"aid": aid, "yms": months})).get(aid, {})
+
+    seed = grouped.pop(prev_ym, None) if prev_ym else None
+    _upsert_rows(conn, build_ledger_rows(aid, grouped, tariff_timeline(conn, verify=True), seed=seed))
+    if ym not in grouped:
+        conn.execute(
+            text("DELETE FROM apartment_month_ledger WHERE apartment_id=:aid AND ym=:ym"),
+            {"aid": aid, "ym": ym},
+        )
+
+
+def reprice_ledger(conn, ym_from: str, *, apartment_id: Optional[int] = None) -> int:
+    """Re-apply tariffs to ledger rows with ym >= ym_from (all apartments, or one for an override change)."""
+    _lock_ledger(conn, apartment_id)
+    # fresh load: the tariff write is still uncommitted and must not end up in the shared cache
+    timeline = _load_timeline(conn)
+    where = "ym >= :ym_from"
+    params: Dict[str, Any] = {"ym_from": str(ym_from)}
+    if apartment_id is not None:
+        where += " AND apartment_id=:aid"
+        params["aid"] = int(apartment_id)
+    rows = conn.execute(
+        text(f"SELECT apartment_id, ym, meters FROM apartment_month_ledger WHERE {where}"),
+        params,
+    ).fetchall()
+    out = []
+    for aid, ym, meters in rows:
+        prices = ledger_prices(meters, timeline.global_at(ym), timeline.apartment_at(int(aid), ym))
+        out.append({"apartment_id": int(aid), "ym": str(ym), "meters": meters, **prices})
+    _upsert_rows(conn, out)
+    return len(out)
+
+
+def rebuild_ledger(conn, apartment_id: Optional[int] = None) -> int:
+    """Full rebuild from meter_readings (all apartments, or one). Returns the number of ledger rows written."""
+    _lock_ledger(conn, apartment_id)
+    if apartment_id is None:
+        conn.execute(text("DELETE FROM apartment_month_ledger"))
+        readings = _select_readings(conn, "true", {})
+    else:
+        conn.execute(text("DELETE FROM apartment_month_ledger WHERE apartment_id=:aid"), {"aid": int(apartment_id)})
+        readings = _select_readings(conn, "apartment_id=:aid", {"aid": int(apartment_id)})
+    timeline = _load_timeline(conn)
+    total = 0
+    for aid, months in group_readings(readings).items():
+        rows = build_ledger_rows(aid, months, timeline)
+        _upsert_rows(conn, rows)
+        total += len(rows)
+    return total
+
+
+def backfill_ledger() -> int:
+    """Build the ledger once while the table is empty (first deploy); writers keep it current afterwards."""
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LEDGER_ADVISORY_LOCK_KEY})
+        if conn.execute(text("SELECT 1 FROM apartment_month_ledger LIMIT 1")).fetchone():
+            return 0
+        return rebuild_ledger(conn)
+
+
+def load_ledger(conn, apartment_id: int) -> List[Dict[str, Any]]:
+    """Ledger rows of one apartment ordered by month; built on first use for apartments not yet backfilled."""
+    params = {"aid": int(apartment_id)}
+    sql = text("SELECT ym, meters, tariff, rub, accrual FROM apartment_month_ledger WHERE apartment_id=:aid ORDER BY ym ASC")
+    rows = conn.execute(sql, params).mappings().all()
+    if not rows:
+        has_readings = conn.execute(
+            text("SELECT 1 FROM meter_readings WHERE apartment_id=:aid AND meter_type IN ('cold','hot','electric','sewer') LIMIT 1"),
+            params,
+        ).fetchone()
+        if has_readings and rebuild_ledger(conn, int(apartment_id)):
+            rows = conn.execute(sql, params).mappings().all()
+    return [dict(r) for r in rows]
@@ -1,7 +1,12 @@
+import functools
+import inspect
+import threading
 from typing import Optional, Dict, Any, List
 from sqlalchemy import text
 
 from core.config import engine
+from core.ledger import refresh_ledger_month
+from core.uow import db_conn
 from core.billing import (
     month_now,
     _get_apartment_electric_expected,
@@ -10,6 +15,32 @@ from core.billing import (
 
 _WATER_UNCERTAIN_REASON = "water_type_uncertain"
 
+_LEDGER_NESTING = threading.local()
+
+
+def _maintains_ledger(fn):
+    """
+    Reading writers refresh apartment_month_ledger for (apartment_id, ym) in the same transaction.
+    Writers call each other (write -> normalize -> auto-fill T3); only the outermost call refreshes.
+    """
+    sig = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_LEDGER_NESTING, "depth", 0)
+        _LEDGER_NESTING.depth = depth + 1
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            _LEDGER_NESTING.depth = depth
+        if depth == 0:
+            a = sig.bind(*args, **kwargs).arguments
+            ym = str(a["ym"] or "").strip() or month_now()
+            refresh_ledger_month(a["conn"], int(a["apartment_id"]), ym)
+        return result
+
+    return wrapper
+
 
 def _has_open_water_uncertain_flag(conn, apartment_id: int, ym: str) -> bool:
     row = conn.execute(
@@ -78,6 +109,7 @@ def _ensure_review_flag(
     )
 
 
+@_maintains_ledger
 def _write_water_ocr_with_uncertainty(
     conn,
     apartment_id: int,
@@ -220,6 +252,7 @@ def _write_water_ocr_with_uncertainty(
     return str(kind)
 
 
+@_maintains_ledger
 def _normalize_water_after_manual(conn, apartment_id: int, ym: str) -> None:
     """After manual edits, normalize water readings:
     - min -> hot, max -> cold
@@ -277,6 +310,7 @@ def _normalize_water_after_manual(conn, apartment_id: int, ym: str) -> None:
 # -----------------------
 # INTERNAL DB helper (manual/ocr write into meter_readings)
 # -----------------------
+@_maintains_ledger
 def _add_meter_reading_db_impl(
     conn,
     apartment_id: int,
@@ -379,6 +413,7 @@ def _add_meter_reading_db(*args, **kwargs):
     )
 
 
+@_maintains_ledger
 def _write_electric_explicit(conn, apartment_id: int, ym: str, meter_index: int, new_value: float) -> int:
     """
     expected=3:
@@ -451,6 +486,7 @@ def _write_electric_explicit(conn, apartment_id: int, ym: str, meter_index: int,
     return int(meter_index)
 
 
+@_maintains_ledger
 def _normalize_electric_expected3(conn, apartment_id: int, ym: str) -> None:
     """Normalize electric readings for expected=3:
     - if 3 values exist: idx2=min, idx1=mid, idx3=max
@@ -556,6 +592,7 @@ def _normalize_electric_expected3(conn, apartment_id: int, ym: str) -> None:
     )
 
 
+@_maintains_ledger
 def _normalize_electric_expected2(conn, apartment_id: int, ym: str) -> None:
     """Normalize electric readings for expected=2:
     - if 2 values: idx2=min, idx1=max
@@ -634,6 +671,7 @@ def _normalize_electric_expected2(conn, apartment_id: int, ym: str) -> None:
     )
 
 
+@_maintains_ledger
 def _write_electric_overwrite_then_sort(conn, apartment_id: int, ym: str, meter_index: int, new_value: float, *, source: str = "manual") -> int:
     """Overwrite the specified slot; for expected=3 auto-fill T3 from T1+T2 when T3 is not OCR."""
     try:
@@ -666,10 +704,17 @@ def _write_electric_overwrite_then_sort(conn, apartment_id: int, ym: str, meter_
     return int(meter_index)
 
 
-def _assign_and_write_electric_sorted(apartment_id: int, ym: str, new_value: float) -> int:
+def _assign_and_write_electric_sorted(apartment_id: int, ym: str, new_value: float, *, conn=None) -> int:
     """
     Совместимый вход (не меняем вызовы): возвращает индекс, в который попало новое значение.
+    """
+    with db_conn(conn) as conn:
+        return _assign_and_write_electric_sorted_impl(conn, apartment_id, ym, new_value)
+
 
+@_maintains_ledger
+def _assign_and_write_electric_sorted_impl(conn, apartment_id: int, ym: str, new_value: float) -> int:
+    """
     Новая логика:
       - учитываем apartments.electric_expected (1..3)
       - если получено больше уникальных значений, чем ожидаем, то 1 “лишнее” значение пишем
@@ -687,184 +732,184 @@ def _assign_and_write_electric_sorted(apartment_id: int, ym: str, new_value: flo
         except Exception:
             return False
 
-    with engine.begin() as conn:
-        expected = _get_apartment_electric_expected(conn, apartment_id)
+    expected = _get_apartment_electric_expected(conn, apartment_id)
 
-        # берём все текущие электрические показания за месяц
-        rows = conn.execute(
-            text(
-                "SELECT meter_index, value, source "
-                "FROM meter_readings "
-                "WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric'"
-            ),
-            {"aid": apartment_id, "ym": ym},
-        ).mappings().all()
-
-        # если есть manual — мы НЕ пересортировываем руками введённые значения:
-        # просто пытаемся положить новое значение в первый свободный индекс (1..3),
-        # учитывая expected (лишнее -> pending).
-        has_manual = any((r.get("source") == "manual") for r in rows)
-
-        existing_vals = [float(r["value"]) for r in rows if r.get("value") is not None]
-        if any(same(v, new_value) for v in existing_vals):
-            # Если такое значение уже есть, считаем что пришло "подтверждающее фото":
-            # помечаем соответствующий слот как OCR (особенно важно для T3).
-            matches = []
-            for r in rows:
-                try:
-                    rv = float(r.get("value")) if r.get("value") is not None else None
-                    if rv is not None and same(rv, new_value):
-                        matches.append(
-                            {
-                                "idx": int(r.get("meter_index") or 0),
-                                "src": str(r.get("source") or ""),
-                            }
-                        )
-                except Exception:
-                    continue
+    # берём все текущие электрические показания за месяц
+    rows = conn.execute(
+        text(
+            "SELECT meter_index, value, source "
+            "FROM meter_readings "
+            "WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric'"
+        ),
+        {"aid": apartment_id, "ym": ym},
+    ).mappings().all()
 
-            if matches:
-                # Для expected=3 в первую очередь подтверждаем T3, если он совпал.
-                chosen = None
-                if int(expected) >= 3:
-                    for m in matches:
-                        if int(m["idx"]) == 3:
-                            chosen = m
-                            break
-                if chosen is None:
-                    chosen = matches[0]
-
-                chosen_idx = int(chosen["idx"])
-                if chosen_idx in (1, 2, 3):
-                    conn.execute(
-                        text(
-                            "UPDATE meter_readings "
-                            "SET source='ocr', ocr_value=:ocr, updated_at=now() "
-                            "WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric' AND meter_index=:idx"
-                        ),
-                        {"aid": apartment_id, "ym": ym, "idx": chosen_idx, "ocr": float(new_value)},
+    # если есть manual — мы НЕ пересортировываем руками введённые значения:
+    # просто пытаемся положить новое значение в первый свободный индекс (1..3),
+    # учитывая expected (лишнее -> pending).
+    has_manual = any((r.get("source") == "manual") for r in rows)
+
+    existing_vals = [float(r["value"]) for r in rows if r.get("value") is not None]
+    if any(same(v, new_value) for v in existing_vals):
+        # Если такое значение уже есть, считаем что пришло "подтверждающее фото":
+        # помечаем соответствующий слот как OCR (особенно важно для T3).
+        matches = []
+        for r in rows:
+            try:
+                rv = float(r.get("value")) if r.get("value") is not None else None
+                if rv is not None and same(rv, new_value):
+                    matches.append(
+                        {
+                            "idx": int(r.get("meter_index") or 0),
+                            "src": str(r.get("source") or ""),
+                        }
                     )
-                    return chosen_idx
+            except Exception:
+                continue
+
+        if matches:
+            # Для expected=3 в первую очередь подтверждаем T3, если он совпал.
+            chosen = None
+            if int(expected) >= 3:
+                for m in matches:
+                    if int(m["idx"]) == 3:
+                        chosen = m
+                        break
+            if chosen is None:
+                chosen = matches[0]
+
+            chosen_idx = int(chosen["idx"])
+            if chosen_idx in (1, 2, 3):
+                conn.execute(
+                    text(
+                        "UPDATE meter_readings "
+                        "SET source='ocr', ocr_value=:ocr, updated_at=now() "
+                        "WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric' AND meter_index=:idx"
+                    ),
+                    {"aid": apartment_id, "ym": ym, "idx": chosen_idx, "ocr": float(new_value)},
+                )
+                return chosen_idx
+
+        # fallback: дубликат без явного совпадения слота
+        return 0
 
-            # fallback: дубликат без явного совпадения слота
+    if has_manual:
+        used = set(int(r["meter_index"]) for r in rows if r.get("meter_index") is not None)
+        free = None
+        for i in (1, 2, 3):
+            if i not in used:
+                free = i
+                break
+        if free is None:
+            # All slots are already occupied.
+            # If T3 is still not OCR, allow new photo to replace T3 to break "missing T3" loops.
+            try:
+                if int(expected) >= 3:
+                    r3 = None
+                    for r in rows:
+                        if int(r.get("meter_index") or 0) == 3:
+                            r3 = r
+                            break
+                    if r3 and str(r3.get("source") or "").lower() != "ocr":
+                        conn.execute(
+                            text(
+                                "INSERT INTO meter_readings(apartment_id, ym, meter_type, meter_index, value, source, ocr_value) "
+                                "VALUES(:aid,:ym,'electric',3,:val,'ocr',:ocr) "
+                                "ON CONFLICT (apartment_id, ym, meter_type, meter_index) DO UPDATE SET "
+                                " value=EXCLUDED.value, source=EXCLUDED.source, ocr_value=EXCLUDED.ocr_value, updated_at=now()"
+                            ),
+                            {"aid": apartment_id, "ym": ym, "val": float(new_value), "ocr": float(new_value)},
+                        )
+                        _normalize_electric_expected3(conn, int(apartment_id), str(ym))
+                        return 3
+            except Exception:
+                pass
             return 0
 
-        if has_manual:
-            used = set(int(r["meter_index"]) for r in rows if r.get("meter_index") is not None)
-            free = None
-            for i in (1, 2, 3):
-                if i not in used:
-                    free = i
-                    break
-            if free is None:
-                # All slots are already occupied.
-                # If T3 is still not OCR, allow new photo to replace T3 to break "missing T3" loops.
-                try:
-                    if int(expected) >= 3:
-                        r3 = None
-                        for r in rows:
-                            if int(r.get("meter_index") or 0) == 3:
-                                r3 = r
-                                break
-                        if r3 and str(r3.get("source") or "").lower() != "ocr":
-                            conn.execute(
-                                text(
-                                    "INSERT INTO meter_readings(apartment_id, ym, meter_type, meter_index, value, source, ocr_value) "
-                                    "VALUES(:aid,:ym,'electric',3,:val,'ocr',:ocr) "
-                                    "ON CONFLICT (apartment_id, ym, meter_type, meter_index) DO UPDATE SET "
-                                    " value=EXCLUDED.value, source=EXCLUDED.source, ocr_value=EXCLUDED.ocr_value, updated_at=now()"
-                                ),
-                                {"aid": apartment_id, "ym": ym, "val": float(new_value), "ocr": float(new_value)},
-                            )
-                            _normalize_electric_expected3(conn, int(apartment_id), str(ym))
-                            return 3
-                except Exception:
-                    pass
-                return 0
-
-            # записываем и помечаем pending, если индекс "лишний"
-            conn.execute(
-                text(
-                    "INSERT INTO meter_readings(apartment_id, ym, meter_type, meter_index, value, source) "
-                    "VALUES(:aid,:ym,'electric',:idx,:val,'ocr') "
-                    "ON CONFLICT (apartment_id, ym, meter_type, meter_index) DO UPDATE SET value=EXCLUDED.value, source=EXCLUDED.source"
-                ),
-                {"aid": apartment_id, "ym": ym, "idx": free, "val": float(new_value)},
-            )
-
-            if free > expected and expected < 3:
-                _set_month_extra_state(conn, apartment_id, ym, True, expected)
-            return free
-
-        # OCR-only: собираем уникальные значения (max 3)
-        uniq: List[float] = []
-        for v in existing_vals + [float(new_value)]:
-            if not any(same(v, u) for u in uniq):
-                uniq.append(v)
-
-        uniq = sorted(uniq)[:3]
-
-        extra_pending = False
-        extra_idx: Optional[int] = None
-        extra_val: Optional[float] = None
-
-        normal_vals = uniq
-        if len(uniq) > expected and expected < 3:
-            extra_pending = True
-            extra_idx = expected + 1
-            extra_val = uniq[expected]
-            normal_vals = uniq[:expected]
-
-        # mapping в индексы
-        mapping: Dict[int, float] = {}
-
-        if len(normal_vals) == 1:
-            mapping[1] = normal_vals[0]
-        elif len(normal_vals) == 2:
-            # для expected=3: T2=min, T1=второе, T3 пусто до 3-го значения
-            mapping[2] = normal_vals[0]
-            mapping[1] = normal_vals[1]
-        elif len(normal_vals) == 3:
-            # по требованиям: T2 = min, T3 = max, T1 = среднее (по величине)
-            mapping[2] = normal_vals[0]
-            mapping[1] = normal_vals[1]
-            mapping[3] = normal_vals[2]
-
-        if extra_pending and extra_idx and extra_val is not None:
-            mapping[int(extra_idx)] = float(extra_val)
-
-        # Перезаписываем электро-строки на месяц только в диапазоне 1..3
+        # записываем и помечаем pending, если индекс "лишний"
         conn.execute(
             text(
-                "DELETE FROM meter_readings "
-                "WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric' AND meter_index BETWEEN 1 AND 3"
+                "INSERT INTO meter_readings(apartment_id, ym, meter_type, meter_index, value, source) "
+                "VALUES(:aid,:ym,'electric',:idx,:val,'ocr') "
+                "ON CONFLICT (apartment_id, ym, meter_type, meter_index) DO UPDATE SET value=EXCLUDED.value, source=EXCLUDED.source"
             ),
-            {"aid": apartment_id, "ym": ym},
+            {"aid": apartment_id, "ym": ym, "idx": free, "val": float(new_value)},
         )
-        for idx, val in mapping.items():
-            conn.execute(
-                text(
-                    "INSERT INTO meter_readings(apartment_id, ym, meter_type, meter_index, value, source) "
-                    "VALUES(:aid,:ym,'electric',:idx,:val,'ocr') "
-                    "ON CONFLICT (apartment_id, ym, meter_type, meter_index) DO UPDATE SET value=EXCLUDED.value, source=EXCLUDED.source"
-                ),
-                {"aid": apartment_id, "ym": ym, "idx": int(idx), "val": float(val)},
-            )
 
-        # pending flag
-        if extra_pending:
+        if free > expected and expected < 3:
             _set_month_extra_state(conn, apartment_id, ym, True, expected)
-        else:
-            _set_month_extra_state(conn, apartment_id, ym, False, None)
+        return free
+
+    # OCR-only: собираем уникальные значения (max 3)
+    uniq: List[float] = []
+    for v in existing_vals + [float(new_value)]:
+        if not any(same(v, u) for u in uniq):
+            uniq.append(v)
+
+    uniq = sorted(uniq)[:3]
+
+    extra_pending = False
+    extra_idx: Optional[int] = None
+    extra_val: Optional[float] = None
+
+    normal_vals = uniq
+    if len(uniq) > expected and expected < 3:
+        extra_pending = True
+        extra_idx = expected + 1
+        extra_val = uniq[expected]
+        normal_vals = uniq[:expected]
+
+    # mapping в индексы
+    mapping: Dict[int, float] = {}
+
+    if len(normal_vals) == 1:
+        mapping[1] = normal_vals[0]
+    elif len(normal_vals) == 2:
+        # для expected=3: T2=min, T1=второе, T3 пусто до 3-го значения
+        mapping[2] = normal_vals[0]
+        mapping[1] = normal_vals[1]
+    elif len(normal_vals) == 3:
+        # по требованиям: T2 = min, T3 = max, T1 = среднее (по величине)
+        mapping[2] = normal_vals[0]
+        mapping[1] = normal_vals[1]
+        mapping[3] = normal_vals[2]
+
+    if extra_pending and extra_idx and extra_val is not None:
+        mapping[int(extra_idx)] = float(extra_val)
+
+    # Перезаписываем электро-строки на месяц только в диапазоне 1..3
+    conn.execute(
+        text(
+            "DELETE FROM meter_readings "
+            "WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric' AND meter_index BETWEEN 1 AND 3"
+        ),
+        {"aid": apartment_id, "ym": ym},
+    )
+    for idx, val in mapping.items():
+        conn.execute(
+            text(
+                "INSERT INTO meter_readings(apartment_id, ym, meter_type, meter_index, value, source) "
+                "VALUES(:aid,:ym,'electric',:idx,:val,'ocr') "
+                "ON CONFLICT (apartment_id, ym, meter_type, meter_index) DO UPDATE SET value=EXCLUDED.value, source=EXCLUDED.source"
+            ),
+            {"aid": apartment_id, "ym": ym, "idx": int(idx), "val": float(val)},
+        )
 
-        # определяем, какой индекс получил new_value
-        for idx, val in mapping.items():
-            if same(val, float(new_value)):
-                return int(idx)
+    # pending flag
+    if extra_pending:
+        _set_month_extra_state(conn, apartment_id, ym, True, expected)
+    else:
+        _set_month_extra_state(conn, apartment_id, ym, False, None)
 
-        return 0
+    # определяем, какой индекс получил new_value
+    for idx, val in mapping.items():
+        if same(val, float(new_value)):
+            return int(idx)
+
+    return 0
 
 
+@_maintains_ledger
 def _auto_fill_t3_from_t1_t2_if_needed(conn, apartment_id: int, ym: str) -> None:
     """
     If T1/T2 are present and T3 was NOT recognized from photo (source != 'ocr'),
@@ -0,0 +1,510 @@
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+from core.config import engine, logger
+
+# Versioned schema migrations. Each step is (version, name, statements) and is applied once, in its own
+# transaction, recording a row in schema_version. Steps are append-only: never edit an applied step, add
+# a new one. Statements stay idempotent (IF NOT EXISTS) so databases created by the old boot-time DDL
+# upgrade cleanly through step 1.
+#
+# Used by core.db.ensure_tables() (API processes) and by scripts (build_ocr_dataset.py, migrate.py).
+
+Migration = Tuple[int, str, List[str]]
+
+_SCHEMA_ADVISORY_LOCK_KEY = 987654321  # any stable 64-bit int
+
+MIGRATIONS: List[Migration] = [
+    (
+        1,
+        "baseline",
+        [
+            # --- apartments ---
+            """
+            CREATE TABLE IF NOT EXISTS apartments (
+                id BIGSERIAL PRIMARY KEY,
+                title TEXT NOT NULL,
+                tenant_name TEXT NULL,
+                address TEXT NULL,
+                note TEXT NULL,
+                ls_account TEXT NULL,
+                electric_expected INTEGER NOT NULL DEFAULT 3,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """,
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS tenant_name TEXT NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS address TEXT NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS note TEXT NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS ls_account TEXT NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS electric_expected INTEGER NOT NULL DEFAULT 3;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now();",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS cold_serial TEXT NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS hot_serial TEXT NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS cold_serial_source TEXT NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS hot_serial_source TEXT NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS tenant_since DATE NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS rent_monthly NUMERIC(14,2) NOT NULL DEFAULT 0;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS utilities_mode TEXT NOT NULL DEFAULT 'by_actual_monthly';",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS utilities_fixed_monthly NUMERIC(14,2) NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS utilities_advance_amount NUMERIC(14,2) NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS utilities_advance_cycle_months INTEGER NOT NULL DEFAULT 3;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS utilities_advance_anchor_ym TEXT NULL;",
+            "ALTER TABLE apartments ADD COLUMN IF NOT EXISTS utilities_show_actual_to_tenant BOOLEAN NOT NULL DEFAULT FALSE;",
+            # --- apartment_rent_history ---
+            """
+            CREATE TABLE IF NOT EXISTS apartment_rent_history (
+                id BIGSERIAL PRIMARY KEY,
+                apartment_id BIGINT NOT NULL REFERENCES apartments(id) ON DELETE CASCADE,
+                ym_from TEXT NOT NULL,               -- YYYY-MM (effective month)
+                rent_monthly NUMERIC(14,2) NOT NULL,
+                tenant_name_snapshot TEXT NULL,
+                changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_apartment_rent_history_apartment_changed ON apartment_rent_history(apartment_id, changed_at DESC);",
+            "CREATE INDEX IF NOT EXISTS idx_apartment_rent_history_apartment_ym ON apartment_rent_history(apartment_id, ym_from DESC);",
+            # --- tariffs ---
+            """
+            CREATE TABLE IF NOT EXISTS tariffs (
+                month_from TEXT PRIMARY KEY,  -- YYYY-MM
+                cold NUMERIC(14,3) NOT NULL,
+                hot NUMERIC(14,3) NOT NULL,
+                electric NUMERIC(14,3) NOT NULL,
+                sewer NUMERIC(14,3) NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """,
+            "ALTER TABLE tariffs ADD COLUMN IF NOT EXISTS sewer NUMERIC(14,3) NULL;",
+            "ALTER TABLE tariffs ADD COLUMN IF NOT EXISTS electric_t1 NUMERIC(14,3) NULL;",
+            "ALTER TABLE tariffs ADD COLUMN IF NOT EXISTS electric_t2 NUMERIC(14,3) NULL;",
+            "ALTER TABLE tariffs ADD COLUMN IF NOT EXISTS electric_t3 NUMERIC(14,3) NULL;",
+            # --- apartment_tariffs (per-apartment overrides) ---
+            """
+            CREATE TABLE IF NOT EXISTS apartment_tariffs (
+                apartment_id BIGINT NOT NULL REFERENCES apartments(id) ON DELETE CASCADE,
+                month_from TEXT NOT NULL,  -- YYYY-MM
+                cold NUMERIC(14,3) NULL,
+                hot NUMERIC(14,3) NULL,
+                sewer NUMERIC(14,3) NULL,
+                electric_t1 NUMERIC(14,3) NULL,
+                electric_t2 NUMERIC(14,3) NULL,
+                electric_t3 NUMERIC(14,3) NULL,
+                rent NUMERIC(14,2) NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (apartment_id, month_from)
+            );
+            """,
+            "ALTER TABLE apartment_tariffs ADD COLUMN IF NOT EXISTS cold NUMERIC(14,3) NULL;",
+            "ALTER TABLE apartment_tariffs ADD COLUMN IF NOT EXISTS hot NUMERIC(14,3) NULL;",
+            "ALTER TABLE apartment_tariffs ADD COLUMN IF NOT EXISTS sewer NUMERIC(14,3) NULL;",
+            "ALTER TABLE apartment_tariffs ADD COLUMN IF NOT EXISTS electric_t1 NUMERIC(14,3) NULL;",
+            "ALTER TABLE apartment_tariffs ADD COLUMN IF NOT EXISTS electric_t2 NUMERIC(14,3) NULL;",
+            "ALTER TABLE apartment_tariffs ADD COLUMN IF NOT EXISTS electric_t3 NUMERIC(14,3) NULL;",
+            "ALTER TABLE apartment_tariffs ADD COLUMN IF NOT EXISTS rent NUMERIC(14,2) NULL;",
+            # --- apartment_contacts ---
+            """
+            CREATE TABLE IF NOT EXISTS apartment_contacts (
+                id BIGSERIAL PRIMARY KEY,
+                apartment_id BIGINT NOT NULL REFERENCES apartments(id) ON DELETE CASCADE,
+                kind TEXT NOT NULL,       -- telegram | phone
+                value TEXT NOT NULL,
+                is_active BOOLEAN NOT NULL DEFAULT TRUE,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """,
+            # --- apartment_statuses ---
+            """
+            CREATE TABLE IF NOT EXISTS apartment_statuses (
+                apartment_id BIGINT PRIMARY KEY REFERENCES apartments(id) ON DELETE CASCADE,
+                rent_paid BOOLEAN NOT NULL DEFAULT FALSE,
+                meters_paid BOOLEAN NOT NULL DEFAULT FALSE,
+                meters_photo_cold BOOLEAN NOT NULL DEFAULT FALSE,
+                meters_photo_hot BOOLEAN NOT NULL DEFAULT FALSE,
+                meters_photo_electric BOOLEAN NOT NULL DEFAULT FALSE,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """,
+            # --- apartment_month_statuses ---
+            """
+            CREATE TABLE IF NOT EXISTS apartment_month_statuses (
+                apartment_id BIGINT NOT NULL REFERENCES apartments(id) ON DELETE CASCADE,
+                ym TEXT NOT NULL, -- YYYY-MM
+                rent_paid BOOLEAN NOT NULL DEFAULT FALSE,
+                meters_photo BOOLEAN NOT NULL DEFAULT FALSE,
+                meters_paid BOOLEAN NOT NULL DEFAULT FALSE,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (apartment_id, ym)
+            );
+            """,
+            # Миграции (добавление новых колонок без ломания старых БД)
+            "ALTER TABLE apartment_month_statuses ADD COLUMN IF NOT EXISTS electric_extra_pending BOOLEAN NOT NULL DEFAULT FALSE",
+            "ALTER TABLE apartment_month_statuses ADD COLUMN IF NOT EXISTS electric_expected_snapshot INTEGER",
+            "ALTER TABLE apartment_month_statuses ADD COLUMN IF NOT EXISTS electric_extra_resolved_at TIMESTAMPTZ",
+            "ALTER TABLE apartment_month_statuses ADD COLUMN IF NOT EXISTS bill_pending JSONB NULL",
+            "ALTER TABLE apartment_month_statuses ADD COLUMN IF NOT EXISTS bill_last_json JSONB NULL",
+            "ALTER TABLE apartment_month_statuses ADD COLUMN IF NOT EXISTS bill_approved_at TIMESTAMPTZ NULL",
+            "ALTER TABLE apartment_month_statuses ADD COLUMN IF NOT EXISTS bill_sent_at TIMESTAMPTZ NULL",
+            "ALTER TABLE apartment_month_statuses ADD COLUMN IF NOT EXISTS bill_sent_total NUMERIC(14,2) NULL",
+            "ALTER TABLE apartment_month_statuses ADD COLUMN IF NOT EXISTS rent_reminder_sent_at TIMESTAMPTZ NULL",
+            # --- meter_readings (единая схема) ---
+            """
+            CREATE TABLE IF NOT EXISTS meter_readings (
+                id BIGSERIAL PRIMARY KEY,
+                apartment_id BIGINT NOT NULL REFERENCES apartments(id) ON DELETE CASCADE,
+                ym TEXT NOT NULL,
+                meter_type TEXT NOT NULL,
+                meter_index INTEGER NOT NULL DEFAULT 1,
+                value NUMERIC(12,3) NOT NULL,
+                source TEXT NOT NULL DEFAULT 'ocr',
+                ocr_value NUMERIC(12,3) NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                UNIQUE (apartment_id, ym, meter_type, meter_index)
+            );
+            """,
+            # --- chat_bindings ---
+            """
+            CREATE TABLE IF NOT EXISTS chat_bindings (
+                chat_id TEXT PRIMARY KEY,
+                apartment_id BIGINT NOT NULL REFERENCES apartments(id) ON DELETE CASCADE,
+                is_active BOOLEAN NOT NULL DEFAULT TRUE,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """,
+            # --- photo_events ---
+            """
+            CREATE TABLE IF NOT EXISTS photo_events (
+                id BIGSERIAL PRIMARY KEY,
+                chat_id TEXT NOT NULL,
+                telegram_username TEXT NULL,
+                phone TEXT NULL,
+                original_filename TEXT NULL,
+                ydisk_path TEXT NULL,
+                status TEXT NOT NULL DEFAULT 'unassigned',
+                apartment_id BIGINT NULL,
+                ym TEXT NULL,
+                ocr_json JSONB NULL,
+
+                meter_index INTEGER NOT NULL DEFAULT 1,
+
+                stage TEXT NOT NULL DEFAULT 'received',
+                stage_updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                file_sha256 TEXT NULL,
+                ocr_type TEXT NULL,
+                ocr_reading NUMERIC(12,3) NULL,
+                meter_kind TEXT NULL,
+                meter_value NUMERIC(12,3) NULL,
+                meter_written BOOLEAN NOT NULL DEFAULT FALSE,
+                diag_json JSONB NULL
+            );
+            """,
+            # --- meter_review_flags (bot/user reports wrong reading) ---
+            """
+            CREATE TABLE IF NOT EXISTS meter_review_flags (
+                id BIGSERIAL PRIMARY KEY,
+                apartment_id BIGINT NOT NULL REFERENCES apartments(id) ON DELETE CASCADE,
+                ym TEXT NOT NULL,
+                meter_type TEXT NOT NULL,
+                meter_index INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL DEFAULT 'open', -- open | resolved
+                reason TEXT NOT NULL DEFAULT 'user_report_wrong_ocr',
+                comment TEXT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                resolved_at TIMESTAMPTZ NULL,
+                resolved_by TEXT NULL
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_meter_review_flags_apartment_ym ON meter_review_flags(apartment_id, ym)",
+            "CREATE INDEX IF NOT EXISTS idx_meter_review_flags_status ON meter_review_flags(status)",
+            # --- notifications (web bell) ---
+            """
+            CREATE TABLE IF NOT EXISTS notifications (
+                id BIGSERIAL PRIMARY KEY,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                read_at TIMESTAMPTZ NULL,
+                status TEXT NOT NULL DEFAULT 'unread', -- unread | read
+                chat_id TEXT NULL,
+                telegram_username TEXT NULL,
+                apartment_id BIGINT NULL REFERENCES apartments(id) ON DELETE SET NULL,
+                type TEXT NOT NULL DEFAULT 'user_message',
+                message TEXT NOT NULL,
+                related JSONB NULL
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_notifications_status ON notifications(status)",
+            "CREATE INDEX IF NOT EXISTS idx_notifications_apartment_id ON notifications(apartment_id)",
+            "CREATE INDEX IF NOT EXISTS idx_notifications_created_at ON notifications(created_at DESC)",
+            # --- ocr training samples ---
+            """
+            CREATE TABLE IF NOT EXISTS ocr_training_samples (
+                id BIGSERIAL PRIMARY KEY,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                processed_at TIMESTAMPTZ NULL,
+                apartment_id BIGINT NOT NULL REFERENCES apartments(id) ON DELETE CASCADE,
+                ym TEXT NOT NULL,
+                meter_type TEXT NOT NULL,
+                meter_index INTEGER NOT NULL DEFAULT 1,
+                photo_event_id BIGINT NULL REFERENCES photo_events(id) ON DELETE SET NULL,
+                ydisk_path TEXT NULL,
+                ocr_value NUMERIC(14,3) NULL,
+                correct_value NUMERIC(14,3) NOT NULL,
+                source TEXT NULL
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_ocr_training_samples_processed ON ocr_training_samples(processed_at)",
+            "CREATE INDEX IF NOT EXISTS idx_ocr_training_samples_photo_event ON ocr_training_samples(photo_event_id)",
+            "CREATE INDEX IF NOT EXISTS idx_ocr_training_samples_apartment_ym ON ocr_training_samples(apartment_id, ym)",
+            # --- ocr training runs ---
+            """
+            CREATE TABLE IF NOT EXISTS ocr_training_runs (
+                id BIGSERIAL PRIMARY KEY,
+                run_month TEXT NOT NULL,
+                started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                finished_at TIMESTAMPTZ NULL
+            );
+            """,
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_ocr_training_runs_month ON ocr_training_runs(run_month)",
+            "CREATE INDEX IF NOT EXISTS idx_photo_events_status ON photo_events(status)",
+            "CREATE INDEX IF NOT EXISTS idx_photo_events_apartment_id ON photo_events(apartment_id)",
+        ],
+    ),
+    (
+        2,
+        "ocr_result_cache",
+        [
+            # --- ocr result cache (whole /recognize result per photo + context + pipeline version) ---
+            """
+            CREATE TABLE IF NOT EXISTS ocr_result_cache (
+                cache_key TEXT PRIMARY KEY,
+                file_sha256 TEXT NOT NULL,
+                pipeline_version TEXT NOT NULL,
+                result_json JSONB NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                last_hit_at TIMESTAMPTZ NULL
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_ocr_result_cache_version ON ocr_result_cache(pipeline_version)",
+            "CREATE INDEX IF NOT EXISTS idx_photo_events_file_sha256 ON photo_events(file_sha256, created_at DESC)",
+        ],
+    ),
+    (
+        3,
+        "ocr_jobs",
+        [
+            # --- ocr jobs (durable queue for async /events/photo) ---
+            """
+            CREATE TABLE IF NOT EXISTS ocr_jobs (
+                id BIGSERIAL PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'queued', -- queued | running | done | failed
+                trace_id TEXT NULL,
+                chat_id TEXT NULL,
+                fields_json JSONB NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until TIMESTAMPTZ NULL,
+                written_at TIMESTAMPTZ NULL, -- the handler's rows committed; never re-run after this
+                error TEXT NULL,
+                result_json JSONB NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                started_at TIMESTAMPTZ NULL,
+                finished_at TIMESTAMPTZ NULL
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS ocr_job_files (
+                job_id BIGINT NOT NULL REFERENCES ocr_jobs(id) ON DELETE CASCADE,
+                idx INTEGER NOT NULL,
+                filename TEXT NULL,
+                mime TEXT NULL,
+                blob BYTEA NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_ocr_jobs_pending ON ocr_jobs(id) WHERE status IN ('queued', 'running')",
+        ],
+    ),
+    (
+        4,
+        "ydisk_outbox",
+        [
+            # --- Yandex Disk upload outbox (photo_events.ydisk_path is set when the upload lands) ---
+            """
+            CREATE TABLE IF NOT EXISTS ydisk_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                photo_event_id BIGINT NULL,
+                disk_path TEXT NOT NULL,
+                blob BYTEA NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued', -- queued | running | failed
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                lease_until TIMESTAMPTZ NULL,
+                error TEXT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_ydisk_outbox_pending ON ydisk_outbox(next_attempt_at, id) WHERE status IN ('queued', 'running')",
+        ],
+    ),
+    (
+        5,
+        "apartment_month_ledger",
+        [
+            # --- per-month meter ledger (materialized from meter_readings + tariffs, see core/ledger.py) ---
+            """
+            CREATE TABLE IF NOT EXISTS apartment_month_ledger (
+                apartment_id BIGINT NOT NULL REFERENCES apartments(id) ON DELETE CASCADE,
+                ym TEXT NOT NULL,
+                meters JSONB NOT NULL,   -- slot -> {current, previous, delta, source}
+                tariff JSONB NOT NULL,   -- global tariff per slot
+                rub JSONB NOT NULL,      -- slot -> rub by global tariff, plus total
+                accrual JSONB NOT NULL,  -- slot -> rub by apartment tariff (overrides applied)
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (apartment_id, ym)
+            );
+            """,
+        ],
+    ),
+    (
+        6,
+        "hot_path_indexes",
+        [
+            # previous reading of one meter: seek (apartment, meter) and walk ym backwards
+            "CREATE INDEX IF NOT EXISTS idx_meter_readings_meter_ym ON meter_readings(apartment_id, meter_type, meter_index, ym DESC)",
+            # latest photo of one meter in a month (admin photo, training capture); its apartment_id prefix
+            # also serves the plain apartment lookups, so the single-column index goes
+            "CREATE INDEX IF NOT EXISTS idx_photo_events_meter ON photo_events(apartment_id, ym, meter_kind, meter_index, created_at DESC)",
+            "DROP INDEX IF EXISTS idx_photo_events_apartment_id",
+            # planned upload path / pending blob of a photo event
+            "CREATE INDEX IF NOT EXISTS idx_ydisk_outbox_photo_event ON ydisk_outbox(photo_event_id, id DESC)",
+            # recent confirmed water values for OCR context: newest first, only rows the query can return
+            """
+            CREATE INDEX IF NOT EXISTS idx_ocr_training_samples_water_recent
+            ON ocr_training_samples(apartment_id, created_at DESC, id DESC)
+            WHERE meter_type IN ('cold','hot') AND meter_index=1 AND correct_value > 0
+            """,
+        ],
+    ),
+    (
+        7,
+        "notifications_notify",
+        [
+            # push channel for the admin bell (core/notifications.py): row events on insert, one event per
+            # statement for status updates and deletes (mark read, clear read)
+            """
+            CREATE OR REPLACE FUNCTION notifications_notify() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    PERFORM pg_notify('notifications', json_build_object('op', 'INSERT', 'id', NEW.id, 'type', NEW.type)::text);
+                    RETURN NEW;
+                END IF;
+                PERFORM pg_notify('notifications', json_build_object('op', TG_OP)::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS trg_notifications_insert_notify ON notifications",
+            "CREATE TRIGGER trg_notifications_insert_notify AFTER INSERT ON notifications FOR EACH ROW EXECUTE FUNCTION notifications_notify()",
+            "DROP TRIGGER IF EXISTS trg_notifications_change_notify ON notifications",
+            "CREATE TRIGGER trg_notifications_change_notify AFTER UPDATE OR DELETE ON notifications FOR EACH STATEMENT EXECUTE FUNCTION notifications_notify()",
+        ],
+    ),
+    (
+        8,
+        "keyset_pagination_indexes",
+        [
+            # admin listings page by keyset (core/pagination.py): each index matches its ORDER BY exactly,
+            # including the id tie-breaker, and replaces the narrower index it grew out of
+            "CREATE INDEX IF NOT EXISTS idx_photo_events_unassigned ON photo_events(id DESC) WHERE status='unassigned' AND apartment_id IS NULL",
+            "CREATE INDEX IF NOT EXISTS idx_notifications_created_id ON notifications(created_at DESC, id DESC)",
+            "DROP INDEX IF EXISTS idx_notifications_created_at",
+            # also serves the unread counter of the notification push channel (migration 7)
+            "CREATE INDEX IF NOT EXISTS idx_notifications_unread_created_id ON notifications(created_at DESC, id DESC) WHERE status='unread'",
+            "CREATE INDEX IF NOT EXISTS idx_apartment_rent_history_apartment_changed_id ON apartment_rent_history(apartment_id, changed_at DESC, id DESC)",
+            "DROP INDEX IF EXISTS idx_apartment_rent_history_apartment_changed",
+        ],
+    ),
+    (
+        9,
+        "ocr_template_feed",
+        [
+            # admin corrections are pushed to the OCR service template store (core/template_feed.py);
+            # existing samples start as pending, so past corrections are learned too
+            "ALTER TABLE ocr_training_samples ADD COLUMN IF NOT EXISTS template_state TEXT NOT NULL DEFAULT 'pending'",
+            "ALTER TABLE ocr_training_samples ADD COLUMN IF NOT EXISTS template_attempts INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE ocr_training_samples ADD COLUMN IF NOT EXISTS template_next_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            "ALTER TABLE ocr_training_samples ADD COLUMN IF NOT EXISTS template_error TEXT NULL",
+            "CREATE INDEX IF NOT EXISTS idx_ocr_training_samples_template_pending ON ocr_training_samples(template_next_at, id) WHERE template_state='pending'",
+            "CREATE INDEX IF NOT EXISTS idx_ocr_result_cache_file_sha256 ON ocr_result_cache(file_sha256)",
+        ],
+    ),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_schema_version(conn) -> int:
+    """Highest applied step, 0 for a database that has never been migrated."""
+    exists = conn.execute(text("SELECT to_regclass('schema_version') IS NOT NULL")).scalar()
+    if not exists:
+        return 0
+    return int(conn.execute(text("SELECT COALESCE(max(version), 0) FROM schema_version")).scalar() or 0)
+
+
+def pending_migrations(version: int) -> List[Migration]:
+    return [m for m in MIGRATIONS if m[0] > int(version)]
+
+
+def _apply_pending(conn) -> List[int]:
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """))
+    conn.commit()
+    # re-read under the lock: another process may have migrated while we waited
+    applied: List[int] = []
+    for version, name, statements in pending_migrations(current_schema_version(conn)):
+        try:
+            conn.execute(text("SET LOCAL lock_timeout = '3s'"))
+            conn.execute(text("SET LOCAL statement_timeout = '30s'"))
+            for sql in statements:
+                conn.execute(text(sql))
+            conn.execute(
+                text("INSERT INTO schema_version(version, name) VALUES(:v, :n)"),
+                {"v": int(version), "n": str(name)},
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("schema migration %s (%s) applied", version, name)
+        applied.append(int(version))
+    return applied
+
+
+def migrate(bind=None) -> List[int]:
+    """Apply pending steps; returns the versions applied (empty when the schema is current).
+
+    The up-to-date check is a single read without locks, so calling this on every boot is cheap.
+    """
+    bind = bind if bind is not None else engine
+    with bind.connect() as conn:
+        if current_schema_version(conn) >= SCHEMA_VERSION:
+            return []
+        conn.rollback()
+        # cross-process lock so concurrent workers/containers never run DDL at the same time
+        conn.execute(text("SET LOCAL lock_timeout = '30s'"))
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _SCHEMA_ADVISORY_LOCK_KEY})
+        conn.commit()
+        try:
+            return _apply_pending(conn)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _SCHEMA_ADVISORY_LOCK_KEY})
+            conn.commit()
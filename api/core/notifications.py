@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+import select
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+from core.config import engine, logger
+from core.db import db_ready
+
+# Push channel for the admin bell. A trigger on `notifications` (migration 7) sends pg_notify on every insert
+# and on status updates/deletes. Each API worker keeps one LISTEN connection in a background thread; on a
+# notification it recounts unread rows once and wakes the SSE/long-poll waiters, so idle dashboards cost no
+# queries at all. Without a live listener the counter falls back to a short TTL cache.
+# The change cursor (`seq`) is derived from the table itself, "<max id>:<unread count>", so it is the same in
+# every API worker and a long-poll may land on any of them.
+NOTIFY_CHANNEL = "notifications"
+NOTIFY_LISTEN_ENABLED = os.getenv("NOTIFY_LISTEN_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+NOTIFY_PING_SEC = max(5.0, float(os.getenv("NOTIFY_PING_SEC", "30")))
+NOTIFY_HEARTBEAT_SEC = max(1.0, float(os.getenv("NOTIFY_HEARTBEAT_SEC", "15")))
+NOTIFY_LONGPOLL_MAX_SEC = max(1.0, float(os.getenv("NOTIFY_LONGPOLL_MAX_SEC", "30")))
+UNREAD_COUNT_TTL_SEC = max(0.0, float(os.getenv("UNREAD_COUNT_TTL_SEC", "5")))
+
+_UNREAD_SQL = """
+    SELECT (SELECT COUNT(*) FROM notifications WHERE status='unread'),
+           (SELECT COALESCE(max(id), 0) FROM notifications)
+"""
+
+_LOCK = threading.Lock()
+_STATE: Dict[str, Any] = {"unread": None, "max_id": 0, "listening": False, "checked_at": 0.0, "last": None}
+# asyncio.Event -> loop it belongs to; the listener thread wakes them with call_soon_threadsafe
+_SUBSCRIBERS: Dict[asyncio.Event, asyncio.AbstractEventLoop] = {}
+_STOP = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+
+
+def _cursor(unread: Optional[int], max_id: int) -> Optional[str]:
+    return None if unread is None else f"{int(max_id)}:{int(unread)}"
+
+
+def snapshot() -> Dict[str, Any]:
+    with _LOCK:
+        return {
+            "unread_count": _STATE["unread"],
+            "seq": _cursor(_STATE["unread"], _STATE["max_id"]),
+            "last": _STATE["last"],
+        }
+
+
+def _publish(unread: int, max_id: int, last: Optional[Dict[str, Any]] = None) -> None:
+    """Store a fresh count; wake subscribers when it changed or a new notification arrived."""
+    with _LOCK:
+        changed = _STATE["unread"] != unread or _STATE["max_id"] != max_id
+        _STATE.update(unread=int(unread), max_id=int(max_id), checked_at=time.monotonic())
+        if not changed:
+            return
+        _STATE["last"] = last
+        subs = list(_SUBSCRIBERS.items())
+    for ev, loop in subs:
+        try:
+            loop.call_soon_threadsafe(ev.set)
+        except RuntimeError:
+            pass  # loop closed: the subscriber is going away
+
+
+def invalidate_unread_count() -> None:
+    """Drop the cached count (after a write in this process) so the next read sees it immediately."""
+    with _LOCK:
+        _STATE["unread"] = None
+
+
+def unread_count(conn) -> int:
+    with _LOCK:
+        n = _STATE["unread"]
+        fresh = _STATE["listening"] or time.monotonic() - _STATE["checked_at"] < UNREAD_COUNT_TTL_SEC
+        if n is not None and fresh:
+            return int(n)
+    row = conn.execute(text(_UNREAD_SQL)).fetchone()
+    n = int(row[0] or 0)
+    _publish(n, int(row[1] or 0))
+    return n
+
+
+def subscribe() -> asyncio.Event:
+    ev = asyncio.Event()
+    with _LOCK:
+        _SUBSCRIBERS[ev] = asyncio.get_running_loop()
+    return ev
+
+
+def unsubscribe(ev: asyncio.Event) -> None:
+    with _LOCK:
+        _SUBSCRIBERS.pop(ev, None)
+
+
+def _parse_payload(payload: str) -> Dict[str, Any]:
+    try:
+        data = json.loads(payload or "{}")
+    except Exception:
+        data = {}
+    return data if isinstance(data, dict) else {}
+
+
+def _listen_once() -> None:
+    raw = engine.raw_connection()
+    # dedicated connection for the process lifetime: keep it out of the request pool
+    raw.detach()
+    try:
+        dbapi = raw.driver_connection
+        dbapi.autocommit = True
+        cur = dbapi.cursor()
+        cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        cur.execute(_UNREAD_SQL)
+        with _LOCK:
+            _STATE["listening"] = True
+        row = cur.fetchone()
+        _publish(int(row[0] or 0), int(row[1] or 0))
+        logger.info("notification listener started")
+        while not _STOP.is_set():
+            ready, _, _ = select.select([dbapi], [], [], NOTIFY_PING_SEC)
+            if not ready:
+                cur.execute("SELECT 1")  # detects a dead connection while idle
+                continue
+            dbapi.poll()
+            last = None
+            while dbapi.notifies:
+                last = _parse_payload(dbapi.notifies.pop(0).payload)
+            if last is not None:
+                # a burst of notifications costs one count
+                cur.execute(_UNREAD_SQL)
+                row = cur.fetchone()
+                _publish(int(row[0] or 0), int(row[1] or 0), last)
+    finally:
+        with _LOCK:
+            _STATE["listening"] = False
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+def _listen_loop() -> None:
+    backoff = 1.0
+    while not _STOP.is_set():
+        started = time.monotonic()
+        try:
+            _listen_once()
+        except Exception as e:
+            logger.warning("notification listener failed: %s", e)
+        if time.monotonic() - started > 60:
+            backoff = 1.0
+        _STOP.wait(backoff)
+        backoff = min(30.0, backoff * 2)
+
+
+def start_notification_listener() -> None:
+    global _THREAD
+    if not (NOTIFY_LISTEN_ENABLED and db_ready()):
+        return
+    with _LOCK:
+        if _THREAD is not None and _THREAD.is_alive():
+            return
+        _STOP.clear()
+        _THREAD = threading.Thread(target=_listen_loop, name="notify-listener", daemon=True)
+        _THREAD.start()
+
+
+def _current_count() -> int:
+    with engine.connect() as conn:
+        return unread_count(conn)
+
+
+async def _count_snapshot() -> Dict[str, Any]:
+    from starlette.concurrency import run_in_threadpool
+
+    snap = snapshot()
+    if snap["unread_count"] is None or not _STATE["listening"]:
+        await run_in_threadpool(_current_count)
+        snap = snapshot()
+    return snap
+
+
+async def wait_for_change(since_seq: Optional[str], timeout: float) -> Dict[str, Any]:
+    """Long-poll: return as soon as seq differs from since_seq, or after timeout."""
+    ev = subscribe()
+    try:
+        snap = await _count_snapshot()
+        if since_seq is None or snap["seq"] != str(since_seq):
+            return snap
+        try:
+            await asyncio.wait_for(ev.wait(), timeout=max(0.0, min(float(timeout), NOTIFY_LONGPOLL_MAX_SEC)))
+        except asyncio.TimeoutError:
+            pass
+        return await _count_snapshot()
+    finally:
+        unsubscribe(ev)
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def event_stream(request):
+    """SSE body: one `unread` event per change, a comment line as heartbeat."""
+    ev = subscribe()
+    try:
+        sent_seq = None
+        while not await request.is_disconnected():
+            ev.clear()
+            snap = await _count_snapshot()
+            if snap["seq"] != sent_seq:
+                sent_seq = snap["seq"]
+                yield _sse("unread", snap)
+            try:
+                await asyncio.wait_for(ev.wait(), timeout=NOTIFY_HEARTBEAT_SEC)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+    finally:
+        unsubscribe(ev)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+from sqlalchemy import text
+
+from core.config import OCR_URL, logger
+
+OCR_RESULT_CACHE_ENABLED = os.getenv("OCR_RESULT_CACHE_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+OCR_PIPELINE_VERSION_TTL_SEC = float(os.getenv("OCR_PIPELINE_VERSION_TTL_SEC", "60"))
+
+_VERSION_LOCK = threading.Lock()
+_VERSION_CACHE: dict = {"value": None, "ts": 0.0}
+_LAST_PURGED_VERSION: Optional[str] = None
+
+
+def _ocr_health_url() -> str:
+    url = str(OCR_URL or "").strip().rstrip("/")
+    if url.endswith("/recognize"):
+        return url[: -len("/recognize")] + "/health"
+    return url + "/health"
+
+
+def get_ocr_pipeline_version() -> Optional[str]:
+    """
+    Pipeline fingerprint reported by the OCR service (/health -> pipeline_version).
+    It changes when OCR code version, models or template DBs change, which invalidates cached results.
+    Returns None when the service is unreachable: callers must not use the cache then.
+    """
+    now = time.monotonic()
+    with _VERSION_LOCK:
+        if _VERSION_CACHE["value"] and (now - float(_VERSION_CACHE["ts"])) < OCR_PIPELINE_VERSION_TTL_SEC:
+            return str(_VERSION_CACHE["value"])
+    try:
+        r = requests.get(_ocr_health_url(), timeout=(2, 3))
+        version = (r.json() or {}).get("pipeline_version") if r.ok else None
+    except Exception as e:
+        logger.warning("ocr pipeline version lookup failed: %s", e)
+        version = None
+    with _VERSION_LOCK:
+        _VERSION_CACHE["value"] = str(version) if version else None
+        _VERSION_CACHE["ts"] = now
+    return str(version) if version else None
+
+
+def ocr_result_cache_key(
+    file_sha256: str,
+    *,
+    context_prev_water: Optional[str],
+    context_serial_hint: Optional[str],
+    pipeline_version: str,
+) -> str:
+    h = hashlib.sha256()
+    for part in (file_sha256, context_prev_water or "", context_serial_hint or "", pipeline_version):
+        h.update(str(part).encode("utf-8", "ignore"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def get_cached_ocr_result(conn, cache_key: str) -> Optional[dict]:
+    row = conn.execute(
+        text(
+            """
+            UPDATE ocr_result_cache
+            SET hits = hits + 1, last_hit_at = now()
+            WHERE cache_key = :k
+            RETURNING result_json
+            """
+        ),
+        {"k": str(cache_key)},
+    ).fetchone()
+    if not row:
+        return None
+    val = row[0]
+    if isinstance(val, str):
+        try:
+            val = json.loads(val)
+        except Exception:
+            return None
+    return dict(val) if isinstance(val, dict) else None
+
+
+def put_cached_ocr_result(
+    conn,
+    *,
+    cache_key: str,
+    file_sha256: str,
+    pipeline_version: str,
+    result: dict,
+) -> None:
+    global _LAST_PURGED_VERSION
+    if not isinstance(result, dict):
+        return
+    # A new pipeline version makes every older row unreachable; drop them once per version.
+    if _LAST_PURGED_VERSION != pipeline_version:
+        conn.execute(
+            text("DELETE FROM ocr_result_cache WHERE pipeline_version <> :v"),
+            {"v": str(pipeline_version)},
+        )
+        _LAST_PURGED_VERSION = pipeline_version
+    conn.execute(
+        text(
+            """
+            INSERT INTO ocr_result_cache(cache_key, file_sha256, pipeline_version, result_json)
+            VALUES(:k, :sha, :v, CAST(:res AS JSONB))
+            ON CONFLICT (cache_key) DO UPDATE
+            SET result_json = EXCLUDED.result_json, created_at = now()
+            """
+        ),
+        {
+            "k": str(cache_key),
+            "sha": str(file_sha256),
+            "v": str(pipeline_version),
+            "res": json.dumps(result, ensure_ascii=False),
+        },
+    )
+
+
+def invalidate_cached_ocr_results(conn, file_sha256: str) -> None:
+    """Drop every cached result of one photo (e.g. after its correction was learned by the OCR service)."""
+    conn.execute(text("DELETE FROM ocr_result_cache WHERE file_sha256 = :sha"), {"sha": str(file_sha256)})
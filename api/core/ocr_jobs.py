@@ -0,0 +1,290 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import text
+
+from core.config import engine, logger
+from core.db import db_ready, ensure_tables
+
+# Durable photo/OCR job queue (Postgres). The API acknowledges a photo as soon as it is stored here;
+# worker threads in every API process drain the queue with FOR UPDATE SKIP LOCKED.
+# The running worker renews its lease, and every update is fenced on (id, attempts) so a worker that lost
+# the job cannot touch it. The handler's writes commit together with written_at (mark_photo_job_written);
+# a job that got that far is never re-run, since photo_events, meter_readings and the Telegram message
+# are not idempotent.
+OCR_JOB_WORKERS = max(0, min(16, int(os.getenv("OCR_JOB_WORKERS", "2"))))
+OCR_JOB_POLL_SEC = max(0.2, float(os.getenv("OCR_JOB_POLL_SEC", "1.0")))
+OCR_JOB_LEASE_SEC = max(30, int(os.getenv("OCR_JOB_LEASE_SEC", "300")))
+OCR_JOB_MAX_ATTEMPTS = max(1, min(10, int(os.getenv("OCR_JOB_MAX_ATTEMPTS", "3"))))
+
+_WORKERS_LOCK = threading.Lock()
+_WORKERS: list[threading.Thread] = []
+
+
+class PhotoJobLost(RuntimeError):
+    """The job was re-claimed or already written by another run; the current run must stop without writing."""
+
+
+def enqueue_photo_job(fields: dict, photo_payloads: list[dict]) -> int:
+    ensure_tables()
+    with engine.begin() as conn:
+        row = conn.execute(
+            text(
+                """
+                INSERT INTO ocr_jobs(trace_id, chat_id, fields_json)
+                VALUES(:trace_id, :chat_id, CAST(:fields AS JSONB))
+                RETURNING id
+                """
+            ),
+            {
+                "trace_id": str(fields.get("trace_id") or ""),
+                "chat_id": str(fields.get("chat_id") or "unknown"),
+                "fields": json.dumps(fields, ensure_ascii=False, default=str),
+            },
+        ).fetchone()
+        job_id = int(row[0])
+        for idx, p in enumerate(photo_payloads):
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO ocr_job_files(job_id, idx, filename, mime, blob)
+                    VALUES(:job_id, :idx, :filename, :mime, :blob)
+                    """
+                ),
+                {
+                    "job_id": job_id,
+                    "idx": int(idx),
+                    "filename": str(p.get("filename") or "photo.jpg"),
+                    "mime": str(p.get("mime") or "image/jpeg"),
+                    "blob": bytes(p["blob"]),
+                },
+            )
+    logger.info("ocr_job queued job_id=%s trace_id=%s files=%s", job_id, fields.get("trace_id"), len(photo_payloads))
+    return job_id
+
+
+def get_photo_job(job_id: int) -> Optional[dict]:
+    with engine.begin() as conn:
+        row = conn.execute(
+            text(
+                """
+                SELECT id, status, trace_id, chat_id, attempts, error, result_json,
+                       created_at, started_at, finished_at
+                FROM ocr_jobs
+                WHERE id=:id
+                """
+            ),
+            {"id": int(job_id)},
+        ).mappings().first()
+    if not row:
+        return None
+    return {
+        "job_id": int(row["id"]),
+        "status": str(row["status"]),
+        "trace_id": row["trace_id"],
+        "chat_id": row["chat_id"],
+        "attempts": int(row["attempts"] or 0),
+        "error": row["error"],
+        "result": row["result_json"],
+        "created_at": row["created_at"].isoformat() if row["created_at"] else None,
+        "started_at": row["started_at"].isoformat() if row["started_at"] else None,
+        "finished_at": row["finished_at"].isoformat() if row["finished_at"] else None,
+    }
+
+
+def claim_photo_job() -> Optional[dict]:
+    """Take the oldest queued job (or one whose worker lease expired, e.g. after an API restart)."""
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                UPDATE ocr_jobs
+                SET status='failed', error='lease_expired', finished_at=now(), lease_until=NULL
+                WHERE status='running' AND lease_until < now()
+                  AND (attempts >= :max_attempts OR written_at IS NOT NULL)
+                """
+            ),
+            {"max_attempts": int(OCR_JOB_MAX_ATTEMPTS)},
+        )
+        row = conn.execute(
+            text(
+                """
+                UPDATE ocr_jobs
+                SET status='running',
+                    attempts = attempts + 1,
+                    started_at = now(),
+                    lease_until = now() + make_interval(secs => :lease)
+                WHERE id = (
+                    SELECT id FROM ocr_jobs
+                    WHERE status='queued'
+                       OR (status='running' AND lease_until < now() AND attempts < :max_attempts AND written_at IS NULL)
+                    ORDER BY id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, attempts, fields_json
+                """
+            ),
+            {"lease": int(OCR_JOB_LEASE_SEC), "max_attempts": int(OCR_JOB_MAX_ATTEMPTS)},
+        ).mappings().first()
+        if not row:
+            return None
+        files = conn.execute(
+            text("SELECT filename, mime, blob FROM ocr_job_files WHERE job_id=:id ORDER BY idx"),
+            {"id": int(row["id"])},
+        ).mappings().all()
+    fields = row["fields_json"]
+    if isinstance(fields, str):
+        fields = json.loads(fields)
+    return {
+        "id": int(row["id"]),
+        "attempts": int(row["attempts"]),
+        "fields": dict(fields or {}),
+        "photos": [
+            {"blob": bytes(f["blob"]), "filename": f["filename"], "mime": f["mime"]}
+            for f in files
+        ],
+    }
+
+
+def renew_photo_job_lease(job_id: int, *, attempts: int) -> bool:
+    """Extend the lease of a job this run still owns; False when it was taken over or finished."""
+    with engine.begin() as conn:
+        row = conn.execute(
+            text(
+                """
+                UPDATE ocr_jobs
+                SET lease_until = now() + make_interval(secs => :lease)
+                WHERE id=:id AND attempts=:attempts AND status='running'
+                RETURNING id
+                """
+            ),
+            {"id": int(job_id), "attempts": int(attempts), "lease": int(OCR_JOB_LEASE_SEC)},
+        ).fetchone()
+    return row is not None
+
+
+def mark_photo_job_written(conn, job_id: int, *, attempts: int) -> None:
+    """
+    Run inside the handler's write transaction: commits atomically with its rows, so a retry can tell
+    whether they exist. Raises PhotoJobLost when another run owns the job or has already written it.
+    """
+    row = conn.execute(
+        text(
+            """
+            UPDATE ocr_jobs
+            SET written_at = now()
+            WHERE id=:id AND attempts=:attempts AND status='running' AND written_at IS NULL
+            RETURNING id
+            """
+        ),
+        {"id": int(job_id), "attempts": int(attempts)},
+    ).fetchone()
+    if row is None:
+        raise PhotoJobLost(f"ocr job {int(job_id)} attempt {int(attempts)} no longer owns the job")
+
+
+def complete_photo_job(job_id: int, result: dict, *, attempts: int) -> None:
+    with engine.begin() as conn:
+        row = conn.execute(
+            text(
+                """
+                UPDATE ocr_jobs
+                SET status='done', finished_at=now(), lease_until=NULL, error=NULL,
+                    result_json=CAST(:result AS JSONB)
+                WHERE id=:id AND attempts=:attempts AND status='running'
+                RETURNING id
+                """
+            ),
+            {"id": int(job_id), "attempts": int(attempts), "result": json.dumps(result, ensure_ascii=False, default=str)},
+        ).fetchone()
+        if row is None:
+            return
+        # Photo bytes live on in photo_events / Yandex Disk; the queue copy is no longer needed.
+        conn.execute(text("DELETE FROM ocr_job_files WHERE job_id=:id"), {"id": int(job_id)})
+
+
+def fail_photo_job(job_id: int, error: str, *, attempts: int) -> None:
+    """Requeue a failed run, unless it was the last attempt or its writes already committed."""
+    with engine.begin() as conn:
+        row = conn.execute(
+            text(
+                """
+                UPDATE ocr_jobs
+                SET status = CASE WHEN :last OR written_at IS NOT NULL THEN 'failed' ELSE 'queued' END,
+                    error=:error, lease_until=NULL,
+                    finished_at = CASE WHEN :last OR written_at IS NOT NULL THEN now() ELSE NULL END
+                WHERE id=:id AND attempts=:attempts AND status='running'
+                RETURNING status
+                """
+            ),
+            {
+                "id": int(job_id),
+                "attempts": int(attempts),
+                "error": str(error)[:2000],
+                "last": int(attempts) >= OCR_JOB_MAX_ATTEMPTS,
+            },
+        ).fetchone()
+        if row is not None and row[0] == "failed":
+            conn.execute(text("DELETE FROM ocr_job_files WHERE job_id=:id"), {"id": int(job_id)})
+
+
+def _keep_lease(job: dict, stop: threading.Event) -> None:
+    while not stop.wait(OCR_JOB_LEASE_SEC / 3.0):
+        try:
+            if not renew_photo_job_lease(job["id"], attempts=job["attempts"]):
+                return
+        except Exception:
+            logger.exception("ocr_job lease renew failed job_id=%s", job["id"])
+
+
+def run_photo_job(handler: Callable[[dict, list[dict], dict], dict], job: dict) -> None:
+    """Run one claimed job with its lease renewed in the background until the handler returns."""
+    stop = threading.Event()
+    keeper = threading.Thread(target=_keep_lease, args=(job, stop), name=f"ocr-job-lease-{job['id']}", daemon=True)
+    keeper.start()
+    t0 = time.monotonic()
+    try:
+        result = handler(job["fields"], job["photos"], job)
+        complete_photo_job(job["id"], result, attempts=job["attempts"])
+        logger.info("ocr_job done job_id=%s elapsed_ms=%s", job["id"], int((time.monotonic() - t0) * 1000))
+    except PhotoJobLost as e:
+        logger.warning("ocr_job dropped job_id=%s attempt=%s: %s", job["id"], job["attempts"], e)
+    except Exception as e:
+        logger.exception("ocr_job failed job_id=%s attempt=%s", job["id"], job["attempts"])
+        try:
+            fail_photo_job(job["id"], str(e), attempts=job["attempts"])
+        except Exception:
+            logger.exception("ocr_job fail-mark failed job_id=%s", job["id"])
+    finally:
+        stop.set()
+
+
+def _worker_loop(handler: Callable[[dict, list[dict], dict], dict]) -> None:
+    while True:
+        try:
+            job = claim_photo_job()
+        except Exception:
+            logger.exception("ocr_job claim failed")
+            time.sleep(OCR_JOB_POLL_SEC * 5)
+            continue
+        if job is None:
+            time.sleep(OCR_JOB_POLL_SEC)
+            continue
+        run_photo_job(handler, job)
+
+
+def start_photo_job_workers(handler: Callable[[dict, list[dict], dict], dict]) -> None:
+    """Start OCR_JOB_WORKERS daemon threads once per process."""
+    if not db_ready() or OCR_JOB_WORKERS <= 0:
+        return
+    with _WORKERS_LOCK:
+        if _WORKERS:
+            return
+        for i in range(OCR_JOB_WORKERS):
+            t = threading.Thread(target=_worker_loop, args=(handler,), name=f"ocr-job-{i}", daemon=True)
+            t.start()
+            _WORKERS.append(t)
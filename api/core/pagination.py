@@ -0,0 +1,64 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+# Keyset pagination for admin listings. A cursor is an opaque token with the sort key of the last row of the
+# previous page (e.g. [created_at, id]); the next page is `WHERE (created_at, id) < (:c0, :c1)` on the same
+# ORDER BY, which an index walks directly instead of counting past OFFSET rows. The endpoint name is part of
+# the token so a cursor cannot be replayed against another listing.
+
+
+def _jsonable(v: Any) -> Any:
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+def encode_cursor(kind: str, values: Sequence[Any]) -> str:
+    raw = json.dumps({"k": kind, "v": [_jsonable(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def cursor_ts(v: Any) -> datetime:
+    """Timestamp part of a cursor; strings only, so a crafted number is rejected like any other garbage."""
+    if not isinstance(v, str):
+        raise ValueError("cursor timestamp must be a string")
+    return datetime.fromisoformat(v)
+
+
+def cursor_id(v: Any) -> int:
+    if isinstance(v, bool) or not isinstance(v, int):
+        raise ValueError("cursor id must be an integer")
+    return v
+
+
+def decode_cursor(cursor: Optional[str], kind: str, types: Sequence[Callable[[Any], Any]]) -> Optional[List[Any]]:
+    """
+    Typed sort key from a cursor (None when there is none): one converter per key part, e.g. (cursor_ts, cursor_id).
+    400 invalid_cursor for foreign, broken or mistyped tokens.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(str(cursor) + "=" * (-len(str(cursor)) % 4))
+        data = json.loads(raw.decode("utf-8"))
+        values = data["v"]
+        if data.get("k") != kind or not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("cursor mismatch")
+        return [conv(v) for conv, v in zip(types, values)]
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid_cursor")
+
+
+def keyset_page(
+    rows: Sequence[Any],
+    limit: int,
+    kind: str,
+    key: Callable[[Any], Tuple[Any, ...]],
+) -> Tuple[List[Any], Optional[str]]:
+    """Split limit+1 fetched rows into the page and the cursor of the next one (None on the last page)."""
+    items = list(rows[:limit])
+    if len(rows) <= limit or not items:
+        return items, None
+    return items, encode_cursor(kind, key(items[-1]))
@@ -0,0 +1,111 @@
+import os
+import re
+import threading
+import uuid
+from typing import Optional
+
+from core.config import logger
+
+# Content-addressed local cache of meter photos (key = photo_events.file_sha256).
+# Written at ingest, read by the admin UI photo endpoint; LRU by file mtime, bounded by total size.
+PHOTO_CACHE_DIR = os.getenv("PHOTO_CACHE_DIR", "/app/cache/photos").strip()
+try:
+    PHOTO_CACHE_MAX_BYTES = int(float(os.getenv("PHOTO_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+except Exception:
+    PHOTO_CACHE_MAX_BYTES = 2048 * 1024 * 1024
+PHOTO_CACHE_MAX_BYTES = max(16 * 1024 * 1024, PHOTO_CACHE_MAX_BYTES)
+# The photo URL is per apartment/month/meter, so its content can change; clients revalidate by ETag.
+PHOTO_CACHE_CONTROL = os.getenv("PHOTO_CACHE_CONTROL", "private, max-age=60").strip()
+
+_SHA_RE = re.compile(r"^[0-9a-f]{64}$")
+_LOCK = threading.Lock()
+_STATE: dict = {"total_bytes": None}
+
+
+def _blob_path(sha: str) -> Optional[str]:
+    sha = str(sha or "").strip().lower()
+    if not PHOTO_CACHE_DIR or not _SHA_RE.match(sha):
+        return None
+    return os.path.join(PHOTO_CACHE_DIR, sha[:2], sha)
+
+
+def _scan() -> list[tuple[float, int, str]]:
+    out = []
+    for root, _dirs, files in os.walk(PHOTO_CACHE_DIR):
+        for name in files:
+            if not _SHA_RE.match(name):
+                continue
+            p = os.path.join(root, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            out.append((st.st_mtime, st.st_size, p))
+    return out
+
+
+def _total_bytes_locked() -> int:
+    if _STATE["total_bytes"] is None:
+        _STATE["total_bytes"] = sum(size for _mt, size, _p in _scan())
+    return int(_STATE["total_bytes"])
+
+
+def _evict_locked() -> None:
+    if _total_bytes_locked() <= PHOTO_CACHE_MAX_BYTES:
+        return
+    target = int(PHOTO_CACHE_MAX_BYTES * 0.9)
+    entries = sorted(_scan())
+    total = sum(size for _mt, size, _p in entries)
+    for _mt, size, p in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(p)
+            total -= size
+        except OSError:
+            continue
+    _STATE["total_bytes"] = total
+
+
+def photo_cache_get(sha: str) -> Optional[bytes]:
+    p = _blob_path(sha)
+    if not p:
+        return None
+    try:
+        with open(p, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(p, None)  # LRU: a hit makes the entry recent
+    except OSError:
+        pass
+    return data
+
+
+def photo_cache_put(sha: str, content: bytes) -> bool:
+    p = _blob_path(sha)
+    if not p or not content:
+        return False
+    if os.path.exists(p):
+        try:
+            os.utime(p, None)
+        except OSError:
+            pass
+        return True
+    try:
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(bytes(content))
+        os.replace(tmp, p)
+    except OSError as e:
+        logger.warning("photo_cache put failed sha=%s: %s", sha, e)
+        return False
+    with _LOCK:
+        if _STATE["total_bytes"] is None:
+            _total_bytes_locked()  # first scan already sees the new file
+        else:
+            _STATE["total_bytes"] += len(content)
+        _evict_locked()
+    return True
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text
+
+from core.billing import calc_bills
+from core.ledger import LEDGER_SLOTS
+
+# Building overview: many apartments x a month range in one response, with only the requested fields.
+# Every field is loaded with one query over the whole (apartment_ids, ym range) box (bills via calc_bills,
+# which is itself a fixed number of queries), so the cost does not grow with the number of apartments.
+
+PORTFOLIO_FIELDS = ("readings", "deltas", "bill", "flags", "statuses")
+PORTFOLIO_MAX_APARTMENTS = max(1, min(5000, int(os.getenv("PORTFOLIO_MAX_APARTMENTS", "500"))))
+PORTFOLIO_MAX_MONTHS = 36
+
+
+def parse_fields(raw: Optional[str]) -> Tuple[str, ...]:
+    """Comma-separated field names in PORTFOLIO_FIELDS order (all when empty); ValueError on unknown names."""
+    names = {x.strip() for x in (raw or "").split(",") if x.strip()}
+    unknown = sorted(names - set(PORTFOLIO_FIELDS))
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return tuple(f for f in PORTFOLIO_FIELDS if not names or f in names)
+
+
+def _load_apartments(conn, ids: Sequence[int]) -> List[Tuple[int, Any]]:
+    if ids:
+        rows = conn.execute(
+            text("SELECT id, title FROM apartments WHERE id = ANY(:ids) ORDER BY id"),
+            {"ids": list(ids)},
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            text("SELECT id, title FROM apartments ORDER BY id LIMIT :lim"),
+            {"lim": PORTFOLIO_MAX_APARTMENTS},
+        ).fetchall()
+    return [(int(r[0]), r[1]) for r in rows]
+
+
+def _load_ledger(conn, ids: Sequence[int], ym_from: str, ym_to: str) -> Dict[Tuple[int, str], Dict[str, Any]]:
+    rows = conn.execute(
+        text(
+            """
+            SELECT apartment_id, ym, meters
+            FROM apartment_month_ledger
+            WHERE apartment_id = ANY(:ids) AND ym BETWEEN :ym_from AND :ym_to
+            """
+        ),
+        {"ids": list(ids), "ym_from": ym_from, "ym_to": ym_to},
+    ).fetchall()
+    return {(int(r[0]), str(r[1])): (r[2] or {}) for r in rows}
+
+
+def _load_flags(conn, ids: Sequence[int], ym_from: str, ym_to: str) -> Dict[Tuple[int, str], List[Dict[str, Any]]]:
+    rows = conn.execute(
+        text(
+            """
+            SELECT id, apartment_id, ym, meter_type, meter_index, reason, created_at
+            FROM meter_review_flags
+            WHERE apartment_id = ANY(:ids) AND ym BETWEEN :ym_from AND :ym_to AND status='open'
+            ORDER BY created_at DESC, id DESC
+            """
+        ),
+        {"ids": list(ids), "ym_from": ym_from, "ym_to": ym_to},
+    ).mappings().all()
+    out: Dict[Tuple[int, str], List[Dict[str, Any]]] = {}
+    for r in rows:
+        out.setdefault((int(r["apartment_id"]), str(r["ym"])), []).append(
+            {
+                "id": int(r["id"]),
+                "meter_type": r["meter_type"],
+                "meter_index": int(r["meter_index"] or 1),
+                "reason": r["reason"],
+                "created_at": (r["created_at"].isoformat() if r["created_at"] else None),
+            }
+        )
+    return out
+
+
+def _load_statuses(conn, ids: Sequence[int], ym_from: str, ym_to: str) -> Dict[Tuple[int, str], Dict[str, Any]]:
+    rows = conn.execute(
+        text(
+            """
+            SELECT apartment_id, ym, rent_paid, meters_photo, meters_paid, bill_approved_at, bill_sent_at
+            FROM apartment_month_statuses
+            WHERE apartment_id = ANY(:ids) AND ym BETWEEN :ym_from AND :ym_to
+            """
+        ),
+        {"ids": list(ids), "ym_from": ym_from, "ym_to": ym_to},
+    ).mappings().all()
+    out: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    for r in rows:
+        out[(int(r["apartment_id"]), str(r["ym"]))] = {
+            "rent_paid": bool(r["rent_paid"]),
+            "meters_photo": bool(r["meters_photo"]),
+            "meters_paid": bool(r["meters_paid"]),
+            "bill_approved_at": (r["bill_approved_at"].isoformat() if r["bill_approved_at"] else None),
+            "bill_sent_at": (r["bill_sent_at"].isoformat() if r["bill_sent_at"] else None),
+        }
+    return out
+
+
+_EMPTY_STATUSES = {
+    "rent_paid": False,
+    "meters_photo": False,
+    "meters_paid": False,
+    "bill_approved_at": None,
+    "bill_sent_at": None,
+}
+
+
+def meter_values(meters: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """slot -> ledger value (current or delta); sewer delta is cold + hot, as in the dashboard table."""
+    out = {slot: (meters.get(slot) or {}).get(key) for slot in LEDGER_SLOTS}
+    if key == "delta" and out["cold"] is not None and out["hot"] is not None:
+        out["sewer"] = out["cold"] + out["hot"]
+    return out
+
+
+def build_portfolio(conn, apartment_ids: Iterable[int], months: List[str], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    """Per apartment: {apartment_id, title, months: [{ym, <field>: ...}]} with only the requested fields."""
+    apartments = _load_apartments(conn, list(dict.fromkeys(int(a) for a in apartment_ids)))
+    ids = [aid for aid, _ in apartments]
+    if not ids or not months:
+        return [{"apartment_id": aid, "title": title, "months": []} for aid, title in apartments]
+
+    ym_from, ym_to = months[0], months[-1]
+    ledger = _load_ledger(conn, ids, ym_from, ym_to) if ("readings" in fields or "deltas" in fields) else {}
+    bills = calc_bills(conn, ids, months) if "bill" in fields else {}
+    flags = _load_flags(conn, ids, ym_from, ym_to) if "flags" in fields else {}
+    statuses = _load_statuses(conn, ids, ym_from, ym_to) if "statuses" in fields else {}
+
+    items = []
+    for aid, title in apartments:
+        rows = []
+        for ym in months:
+            key = (aid, ym)
+            row: Dict[str, Any] = {"ym": ym}
+            if "readings" in fields:
+                row["readings"] = meter_values(ledger.get(key) or {}, "current")
+            if "deltas" in fields:
+                row["deltas"] = meter_values(ledger.get(key) or {}, "delta")
+            if "bill" in fields:
+                row["bill"] = bills.get(key)
+            if "flags" in fields:
+                row["flags"] = flags.get(key, [])
+            if "statuses" in fields:
+                row["statuses"] = statuses.get(key, dict(_EMPTY_STATUSES))
+            rows.append(row)
+        items.append({"apartment_id": aid, "title": title, "months": rows})
+    return items
+
+
+def encode_body(payload: Dict[str, Any]) -> Tuple[bytes, str]:
+    """Compact JSON body and its weak ETag (hash of the body, so any visible change yields a new tag)."""
+    body = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, 'W/"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # If-None-Match uses weak comparison: W/"x" and "x" are the same tag
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return "*" in tags or any((t[2:] if t.startswith("W/") else t) == bare for t in tags)
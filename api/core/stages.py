@@ -0,0 +1,49 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+# Blocking stages of photo processing (OCR HTTP, Yandex Disk WebDAV, DB) must not run on the event loop.
+# Whole photo events run in a dedicated executor; each external stage has its own concurrency cap so a
+# slow OCR or WebDAV backend cannot take all workers (DB is capped by the engine pool, see core.config).
+PHOTO_EVENT_WORKERS = max(1, min(32, int(os.getenv("PHOTO_EVENT_WORKERS", "4"))))
+PHOTO_EVENT_MAX_PENDING = max(1, min(1024, int(os.getenv("PHOTO_EVENT_MAX_PENDING", "32"))))
+OCR_STAGE_CONCURRENCY = max(1, min(32, int(os.getenv("OCR_STAGE_CONCURRENCY", "4"))))
+YDISK_STAGE_CONCURRENCY = max(1, min(16, int(os.getenv("YDISK_STAGE_CONCURRENCY", "2"))))
+
+_PHOTO_EVENT_EXECUTOR = ThreadPoolExecutor(max_workers=PHOTO_EVENT_WORKERS, thread_name_prefix="photo-event")
+_PENDING_LOCK = threading.Lock()
+_PENDING = 0
+
+# Thread-level semaphores: they are taken inside executor / job-worker threads, never on the loop.
+ocr_stage = threading.BoundedSemaphore(OCR_STAGE_CONCURRENCY)
+ydisk_stage = threading.BoundedSemaphore(YDISK_STAGE_CONCURRENCY)
+
+
+async def run_photo_stage(fn, *args, **kwargs):
+    """Run blocking fn in the photo-event executor; 503 when the backlog is full."""
+    global _PENDING
+    with _PENDING_LOCK:
+        if _PENDING >= PHOTO_EVENT_MAX_PENDING:
+            raise HTTPException(status_code=503, detail="photo_event_busy")
+        _PENDING += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_PHOTO_EVENT_EXECUTOR, functools.partial(fn, *args, **kwargs))
+    finally:
+        with _PENDING_LOCK:
+            _PENDING -= 1
+
+
+def stage_stats() -> dict:
+    with _PENDING_LOCK:
+        pending = _PENDING
+    return {
+        "photo_event_pending": pending,
+        "photo_event_workers": PHOTO_EVENT_WORKERS,
+        "ocr_stage_concurrency": OCR_STAGE_CONCURRENCY,
+        "ydisk_stage_concurrency": YDISK_STAGE_CONCURRENCY,
+    }
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+# In-process tariff timeline: global `tariffs` and per-apartment `apartment_tariffs`, each kept as a list
+# sorted by month_from and resolved with bisect ("latest month_from <= ym").
+# Writes in this process call invalidate_tariffs(); other API workers notice changes through a cheap
+# count/max(updated_at) probe once the entry is older than TARIFF_CACHE_TTL_SEC.
+TARIFF_CACHE_TTL_SEC = max(0, min(3600, int(os.getenv("TARIFF_CACHE_TTL_SEC", "30"))))
+
+_LOCK = threading.Lock()
+_STATE: Dict[str, Any] = {"timeline": None, "version": None, "checked_at": 0.0}
+
+
+def _f(v) -> Optional[float]:
+    return float(v) if v is not None else None
+
+
+def _global_row(row) -> Dict[str, Any]:
+    # electric_t* already COALESCE'd with the base electric tariff by the query
+    return {
+        "month_from": str(row["month_from"]),
+        "cold": float(row["cold"]),
+        "hot": float(row["hot"]),
+        "sewer": float(row["sewer"]),
+        "electric": float(row["electric"]),
+        "electric_t1": _f(row["electric_t1"]),
+        "electric_t2": _f(row["electric_t2"]),
+        "electric_t3": _f(row["electric_t3"]),
+    }
+
+
+def _override_row(row) -> Dict[str, Any]:
+    return {
+        "month_from": str(row["month_from"]),
+        "cold": _f(row["cold"]),
+        "hot": _f(row["hot"]),
+        "sewer": _f(row["sewer"]),
+        "electric_t1": _f(row["electric_t1"]),
+        "electric_t2": _f(row["electric_t2"]),
+        "electric_t3": _f(row["electric_t3"]),
+        "rent": _f(row["rent"]),
+    }
+
+
+class _Series:
+    """Rows sorted by month_from with a parallel key list for bisect."""
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = sorted(rows, key=lambda r: r["month_from"])
+        self.keys = [r["month_from"] for r in self.rows]
+
+    def at(self, ym: str) -> Optional[Dict[str, Any]]:
+        i = bisect_right(self.keys, str(ym))
+        return self.rows[i - 1] if i > 0 else None
+
+
+class TariffTimeline:
+    def __init__(self, global_rows: List[Dict[str, Any]], overrides: Dict[int, List[Dict[str, Any]]]):
+        self.global_series = _Series(global_rows)
+        self.overrides = {int(aid): _Series(rows) for aid, rows in overrides.items()}
+
+    def global_at(self, ym: str) -> Optional[Dict[str, Any]]:
+        return self.global_series.at(ym)
+
+    def override_at(self, apartment_id: int, ym: str) -> Optional[Dict[str, Any]]:
+        s = self.overrides.get(int(apartment_id))
+        return s.at(ym) if s else None
+
+    def apartment_at(self, apartment_id: int, ym: str) -> Dict[str, float]:
+        """Global tariff with the latest apartment override applied per field (missing fields fall back)."""
+        base = self.global_at(ym) or {}
+        ov = self.override_at(apartment_id, ym) or {}
+
+        def pick(key: str) -> float:
+            v = ov.get(key)
+            if v is None:
+                v = base.get(key)
+            return float(v or 0)
+
+        return {
+            "cold": pick("cold"),
+            "hot": pick("hot"),
+            "sewer": pick("sewer"),
+            "e1": pick("electric_t1"),
+            "e2": pick("electric_t2"),
+        }
+
+
+def _load_version(conn) -> tuple:
+    row = conn.execute(
+        text("""
+            SELECT
+                (SELECT count(*) FROM tariffs),
+                (SELECT max(updated_at) FROM tariffs),
+                (SELECT count(*) FROM apartment_tariffs),
+                (SELECT max(updated_at) FROM apartment_tariffs)
+        """)
+    ).fetchone()
+    return tuple(row) if row else ()
+
+
+def _load_timeline(conn) -> TariffTimeline:
+    global_rows = conn.execute(
+        text("""
+            SELECT
+                month_from,
+                cold, hot, sewer,
+                electric,
+                COALESCE(electric_t1, electric) AS electric_t1,
+                COALESCE(electric_t2, electric) AS electric_t2,
+                COALESCE(electric_t3, electric) AS electric_t3
+            FROM tariffs
+        """)
+    ).mappings().all()
+    override_rows = conn.execute(
+        text("""
+            SELECT apartment_id, month_from, cold, hot, sewer, electric_t1, electric_t2, electric_t3, rent
+            FROM apartment_tariffs
+        """)
+    ).mappings().all()
+    overrides: Dict[int, List[Dict[str, Any]]] = {}
+    for r in override_rows:
+        overrides.setdefault(int(r["apartment_id"]), []).append(_override_row(r))
+    return TariffTimeline([_global_row(r) for r in global_rows], overrides)
+
+
+def tariff_timeline(conn, *, verify: bool = False) -> TariffTimeline:
+    """
+    Cached timeline; the tariff version is re-checked after TARIFF_CACHE_TTL_SEC, or on every call with
+    verify=True (for writes that persist priced amounts, which must not use another worker's stale tariffs).
+    """
+    now = time.monotonic()
+    with _LOCK:
+        tl = _STATE["timeline"]
+        if tl is not None and not verify and now - _STATE["checked_at"] < TARIFF_CACHE_TTL_SEC:
+            return tl
+    version = _load_version(conn)
+    with _LOCK:
+        tl = _STATE["timeline"]
+        if tl is not None and version == _STATE["version"]:
+            _STATE["checked_at"] = now
+            return tl
+    # load outside the lock; a concurrent loader may win, both results are equivalent
+    tl = _load_timeline(conn)
+    with _LOCK:
+        _STATE.update(timeline=tl, version=version, checked_at=now)
+    return tl
+
+
+def invalidate_tariffs() -> None:
+    with _LOCK:
+        _STATE.update(timeline=None, version=None, checked_at=0.0)
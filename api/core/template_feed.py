@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+from sqlalchemy import text
+
+from core.config import OCR_URL, engine, logger
+from core.db import db_ready
+from core.integrations import ydisk_get, ydisk_ready
+from core.ocr_cache import invalidate_cached_ocr_results
+from core.photo_cache import photo_cache_get
+
+# Online template learning: every admin correction stored in ocr_training_samples is sent, with its photo,
+# to the OCR service template store (POST /templates/learn). The OCR service merges learned templates over
+# its seed files, so a repeat of a corrected photo takes the template early match without OpenAI calls.
+# The samples table is the queue: template_state pending -> done | skipped | failed.
+TEMPLATE_FEED_ENABLED = os.getenv("TEMPLATE_FEED_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+TEMPLATE_FEED_POLL_SEC = max(1.0, float(os.getenv("TEMPLATE_FEED_POLL_SEC", "10")))
+TEMPLATE_FEED_LEASE_SEC = max(30, int(os.getenv("TEMPLATE_FEED_LEASE_SEC", "120")))
+TEMPLATE_FEED_MAX_ATTEMPTS = max(1, min(50, int(os.getenv("TEMPLATE_FEED_MAX_ATTEMPTS", "8"))))
+TEMPLATE_FEED_BACKOFF_SEC = max(1, int(os.getenv("TEMPLATE_FEED_BACKOFF_SEC", "60")))
+
+_WORKER_LOCK = threading.Lock()
+_WORKER: dict = {"thread": None}
+
+
+def _ocr_learn_url() -> str:
+    url = str(OCR_URL or "").strip().rstrip("/")
+    if url.endswith("/recognize"):
+        return url[: -len("/recognize")] + "/templates/learn"
+    return url + "/templates/learn"
+
+
+def template_meter_type(meter_type: str, meter_index: int) -> Optional[str]:
+    """OCR template kind of a sample: electric tariffs and the main water meters; None for anything else."""
+    mt = str(meter_type)
+    if mt == "electric":
+        return "electric"
+    if mt in ("cold", "hot") and int(meter_index or 1) == 1:
+        return mt
+    return None
+
+
+def _retry_delay_sec(attempts: int) -> int:
+    return int(min(6 * 3600, TEMPLATE_FEED_BACKOFF_SEC * (2 ** max(0, int(attempts) - 1))))
+
+
+def claim_template_sample() -> Optional[dict]:
+    with engine.begin() as conn:
+        row = conn.execute(
+            text(
+                """
+                UPDATE ocr_training_samples s
+                SET template_attempts = s.template_attempts + 1,
+                    template_next_at = now() + make_interval(secs => :lease)
+                FROM (
+                    SELECT id FROM ocr_training_samples
+                    WHERE template_state='pending' AND template_next_at <= now()
+                    ORDER BY template_next_at, id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                ) c
+                WHERE s.id = c.id
+                RETURNING s.id, s.template_attempts, s.meter_type, s.meter_index, s.correct_value, s.ydisk_path,
+                          (SELECT pe.file_sha256 FROM photo_events pe WHERE pe.id = s.photo_event_id) AS file_sha256
+                """
+            ),
+            {"lease": int(TEMPLATE_FEED_LEASE_SEC)},
+        ).mappings().first()
+    if not row:
+        return None
+    return {
+        "id": int(row["id"]),
+        "attempts": int(row["template_attempts"]),
+        "meter_type": str(row["meter_type"]),
+        "meter_index": int(row["meter_index"] or 1),
+        "correct_value": float(row["correct_value"]),
+        "ydisk_path": row["ydisk_path"],
+        "file_sha256": row["file_sha256"],
+    }
+
+
+def finish_template_sample(item: dict, state: str, error: Optional[str] = None) -> None:
+    """state: done | skipped (never retried) | pending (retry with backoff, failed after the last attempt)."""
+    if state == "pending" and int(item["attempts"]) >= TEMPLATE_FEED_MAX_ATTEMPTS:
+        state = "failed"
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                UPDATE ocr_training_samples
+                SET template_state=:state, template_error=:error,
+                    template_next_at = now() + make_interval(secs => :delay)
+                WHERE id=:id
+                """
+            ),
+            {
+                "id": int(item["id"]),
+                "state": state,
+                "error": (str(error)[:2000] if error else None),
+                "delay": _retry_delay_sec(int(item["attempts"])) if state == "pending" else 0,
+            },
+        )
+        if state == "done" and item.get("file_sha256"):
+            # the learned template changes the result for this photo only; other cached results stay valid
+            invalidate_cached_ocr_results(conn, str(item["file_sha256"]))
+
+
+def _sample_photo(item: dict) -> Optional[bytes]:
+    content = photo_cache_get(item.get("file_sha256") or "")
+    if content:
+        return content
+    if item.get("ydisk_path") and ydisk_ready():
+        return ydisk_get(str(item["ydisk_path"]))
+    return None
+
+
+def process_template_sample(item: dict) -> str:
+    mt = template_meter_type(item["meter_type"], item["meter_index"])
+    if mt is None:
+        finish_template_sample(item, "skipped", "meter not covered by OCR templates")
+        return "skipped"
+    try:
+        content = _sample_photo(item)
+        if not content:
+            raise RuntimeError("photo not available")
+        r = requests.post(
+            _ocr_learn_url(),
+            files={"file": ("photo.jpg", content, "image/jpeg")},
+            data={"meter_type": mt, "reading": f"{float(item['correct_value']):.3f}"},
+            timeout=(3, 30),
+        )
+    except Exception as e:
+        logger.warning("template_feed sample=%s attempt=%s failed: %s", item["id"], item["attempts"], e)
+        finish_template_sample(item, "pending", str(e))
+        return "pending"
+    if r.status_code == 400:
+        # the OCR service rejected the photo or value itself; retrying cannot help
+        finish_template_sample(item, "skipped", f"ocr {r.status_code}: {r.text[:300]}")
+        return "skipped"
+    if not r.ok:
+        finish_template_sample(item, "pending", f"ocr {r.status_code}: {r.text[:300]}")
+        return "pending"
+    finish_template_sample(item, "done")
+    return "done"
+
+
+def _worker_loop() -> None:
+    while True:
+        try:
+            item = claim_template_sample()
+        except Exception:
+            logger.exception("template_feed claim failed")
+            time.sleep(TEMPLATE_FEED_POLL_SEC * 5)
+            continue
+        if item is None:
+            time.sleep(TEMPLATE_FEED_POLL_SEC)
+            continue
+        try:
+            process_template_sample(item)
+        except Exception:
+            logger.exception("template_feed sample failed id=%s", item["id"])
+
+
+def start_template_feed_worker() -> None:
+    if not (TEMPLATE_FEED_ENABLED and db_ready()):
+        return
+    with _WORKER_LOCK:
+        if _WORKER["thread"] is not None:
+            return
+        t = threading.Thread(target=_worker_loop, name="template-feed", daemon=True)
+        t.start()
+        _WORKER["thread"] = t
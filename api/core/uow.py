@@ -0,0 +1,101 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional, TypeVar
+
+from sqlalchemy.exc import DBAPIError
+
+from core.config import engine, logger
+
+# Unit of work: one connection + one transaction for a whole multi-step write path (e.g. a photo event),
+# instead of a pool checkout and a commit per step. Write steps run in savepoints so a failing step rolls back
+# alone, the way the old independent `with engine.begin()` blocks did; read-only steps skip the savepoint
+# (two round-trips each) because they have nothing to undo.
+UOW_MAX_RETRIES = max(0, min(10, int(os.getenv("UOW_MAX_RETRIES", "3"))))
+
+# serialization_failure, deadlock_detected
+_RETRYABLE_SQLSTATES = ("40001", "40P01")
+
+T = TypeVar("T")
+
+
+def is_serialization_failure(exc: BaseException) -> bool:
+    orig = getattr(exc, "orig", exc)
+    code = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    return str(code or "") in _RETRYABLE_SQLSTATES
+
+
+class UnitOfWork:
+    def __init__(self, conn):
+        self.conn = conn
+        self.steps = 0
+        self.retry_requested = False
+        self.aborted: Optional[BaseException] = None
+
+    @contextmanager
+    def step(self):
+        """Savepoint inside the unit's transaction; drop-in for `with engine.begin() as conn`."""
+        self.steps += 1
+        try:
+            with self.conn.begin_nested():
+                yield self.conn
+        except Exception as e:
+            # Callers often swallow step errors; remember that the whole unit has to be replayed.
+            if is_serialization_failure(e):
+                self.retry_requested = True
+            raise
+
+    @contextmanager
+    def read(self):
+        """Read-only step without a savepoint; a database error there aborts the whole unit."""
+        self.steps += 1
+        try:
+            yield self.conn
+        except DBAPIError as e:
+            # Without a savepoint Postgres has aborted the transaction: later steps and the commit would
+            # fail or silently roll back, so the unit fails (or is replayed) even if the caller swallows this.
+            if is_serialization_failure(e):
+                self.retry_requested = True
+            if self.aborted is None:
+                self.aborted = e
+            raise
+
+
+class _ReplayUnitOfWork(Exception):
+    pass
+
+
+def run_unit_of_work(fn: Callable[[UnitOfWork], T], *, retries: Optional[int] = None, label: str = "uow") -> T:
+    """
+    Run fn(uow) in a single transaction and commit once.
+    fn is replayed from scratch on serialization failures / deadlocks, so it must reset any state it mutates.
+    """
+    max_retries = UOW_MAX_RETRIES if retries is None else max(0, int(retries))
+    attempt = 0
+    while True:
+        try:
+            with engine.connect() as conn:
+                with conn.begin():
+                    uow = UnitOfWork(conn)
+                    result = fn(uow)
+                    if uow.retry_requested and attempt < max_retries:
+                        raise _ReplayUnitOfWork()
+                    if uow.aborted is not None:
+                        raise uow.aborted
+            return result
+        except Exception as e:
+            if not (isinstance(e, _ReplayUnitOfWork) or is_serialization_failure(e)) or attempt >= max_retries:
+                raise
+            attempt += 1
+            logger.warning("%s serialization failure, retry %s/%s", label, attempt, max_retries)
+            time.sleep(min(1.0, 0.05 * (2 ** attempt)))
+
+
+@contextmanager
+def db_conn(conn=None):
+    """Use the caller's connection (unit of work) when given, otherwise a short transaction of our own."""
+    if conn is not None:
+        yield conn
+        return
+    with engine.begin() as own:
+        yield own
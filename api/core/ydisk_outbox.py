@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import text
+
+from core.config import engine, logger
+from core.db import db_ready
+from core.integrations import ydisk_ready, ydisk_upload
+from core.stages import ydisk_stage
+
+# Durable outbox for Yandex Disk uploads. photo_event stores the photo here in its own transaction and
+# returns; worker threads upload in the background with exponential backoff and then fill
+# photo_events.ydisk_path.
+YDISK_OUTBOX_ENABLED = os.getenv("YDISK_OUTBOX_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+YDISK_OUTBOX_WORKERS = max(0, min(8, int(os.getenv("YDISK_OUTBOX_WORKERS", "1"))))
+YDISK_OUTBOX_POLL_SEC = max(0.2, float(os.getenv("YDISK_OUTBOX_POLL_SEC", "2.0")))
+YDISK_OUTBOX_LEASE_SEC = max(30, int(os.getenv("YDISK_OUTBOX_LEASE_SEC", "180")))
+YDISK_OUTBOX_MAX_ATTEMPTS = max(1, min(50, int(os.getenv("YDISK_OUTBOX_MAX_ATTEMPTS", "12"))))
+YDISK_OUTBOX_BACKOFF_SEC = max(1, int(os.getenv("YDISK_OUTBOX_BACKOFF_SEC", "15")))
+
+_WORKERS_LOCK = threading.Lock()
+_WORKERS: list[threading.Thread] = []
+
+
+def ydisk_outbox_active() -> bool:
+    return YDISK_OUTBOX_ENABLED and YDISK_OUTBOX_WORKERS > 0 and db_ready() and ydisk_ready()
+
+
+def enqueue_ydisk_upload(conn, *, photo_event_id: Optional[int], disk_path: str, content: bytes) -> int:
+    """Queue an upload inside the caller's transaction (commits together with the photo_events row)."""
+    row = conn.execute(
+        text(
+            """
+            INSERT INTO ydisk_outbox(photo_event_id, disk_path, blob)
+            VALUES(:pe, :path, :blob)
+            RETURNING id
+            """
+        ),
+        {
+            "pe": int(photo_event_id) if photo_event_id is not None else None,
+            "path": str(disk_path),
+            "blob": bytes(content),
+        },
+    ).fetchone()
+    return int(row[0])
+
+
+def _retry_delay_sec(attempts: int) -> int:
+    return int(min(3600, YDISK_OUTBOX_BACKOFF_SEC * (2 ** max(0, int(attempts) - 1))))
+
+
+def claim_ydisk_upload() -> Optional[dict]:
+    """Take the next due upload (or one whose worker lease expired); uploads that keep crashing a worker end up failed."""
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                UPDATE ydisk_outbox
+                SET status='failed', error='lease_expired', lease_until=NULL
+                WHERE status='running' AND lease_until < now() AND attempts >= :max_attempts
+                """
+            ),
+            {"max_attempts": int(YDISK_OUTBOX_MAX_ATTEMPTS)},
+        )
+        row = conn.execute(
+            text(
+                """
+                UPDATE ydisk_outbox
+                SET status='running',
+                    attempts = attempts + 1,
+                    lease_until = now() + make_interval(secs => :lease)
+                WHERE id = (
+                    SELECT id FROM ydisk_outbox
+                    WHERE (status='queued' AND next_attempt_at <= now())
+                       OR (status='running' AND lease_until < now() AND attempts < :max_attempts)
+                    ORDER BY next_attempt_at, id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, attempts, photo_event_id, disk_path, blob
+                """
+            ),
+            {"lease": int(YDISK_OUTBOX_LEASE_SEC), "max_attempts": int(YDISK_OUTBOX_MAX_ATTEMPTS)},
+        ).mappings().first()
+    if not row:
+        return None
+    return {
+        "id": int(row["id"]),
+        "attempts": int(row["attempts"]),
+        "photo_event_id": (int(row["photo_event_id"]) if row["photo_event_id"] is not None else None),
+        "disk_path": str(row["disk_path"]),
+        "blob": bytes(row["blob"]),
+    }
+
+
+def complete_ydisk_upload(item: dict) -> None:
+    with engine.begin() as conn:
+        if item.get("photo_event_id") is not None:
+            conn.execute(
+                text("UPDATE photo_events SET ydisk_path=:path WHERE id=:id AND ydisk_path IS NULL"),
+                {"id": int(item["photo_event_id"]), "path": str(item["disk_path"])},
+            )
+        conn.execute(text("DELETE FROM ydisk_outbox WHERE id=:id"), {"id": int(item["id"])})
+
+
+def fail_ydisk_upload(item: dict, error: str) -> None:
+    final = int(item["attempts"]) >= YDISK_OUTBOX_MAX_ATTEMPTS
+    with engine.begin() as conn:
+        # Failed rows keep the blob so the photo is not lost; an admin can re-queue them.
+        conn.execute(
+            text(
+                """
+                UPDATE ydisk_outbox
+                SET status=:status, error=:error, lease_until=NULL,
+                    next_attempt_at = now() + make_interval(secs => :delay)
+                WHERE id=:id
+                """
+            ),
+            {
+                "id": int(item["id"]),
+                "status": "failed" if final else "queued",
+                "error": str(error)[:2000],
+                "delay": _retry_delay_sec(int(item["attempts"])),
+            },
+        )
+
+
+def process_ydisk_upload(item: dict) -> None:
+    try:
+        with ydisk_stage:
+            ydisk_upload(item["disk_path"], item["blob"])
+    except Exception as e:
+        logger.warning(
+            "ydisk_outbox upload failed id=%s attempt=%s path=%s: %s",
+            item["id"],
+            item["attempts"],
+            item["disk_path"],
+            e,
+        )
+        fail_ydisk_upload(item, str(e))
+        return
+    complete_ydisk_upload(item)
+
+
+def _worker_loop() -> None:
+    while True:
+        try:
+            item = claim_ydisk_upload()
+        except Exception:
+            logger.exception("ydisk_outbox claim failed")
+            time.sleep(YDISK_OUTBOX_POLL_SEC * 5)
+            continue
+        if item is None:
+            time.sleep(YDISK_OUTBOX_POLL_SEC)
+            continue
+        try:
+            process_ydisk_upload(item)
+        except Exception:
+            logger.exception("ydisk_outbox item failed id=%s", item["id"])
+
+
+def start_ydisk_outbox_workers() -> None:
+    if not ydisk_outbox_active():
+        return
+    with _WORKERS_LOCK:
+        if _WORKERS:
+            return
+        for i in range(YDISK_OUTBOX_WORKERS):
+            t = threading.Thread(target=_worker_loop, name=f"ydisk-outbox-{i}", daemon=True)
+            t.start()
+            _WORKERS.append(t)
@@ -3,10 +3,17 @@ from fastapi import FastAPI
 from core.config import OCR_URL
 from core.db import db_ready, ensure_tables
 from core.integrations import ydisk_ready
+from core.ledger import backfill_ledger
+from core.notifications import start_notification_listener
+from core.ocr_jobs import start_photo_job_workers
+from core.stages import stage_stats
+from core.template_feed import start_template_feed_worker
+from core.ydisk_outbox import start_ydisk_outbox_workers
 from routes.admin_ui import router as admin_ui_router
 from routes.admin import router as admin_router
-from routes.events import router as events_router
+from routes.events import router as events_router, _run_photo_job
 from routes.bot import router as bot_router
+from routes.bulk import router as bulk_router
 from routes.dashboard import router as dashboard_router
 from routes.tariffs import router as tariffs_router
 
@@ -18,6 +25,7 @@ app.include_router(events_router)
 app.include_router(bot_router)
 app.include_router(dashboard_router)
 app.include_router(tariffs_router)
+app.include_router(bulk_router)
 
 
 @app.on_event("startup")
@@ -28,6 +36,26 @@ def _startup():
         ensure_tables()
     except Exception as e:
         print(f"[startup] ensure_tables failed: {e}")
+    try:
+        backfill_ledger()
+    except Exception as e:
+        print(f"[startup] ledger backfill failed: {e}")
+    try:
+        start_photo_job_workers(_run_photo_job)
+    except Exception as e:
+        print(f"[startup] ocr job workers failed: {e}")
+    try:
+        start_ydisk_outbox_workers()
+    except Exception as e:
+        print(f"[startup] ydisk outbox workers failed: {e}")
+    try:
+        start_notification_listener()
+    except Exception as e:
+        print(f"[startup] notification listener failed: {e}")
+    try:
+        start_template_feed_worker()
+    except Exception as e:
+        print(f"[startup] template feed worker failed: {e}")
 
 
 @app.get("/health")
@@ -37,4 +65,5 @@ def health():
         "ocr_url": OCR_URL,
         "db": "ok" if db_ready() else "disabled",
         "ydisk": "ok" if ydisk_ready() else "disabled",
+        "stages": stage_stats(),
     }
@@ -5,6 +5,9 @@ from sqlalchemy import text
 from core.config import engine
 from core.db import db_ready, ensure_tables
 from core.admin_helpers import norm_phone, bind_chat, current_ym
+from core.ledger import reprice_ledger
+from core.pagination import cursor_id, decode_cursor, keyset_page
+from core.tariff_timeline import invalidate_tariffs
 
 router = APIRouter()
 
@@ -33,17 +36,23 @@ def create_apartment(title: str, address: str | None = None, note: str | None =
 
 
 @router.get("/admin/apartments")
-def list_apartments(limit: int = 50, offset: int = 0):
+def list_apartments(limit: int = 50, offset: int = 0, cursor: str | None = None):
     if not db_ready():
         raise HTTPException(status_code=500, detail="DB is not configured")
     ensure_tables()
 
     limit = max(1, min(limit, 200))
     offset = max(0, offset)
+    # cursor (keyset on id) wins over the legacy offset
+    after = decode_cursor(cursor, "apartments", (cursor_id,))
+    where_sql = "WHERE a.id < :after_id" if after else ""
+    params: Dict[str, Any] = {"limit": limit + 1, "offset": 0 if after else offset}
+    if after:
+        params["after_id"] = after[0]
 
     with engine.begin() as conn:
         rows = conn.execute(
-            text("""
+            text(f"""
                 SELECT
                     a.id,
                     a.title,
@@ -66,13 +75,15 @@ def list_apartments(limit: int = 50, offset: int = 0):
                     WHERE is_active=true
                     GROUP BY apartment_id
                 ) b ON b.apartment_id = a.id
+                {where_sql}
                 ORDER BY a.id DESC
                 LIMIT :limit OFFSET :offset
             """),
-            {"limit": limit, "offset": offset},
+            params,
         ).mappings().all()
 
-    return {"ok": True, "items": list(rows), "limit": limit, "offset": offset}
+    items, next_cursor = keyset_page(rows, limit, "apartments", lambda r: (r["id"],))
+    return {"ok": True, "items": items, "limit": limit, "offset": offset, "next_cursor": next_cursor}
 
 
 @router.get("/admin/apartments/{apartment_id}")
@@ -307,6 +318,9 @@ def unbind_chat_admin(chat_id: str):
                 """),
                 {"aid": int(aid), "ym": current_ym()},
             )
+            reprice_ledger(conn, current_ym(), apartment_id=int(aid))
+    if apartment_ids:
+        invalidate_tariffs()
     return {"ok": True, "chat_id": str(chat_id)}
 
 
@@ -315,27 +329,34 @@ def unbind_chat_admin(chat_id: str):
 # -----------------------
 
 @router.get("/admin/photo-events/unassigned")
-def list_unassigned(limit: int = 50, offset: int = 0):
+def list_unassigned(limit: int = 50, offset: int = 0, cursor: str | None = None):
     if not db_ready():
         raise HTTPException(status_code=500, detail="DB is not configured")
     ensure_tables()
 
     limit = max(1, min(limit, 200))
     offset = max(0, offset)
+    after = decode_cursor(cursor, "photo_events_unassigned", (cursor_id,))
+    params: Dict[str, Any] = {"limit": limit + 1, "offset": 0 if after else offset}
+    keyset_sql = ""
+    if after:
+        keyset_sql = "AND id < :after_id"
+        params["after_id"] = after[0]
 
     with engine.begin() as conn:
         rows = conn.execute(
-            text("""
+            text(f"""
                 SELECT id, chat_id, telegram_username, phone, ydisk_path, status, apartment_id, ocr_json, created_at
                 FROM photo_events
-                WHERE status = 'unassigned' AND apartment_id IS NULL
+                WHERE status = 'unassigned' AND apartment_id IS NULL {keyset_sql}
                 ORDER BY id DESC
                 LIMIT :limit OFFSET :offset
             """),
-            {"limit": limit, "offset": offset},
+            params,
         ).mappings().all()
 
-    return {"ok": True, "items": list(rows)}
+    items, next_cursor = keyset_page(rows, limit, "photo_events_unassigned", lambda r: (r["id"],))
+    return {"ok": True, "items": items, "next_cursor": next_cursor}
 
 
 @router.post("/admin/photo-events/{photo_event_id}/assign")
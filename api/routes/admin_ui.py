@@ -2,13 +2,14 @@ from typing import Optional, Dict, Any, List
 from datetime import date, timedelta
 import calendar
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy import text
 import threading
 import subprocess
 import mimetypes
 import re
 import json
+import hashlib
 
 from core.config import engine
 from core.db import db_ready, ensure_tables
@@ -16,12 +17,13 @@ from core.admin_helpers import (
     current_ym,
     _get_active_contact,
     _set_contact,
-    _get_month_statuses,
     _upsert_month_statuses,
     _normalize_serial,
 )
 from core.billing import (
     _calc_month_bill,
+    calc_bills,
+    month_range,
     _get_month_bill_state,
     _set_month_bill_state,
     _get_active_chat_id,
@@ -31,11 +33,20 @@ from core.billing import (
     is_ym,
 )
 from core.meters import _add_meter_reading_db, _write_electric_overwrite_then_sort, _auto_fill_t3_from_t1_t2_if_needed, _normalize_water_after_manual
+from core.apartment_list import load_apartment_list
 from core.integrations import _tg_send_message, ydisk_get
+from core.photo_cache import PHOTO_CACHE_CONTROL, photo_cache_get, photo_cache_put
+from core.ledger import load_ledger, refresh_ledger_month, reprice_ledger
+from core.tariff_timeline import invalidate_tariffs
+from core.pagination import cursor_id, cursor_ts, decode_cursor, keyset_page
+from core.notifications import (
+    NOTIFY_LONGPOLL_MAX_SEC,
+    event_stream,
+    invalidate_unread_count,
+    unread_count,
+    wait_for_change,
+)
 from core.schemas import (
-    UIContacts,
-    UIStatuses,
-    UIApartmentItem,
     UIApartmentCreate,
     UIApartmentPatch,
     UIStatusesPatch,
@@ -209,64 +220,7 @@ def ui_list_apartments(ym: Optional[str] = None):
     ym_ = (ym or current_ym()).strip()
 
     with engine.begin() as conn:
-        rows = conn.execute(
-            text("""
-                SELECT id, title, address, tenant_name, note, ls_account, electric_expected, cold_serial, hot_serial, tenant_since, rent_monthly,
-                       utilities_mode, utilities_fixed_monthly, utilities_advance_amount, utilities_advance_cycle_months,
-                       utilities_advance_anchor_ym, utilities_show_actual_to_tenant
-                FROM apartments
-                ORDER BY id DESC
-            """)
-        ).fetchall()
-
-    items: List[Dict[str, Any]] = []
-    for r in rows:
-        aid = int(r[0])
-        phone = _get_active_contact(aid, "phone")
-        telegram = _get_active_contact(aid, "telegram")
-        statuses = _get_month_statuses(aid, ym_)
-        has_active_chat = False
-        try:
-            with engine.begin() as conn:
-                has_active_chat = bool(_get_active_chat_id(conn, aid))
-        except Exception:
-            has_active_chat = False
-        all_photos_received = False
-        try:
-            with engine.begin() as conn:
-                bill = _calc_month_bill(conn, apartment_id=int(aid), ym=str(ym_))
-                all_photos_received = bool(bill.get("is_complete_photos"))
-        except Exception:
-            all_photos_received = False
-        items.append(
-            UIApartmentItem(
-                id=aid,
-                title=r[1],
-                address=r[2],
-                tenant_name=r[3],
-                note=r[4],
-                ls_account=r[5],
-                electric_expected=int(r[6]) if r[6] is not None else 3,
-                cold_serial=r[7],
-                hot_serial=r[8],
-                tenant_since=str(r[9]) if len(r) > 9 and r[9] is not None else None,
-                rent_monthly=float(r[10]) if len(r) > 10 and r[10] is not None else 0.0,
-                utilities_mode=str(r[11] or "by_actual_monthly"),
-                utilities_fixed_monthly=float(r[12]) if len(r) > 12 and r[12] is not None else None,
-                utilities_advance_amount=float(r[13]) if len(r) > 13 and r[13] is not None else None,
-                utilities_advance_cycle_months=int(r[14]) if len(r) > 14 and r[14] is not None else 3,
-                utilities_advance_anchor_ym=str(r[15]) if len(r) > 15 and r[15] is not None else None,
-                utilities_show_actual_to_tenant=bool(r[16]) if len(r) > 16 and r[16] is not None else False,
-                has_active_chat=has_active_chat,
-                contacts=UIContacts(phone=phone, telegram=telegram),
-                statuses=UIStatuses(
-                    rent_paid=bool(getattr(statuses, "rent_paid", False)),
-                    meters_photo=bool(getattr(statuses, "meters_photo", False)),
-                    meters_paid=bool(getattr(statuses, "meters_paid", False)),
-                    all_photos_received=bool(all_photos_received),
-                ),
-            ).model_dump()
-        )
+        items = load_apartment_list(conn, ym_)
 
     return {"ok": True, "ym": ym_, "items": items}
 
@@ -530,11 +484,18 @@ def ui_patch_apartment(apartment_id: int, body: UIApartmentPatch):
 
 
 @router.get("/admin/ui/apartments/{apartment_id}/rent-history")
-def ui_apartment_rent_history(apartment_id: int, limit: int = 50):
+def ui_apartment_rent_history(apartment_id: int, limit: int = 50, offset: int = 0, cursor: Optional[str] = None):
     if not db_ready():
         raise HTTPException(status_code=503, detail="db_disabled")
     ensure_tables()
     lim = max(1, min(int(limit or 50), 200))
+    offset = max(0, int(offset or 0))
+    after = decode_cursor(cursor, "rent_history", (cursor_ts, cursor_id))
+    keyset_sql = ""
+    params: Dict[str, Any] = {"aid": int(apartment_id), "lim": lim + 1, "offset": 0 if after else offset}
+    if after:
+        keyset_sql = "AND (changed_at, id) < (CAST(:after_ts AS TIMESTAMPTZ), :after_id)"
+        params.update(after_ts=after[0], after_id=after[1])
 
     with engine.begin() as conn:
         apt = conn.execute(
@@ -546,18 +507,19 @@ def ui_apartment_rent_history(apartment_id: int, limit: int = 50):
             raise HTTPException(status_code=404, detail="apartment_not_found")
         rows = conn.execute(
             text(
-                """
+                f"""
                 SELECT id, apartment_id, ym_from, rent_monthly, tenant_name_snapshot, changed_at
                 FROM apartment_rent_history
-                WHERE apartment_id=:aid
+                WHERE apartment_id=:aid {keyset_sql}
                 ORDER BY changed_at DESC, id DESC
-                LIMIT :lim
+                LIMIT :lim OFFSET :offset
                 """
             ),
-            {"aid": int(apartment_id), "lim": lim},
+            params,
         ).mappings().all()
-        items = list(rows)
-        if not items:
+        items, next_cursor = keyset_page(rows, lim, "rent_history", lambda r: (r["changed_at"], r["id"]))
+        # synthesized history only when the apartment has no rows at all (first page)
+        if not items and not after and not offset:
             fallback_rows = conn.execute(
                 text(
                     """
@@ -592,7 +554,7 @@ def ui_apartment_rent_history(apartment_id: int, limit: int = 50):
                         "changed_at": None,
                     }
                 )
-    return {"ok": True, "apartment_id": int(apartment_id), "items": items}
+    return {"ok": True, "apartment_id": int(apartment_id), "items": items, "next_cursor": next_cursor}
 
 
 @router.delete("/admin/ui/apartments/{apartment_id}")
@@ -654,8 +616,53 @@ def ui_apartment_card(apartment_id: int):
     }
 
 
+# photo_events.ydisk_path stays NULL while the upload waits in ydisk_outbox; use the planned path then.
+_PHOTO_PATH_SQL = (
+    "COALESCE(pe.ydisk_path, (SELECT o.disk_path FROM ydisk_outbox o "
+    "WHERE o.photo_event_id=pe.id ORDER BY o.id DESC LIMIT 1))"
+)
+
+
+def _ranked_meter_photo(conn, params: Dict[str, Any]):
+    # One ranked query instead of three sequential ones:
+    # 0 = photo of the value currently written, 2 = newest "review" photo (incoming replacement
+    # that did not overwrite yet), 3 = newest written photo. The flagged photo sits at rank 1.
+    return conn.execute(
+        text(
+            f"""
+            SELECT id, path, file_sha256, rank
+            FROM (
+                SELECT pe.id, pe.created_at, pe.file_sha256, {_PHOTO_PATH_SQL} AS path,
+                       CASE
+                           WHEN pe.meter_written=true AND pe.meter_value = (
+                               SELECT value FROM meter_readings
+                               WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=:mi
+                               LIMIT 1
+                           ) THEN 0
+                           WHEN pe.meter_written=false OR pe.stage='needs_review' THEN 2
+                           WHEN pe.meter_written=true THEN 3
+                       END AS rank
+                FROM photo_events pe
+                WHERE pe.apartment_id=:aid AND pe.ym=:ym AND pe.meter_kind=:mt AND pe.meter_index=:mi
+            ) c
+            WHERE rank IS NOT NULL AND path IS NOT NULL
+            ORDER BY rank, created_at DESC
+            LIMIT 1
+            """
+        ),
+        params,
+    ).mappings().first()
+
+
 @router.get("/admin/ui/apartments/{apartment_id}/photo")
-def ui_get_meter_photo(apartment_id: int, ym: str, meter_type: str, meter_index: int = 1, flag_id: Optional[int] = None):
+def ui_get_meter_photo(
+    request: Request,
+    apartment_id: int,
+    ym: str,
+    meter_type: str,
+    meter_index: int = 1,
+    flag_id: Optional[int] = None,
+):
     if not db_ready():
         raise HTTPException(status_code=503, detail="db_disabled")
     ensure_tables()
@@ -670,8 +677,9 @@ def ui_get_meter_photo(apartment_id: int, ym: str, meter_type: str, meter_index:
         mi = 1
     mi = max(1, min(3, mi))
 
+    params = {"aid": int(apartment_id), "ym": str(ym), "mt": str(mt), "mi": int(mi)}
     with engine.begin() as conn:
-        ydisk_path = None
+        flagged = None
         # 1) If "Проверить значение" is pressed for a specific flag, prioritize the photo
         # that caused that flag (new incoming photo), not the last written historical one.
         if flag_id:
@@ -685,8 +693,9 @@ def ui_get_meter_photo(apartment_id: int, ym: str, meter_type: str, meter_index:
                         LIMIT 1
                         """
                     ),
-                    {"fid": int(flag_id), "aid": int(apartment_id), "ym": str(ym), "mt": str(mt), "mi": int(mi)},
+                    {"fid": int(flag_id), **params},
                 ).mappings().first()
+                flag_path = None
                 if fr and fr.get("comment"):
                     c = fr.get("comment")
                     try:
@@ -696,72 +705,73 @@ def ui_get_meter_photo(apartment_id: int, ym: str, meter_type: str, meter_index:
                     if isinstance(parsed, dict):
                         p = parsed.get("ydisk_path")
                         if isinstance(p, str) and p.strip():
-                            ydisk_path = p.strip()
+                            flag_path = p.strip()
+                if flag_path:
+                    row = conn.execute(
+                        text(
+                            """
+                            SELECT id, file_sha256
+                            FROM photo_events
+                            WHERE ydisk_path=:p
+                               OR id IN (SELECT photo_event_id FROM ydisk_outbox WHERE disk_path=:p)
+                            ORDER BY created_at DESC
+                            LIMIT 1
+                            """
+                        ),
+                        {"p": flag_path},
+                    ).mappings().first()
+                    flagged = {
+                        "id": (row["id"] if row else None),
+                        "path": flag_path,
+                        "file_sha256": (row["file_sha256"] if row else None),
+                        "rank": 1,
+                    }
             except Exception:
-                ydisk_path = None
+                flagged = None
 
-        # 2) Then prefer newest "review" photo (incoming replacement that did not overwrite yet).
-        if not ydisk_path:
-            row = conn.execute(
-                text(
-                    "SELECT ydisk_path FROM photo_events "
-                    "WHERE apartment_id=:aid AND ym=:ym AND meter_kind=:mk AND meter_index=:mi "
-                    "AND (meter_written=false OR stage='needs_review') "
-                    "ORDER BY created_at DESC LIMIT 1"
-                ),
-                {"aid": int(apartment_id), "ym": str(ym), "mk": str(mt), "mi": int(mi)},
-            ).fetchone()
-            if row and row[0]:
-                ydisk_path = row[0]
+        # 2) Best photo by rank (see _ranked_meter_photo).
+        best = _ranked_meter_photo(conn, params)
+        photo = dict(best) if best else None
+        if flagged and (photo is None or int(photo["rank"]) > 0):
+            photo = flagged
 
-        val_row = conn.execute(
-            text(
-                "SELECT value FROM meter_readings "
-                "WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=:mi "
-                "LIMIT 1"
-            ),
-            {"aid": int(apartment_id), "ym": str(ym), "mt": str(mt), "mi": int(mi)},
-        ).fetchone()
-        cur_val = float(val_row[0]) if val_row and val_row[0] is not None else None
+        if not photo:
+            raise HTTPException(status_code=404, detail="photo_not_found")
 
-        if cur_val is not None:
-            row = conn.execute(
-                text(
-                    "SELECT ydisk_path FROM photo_events "
-                    "WHERE apartment_id=:aid AND ym=:ym AND meter_kind=:mk AND meter_index=:mi "
-                    "AND meter_written=true AND meter_value=:val "
-                    "ORDER BY created_at DESC LIMIT 1"
-                ),
-                {"aid": int(apartment_id), "ym": str(ym), "mk": str(mt), "mi": int(mi), "val": float(cur_val)},
-            ).fetchone()
-            if row and row[0]:
-                ydisk_path = row[0]
+        sha = str(photo.get("file_sha256") or "").strip().lower() or None
+        etag = f'"{sha}"' if sha else None
+        if etag and request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": PHOTO_CACHE_CONTROL})
 
-        if not ydisk_path:
+        content = photo_cache_get(sha) if sha else None
+        if content is None and photo.get("id") is not None:
+            # Upload still pending: the outbox holds the original bytes.
             row = conn.execute(
-                text(
-                    "SELECT ydisk_path FROM photo_events "
-                    "WHERE apartment_id=:aid AND ym=:ym AND meter_kind=:mk AND meter_index=:mi "
-                    "AND meter_written=true "
-                    "ORDER BY created_at DESC LIMIT 1"
-                ),
-                {"aid": int(apartment_id), "ym": str(ym), "mk": str(mt), "mi": int(mi)},
+                text("SELECT blob FROM ydisk_outbox WHERE photo_event_id=:id ORDER BY id DESC LIMIT 1"),
+                {"id": int(photo["id"])},
             ).fetchone()
-            if row and row[0]:
-                ydisk_path = row[0]
-
-    if not ydisk_path:
-        raise HTTPException(status_code=404, detail="photo_not_found")
+            if row and row[0] is not None:
+                content = bytes(row[0])
 
-    try:
-        content = ydisk_get(str(ydisk_path))
-    except Exception:
-        raise HTTPException(status_code=404, detail="ydisk_get_failed")
+    ydisk_path = str(photo["path"])
+    if content is None:
+        try:
+            content = ydisk_get(ydisk_path)
+        except Exception:
+            raise HTTPException(status_code=404, detail="ydisk_get_failed")
+    if not sha:
+        sha = hashlib.sha256(content).hexdigest()
+        etag = f'"{sha}"'
+    photo_cache_put(sha, content)
 
-    content_type, _ = mimetypes.guess_type(str(ydisk_path))
+    content_type, _ = mimetypes.guess_type(ydisk_path)
     if not content_type:
         content_type = "image/jpeg"
-    return Response(content=content, media_type=content_type)
+    return Response(
+        content=content,
+        media_type=content_type,
+        headers={"ETag": etag, "Cache-Control": PHOTO_CACHE_CONTROL},
+    )
 
 
 @router.patch("/admin/ui/apartments/{apartment_id}/statuses")
@@ -802,133 +812,31 @@ def ui_apartment_history(apartment_id: int):
         if not ap:
             raise HTTPException(status_code=404, detail="apartment_not_found")
 
-        rows = conn.execute(
-            text(
-                """
-                SELECT
-                    ym,
-                    meter_type,
-                    meter_index,
-                    value,
-                    source
-                FROM meter_readings
-                WHERE apartment_id=:aid AND meter_type IN ('cold','hot','electric','sewer')
-                ORDER BY ym ASC, meter_type ASC, meter_index ASC
-                """
-            ),
-            {"aid": int(apartment_id)},
-        ).mappings().all()
+        ledger = load_ledger(conn, int(apartment_id))
 
-        global_tariffs = conn.execute(
-            text(
-                """
-                SELECT month_from, cold, hot, sewer,
-                       COALESCE(electric_t1, electric) AS electric_t1,
-                       COALESCE(electric_t2, electric) AS electric_t2
-                FROM tariffs
-                ORDER BY month_from ASC
-                """
-            )
-        ).mappings().all()
-
-        apartment_overrides = conn.execute(
-            text(
-                """
-                SELECT month_from, cold, hot, sewer, electric_t1, electric_t2
-                FROM apartment_tariffs
-                WHERE apartment_id=:aid
-                ORDER BY month_from ASC
-                """
-            ),
-            {"aid": int(apartment_id)},
-        ).mappings().all()
+    def _meter(row: Dict[str, Any], slot: str, title: str) -> Dict[str, Any]:
+        m = row["meters"][slot]
+        return {"title": title, "current": m["current"], "previous": m["previous"], "delta": m["delta"], "source": m["source"]}
 
-    # группировка по месяцу
-    by_month: Dict[str, Any] = {}
-    for r in rows:
-        ym = r["ym"]
-        mt = r["meter_type"]
-        mi = int(r["meter_index"] or 1)
-        val = float(r["value"]) if r["value"] is not None else None
-
-        if ym not in by_month:
-            by_month[ym] = {
-                "month": ym,
+    history = []
+    for row in ledger:
+        history.append(
+            {
+                "month": row["ym"],
                 "meters": {
-                    "cold": {"title": "ХВС", "current": None, "previous": None, "delta": None, "source": None},
-                    "hot": {"title": "ГВС", "current": None, "previous": None, "delta": None, "source": None},
+                    "cold": _meter(row, "cold", "ХВС"),
+                    "hot": _meter(row, "hot", "ГВС"),
                     "electric": {
                         "title": "Электро",
-                        "t1": {"title": "T1", "current": None, "previous": None, "delta": None, "source": None, "derived": False},
-                        "t2": {"title": "T2", "current": None, "previous": None, "delta": None, "source": None},
-                        "t3": {"title": "T3", "current": None, "previous": None, "delta": None, "source": None, "derived": False},
+                        "t1": {**_meter(row, "e1", "T1"), "derived": False},
+                        "t2": _meter(row, "e2", "T2"),
+                        "t3": {**_meter(row, "e3", "T3"), "derived": False},
                     },
-                    "sewer": {"title": "Водоотведение", "current": None, "previous": None, "delta": None, "source": None},
+                    "sewer": _meter(row, "sewer", "Водоотведение"),
                 },
             }
-
-        if mt == "cold":
-            by_month[ym]["meters"]["cold"]["current"] = val
-            by_month[ym]["meters"]["cold"]["source"] = r.get("source")
-        elif mt == "hot":
-            by_month[ym]["meters"]["hot"]["current"] = val
-            by_month[ym]["meters"]["hot"]["source"] = r.get("source")
-        elif mt == "sewer":
-            by_month[ym]["meters"]["sewer"]["current"] = val
-            by_month[ym]["meters"]["sewer"]["source"] = r.get("source")
-        elif mt == "electric":
-            if mi == 1:
-                by_month[ym]["meters"]["electric"]["t1"]["current"] = val
-                by_month[ym]["meters"]["electric"]["t1"]["source"] = r.get("source")
-            elif mi == 2:
-                by_month[ym]["meters"]["electric"]["t2"]["current"] = val
-                by_month[ym]["meters"]["electric"]["t2"]["source"] = r.get("source")
-            elif mi == 3:
-                by_month[ym]["meters"]["electric"]["t3"]["current"] = val
-                by_month[ym]["meters"]["electric"]["t3"]["source"] = r.get("source")
-
-    # вычисляем дельты по истории
-    history = []
-    prev_cold = prev_hot = prev_e1 = prev_e2 = prev_e3 = None
-    for m in sorted(by_month.keys()):
-        entry = by_month[m]
-        cur_cold = entry["meters"]["cold"]["current"]
-        cur_hot = entry["meters"]["hot"]["current"]
-        cur_e1 = entry["meters"]["electric"]["t1"]["current"]
-        cur_e2 = entry["meters"]["electric"]["t2"]["current"]
-        cur_e3 = entry["meters"]["electric"]["t3"]["current"]
-
-        # cold
-        entry["meters"]["cold"]["previous"] = prev_cold
-        if cur_cold is not None and prev_cold is not None:
-            entry["meters"]["cold"]["delta"] = cur_cold - prev_cold
-        prev_cold = cur_cold
-
-        # hot
-        entry["meters"]["hot"]["previous"] = prev_hot
-        if cur_hot is not None and prev_hot is not None:
-            entry["meters"]["hot"]["delta"] = cur_hot - prev_hot
-        prev_hot = cur_hot
-
-        # electric t1
-        entry["meters"]["electric"]["t1"]["previous"] = prev_e1
-        if cur_e1 is not None and prev_e1 is not None:
-            entry["meters"]["electric"]["t1"]["delta"] = cur_e1 - prev_e1
-        prev_e1 = cur_e1
-
-        # electric t2
-        entry["meters"]["electric"]["t2"]["previous"] = prev_e2
-        if cur_e2 is not None and prev_e2 is not None:
-            entry["meters"]["electric"]["t2"]["delta"] = cur_e2 - prev_e2
-        prev_e2 = cur_e2
-
-        # electric t3
-        entry["meters"]["electric"]["t3"]["previous"] = prev_e3
-        if cur_e3 is not None and prev_e3 is not None:
-            entry["meters"]["electric"]["t3"]["delta"] = cur_e3 - prev_e3
-        prev_e3 = cur_e3
-
-        history.append(entry)
+        )
+    accruals = [row["accrual"] for row in ledger]
 
     e_expected = max(1, min(3, int(ap.get("electric_expected") or 3)))
     mode = str(ap.get("utilities_mode") or "by_actual_monthly")
@@ -944,33 +852,8 @@ def ui_apartment_history(apartment_id: int):
         except Exception:
             tenant_since_ym = None
 
-    def _tariff_for_month(ym: str) -> Dict[str, float]:
-        base = None
-        for t in global_tariffs:
-            tf_ym = str(t.get("month_from") or "")
-            if tf_ym <= ym:
-                base = t
-            else:
-                break
-        if base is None:
-            base = {}
-        ov = None
-        for t in apartment_overrides:
-            tf_ym = str(t.get("month_from") or "")
-            if tf_ym <= ym:
-                ov = t
-            else:
-                break
-        return {
-            "cold": float((ov.get("cold") if ov and ov.get("cold") is not None else base.get("cold") if base else 0) or 0),
-            "hot": float((ov.get("hot") if ov and ov.get("hot") is not None else base.get("hot") if base else 0) or 0),
-            "sewer": float((ov.get("sewer") if ov and ov.get("sewer") is not None else base.get("sewer") if base else 0) or 0),
-            "e1": float((ov.get("electric_t1") if ov and ov.get("electric_t1") is not None else base.get("electric_t1") if base else 0) or 0),
-            "e2": float((ov.get("electric_t2") if ov and ov.get("electric_t2") is not None else base.get("electric_t2") if base else 0) or 0),
-        }
-
     carry = 0.0
-    for entry in history:
+    for entry, acc in zip(history, accruals):
         ym = str(entry.get("month") or "")
         meters = entry.get("meters") or {}
         cold = (meters.get("cold") or {}).get("current")
@@ -979,14 +862,6 @@ def ui_apartment_history(apartment_id: int):
         t2 = ((meters.get("electric") or {}).get("t2") or {}).get("current")
         t3 = ((meters.get("electric") or {}).get("t3") or {}).get("current")
 
-        dc = (meters.get("cold") or {}).get("delta")
-        dh = (meters.get("hot") or {}).get("delta")
-        de1 = ((meters.get("electric") or {}).get("t1") or {}).get("delta")
-        de2 = ((meters.get("electric") or {}).get("t2") or {}).get("delta")
-        ds = (meters.get("sewer") or {}).get("delta")
-        if ds is None:
-            ds = (dc or 0) + (dh or 0)
-
         is_complete = (
             cold is not None
             and hot is not None
@@ -995,16 +870,9 @@ def ui_apartment_history(apartment_id: int):
             and (e_expected < 3 or t3 is not None)
         )
 
-        tf = _tariff_for_month(ym)
-        rc = (float(dc) * tf["cold"]) if dc is not None else None
-        rh = (float(dh) * tf["hot"]) if dh is not None else None
-        re1 = (float(de1) * tf["e1"]) if de1 is not None else None
-        re2 = (float(de2) * tf["e2"]) if de2 is not None else None
-        rs = (float(ds) * tf["sewer"]) if ds is not None else None
-
         actual = None
         if is_complete:
-            parts = [x for x in [rc, rh, re1, re2, rs] if x is not None]
+            parts = [x for x in [acc["cold"], acc["hot"], acc["e1"], acc["e2"], acc["sewer"]] if x is not None]
             actual = float(sum(parts)) if parts else None
 
         active_for_month = True
@@ -1156,6 +1024,8 @@ async def ui_upsert_apartment_tariff(apartment_id: int, request: Request):
                 "rent": rent,
             },
         )
+        reprice_ledger(conn, ym, apartment_id=int(apartment_id))
+    invalidate_tariffs()
 
     return {"ok": True, "apartment_id": int(apartment_id), "month_from": ym}
 
@@ -1256,6 +1126,32 @@ def ui_get_bill(apartment_id: int, ym: Optional[str] = None):
         return {"ok": True, "apartment_id": int(apartment_id), "ym": str(ym_), "bill": bill, "state": state}
 
 
+@router.get("/admin/ui/bills")
+def ui_get_bills(ym_from: Optional[str] = None, ym_to: Optional[str] = None, apartment_ids: Optional[str] = None):
+    """Bills for many apartments x months in one pass (apartment_ids: comma-separated, default all)."""
+    if not db_ready():
+        raise HTTPException(status_code=503, detail="db_disabled")
+    ensure_tables()
+    ym_to_ = (ym_to or current_ym()).strip()
+    ym_from_ = (ym_from or ym_to_).strip()
+    months = month_range(ym_from_, ym_to_)
+    if not months:
+        raise HTTPException(status_code=400, detail="invalid_month_range")
+    if len(months) > 36:
+        raise HTTPException(status_code=400, detail="month_range_too_long")
+    try:
+        ids = [int(x) for x in (apartment_ids or "").split(",") if x.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid_apartment_ids")
+
+    with engine.begin() as conn:
+        if not ids:
+            ids = [int(r[0]) for r in conn.execute(text("SELECT id FROM apartments ORDER BY id")).fetchall()]
+        bills = calc_bills(conn, ids, months)
+    items = [{"apartment_id": aid, "ym": ym, "bill": bill} for (aid, ym), bill in bills.items()]
+    return {"ok": True, "ym_from": ym_from_, "ym_to": ym_to_, "items": items}
+
+
 @router.post("/admin/ui/apartments/{apartment_id}/bill/approve")
 def ui_approve_bill(apartment_id: int, payload: BillApproveIn):
     if not db_ready():
@@ -1372,6 +1268,7 @@ def admin_reject_electric_extra(apartment_id: int, ym: str):
             ),
             {"aid": apartment_id, "ym": ym, "snap": snapshot},
         )
+        refresh_ledger_month(conn, int(apartment_id), str(ym))
         _set_month_extra_state(conn, apartment_id, ym, False, None)
 
     return {"ok": True, "electric_expected_snapshot": snapshot}
@@ -1606,7 +1503,7 @@ def ui_last_ocr_dataset():
 
 
 @router.get("/admin/notifications")
-def ui_list_notifications(status: str = "unread", limit: int = 50, offset: int = 0):
+def ui_list_notifications(status: str = "unread", limit: int = 50, offset: int = 0, cursor: Optional[str] = None):
     if not db_ready():
         raise HTTPException(status_code=503, detail="db_disabled")
     ensure_tables()
@@ -1617,18 +1514,21 @@ def ui_list_notifications(status: str = "unread", limit: int = 50, offset: int =
 
     limit = max(1, min(int(limit or 50), 200))
     offset = max(0, int(offset or 0))
+    # keyset on (created_at, id); the status is part of the kind so cursors do not cross filters
+    after = decode_cursor(cursor, f"notifications:{status_}", (cursor_ts, cursor_id))
 
     where = []
-    params: Dict[str, Any] = {"limit": limit, "offset": offset}
+    params: Dict[str, Any] = {"limit": limit + 1, "offset": 0 if after else offset}
     if status_ == "unread":
         where.append("n.status='unread'")
+    if after:
+        where.append("(n.created_at, n.id) < (CAST(:after_ts AS TIMESTAMPTZ), :after_id)")
+        params.update(after_ts=after[0], after_id=after[1])
 
     where_sql = ("WHERE " + " AND ".join(where)) if where else ""
 
     with engine.begin() as conn:
-        unread_count = conn.execute(
-            text("SELECT COUNT(*) FROM notifications WHERE status='unread'")
-        ).scalar() or 0
+        unread = unread_count(conn)
 
         rows = conn.execute(
             text(
@@ -1641,13 +1541,14 @@ def ui_list_notifications(status: str = "unread", limit: int = 50, offset: int =
                 FROM notifications n
                 LEFT JOIN apartments a ON a.id = n.apartment_id
                 {where_sql}
-                ORDER BY n.created_at DESC
+                ORDER BY n.created_at DESC, n.id DESC
                 LIMIT :limit OFFSET :offset
                 """
             ),
             params,
         ).mappings().all()
 
+    rows, next_cursor = keyset_page(rows, limit, f"notifications:{status_}", lambda r: (r["created_at"], r["id"]))
     items = []
     for r in rows:
         items.append(
@@ -1666,7 +1567,31 @@ def ui_list_notifications(status: str = "unread", limit: int = 50, offset: int =
             }
         )
 
-    return {"ok": True, "items": items, "unread_count": int(unread_count)}
+    return {"ok": True, "items": items, "unread_count": int(unread), "next_cursor": next_cursor}
+
+
+@router.get("/admin/notifications/unread")
+async def ui_wait_unread_count(since: Optional[str] = None, wait: float = 0):
+    """Unread counter; with `since` (seq of the last answer) and `wait` it long-polls until it changes."""
+    if not db_ready():
+        raise HTTPException(status_code=503, detail="db_disabled")
+    ensure_tables()
+    timeout = max(0.0, min(float(wait or 0), NOTIFY_LONGPOLL_MAX_SEC))
+    snap = await wait_for_change(since if timeout > 0 else None, timeout)
+    return {"ok": True, "unread_count": int(snap["unread_count"] or 0), "seq": snap["seq"], "last": snap["last"]}
+
+
+@router.get("/admin/notifications/stream")
+async def ui_stream_notifications(request: Request):
+    """Server-sent events: `unread` with {unread_count, seq, last} on connect and on every change."""
+    if not db_ready():
+        raise HTTPException(status_code=503, detail="db_disabled")
+    ensure_tables()
+    return StreamingResponse(
+        event_stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/admin/notifications/{notification_id}/read")
@@ -1686,6 +1611,7 @@ def ui_mark_notification_read(notification_id: int):
             ),
             {"id": int(notification_id)},
         )
+    invalidate_unread_count()
     return {"ok": True, "id": int(notification_id)}
 
 
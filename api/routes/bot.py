@@ -13,6 +13,7 @@ from core.billing import (
     find_apartment_for_chat,
 )
 from core.meters import _add_meter_reading_db, _write_electric_overwrite_then_sort
+from core.ledger import refresh_ledger_month
 from core.learning import capture_training_sample
 from core.schemas import BotContactIn, BotManualReadingIn, BotDuplicateResolveIn, BotWrongReadingReportIn, BotNotificationIn
 
@@ -182,6 +183,7 @@ def bot_duplicate_resolve(payload: BotDuplicateResolveIn):
                 """),
                 {"aid": apartment_id, "ym": ym, "t": meter_kind, "i": int(meter_index)},
             )
+            refresh_ledger_month(conn, int(apartment_id), ym)
             conn.execute(
                 text("""
                     UPDATE photo_events
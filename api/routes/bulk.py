@@ -0,0 +1,118 @@
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from core.billing import is_ym
+from core.bulk_io import (
+    BULK_IMPORT_MAX_ERRORS,
+    BULK_IMPORT_MAX_ROWS,
+    READING_COLUMNS,
+    RecordReader,
+    bulk_format,
+    import_readings,
+    parse_reading,
+    stream_rows,
+    validate_records,
+)
+from core.config import engine
+from core.db import db_ready, ensure_tables
+
+router = APIRouter()
+
+_MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def _format_or_400(fmt: Optional[str], content_type: Optional[str] = None) -> str:
+    try:
+        return bulk_format(fmt, content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def read_import_body(request: Request, fmt: str, parse):
+    """Parse and validate the body while it streams in; 400 with line errors, 413 over the row limit."""
+    reader = RecordReader(fmt)
+    rows, errors, n_errors = [], [], 0
+
+    def _take(records):
+        nonlocal n_errors
+        r, e, n = validate_records(records, parse)
+        rows.extend(r)
+        errors.extend(e[: max(0, BULK_IMPORT_MAX_ERRORS - len(errors))])
+        n_errors += n
+        if len(rows) + n_errors > BULK_IMPORT_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"too many rows (max {BULK_IMPORT_MAX_ROWS})")
+
+    async for chunk in request.stream():
+        _take(reader.feed(chunk))
+    _take(reader.close())
+    if n_errors:
+        raise HTTPException(status_code=400, detail={"error": "invalid_rows", "error_count": n_errors, "errors": errors})
+    if not rows:
+        raise HTTPException(status_code=400, detail="no rows")
+    return rows
+
+
+def export_response(chunks, fmt: str, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        chunks,
+        media_type=_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+
+def _import_readings_tx(rows, dry_run: bool) -> Dict[str, Any]:
+    try:
+        with engine.begin() as conn:
+            return import_readings(conn, rows, dry_run=dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/admin/readings/import")
+async def import_meter_readings(request: Request, format: Optional[str] = None, dry_run: bool = False):
+    """Bulk readings, CSV (header: apartment_id,ym,meter_type,meter_index,value[,source]) or NDJSON.
+
+    All-or-nothing: any invalid line rejects the file. Values are slotted like manual admin input
+    (water min -> hot, electric sorted by apartments.electric_expected, T3 auto-filled).
+    """
+    if not db_ready():
+        raise HTTPException(status_code=503, detail="db_disabled")
+    ensure_tables()
+    fmt = _format_or_400(format, request.headers.get("content-type"))
+    rows = await read_import_body(request, fmt, parse_reading)
+    summary = await run_in_threadpool(_import_readings_tx, rows, bool(dry_run))
+    return {"ok": True, **summary}
+
+
+@router.get("/admin/readings/export")
+def export_meter_readings(
+    format: str = "csv",
+    apartment_id: Optional[int] = None,
+    ym_from: Optional[str] = None,
+    ym_to: Optional[str] = None,
+):
+    if not db_ready():
+        raise HTTPException(status_code=503, detail="db_disabled")
+    ensure_tables()
+    fmt = _format_or_400(format)
+    where = ["meter_type IN ('cold','hot','sewer','electric')"]
+    params: Dict[str, Any] = {}
+    if apartment_id is not None:
+        where.append("apartment_id=:aid")
+        params["aid"] = int(apartment_id)
+    for name, op, v in (("ym_from", ">=", ym_from), ("ym_to", "<=", ym_to)):
+        if v:
+            if not is_ym(v):
+                raise HTTPException(status_code=400, detail=f"invalid {name}")
+            where.append(f"ym {op} :{name}")
+            params[name] = str(v).strip()
+    sql = f"""
+        SELECT {', '.join(READING_COLUMNS)}
+        FROM meter_readings
+        WHERE {' AND '.join(where)}
+        ORDER BY apartment_id, ym, meter_type, meter_index
+    """
+    return export_response(stream_rows(engine, sql, params, READING_COLUMNS, fmt, numeric=("value",)), fmt, "meter_readings")
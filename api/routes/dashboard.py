@@ -1,5 +1,5 @@
-from typing import Dict, Any
-from fastapi import APIRouter, HTTPException
+from typing import Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Request, Response
 from sqlalchemy import text
 
 from core.config import engine, logger
@@ -12,10 +12,20 @@ from core.billing import (
     _get_active_chat_id,
     _same_total,
     _get_apartment_electric_expected,
+    month_range,
 )
 from core.meters import _auto_fill_t3_from_t1_t2_if_needed
+from core.ledger import load_ledger, refresh_ledger_month
 from core.admin_helpers import update_apartment_statuses
 from core.integrations import _tg_send_message
+from core.portfolio import (
+    PORTFOLIO_MAX_APARTMENTS,
+    PORTFOLIO_MAX_MONTHS,
+    build_portfolio,
+    encode_body,
+    etag_matches,
+    parse_fields,
+)
 from core.schemas import MeterCurrentPatch, UIStatusesPatch
 
 router = APIRouter()
@@ -64,6 +74,53 @@ def dashboard_apartments():
     return {"ok": True, "items": items}
 
 
+# -----------------------
+# Dashboard: building overview (many apartments x months, projected fields)
+# -----------------------
+
+@router.get("/dashboard/portfolio")
+def dashboard_portfolio(
+    request: Request,
+    apartment_ids: Optional[str] = None,
+    ym_from: Optional[str] = None,
+    ym_to: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    fields: comma-separated subset of readings,deltas,bill,flags,statuses (default all).
+    Answers 304 when If-None-Match carries the ETag of an unchanged response.
+    """
+    if not db_ready():
+        raise HTTPException(status_code=500, detail="DB is not configured")
+    ensure_tables()
+    ym_to_ = (ym_to or month_now()).strip()
+    ym_from_ = (ym_from or ym_to_).strip()
+    months = month_range(ym_from_, ym_to_)
+    if not months:
+        raise HTTPException(status_code=400, detail="invalid_month_range")
+    if len(months) > PORTFOLIO_MAX_MONTHS:
+        raise HTTPException(status_code=400, detail="month_range_too_long")
+    try:
+        ids = [int(x) for x in (apartment_ids or "").split(",") if x.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid_apartment_ids")
+    if len(ids) > PORTFOLIO_MAX_APARTMENTS:
+        raise HTTPException(status_code=400, detail="too_many_apartments")
+    try:
+        fields_ = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    with engine.begin() as conn:
+        items = build_portfolio(conn, ids, months, fields_)
+
+    body, etag = encode_body({"ok": True, "ym_from": ym_from_, "ym_to": ym_to_, "fields": list(fields_), "items": items})
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 # -----------------------
 # Dashboard: meters table (+ ₽)
 # -----------------------
@@ -75,159 +132,45 @@ def dashboard_apartment_meters(apartment_id: int):
     ensure_tables()
 
     with engine.begin() as conn:
-        rows = conn.execute(
-            text("""
-                SELECT
-                    mr.ym,
-                    mr.meter_type,
-                    mr.meter_index,
-                    mr.value,
-                    COALESCE(t.cold, 0) AS cold_tariff,
-                    COALESCE(t.hot, 0) AS hot_tariff,
-                    COALESCE(t.sewer, 0) AS sewer_tariff,
-                    COALESCE(t.electric_t1, t.electric, 0) AS e1_tariff,
-                    COALESCE(t.electric_t2, t.electric, 0) AS e2_tariff,
-                    COALESCE(t.electric_t3, t.electric, 0) AS e3_tariff
-                FROM meter_readings mr
-                LEFT JOIN (
-                    SELECT DISTINCT ON (month_from)
-                        month_from, cold, hot, sewer, electric, electric_t1, electric_t2, electric_t3
-                    FROM tariffs
-                    ORDER BY month_from DESC
-                ) t ON t.month_from <= mr.ym
-                WHERE mr.apartment_id = :aid
-                  AND mr.meter_type IN ('cold','hot','electric','sewer')
-                ORDER BY mr.ym ASC, mr.meter_type ASC, mr.meter_index ASC
-            """),
-            {"aid": int(apartment_id)},
-        ).mappings().all()
-
-    # group by month and type
-    by_month: Dict[str, Any] = {}
-    for r in rows:
-        ym = r["ym"]
-        mt = r["meter_type"]
-        mi = int(r["meter_index"] or 1)
-        val = float(r["value"]) if r["value"] is not None else None
-
-        if ym not in by_month:
-            by_month[ym] = {
-                "month": ym,
+        ledger = load_ledger(conn, int(apartment_id))
+
+    def _kind(row: Dict[str, Any], slot: str, title: str) -> Dict[str, Any]:
+        m = row["meters"][slot]
+        return {
+            "title": title,
+            "current": m["current"],
+            "previous": m["previous"],
+            "delta": m["delta"],
+            "tariff": row["tariff"][slot],
+            "rub": row["rub"][slot],
+        }
+
+    months = []
+    for row in ledger:
+        m = row["meters"]
+        sewer = _kind(row, "sewer", "Водоотведение")
+        # sewer is billed as cold + hot consumption
+        if m["cold"]["delta"] is not None and m["hot"]["delta"] is not None:
+            sewer["delta"] = m["cold"]["delta"] + m["hot"]["delta"]
+        months.append(
+            {
+                "month": row["ym"],
                 "kinds": {
-                    "cold": {"title": "ХВС", "current": None, "previous": None, "delta": None, "tariff": float(r["cold_tariff"] or 0), "rub": None},
-                    "hot": {"title": "ГВС", "current": None, "previous": None, "delta": None, "tariff": float(r["hot_tariff"] or 0), "rub": None},
+                    "cold": _kind(row, "cold", "ХВС"),
+                    "hot": _kind(row, "hot", "ГВС"),
                     "electric": {
                         "title": "Электро",
-                        "t1": {"title": "T1", "current": None, "previous": None, "delta": None, "tariff": float(r["e1_tariff"] or 0), "rub": None},
-                        "t2": {"title": "T2", "current": None, "previous": None, "delta": None, "tariff": float(r["e2_tariff"] or 0), "rub": None},
-                        "t3": {"title": "T3", "current": None, "previous": None, "delta": None, "tariff": float(r["e3_tariff"] or 0), "rub": None, "derived": False},
+                        "t1": _kind(row, "e1", "T1"),
+                        "t2": _kind(row, "e2", "T2"),
+                        "t3": {**_kind(row, "e3", "T3"), "derived": False},
                     },
-                    "sewer": {"title": "Водоотведение", "current": None, "previous": None, "delta": None, "tariff": float(r["sewer_tariff"] or 0), "rub": None},
+                    "sewer": sewer,
                 },
+                "total_rub": row["rub"]["total"],
             }
+        )
 
-        entry = by_month[ym]
-        if mt == "cold":
-            entry["kinds"]["cold"]["current"] = val
-        elif mt == "hot":
-            entry["kinds"]["hot"]["current"] = val
-        elif mt == "sewer":
-            entry["kinds"]["sewer"]["current"] = val
-        elif mt == "electric":
-            if mi == 1:
-                entry["kinds"]["electric"]["t1"]["current"] = val
-            elif mi == 2:
-                entry["kinds"]["electric"]["t2"]["current"] = val
-            elif mi == 3:
-                entry["kinds"]["electric"]["t3"]["current"] = val
-
-    # compute deltas & rubles
-    prev_cold = prev_hot = prev_e1 = prev_e2 = prev_e3 = None
-    history = []
-    for ym in sorted(by_month.keys()):
-        entry = by_month[ym]
-
-        # cold
-        cur = entry["kinds"]["cold"]["current"]
-        entry["kinds"]["cold"]["previous"] = prev_cold
-        if cur is not None and prev_cold is not None:
-            d = cur - prev_cold
-            entry["kinds"]["cold"]["delta"] = d
-            t = entry["kinds"]["cold"]["tariff"]
-            if t is not None:
-                entry["kinds"]["cold"]["rub"] = float(d) * float(t)
-        prev_cold = cur
-
-        # hot
-        cur = entry["kinds"]["hot"]["current"]
-        entry["kinds"]["hot"]["previous"] = prev_hot
-        if cur is not None and prev_hot is not None:
-            d = cur - prev_hot
-            entry["kinds"]["hot"]["delta"] = d
-            t = entry["kinds"]["hot"]["tariff"]
-            if t is not None:
-                entry["kinds"]["hot"]["rub"] = float(d) * float(t)
-        prev_hot = cur
-
-        # electric t1
-        cur = entry["kinds"]["electric"]["t1"]["current"]
-        entry["kinds"]["electric"]["t1"]["previous"] = prev_e1
-        if cur is not None and prev_e1 is not None:
-            d = cur - prev_e1
-            entry["kinds"]["electric"]["t1"]["delta"] = d
-            t = entry["kinds"]["electric"]["t1"]["tariff"]
-            if t is not None:
-                entry["kinds"]["electric"]["t1"]["rub"] = float(d) * float(t)
-        prev_e1 = cur
-
-        # electric t2
-        cur = entry["kinds"]["electric"]["t2"]["current"]
-        entry["kinds"]["electric"]["t2"]["previous"] = prev_e2
-        if cur is not None and prev_e2 is not None:
-            d = cur - prev_e2
-            entry["kinds"]["electric"]["t2"]["delta"] = d
-            t = entry["kinds"]["electric"]["t2"]["tariff"]
-            if t is not None:
-                entry["kinds"]["electric"]["t2"]["rub"] = float(d) * float(t)
-        prev_e2 = cur
-
-        # electric t3
-        cur = entry["kinds"]["electric"]["t3"]["current"]
-        entry["kinds"]["electric"]["t3"]["previous"] = prev_e3
-        if cur is not None and prev_e3 is not None:
-            d = cur - prev_e3
-            entry["kinds"]["electric"]["t3"]["delta"] = d
-            t = entry["kinds"]["electric"]["t3"]["tariff"]
-            if t is not None:
-                entry["kinds"]["electric"]["t3"]["rub"] = float(d) * float(t)
-        prev_e3 = cur
-
-        # sewer
-        cold_delta = entry["kinds"]["cold"]["delta"]
-        hot_delta = entry["kinds"]["hot"]["delta"]
-        if cold_delta is not None and hot_delta is not None:
-            sewer_delta = cold_delta + hot_delta
-            entry["kinds"]["sewer"]["delta"] = sewer_delta
-            if entry["kinds"]["sewer"]["tariff"] is not None:
-                entry["kinds"]["sewer"]["rub"] = float(sewer_delta) * float(entry["kinds"]["sewer"]["tariff"])
-
-        # total_rub (month sum)
-        rubs = [
-            entry["kinds"]["cold"]["rub"],
-            entry["kinds"]["hot"]["rub"],
-            entry["kinds"]["electric"]["t1"]["rub"],
-            entry["kinds"]["electric"]["t2"]["rub"],
-            entry["kinds"]["electric"]["t3"]["rub"],
-            entry["kinds"]["sewer"]["rub"],
-        ]
-        if all(x is not None for x in rubs):
-            entry["total_rub"] = float(sum(float(x) for x in rubs if x is not None))
-        else:
-            entry["total_rub"] = None
-
-        history.append(entry)
-
-    return {"apartment_id": apartment_id, "months": list(by_month.values())}
+    return {"apartment_id": apartment_id, "months": months}
 
 
 # -----------------------
@@ -288,6 +231,7 @@ def patch_current_month_readings(apartment_id: int, payload: MeterCurrentPatch):
                     "val": float(val),
                 },
             )
+        refresh_ledger_month(conn, int(apartment_id), str(m))
 
         # For expected=3: after manual T1/T2 edit set T3=T1+T2 if T3 is not OCR
         try:
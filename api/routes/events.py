@@ -1,3 +1,4 @@
+import copy
 import json
 import re
 import hashlib
@@ -8,14 +9,28 @@ import time
 import uuid
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from fastapi import APIRouter, Request, UploadFile, File
+from fastapi import APIRouter, HTTPException, Request, UploadFile, File
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import text
 from datetime import datetime
 
 from core.config import OCR_URL, engine, logger
 from core.db import db_ready, ensure_tables
-from core.integrations import ydisk_ready, upload_to_ydisk, _tg_send_message
+from core.ledger import refresh_ledger_month
+from core.integrations import ydisk_ready, ydisk_photo_path, ydisk_upload, upload_to_ydisk, _tg_send_message
+from core.ocr_jobs import PhotoJobLost, enqueue_photo_job, get_photo_job, mark_photo_job_written
+from core.photo_cache import photo_cache_put
+from core.ydisk_outbox import enqueue_ydisk_upload, ydisk_outbox_active
+from core.stages import ocr_stage, ydisk_stage, run_photo_stage
+from core.uow import UnitOfWork, run_unit_of_work
+from core.ocr_cache import (
+    OCR_RESULT_CACHE_ENABLED,
+    get_ocr_pipeline_version,
+    ocr_result_cache_key,
+    get_cached_ocr_result,
+    put_cached_ocr_result,
+)
 from core.billing import (
     month_now,
     is_ym,
@@ -56,7 +71,7 @@ OCR_HTTP_TIMEOUT_SEC = float(os.getenv("OCR_HTTP_TIMEOUT_SEC", "75"))
 OCR_HTTP_TIMEOUT_FLOOR_SEC = float(os.getenv("OCR_HTTP_TIMEOUT_FLOOR_SEC", "70"))
 OCR_HTTP_RETRIES = int(os.getenv("OCR_HTTP_RETRIES", "1"))
 WATER_INTEGER_ONLY = os.getenv("WATER_INTEGER_ONLY", "0").strip().lower() in ("1", "true", "yes", "on")
-OCR_SERIES_HTTP_TIMEOUT_SEC = float(os.getenv("OCR_SERIES_HTTP_TIMEOUT_SEC", "220"))
+OCR_SERIES_HTTP_TIMEOUT_SEC = float(os.getenv("OCR_SERIES_HTTP_TIMEOUT_SEC", "100"))
 OCR_SERIES_SINGLE_REPEATS = max(1, min(5, int(os.getenv("OCR_SERIES_SINGLE_REPEATS", "3"))))
 PHOTO_EVENT_MAX_FILES = int(os.getenv("PHOTO_EVENT_MAX_FILES", "6"))
 
@@ -118,12 +133,13 @@ def _call_ocr_with_retries(
                 read_timeout = max(10.0, float(read_timeout_override_sec))
             else:
                 read_timeout = max(float(OCR_HTTP_TIMEOUT_SEC), float(OCR_HTTP_TIMEOUT_FLOOR_SEC))
-            resp = requests.post(
-                OCR_URL,
-                data=post_data,
-                files={"file": upload_file},
-                timeout=(5, read_timeout),
-            )
+            with ocr_stage:
+                resp = requests.post(
+                    OCR_URL,
+                    data=post_data,
+                    files={"file": upload_file},
+                    timeout=(5, read_timeout),
+                )
             return resp, None
         except Exception as e:
             last_exc = e
@@ -167,12 +183,13 @@ def _call_ocr_series_with_retries(
             read_timeout = max(base_timeout, float(OCR_SERIES_HTTP_TIMEOUT_SEC))
             # series calls can be much slower than single-image OCR
             read_timeout = max(read_timeout, min(900.0, base_timeout * max(1, len(photos))))
-            resp = requests.post(
-                _ocr_series_url(),
-                data=post_data,
-                files=files_payload,
-                timeout=(5, read_timeout),
-            )
+            with ocr_stage:
+                resp = requests.post(
+                    _ocr_series_url(),
+                    data=post_data,
+                    files=files_payload,
+                    timeout=(5, read_timeout),
+                )
             return resp, None
         except Exception as e:
             last_exc = e
@@ -1374,18 +1391,16 @@ def _flag_manual_overwrite(
         },
     )
 
-@router.post("/events/photo")
-async def photo_event(request: Request, file: UploadFile = File(None)):
+def _photo_event_fields(form) -> dict:
+    """Parse non-file photo_event form fields into kwargs for _process_photo_event (JSON-safe for the job queue)."""
     diag = {"errors": [], "warnings": []}
 
-    form = await request.form()
     trace_id_raw = form.get("trace_id")
     trace_id = (str(trace_id_raw).strip() if trace_id_raw is not None else "") or f"evt-{uuid.uuid4().hex[:12]}"
     diag["trace_id"] = trace_id
     chat_id = form.get("chat_id") or "unknown"
     telegram_username = form.get("telegram_username") or None
     phone = form.get("phone") or None
-    t0 = time.monotonic()
 
     # month (ym) for this photo event. Bot may send it; otherwise default to current month.
     ym_raw = form.get("ym")
@@ -1408,6 +1423,24 @@ async def photo_event(request: Request, file: UploadFile = File(None)):
         diag["warnings"].append({"invalid_meter_index": str(raw_meter_index)})
 
     meter_index = max(1, min(3, meter_index))
+    return {
+        "diag": diag,
+        "trace_id": trace_id,
+        "chat_id": str(chat_id),
+        "telegram_username": telegram_username,
+        "phone": phone,
+        "ym": ym,
+        "raw_meter_index": (str(raw_meter_index) if raw_meter_index is not None else None),
+        "meter_index": meter_index,
+        "meter_index_mode": meter_index_mode,
+    }
+
+
+@router.post("/events/photo")
+async def photo_event(request: Request, file: UploadFile = File(None)):
+    form = await request.form()
+    fields = _photo_event_fields(form)
+    chat_id = fields["chat_id"]
 
     def _looks_like_upload(v) -> bool:
         return (
@@ -1465,6 +1498,59 @@ async def photo_event(request: Request, file: UploadFile = File(None)):
     if not photo_payloads:
         return JSONResponse(status_code=200, content={"status": "accepted", "error": "no_file", "chat_id": str(chat_id)})
 
+    # Async mode: persist the photo as an OCR job and acknowledge right away.
+    # The job worker runs _process_photo_event; clients poll /events/photo/jobs/{job_id}.
+    if str(form.get("async") or "").strip().lower() in ("1", "true", "yes", "on") and db_ready():
+        try:
+            job_id = await run_in_threadpool(enqueue_photo_job, fields, photo_payloads)
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "status": "queued",
+                    "job_id": job_id,
+                    "trace_id": fields["trace_id"],
+                    "chat_id": str(chat_id),
+                },
+            )
+        except Exception as e:
+            fields["diag"]["warnings"].append({"ocr_job_enqueue_failed": str(e)})
+
+    # OCR HTTP, WebDAV and DB work are blocking: keep them off the event loop.
+    content = await run_photo_stage(_process_photo_event, photo_payloads=photo_payloads, **fields)
+    return JSONResponse(status_code=200, content=content)
+
+
+@router.get("/events/photo/jobs/{job_id}")
+def photo_job_status(job_id: int):
+    if not db_ready():
+        raise HTTPException(status_code=500, detail="DB is not configured")
+    ensure_tables()
+    job = get_photo_job(int(job_id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
+def _run_photo_job(fields: dict, photo_payloads: list[dict], job: dict) -> dict:
+    """OCR job handler: same processing as the synchronous endpoint."""
+    return _process_photo_event(photo_payloads=photo_payloads, job=job, **fields)
+
+
+def _process_photo_event(
+    *,
+    photo_payloads: list[dict],
+    diag: dict,
+    trace_id: str,
+    chat_id: str,
+    telegram_username: str | None,
+    phone: str | None,
+    ym: str,
+    raw_meter_index: str | None,
+    meter_index: int,
+    meter_index_mode: str,
+    job: dict | None = None,
+) -> dict:
+    t0 = time.monotonic()
     selected_idx = 0
     blob = bytes(photo_payloads[selected_idx]["blob"])
     selected_filename = str(photo_payloads[selected_idx].get("filename") or "photo.jpg")
@@ -1559,6 +1645,10 @@ async def photo_event(request: Request, file: UploadFile = File(None)):
     ocr_t0 = time.monotonic()
     ocr_http_ok = False
     ocr_http_status = None
+    ocr_resp, ocr_exc = None, None
+    ocr_cached: dict | None = None
+    ocr_cache_key: str | None = None
+    ocr_pipeline_version: str | None = None
     if len(photo_payloads) > 1:
         series_photos = [
             (bytes(p["blob"]), str(p.get("filename") or "photo.jpg"), str(p.get("mime") or "image/jpeg"))
@@ -1571,16 +1661,54 @@ async def photo_event(request: Request, file: UploadFile = File(None)):
             context_serial_hint=context_serial_hint,
         )
     else:
-        ocr_resp, ocr_exc = _call_ocr_with_retries(
-            blob,
-            filename=selected_filename,
-            mime_type=selected_mime,
-            trace_id=trace_id,
-            context_prev_water=context_prev_water,
-            context_serial_hint=context_serial_hint,
-        )
+        # Same photo + same context + same OCR pipeline -> reuse the stored /recognize result.
+        if db_ready() and OCR_RESULT_CACHE_ENABLED:
+            try:
+                ocr_pipeline_version = get_ocr_pipeline_version()
+                if ocr_pipeline_version:
+                    ocr_cache_key = ocr_result_cache_key(
+                        file_sha256,
+                        context_prev_water=context_prev_water,
+                        context_serial_hint=context_serial_hint,
+                        pipeline_version=ocr_pipeline_version,
+                    )
+                    with engine.begin() as conn:
+                        ocr_cached = get_cached_ocr_result(conn, ocr_cache_key)
+                        if ocr_cached is not None:
+                            dup_row = conn.execute(
+                                text(
+                                    """
+                                    SELECT id FROM photo_events
+                                    WHERE file_sha256=:sha
+                                    ORDER BY created_at DESC
+                                    LIMIT 1
+                                    """
+                                ),
+                                {"sha": file_sha256},
+                            ).fetchone()
+                            diag["ocr_cache"] = {
+                                "hit": True,
+                                "duplicate_of_photo_event_id": int(dup_row[0]) if dup_row else None,
+                            }
+            except Exception as e:
+                ocr_cache_key = None
+                ocr_cached = None
+                diag["warnings"].append({"ocr_result_cache_lookup_error": str(e)})
+        if ocr_cached is None:
+            ocr_resp, ocr_exc = _call_ocr_with_retries(
+                blob,
+                filename=selected_filename,
+                mime_type=selected_mime,
+                trace_id=trace_id,
+                context_prev_water=context_prev_water,
+                context_serial_hint=context_serial_hint,
+            )
     diag["ocr_latency_ms"] = int((time.monotonic() - ocr_t0) * 1000)
-    if ocr_resp is not None:
+    if ocr_cached is not None:
+        ocr_data = dict(ocr_cached)
+        ocr_http_ok = True
+        ocr_http_status = 200
+    elif ocr_resp is not None:
         ocr_http_ok = bool(ocr_resp.ok)
         ocr_http_status = int(ocr_resp.status_code)
         if ocr_resp.ok:
@@ -1641,6 +1769,23 @@ async def photo_event(request: Request, file: UploadFile = File(None)):
                         diag["warnings"].append("ocr_series_bad_response")
             else:
                 ocr_data = ocr_json
+                if (
+                    ocr_cache_key
+                    and ocr_pipeline_version
+                    and isinstance(ocr_json, dict)
+                    and ocr_json.get("reading") is not None
+                ):
+                    try:
+                        with engine.begin() as conn:
+                            put_cached_ocr_result(
+                                conn,
+                                cache_key=ocr_cache_key,
+                                file_sha256=file_sha256,
+                                pipeline_version=ocr_pipeline_version,
+                                result=ocr_json,
+                            )
+                    except Exception as e:
+                        diag["warnings"].append({"ocr_result_cache_store_error": str(e)})
         else:
             diag["warnings"].append(f"ocr_http_{ocr_resp.status_code}")
     else:
@@ -1757,523 +1902,568 @@ async def photo_event(request: Request, file: UploadFile = File(None)):
         if isinstance(ocr_data, dict):
             ocr_data["reading"] = value_float
 
-    # 2) resolve apartment
+    # Local copy for the admin UI (content-addressed, so retakes of the same file are free).
+    try:
+        photo_cache_put(file_sha256, blob)
+    except Exception as e:
+        diag["warnings"].append({"photo_cache_put_failed": str(e)})
 
-    if apartment_id is None and db_ready():
+    # 3) upload to ydisk
+    # With the outbox the path is fixed now and the upload is queued together with the photo_events row;
+    # the background worker fills photo_events.ydisk_path once the file lands.
+    ydisk_path = None
+    ydisk_queued = False
+    if ydisk_ready() and ydisk_outbox_active():
+        ydisk_path = ydisk_photo_path(
+            str(chat_id),
+            telegram_username or f"chat_{chat_id}",
+            str(ocr_type or "unknown"),
+            selected_filename,
+        )
+        ydisk_queued = True
+        diag["ydisk_upload"] = "queued"
+    elif ydisk_ready():
         try:
-            apartment_id = find_apartment_by_contact(telegram_username, phone)
-            if apartment_id is not None:
-                bind_chat(str(chat_id), int(apartment_id))
-                # Автозаполнение контактов квартиры (если пришли от пользователя)
-                try:
-                    if telegram_username:
-                        _set_contact(int(apartment_id), "telegram", telegram_username)
-                    if phone:
-                        _set_contact(int(apartment_id), "phone", phone)
-                except Exception as e:
-                    diag["warnings"].append({"autofill_contact_error": str(e)})
+            with ydisk_stage:
+                ydisk_path = upload_to_ydisk(
+                    str(chat_id),
+                    chat_name=telegram_username or f"chat_{chat_id}",
+                    meter_type_label=str(ocr_type or "unknown"),
+                    original_filename=selected_filename,
+                    content=blob,
+                )
         except Exception as e:
-            diag["errors"].append({"apartment_match_error": str(e)})
+            diag["errors"].append({"ydisk_upload_error": str(e)})
+    else:
+        diag["warnings"].append("ydisk_not_configured")
 
-    # Second-pass correction for water: use OCR debug candidates + previous month sanity
-    if db_ready() and apartment_id and value_float is not None and is_water_context:
-        try:
-            dbg = debug_candidates
-            prev_ym = _prev_ym(str(ym))
-            with engine.begin() as conn:
-                prev_cold = _get_prev_reading(conn, int(apartment_id), prev_ym, "cold", 1)
-                prev_hot = _get_prev_reading(conn, int(apartment_id), prev_ym, "hot", 1)
-                prev_ref = None
-                if str(kind) == "hot":
-                    prev_ref = float(prev_hot) if prev_hot is not None else None
-                elif str(kind) == "cold":
-                    prev_ref = float(prev_cold) if prev_cold is not None else None
-                if prev_ref is None:
-                    if prev_cold is not None and prev_hot is not None:
-                        prev_ref = max(float(prev_cold), float(prev_hot))
-                    elif prev_cold is not None:
-                        prev_ref = float(prev_cold)
-                    elif prev_hot is not None:
-                        prev_ref = float(prev_hot)
-            # If current value is suspiciously low, try replacing by better debug candidate
-            delta_from_prev = abs(float(value_float) - float(prev_ref)) if prev_ref is not None else None
-            suspicious = (
-                (
-                    prev_ref is not None
-                    and (
-                        float(value_float) + float(WATER_ANOMALY_THRESHOLD) < float(prev_ref)
-                        or float(value_float) - float(WATER_ANOMALY_THRESHOLD) > float(prev_ref)
-                    )
-                )
-                or (float(value_float) <= 0.0)
-            )
-            if suspicious:
-                if WATER_INTEGER_ONLY:
-                    # Important: in integer-only mode don't auto-replace OCR value by
-                    # "closer to previous month" candidate. This was causing systematic
-                    # upward drift (e.g. 1103 -> 3219) on dark photos.
-                    old_v = float(value_float)
-                    if _looks_like_serial_reading(old_v, serial_norm):
-                        diag["warnings"].append(
-                            {
-                                "water_prev_sanity_saved_with_review": {
-                                    "value": old_v,
-                                    "prev_ref": prev_ref,
-                                    "reason": "serial_like_saved_integer_only",
-                                }
-                            }
-                        )
-                    elif (prev_ref is not None) and (delta_from_prev is not None) and (
-                        float(delta_from_prev) > float(WATER_ANOMALY_THRESHOLD) * 2.0
-                    ):
-                        diag["warnings"].append(
-                            {
-                                "water_prev_sanity_saved_with_review": {
-                                    "value": old_v,
-                                    "prev_ref": prev_ref,
-                                    "reason": "severe_outlier_saved_integer_only_no_autocorrect",
-                                }
-                            }
+    # 2)..6.4) post-OCR persistence runs as one unit of work: a single transaction and commit per photo
+    # (each former `engine.begin()` block is now a savepoint). On serialization failure the whole block is
+    # replayed, so everything it mutates is reset from persist_start first.
+    persist_start = (apartment_id, value_float, kind, copy.deepcopy(ocr_data), copy.deepcopy(diag))
+    photo_event_id = None
+    status = "received"
+    wrote_meter = False
+    assigned_meter_index = int(meter_index)
+
+    def _persist(uow: UnitOfWork | None) -> dict | None:
+        nonlocal apartment_id, value_float, kind, photo_event_id, status, wrote_meter, assigned_meter_index
+        apartment_id, value_float, kind = persist_start[0], persist_start[1], persist_start[2]
+        if isinstance(ocr_data, dict):
+            ocr_data.clear()
+            ocr_data.update(copy.deepcopy(persist_start[3]))
+        diag.clear()
+        diag.update(copy.deepcopy(persist_start[4]))
+        if job is not None and uow is not None:
+            # commits with the rows below, so a retry of the job can never write them twice
+            mark_photo_job_written(uow.conn, job["id"], attempts=job["attempts"])
+
+        # 2) resolve apartment
+
+        if apartment_id is None and db_ready():
+            try:
+                with uow.step() as conn:
+                    apartment_id = find_apartment_by_contact(telegram_username, phone, conn=conn)
+                    if apartment_id is not None:
+                        bind_chat(str(chat_id), int(apartment_id), conn=conn)
+                if apartment_id is not None:
+                    # Автозаполнение контактов квартиры (если пришли от пользователя)
+                    try:
+                        with uow.step() as conn:
+                            if telegram_username:
+                                _set_contact(int(apartment_id), "telegram", telegram_username, conn=conn)
+                            if phone:
+                                _set_contact(int(apartment_id), "phone", phone, conn=conn)
+                    except Exception as e:
+                        diag["warnings"].append({"autofill_contact_error": str(e)})
+            except Exception as e:
+                diag["errors"].append({"apartment_match_error": str(e)})
+
+        # Second-pass correction for water: use OCR debug candidates + previous month sanity
+        if db_ready() and apartment_id and value_float is not None and is_water_context:
+            try:
+                dbg = debug_candidates
+                prev_ym = _prev_ym(str(ym))
+                with uow.read() as conn:
+                    prev_cold = _get_prev_reading(conn, int(apartment_id), prev_ym, "cold", 1)
+                    prev_hot = _get_prev_reading(conn, int(apartment_id), prev_ym, "hot", 1)
+                    prev_ref = None
+                    if str(kind) == "hot":
+                        prev_ref = float(prev_hot) if prev_hot is not None else None
+                    elif str(kind) == "cold":
+                        prev_ref = float(prev_cold) if prev_cold is not None else None
+                    if prev_ref is None:
+                        if prev_cold is not None and prev_hot is not None:
+                            prev_ref = max(float(prev_cold), float(prev_hot))
+                        elif prev_cold is not None:
+                            prev_ref = float(prev_cold)
+                        elif prev_hot is not None:
+                            prev_ref = float(prev_hot)
+                # If current value is suspiciously low, try replacing by better debug candidate
+                delta_from_prev = abs(float(value_float) - float(prev_ref)) if prev_ref is not None else None
+                suspicious = (
+                    (
+                        prev_ref is not None
+                        and (
+                            float(value_float) + float(WATER_ANOMALY_THRESHOLD) < float(prev_ref)
+                            or float(value_float) - float(WATER_ANOMALY_THRESHOLD) > float(prev_ref)
                         )
-                else:
-                    best_c = _choose_water_debug_candidate_with_prev(
-                        dbg,
-                        prev_value=prev_ref,
-                        serial_norm=serial_norm,
                     )
-                    if best_c and best_c.get("reading") is not None:
+                    or (float(value_float) <= 0.0)
+                )
+                if suspicious:
+                    if WATER_INTEGER_ONLY:
+                        # Important: in integer-only mode don't auto-replace OCR value by
+                        # "closer to previous month" candidate. This was causing systematic
+                        # upward drift (e.g. 1103 -> 3219) on dark photos.
                         old_v = float(value_float)
-                        candidate_v = float(best_c.get("reading"))
-                        # accept only meaningful improvement; otherwise block write
-                        if abs(candidate_v - float(prev_ref)) + 120.0 < abs(old_v - float(prev_ref)):
-                            value_float = candidate_v
-                            kind = _ocr_to_kind(best_c.get("type")) or kind
-                            if isinstance(ocr_data, dict):
-                                ocr_data["reading"] = float(value_float)
-                                ocr_data["type"] = best_c.get("type")
+                        if _looks_like_serial_reading(old_v, serial_norm):
                             diag["warnings"].append(
                                 {
-                                    "water_prev_sanity_corrected": {
-                                        "from": old_v,
-                                        "to": float(value_float),
+                                    "water_prev_sanity_saved_with_review": {
+                                        "value": old_v,
                                         "prev_ref": prev_ref,
-                                        "variant": best_c.get("variant"),
-                                        "provider": best_c.get("provider"),
+                                        "reason": "serial_like_saved_integer_only",
                                     }
                                 }
                             )
-                        else:
+                        elif (prev_ref is not None) and (delta_from_prev is not None) and (
+                            float(delta_from_prev) > float(WATER_ANOMALY_THRESHOLD) * 2.0
+                        ):
                             diag["warnings"].append(
                                 {
-                                    "water_prev_sanity_blocked": {
+                                    "water_prev_sanity_saved_with_review": {
                                         "value": old_v,
-                                        "candidate": candidate_v,
                                         "prev_ref": prev_ref,
-                                        "reason": "no_meaningful_improvement",
+                                        "reason": "severe_outlier_saved_integer_only_no_autocorrect",
                                     }
                                 }
                             )
-                            if (prev_ref is not None) and (
-                                abs(old_v - float(prev_ref)) > float(WATER_ANOMALY_THRESHOLD) * 2.0
-                            ):
-                                value_float = None
+                    else:
+                        best_c = _choose_water_debug_candidate_with_prev(
+                            dbg,
+                            prev_value=prev_ref,
+                            serial_norm=serial_norm,
+                        )
+                        if best_c and best_c.get("reading") is not None:
+                            old_v = float(value_float)
+                            candidate_v = float(best_c.get("reading"))
+                            # accept only meaningful improvement; otherwise block write
+                            if abs(candidate_v - float(prev_ref)) + 120.0 < abs(old_v - float(prev_ref)):
+                                value_float = candidate_v
+                                kind = _ocr_to_kind(best_c.get("type")) or kind
+                                if isinstance(ocr_data, dict):
+                                    ocr_data["reading"] = float(value_float)
+                                    ocr_data["type"] = best_c.get("type")
+                                diag["warnings"].append(
+                                    {
+                                        "water_prev_sanity_corrected": {
+                                            "from": old_v,
+                                            "to": float(value_float),
+                                            "prev_ref": prev_ref,
+                                            "variant": best_c.get("variant"),
+                                            "provider": best_c.get("provider"),
+                                        }
+                                    }
+                                )
+                            else:
                                 diag["warnings"].append(
                                     {
                                         "water_prev_sanity_blocked": {
                                             "value": old_v,
+                                            "candidate": candidate_v,
                                             "prev_ref": prev_ref,
-                                            "reason": "blocked_severe_outlier",
+                                            "reason": "no_meaningful_improvement",
                                         }
                                     }
                                 )
-                    elif _looks_like_serial_reading(value_float, serial_norm):
-                        diag["warnings"].append(
-                            {
-                                "water_prev_sanity_blocked": {
-                                    "value": float(value_float),
-                                    "prev_ref": prev_ref,
-                                    "reason": "serial_like_and_too_low",
+                                if (prev_ref is not None) and (
+                                    abs(old_v - float(prev_ref)) > float(WATER_ANOMALY_THRESHOLD) * 2.0
+                                ):
+                                    value_float = None
+                                    diag["warnings"].append(
+                                        {
+                                            "water_prev_sanity_blocked": {
+                                                "value": old_v,
+                                                "prev_ref": prev_ref,
+                                                "reason": "blocked_severe_outlier",
+                                            }
+                                        }
+                                    )
+                        elif _looks_like_serial_reading(value_float, serial_norm):
+                            diag["warnings"].append(
+                                {
+                                    "water_prev_sanity_blocked": {
+                                        "value": float(value_float),
+                                        "prev_ref": prev_ref,
+                                        "reason": "serial_like_and_too_low",
+                                    }
                                 }
-                            }
-                        )
-                    elif (prev_ref is not None) and (delta_from_prev is not None) and (
-                        float(delta_from_prev) > float(WATER_ANOMALY_THRESHOLD) * 2.0
-                    ):
-                        old_v = float(value_float)
-                        value_float = None
-                        diag["warnings"].append(
-                            {
-                                "water_prev_sanity_blocked": {
-                                    "value": old_v,
-                                    "prev_ref": prev_ref,
-                                    "reason": "blocked_severe_outlier_no_candidate",
+                            )
+                        elif (prev_ref is not None) and (delta_from_prev is not None) and (
+                            float(delta_from_prev) > float(WATER_ANOMALY_THRESHOLD) * 2.0
+                        ):
+                            old_v = float(value_float)
+                            value_float = None
+                            diag["warnings"].append(
+                                {
+                                    "water_prev_sanity_blocked": {
+                                        "value": old_v,
+                                        "prev_ref": prev_ref,
+                                        "reason": "blocked_severe_outlier_no_candidate",
+                                    }
                                 }
-                            }
-                        )
-        except Exception as e:
-            diag["warnings"].append({"water_prev_sanity_failed": str(e)})
-
-    # 2.06) water fallback when OCR returned no numeric reading:
-    # try to recover from debug candidates (including black/red digit extraction).
-    if db_ready() and apartment_id and (value_float is None) and is_water_context:
-        try:
-            dbg = debug_candidates
-            prev_ym = _prev_ym(str(ym))
-            with engine.begin() as conn:
-                prev_cold = _get_prev_reading(conn, int(apartment_id), prev_ym, "cold", 1)
-                prev_hot = _get_prev_reading(conn, int(apartment_id), prev_ym, "hot", 1)
-                prev_ref = None
-                if str(kind) == "hot":
-                    prev_ref = float(prev_hot) if prev_hot is not None else None
-                elif str(kind) == "cold":
-                    prev_ref = float(prev_cold) if prev_cold is not None else None
-                if prev_ref is None:
-                    if prev_cold is not None and prev_hot is not None:
-                        prev_ref = max(float(prev_cold), float(prev_hot))
-                    elif prev_cold is not None:
-                        prev_ref = float(prev_cold)
-                    elif prev_hot is not None:
-                        prev_ref = float(prev_hot)
-            best_c = _choose_water_debug_candidate_with_prev(
-                dbg,
-                prev_value=prev_ref,
-                serial_norm=serial_norm,
-            )
-            if best_c and best_c.get("reading") is not None:
-                value_float = float(best_c.get("reading"))
-                kind = _ocr_to_kind(best_c.get("type")) or kind
-                if isinstance(ocr_data, dict):
-                    ocr_data["reading"] = float(value_float)
-                    ocr_data["type"] = best_c.get("type")
-                diag["warnings"].append(
-                    {
-                        "water_debug_recovered": {
-                            "to": float(value_float),
-                            "prev_ref": prev_ref,
-                            "variant": best_c.get("variant"),
-                            "provider": best_c.get("provider"),
-                            "black_digits": best_c.get("black_digits"),
-                            "red_digits": best_c.get("red_digits"),
-                        }
-                    }
-                )
-        except Exception as e:
-            diag["warnings"].append({"water_debug_recover_failed": str(e)})
+                            )
+            except Exception as e:
+                diag["warnings"].append({"water_prev_sanity_failed": str(e)})
 
-    # 2.05) optional heuristic fix (disabled by default): water missing last decimal digit
-    if ENABLE_AGGRESSIVE_OCR_AUTOFIX and db_ready() and apartment_id and kind in ("cold", "hot") and value_float is not None:
-        try:
-            with engine.begin() as conn:
-                fixed_value, fix_diag = _maybe_fix_water_missing_last_decimal(
-                    conn,
-                    int(apartment_id),
-                    str(ym),
-                    str(kind),
-                    str(ocr_reading) if ocr_reading is not None else None,
-                    float(value_float),
+        # 2.06) water fallback when OCR returned no numeric reading:
+        # try to recover from debug candidates (including black/red digit extraction).
+        if db_ready() and apartment_id and (value_float is None) and is_water_context:
+            try:
+                dbg = debug_candidates
+                prev_ym = _prev_ym(str(ym))
+                with uow.read() as conn:
+                    prev_cold = _get_prev_reading(conn, int(apartment_id), prev_ym, "cold", 1)
+                    prev_hot = _get_prev_reading(conn, int(apartment_id), prev_ym, "hot", 1)
+                    prev_ref = None
+                    if str(kind) == "hot":
+                        prev_ref = float(prev_hot) if prev_hot is not None else None
+                    elif str(kind) == "cold":
+                        prev_ref = float(prev_cold) if prev_cold is not None else None
+                    if prev_ref is None:
+                        if prev_cold is not None and prev_hot is not None:
+                            prev_ref = max(float(prev_cold), float(prev_hot))
+                        elif prev_cold is not None:
+                            prev_ref = float(prev_cold)
+                        elif prev_hot is not None:
+                            prev_ref = float(prev_hot)
+                best_c = _choose_water_debug_candidate_with_prev(
+                    dbg,
+                    prev_value=prev_ref,
+                    serial_norm=serial_norm,
                 )
-            if fix_diag:
-                value_float = float(fixed_value)
-                if isinstance(ocr_data, dict):
-                    ocr_data["reading"] = float(value_float)
-                diag["warnings"].append({"auto_fix_water_missing_last_decimal": fix_diag})
-        except Exception as e:
-            diag["warnings"].append({"auto_fix_water_missing_last_decimal_failed": str(e)})
-
-    # Re-apply integer-only normalization after all corrections.
-    if WATER_INTEGER_ONLY and is_water_context and (value_float is not None):
-        value_float = _as_water_integer(value_float)
-        if isinstance(ocr_data, dict):
-            ocr_data["reading"] = value_float
-
-    # 2.1) optional heuristic fix (disabled by default): one missed digit in electric reading
-    if ENABLE_AGGRESSIVE_OCR_AUTOFIX and db_ready() and apartment_id and kind == "electric" and value_float is not None:
-        try:
-            with engine.begin() as conn:
-                fixed_value, fix_diag = _maybe_fix_missing_digit_electric(conn, int(apartment_id), str(ym), float(value_float))
-            if fix_diag:
-                value_float = float(fixed_value)
-                if isinstance(ocr_data, dict):
-                    ocr_data["reading"] = float(value_float)
-                diag["warnings"].append({"auto_fix_missing_digit": fix_diag})
-        except Exception as e:
-            diag["warnings"].append({"auto_fix_missing_digit_failed": str(e)})
+                if best_c and best_c.get("reading") is not None:
+                    value_float = float(best_c.get("reading"))
+                    kind = _ocr_to_kind(best_c.get("type")) or kind
+                    if isinstance(ocr_data, dict):
+                        ocr_data["reading"] = float(value_float)
+                        ocr_data["type"] = best_c.get("type")
+                    diag["warnings"].append(
+                        {
+                            "water_debug_recovered": {
+                                "to": float(value_float),
+                                "prev_ref": prev_ref,
+                                "variant": best_c.get("variant"),
+                                "provider": best_c.get("provider"),
+                                "black_digits": best_c.get("black_digits"),
+                                "red_digits": best_c.get("red_digits"),
+                            }
+                        }
+                    )
+            except Exception as e:
+                diag["warnings"].append({"water_debug_recover_failed": str(e)})
 
-    # 3) upload to ydisk
-    ydisk_path = None
-    if ydisk_ready():
-        try:
-            ydisk_path = upload_to_ydisk(
-                str(chat_id),
-                chat_name=telegram_username or f"chat_{chat_id}",
-                meter_type_label=str(ocr_type or "unknown"),
-                original_filename=selected_filename,
-                content=blob,
-            )
-        except Exception as e:
-            diag["errors"].append({"ydisk_upload_error": str(e)})
-    else:
-        diag["warnings"].append("ydisk_not_configured")
+        # 2.05) optional heuristic fix (disabled by default): water missing last decimal digit
+        if ENABLE_AGGRESSIVE_OCR_AUTOFIX and db_ready() and apartment_id and kind in ("cold", "hot") and value_float is not None:
+            try:
+                with uow.read() as conn:
+                    fixed_value, fix_diag = _maybe_fix_water_missing_last_decimal(
+                        conn,
+                        int(apartment_id),
+                        str(ym),
+                        str(kind),
+                        str(ocr_reading) if ocr_reading is not None else None,
+                        float(value_float),
+                    )
+                if fix_diag:
+                    value_float = float(fixed_value)
+                    if isinstance(ocr_data, dict):
+                        ocr_data["reading"] = float(value_float)
+                    diag["warnings"].append({"auto_fix_water_missing_last_decimal": fix_diag})
+            except Exception as e:
+                diag["warnings"].append({"auto_fix_water_missing_last_decimal_failed": str(e)})
 
-    # 4) status/stage
-    if ydisk_path and apartment_id:
-        status = "assigned"
-        stage = "assigned"
-    elif ydisk_path:
-        status = "unassigned"
-        stage = "uploaded"
-    else:
-        status = "ydisk_error"
-        stage = "received"
+        # Re-apply integer-only normalization after all corrections.
+        if WATER_INTEGER_ONLY and is_water_context and (value_float is not None):
+            value_float = _as_water_integer(value_float)
+            if isinstance(ocr_data, dict):
+                ocr_data["reading"] = value_float
 
-    # 5) insert photo_event
-    photo_event_id = None
-    if db_ready():
-        try:
-            ocr_json_str = json.dumps(ocr_data, ensure_ascii=False) if ocr_data is not None else None
-            diag_json_str = json.dumps(diag, ensure_ascii=False) if diag is not None else None
+        # 2.1) optional heuristic fix (disabled by default): one missed digit in electric reading
+        if ENABLE_AGGRESSIVE_OCR_AUTOFIX and db_ready() and apartment_id and kind == "electric" and value_float is not None:
+            try:
+                with uow.read() as conn:
+                    fixed_value, fix_diag = _maybe_fix_missing_digit_electric(conn, int(apartment_id), str(ym), float(value_float))
+                if fix_diag:
+                    value_float = float(fixed_value)
+                    if isinstance(ocr_data, dict):
+                        ocr_data["reading"] = float(value_float)
+                    diag["warnings"].append({"auto_fix_missing_digit": fix_diag})
+            except Exception as e:
+                diag["warnings"].append({"auto_fix_missing_digit_failed": str(e)})
+
+        # 4) status/stage
+        if ydisk_path and apartment_id:
+            status = "assigned"
+            stage = "assigned"
+        elif ydisk_path:
+            status = "unassigned"
+            stage = "uploaded"
+        else:
+            status = "ydisk_error"
+            stage = "received"
 
-            with engine.begin() as conn:
-                photo_event_id = conn.execute(
-                    text("""
-                        INSERT INTO photo_events
-                        (
-                            chat_id, telegram_username, phone, original_filename, ydisk_path,
-                            status, apartment_id, ym, ocr_json,
-                            meter_index,
-                            stage, stage_updated_at,
-                            file_sha256, ocr_type, ocr_reading,
-                            meter_kind, meter_value, meter_written,
-                            diag_json
-                        )
-                        VALUES
-                        (
-                            :chat_id, :username, :phone, :orig, :path,
-                            :status, :apartment_id, :ym,
-                            CASE WHEN :ocr_json IS NULL THEN NULL ELSE CAST(:ocr_json AS JSONB) END,
-                            :meter_index,
-                            :stage, now(),
-                            :file_sha256, :ocr_type, :ocr_reading,
-                            :meter_kind, :meter_value, false,
-                            CASE WHEN :diag_json IS NULL THEN NULL ELSE CAST(:diag_json AS JSONB) END
-                        )
-                        RETURNING id
-                    """),
-                    {
-                        "chat_id": str(chat_id),
-                        "username": telegram_username,
-                        "phone": phone,
-                        "orig": selected_filename,
-                        "path": ydisk_path,
-                        "status": status,
-                        "apartment_id": apartment_id,
-                        "ym": str(ym),
-                        "ocr_json": ocr_json_str,
-                        "meter_index": int(meter_index),
-                        "stage": stage,
-                        "file_sha256": file_sha256,
-                        "ocr_type": (str(ocr_type) if ocr_type is not None else None),
-                        "ocr_reading": (float(value_float) if value_float is not None else None),
-                        "meter_kind": (str(kind) if kind is not None else None),
-                        "meter_value": (float(value_float) if value_float is not None else None),
-                        "diag_json": diag_json_str,
-                    },
-                ).scalar_one()
+        # 5) insert photo_event
+        photo_event_id = None
+        if db_ready():
+            try:
+                ocr_json_str = json.dumps(ocr_data, ensure_ascii=False) if ocr_data is not None else None
+                diag_json_str = json.dumps(diag, ensure_ascii=False) if diag is not None else None
+
+                with uow.step() as conn:
+                    # assigned only once the step commits: a failed enqueue rolls the insert back too
+                    new_event_id = conn.execute(
+                        text("""
+                            INSERT INTO photo_events
+                            (
+                                chat_id, telegram_username, phone, original_filename, ydisk_path,
+                                status, apartment_id, ym, ocr_json,
+                                meter_index,
+                                stage, stage_updated_at,
+                                file_sha256, ocr_type, ocr_reading,
+                                meter_kind, meter_value, meter_written,
+                                diag_json
+                            )
+                            VALUES
+                            (
+                                :chat_id, :username, :phone, :orig, :path,
+                                :status, :apartment_id, :ym,
+                                CASE WHEN :ocr_json IS NULL THEN NULL ELSE CAST(:ocr_json AS JSONB) END,
+                                :meter_index,
+                                :stage, now(),
+                                :file_sha256, :ocr_type, :ocr_reading,
+                                :meter_kind, :meter_value, false,
+                                CASE WHEN :diag_json IS NULL THEN NULL ELSE CAST(:diag_json AS JSONB) END
+                            )
+                            RETURNING id
+                        """),
+                        {
+                            "chat_id": str(chat_id),
+                            "username": telegram_username,
+                            "phone": phone,
+                            "orig": selected_filename,
+                            "path": (None if ydisk_queued else ydisk_path),
+                            "status": status,
+                            "apartment_id": apartment_id,
+                            "ym": str(ym),
+                            "ocr_json": ocr_json_str,
+                            "meter_index": int(meter_index),
+                            "stage": stage,
+                            "file_sha256": file_sha256,
+                            "ocr_type": (str(ocr_type) if ocr_type is not None else None),
+                            "ocr_reading": (float(value_float) if value_float is not None else None),
+                            "meter_kind": (str(kind) if kind is not None else None),
+                            "meter_value": (float(value_float) if value_float is not None else None),
+                            "diag_json": diag_json_str,
+                        },
+                    ).scalar_one()
+                    if ydisk_queued:
+                        enqueue_ydisk_upload(conn, photo_event_id=new_event_id, disk_path=ydisk_path, content=blob)
+                photo_event_id = new_event_id
 
-        except Exception as e:
-            diag["errors"].append({"db_insert_error": str(e)})
+            except Exception as e:
+                diag["errors"].append({"db_insert_error": str(e)})
 
-    # 6) write meter_readings + statuses
-    wrote_meter = False
-    # ym already defined above
-    assigned_meter_index = int(meter_index)
+        # 6) write meter_readings + statuses
+        wrote_meter = False
+        # ym already defined above
+        assigned_meter_index = int(meter_index)
 
-    if db_ready() and apartment_id and (value_float is not None) and (kind or is_water_context):
-        try:
-            # 6.0) anomaly check vs previous month (absolute thresholds)
-            anomaly = False
-            anomaly_reason = None
-            block_write_due_anomaly = False
+        if db_ready() and apartment_id and (value_float is not None) and (kind or is_water_context):
             try:
-                prev_ym = _prev_ym(str(ym))
-                with engine.begin() as conn:
-                    if kind in ("cold", "hot"):
-                        prev_val = _get_prev_reading(conn, int(apartment_id), prev_ym, str(kind), 1)
-                        if prev_val is None:
-                            prev_val = _get_last_reading_before(conn, int(apartment_id), str(ym), str(kind), 1)
-                        if (prev_val is not None) and (abs(float(value_float) - float(prev_val)) > WATER_ANOMALY_THRESHOLD):
-                            anomaly = True
-                            anomaly_reason = {"meter_type": str(kind), "threshold": WATER_ANOMALY_THRESHOLD, "prev": prev_val, "curr": float(value_float)}
-                    elif kind == "electric":
-                        rows = conn.execute(
-                            text(
-                                """
-                                SELECT value
-                                FROM meter_readings
-                                WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric' AND meter_index IN (1,2,3)
-                                """
-                            ),
-                            {"aid": int(apartment_id), "ym": prev_ym},
-                        ).fetchall()
-                        prev_vals = []
-                        for r in rows:
-                            try:
-                                prev_vals.append(float(r[0]))
-                            except Exception:
-                                continue
-                        if not prev_vals:
-                            prev_vals = _get_last_electric_before(conn, int(apartment_id), str(ym))
-                        if prev_vals:
-                            diffs = [abs(float(value_float) - v) for v in prev_vals]
-                            min_diff = min(diffs)
-                            closest_prev = prev_vals[diffs.index(min_diff)]
-                            if min_diff > ELECTRIC_ANOMALY_THRESHOLD:
-                                anomaly = True
-                                anomaly_reason = {
-                                    "meter_type": "electric",
-                                    "threshold": ELECTRIC_ANOMALY_THRESHOLD,
-                                    "prev": float(closest_prev),
-                                    "curr": float(value_float),
-                                }
-            except Exception:
+                # 6.0) anomaly check vs previous month (absolute thresholds)
                 anomaly = False
-
-            # Hard guard: water reading 0 with non-zero history -> needs_review, no write.
-            try:
-                if kind in ("cold", "hot") and value_float is not None and float(value_float) <= 0.0:
+                anomaly_reason = None
+                block_write_due_anomaly = False
+                try:
                     prev_ym = _prev_ym(str(ym))
-                    with engine.begin() as conn:
-                        prev_val = _get_prev_reading(conn, int(apartment_id), prev_ym, str(kind), 1)
-                        if prev_val is None:
-                            prev_val = _get_last_reading_before(conn, int(apartment_id), str(ym), str(kind), 1)
-                    if (prev_val is not None) and (float(prev_val) > 0.0):
-                        anomaly = True
-                        block_write_due_anomaly = True
-                        anomaly_reason = {
-                            "meter_type": str(kind),
-                            "reason": "water_zero_with_history",
-                            "prev": float(prev_val),
-                            "curr": float(value_float),
-                        }
-            except Exception:
-                pass
+                    with uow.read() as conn:
+                        if kind in ("cold", "hot"):
+                            prev_val = _get_prev_reading(conn, int(apartment_id), prev_ym, str(kind), 1)
+                            if prev_val is None:
+                                prev_val = _get_last_reading_before(conn, int(apartment_id), str(ym), str(kind), 1)
+                            if (prev_val is not None) and (abs(float(value_float) - float(prev_val)) > WATER_ANOMALY_THRESHOLD):
+                                anomaly = True
+                                anomaly_reason = {"meter_type": str(kind), "threshold": WATER_ANOMALY_THRESHOLD, "prev": prev_val, "curr": float(value_float)}
+                        elif kind == "electric":
+                            rows = conn.execute(
+                                text(
+                                    """
+                                    SELECT value
+                                    FROM meter_readings
+                                    WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric' AND meter_index IN (1,2,3)
+                                    """
+                                ),
+                                {"aid": int(apartment_id), "ym": prev_ym},
+                            ).fetchall()
+                            prev_vals = []
+                            for r in rows:
+                                try:
+                                    prev_vals.append(float(r[0]))
+                                except Exception:
+                                    continue
+                            if not prev_vals:
+                                prev_vals = _get_last_electric_before(conn, int(apartment_id), str(ym))
+                            if prev_vals:
+                                diffs = [abs(float(value_float) - v) for v in prev_vals]
+                                min_diff = min(diffs)
+                                closest_prev = prev_vals[diffs.index(min_diff)]
+                                if min_diff > ELECTRIC_ANOMALY_THRESHOLD:
+                                    anomaly = True
+                                    anomaly_reason = {
+                                        "meter_type": "electric",
+                                        "threshold": ELECTRIC_ANOMALY_THRESHOLD,
+                                        "prev": float(closest_prev),
+                                        "curr": float(value_float),
+                                    }
+                except Exception:
+                    anomaly = False
 
-            if anomaly:
+                # Hard guard: water reading 0 with non-zero history -> needs_review, no write.
                 try:
-                    with engine.begin() as conn:
-                        # If this is a close retake of an already stored value for the same month,
-                        # don't block it as anomaly; allow overwrite to avoid loops.
-                        try:
-                            if (kind in ("cold", "hot")) or is_water_unknown:
-                                close_mt = _find_close_water(
-                                    conn,
-                                    int(apartment_id),
-                                    str(ym),
-                                    float(value_float),
-                                    WATER_RETAKE_THRESHOLD,
-                                )
-                                if close_mt:
-                                    anomaly = False
-                            elif kind == "electric":
-                                close_mi = _find_close_electric(
-                                    conn,
-                                    int(apartment_id),
-                                    str(ym),
-                                    float(value_float),
-                                    ELECTRIC_RETAKE_THRESHOLD,
-                                )
-                                if close_mi is not None:
-                                    anomaly = False
-                        except Exception:
-                            pass
-
-                        if anomaly:
-                            diag["warnings"].append({"anomaly_jump": anomaly_reason})
-                            # create review flag if missing
-                            mt = str(anomaly_reason.get("meter_type") if isinstance(anomaly_reason, dict) else (kind or "unknown"))
-                            if mt != "electric":
-                                mi = 1
-                            elif meter_index_mode == "explicit" and raw_meter_index is not None:
-                                mi = int(meter_index)
-                            else:
-                                mi = 1
-                            exists = conn.execute(
-                                text(
-                                    """
-                                    SELECT 1
-                                    FROM meter_review_flags
-                                    WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=:mi
-                                      AND status='open' AND reason='anomaly_jump'
-                                    LIMIT 1
-                                    """
-                                ),
-                                {"aid": int(apartment_id), "ym": str(ym), "mt": mt, "mi": int(mi)},
-                            ).fetchone()
-                            if not exists:
-                                conn.execute(
+                    if kind in ("cold", "hot") and value_float is not None and float(value_float) <= 0.0:
+                        prev_ym = _prev_ym(str(ym))
+                        with uow.read() as conn:
+                            prev_val = _get_prev_reading(conn, int(apartment_id), prev_ym, str(kind), 1)
+                            if prev_val is None:
+                                prev_val = _get_last_reading_before(conn, int(apartment_id), str(ym), str(kind), 1)
+                        if (prev_val is not None) and (float(prev_val) > 0.0):
+                            anomaly = True
+                            block_write_due_anomaly = True
+                            anomaly_reason = {
+                                "meter_type": str(kind),
+                                "reason": "water_zero_with_history",
+                                "prev": float(prev_val),
+                                "curr": float(value_float),
+                            }
+                except Exception:
+                    pass
+
+                if anomaly:
+                    try:
+                        with uow.step() as conn:
+                            # If this is a close retake of an already stored value for the same month,
+                            # don't block it as anomaly; allow overwrite to avoid loops.
+                            try:
+                                if (kind in ("cold", "hot")) or is_water_unknown:
+                                    close_mt = _find_close_water(
+                                        conn,
+                                        int(apartment_id),
+                                        str(ym),
+                                        float(value_float),
+                                        WATER_RETAKE_THRESHOLD,
+                                    )
+                                    if close_mt:
+                                        anomaly = False
+                                elif kind == "electric":
+                                    close_mi = _find_close_electric(
+                                        conn,
+                                        int(apartment_id),
+                                        str(ym),
+                                        float(value_float),
+                                        ELECTRIC_RETAKE_THRESHOLD,
+                                    )
+                                    if close_mi is not None:
+                                        anomaly = False
+                            except Exception:
+                                pass
+
+                            if anomaly:
+                                diag["warnings"].append({"anomaly_jump": anomaly_reason})
+                                # create review flag if missing
+                                mt = str(anomaly_reason.get("meter_type") if isinstance(anomaly_reason, dict) else (kind or "unknown"))
+                                if mt != "electric":
+                                    mi = 1
+                                elif meter_index_mode == "explicit" and raw_meter_index is not None:
+                                    mi = int(meter_index)
+                                else:
+                                    mi = 1
+                                exists = conn.execute(
                                     text(
                                         """
-                                        INSERT INTO meter_review_flags(
-                                            apartment_id, ym, meter_type, meter_index, status, reason, comment, created_at, resolved_at
-                                        )
-                                        VALUES(:aid, :ym, :mt, :mi, 'open', 'anomaly_jump', :comment, now(), NULL)
+                                        SELECT 1
+                                        FROM meter_review_flags
+                                        WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=:mi
+                                          AND status='open' AND reason='anomaly_jump'
+                                        LIMIT 1
                                         """
                                     ),
-                                    {
-                                        "aid": int(apartment_id),
-                                        "ym": str(ym),
-                                        "mt": mt,
-                                        "mi": int(mi),
-                                        "comment": json.dumps(anomaly_reason, ensure_ascii=False),
-                                    },
-                                )
-                            # create notification for admin
-                            username = (telegram_username or "").strip().lstrip("@").lower() or "Без username"
-                            related = json.dumps(
-                                {"ym": str(ym), "meter_type": mt, "meter_index": int(mi)},
-                                ensure_ascii=False,
-                            )
-                            msg = f"Подозрительный скачок по {('ХВС' if mt=='cold' else 'ГВС' if mt=='hot' else 'Электро')}: {anomaly_reason}"
-                            conn.execute(
-                                text(
-                                    """
-                                    INSERT INTO notifications(
-                                        chat_id, telegram_username, apartment_id, type, message, related, status, created_at
+                                    {"aid": int(apartment_id), "ym": str(ym), "mt": mt, "mi": int(mi)},
+                                ).fetchone()
+                                if not exists:
+                                    conn.execute(
+                                        text(
+                                            """
+                                            INSERT INTO meter_review_flags(
+                                                apartment_id, ym, meter_type, meter_index, status, reason, comment, created_at, resolved_at
+                                            )
+                                            VALUES(:aid, :ym, :mt, :mi, 'open', 'anomaly_jump', :comment, now(), NULL)
+                                            """
+                                        ),
+                                        {
+                                            "aid": int(apartment_id),
+                                            "ym": str(ym),
+                                            "mt": mt,
+                                            "mi": int(mi),
+                                            "comment": json.dumps(anomaly_reason, ensure_ascii=False),
+                                        },
                                     )
-                                    VALUES(:chat_id, :username, :apartment_id, 'anomaly_jump', :message, CAST(:related AS JSONB), 'unread', now())
-                                    """
-                                ),
-                                {
-                                    "chat_id": str(chat_id),
-                                    "username": username,
-                                    "apartment_id": int(apartment_id),
-                                    "message": msg,
-                                    "related": related,
-                                },
-                            )
-                            if photo_event_id:
-                                diag_json_str = json.dumps(diag, ensure_ascii=False) if diag is not None else None
+                                # create notification for admin
+                                username = (telegram_username or "").strip().lstrip("@").lower() or "Без username"
+                                related = json.dumps(
+                                    {"ym": str(ym), "meter_type": mt, "meter_index": int(mi)},
+                                    ensure_ascii=False,
+                                )
+                                msg = f"Подозрительный скачок по {('ХВС' if mt=='cold' else 'ГВС' if mt=='hot' else 'Электро')}: {anomaly_reason}"
                                 conn.execute(
                                     text(
                                         """
-                                        UPDATE photo_events
-                                        SET
-                                            meter_written = false,
-                                            stage = 'needs_review',
-                                            stage_updated_at = now(),
-                                            diag_json = CASE WHEN :diag_json IS NULL THEN diag_json ELSE CAST(:diag_json AS JSONB) END
-                                        WHERE id = :id
+                                        INSERT INTO notifications(
+                                            chat_id, telegram_username, apartment_id, type, message, related, status, created_at
+                                        )
+                                        VALUES(:chat_id, :username, :apartment_id, 'anomaly_jump', :message, CAST(:related AS JSONB), 'unread', now())
                                         """
                                     ),
-                                    {"id": int(photo_event_id), "diag_json": diag_json_str},
+                                    {
+                                        "chat_id": str(chat_id),
+                                        "username": username,
+                                        "apartment_id": int(apartment_id),
+                                        "message": msg,
+                                        "related": related,
+                                    },
                                 )
-                except Exception:
-                    pass
+                                if photo_event_id:
+                                    diag_json_str = json.dumps(diag, ensure_ascii=False) if diag is not None else None
+                                    conn.execute(
+                                        text(
+                                            """
+                                            UPDATE photo_events
+                                            SET
+                                                meter_written = false,
+                                                stage = 'needs_review',
+                                                stage_updated_at = now(),
+                                                diag_json = CASE WHEN :diag_json IS NULL THEN diag_json ELSE CAST(:diag_json AS JSONB) END
+                                            WHERE id = :id
+                                            """
+                                        ),
+                                        {"id": int(photo_event_id), "diag_json": diag_json_str},
+                                    )
+                    except Exception:
+                        pass
 
-                if block_write_due_anomaly:
-                    return JSONResponse(
-                        status_code=200,
-                        content={
+                    if block_write_due_anomaly:
+                        return {
                             "status": "ok",
                             "chat_id": str(chat_id),
                             "telegram_username": telegram_username,
@@ -2289,374 +2479,373 @@ async def photo_event(request: Request, file: UploadFile = File(None)):
                             "assigned_meter_index": assigned_meter_index,
                             "ym": ym,
                             "bill": None,
-                        },
-                    )
-
-                # Additional digit-length sanity check (guard against missing leading digits)
-                try:
-                    with engine.begin() as conn:
-                        if kind in ("cold", "hot"):
-                            last_val = _get_last_reading_before(conn, int(apartment_id), str(ym), str(kind), 1)
-                        elif kind == "electric":
-                            prev_vals = _get_last_electric_before(conn, int(apartment_id), str(ym))
-                            last_val = max(prev_vals) if prev_vals else None
-                        else:
-                            last_val = None
-                    if (last_val is not None) and (value_float is not None):
-                        if _digits_len(float(last_val)) - _digits_len(float(value_float)) >= 2:
-                            anomaly = True
-                            anomaly_reason = {
-                                "meter_type": str(kind or "unknown"),
-                                "reason": "digit_length_drop",
-                                "prev": float(last_val),
-                                "curr": float(value_float),
-                            }
-                except Exception:
-                    pass
+                        }
 
-                # Same-month sanity: if already have readings for this month,
-                # block huge mismatch to avoid overwriting correct manual values.
-                try:
-                    with engine.begin() as conn:
-                        if kind in ("cold", "hot"):
-                            vals = _get_same_month_water_values(conn, int(apartment_id), str(ym))
-                            existing = [v for mt, v in vals if mt == str(kind)]
-                        elif kind == "electric":
-                            existing = _get_same_month_electric_values(conn, int(apartment_id), str(ym))
-                        else:
-                            existing = []
-                    if existing and (value_float is not None):
-                        diffs = [abs(float(value_float) - v) for v in existing]
-                        min_diff = min(diffs)
-                        closest = existing[diffs.index(min_diff)]
-                        if _digits_len(float(closest)) - _digits_len(float(value_float)) >= 2:
-                            anomaly = True
-                            anomaly_reason = {
-                                "meter_type": str(kind or "unknown"),
-                                "reason": "digit_length_drop_same_month",
-                                "prev": float(closest),
-                                "curr": float(value_float),
-                            }
-                        elif min_diff > (WATER_ANOMALY_THRESHOLD if kind in ("cold", "hot") else ELECTRIC_ANOMALY_THRESHOLD):
-                            anomaly = True
-                            anomaly_reason = {
-                                "meter_type": str(kind or "unknown"),
-                                "reason": "mismatch_same_month",
-                                "prev": float(closest),
-                                "curr": float(value_float),
-                            }
-                except Exception:
-                    pass
+                    # Additional digit-length sanity check (guard against missing leading digits)
+                    try:
+                        with uow.read() as conn:
+                            if kind in ("cold", "hot"):
+                                last_val = _get_last_reading_before(conn, int(apartment_id), str(ym), str(kind), 1)
+                            elif kind == "electric":
+                                prev_vals = _get_last_electric_before(conn, int(apartment_id), str(ym))
+                                last_val = max(prev_vals) if prev_vals else None
+                            else:
+                                last_val = None
+                        if (last_val is not None) and (value_float is not None):
+                            if _digits_len(float(last_val)) - _digits_len(float(value_float)) >= 2:
+                                anomaly = True
+                                anomaly_reason = {
+                                    "meter_type": str(kind or "unknown"),
+                                    "reason": "digit_length_drop",
+                                    "prev": float(last_val),
+                                    "curr": float(value_float),
+                                }
+                    except Exception:
+                        pass
 
-                # even with anomaly we continue and write value to web,
-                # keeping review flag/notification for admin verification
-                if anomaly:
-                    diag["warnings"].append({"anomaly_saved_with_review": True})
-
-            # 6.1) write meter_readings and get assigned_meter_index
-            if kind == "electric":
-                # By default always auto-sort.
-                # First: if value is very close to an existing one, overwrite that slot.
-                close_idx = None
-                prev_manual = None
-                prev_manual_value = None
-                with engine.begin() as conn:
-                    rows = conn.execute(
-                        text(
-                            """
-                            SELECT meter_index, value
-                            FROM meter_readings
-                            WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric'
-                            """
-                        ),
-                        {"aid": int(apartment_id), "ym": str(ym)},
-                    ).fetchall()
-                    best = None
-                    for mi, v in (rows or []):
-                        if v is None:
-                            continue
-                        try:
-                            diff = abs(float(v) - float(value_float))
-                        except Exception:
-                            continue
-                        if diff <= ELECTRIC_RETAKE_THRESHOLD:
-                            if (best is None) or (diff < best[0]):
-                                best = (diff, int(mi))
-                        if best:
-                            close_idx = int(best[1])
+                    # Same-month sanity: if already have readings for this month,
+                    # block huge mismatch to avoid overwriting correct manual values.
+                    try:
+                        with uow.read() as conn:
+                            if kind in ("cold", "hot"):
+                                vals = _get_same_month_water_values(conn, int(apartment_id), str(ym))
+                                existing = [v for mt, v in vals if mt == str(kind)]
+                            elif kind == "electric":
+                                existing = _get_same_month_electric_values(conn, int(apartment_id), str(ym))
+                            else:
+                                existing = []
+                        if existing and (value_float is not None):
+                            diffs = [abs(float(value_float) - v) for v in existing]
+                            min_diff = min(diffs)
+                            closest = existing[diffs.index(min_diff)]
+                            if _digits_len(float(closest)) - _digits_len(float(value_float)) >= 2:
+                                anomaly = True
+                                anomaly_reason = {
+                                    "meter_type": str(kind or "unknown"),
+                                    "reason": "digit_length_drop_same_month",
+                                    "prev": float(closest),
+                                    "curr": float(value_float),
+                                }
+                            elif min_diff > (WATER_ANOMALY_THRESHOLD if kind in ("cold", "hot") else ELECTRIC_ANOMALY_THRESHOLD):
+                                anomaly = True
+                                anomaly_reason = {
+                                    "meter_type": str(kind or "unknown"),
+                                    "reason": "mismatch_same_month",
+                                    "prev": float(closest),
+                                    "curr": float(value_float),
+                                }
+                    except Exception:
+                        pass
+
+                    # even with anomaly we continue and write value to web,
+                    # keeping review flag/notification for admin verification
+                    if anomaly:
+                        diag["warnings"].append({"anomaly_saved_with_review": True})
+
+                # 6.1) write meter_readings and get assigned_meter_index
+                if kind == "electric":
+                    # By default always auto-sort.
+                    # First: if value is very close to an existing one, overwrite that slot.
+                    close_idx = None
+                    prev_manual = None
+                    prev_manual_value = None
+                    with uow.step() as conn:
+                        rows = conn.execute(
+                            text(
+                                """
+                                SELECT meter_index, value
+                                FROM meter_readings
+                                WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric'
+                                """
+                            ),
+                            {"aid": int(apartment_id), "ym": str(ym)},
+                        ).fetchall()
+                        best = None
+                        for mi, v in (rows or []):
+                            if v is None:
+                                continue
                             try:
-                                row = conn.execute(
-                                    text(
-                                        """
-                                        SELECT value, source
-                                        FROM meter_readings
-                                        WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric' AND meter_index=:mi
-                                        LIMIT 1
-                                        """
-                                    ),
-                                    {"aid": int(apartment_id), "ym": str(ym), "mi": int(close_idx)},
-                                ).fetchone()
-                                if row and str(row[1]) == "manual":
-                                    prev_manual = True
-                                    prev_manual_value = float(row[0])
+                                diff = abs(float(v) - float(value_float))
                             except Exception:
-                                pass
-                            _write_electric_overwrite_then_sort(
-                                conn,
-                                int(apartment_id),
-                                str(ym),
-                                int(close_idx),
-                                float(value_float),
-                                source="ocr",
-                            )
-                            assigned_meter_index = int(close_idx)
-                            diag["warnings"].append({"retake_overwrite": {"meter_type": "electric", "meter_index": int(close_idx)}})
+                                continue
+                            if diff <= ELECTRIC_RETAKE_THRESHOLD:
+                                if (best is None) or (diff < best[0]):
+                                    best = (diff, int(mi))
+                            if best:
+                                close_idx = int(best[1])
+                                try:
+                                    row = conn.execute(
+                                        text(
+                                            """
+                                            SELECT value, source
+                                            FROM meter_readings
+                                            WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric' AND meter_index=:mi
+                                            LIMIT 1
+                                            """
+                                        ),
+                                        {"aid": int(apartment_id), "ym": str(ym), "mi": int(close_idx)},
+                                    ).fetchone()
+                                    if row and str(row[1]) == "manual":
+                                        prev_manual = True
+                                        prev_manual_value = float(row[0])
+                                except Exception:
+                                    pass
+                                _write_electric_overwrite_then_sort(
+                                    conn,
+                                    int(apartment_id),
+                                    str(ym),
+                                    int(close_idx),
+                                    float(value_float),
+                                    source="ocr",
+                                )
+                                assigned_meter_index = int(close_idx)
+                                diag["warnings"].append({"retake_overwrite": {"meter_type": "electric", "meter_index": int(close_idx)}})
 
-                if close_idx is None:
-                    if (meter_index_mode == "explicit") and (raw_meter_index is not None):
-                        with engine.begin() as conn:
-                            try:
-                                row = conn.execute(
-                                    text(
-                                        """
-                                        SELECT value, source
-                                        FROM meter_readings
-                                        WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric' AND meter_index=:mi
-                                        LIMIT 1
-                                        """
-                                    ),
-                                    {"aid": int(apartment_id), "ym": str(ym), "mi": int(meter_index)},
-                                ).fetchone()
-                                if row and str(row[1]) == "manual":
-                                    prev_manual = True
-                                    prev_manual_value = float(row[0])
-                            except Exception:
-                                pass
-                            assigned_meter_index = _write_electric_explicit(
-                                conn,
-                                int(apartment_id),
-                                ym,
-                                int(meter_index),
-                                float(value_float),
-                            )
-                    else:
-                        with engine.begin() as conn:
-                            # find closest existing manual value for potential overwrite notice
+                    if close_idx is None:
+                        if (meter_index_mode == "explicit") and (raw_meter_index is not None):
+                            with uow.step() as conn:
+                                try:
+                                    row = conn.execute(
+                                        text(
+                                            """
+                                            SELECT value, source
+                                            FROM meter_readings
+                                            WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric' AND meter_index=:mi
+                                            LIMIT 1
+                                            """
+                                        ),
+                                        {"aid": int(apartment_id), "ym": str(ym), "mi": int(meter_index)},
+                                    ).fetchone()
+                                    if row and str(row[1]) == "manual":
+                                        prev_manual = True
+                                        prev_manual_value = float(row[0])
+                                except Exception:
+                                    pass
+                                assigned_meter_index = _write_electric_explicit(
+                                    conn,
+                                    int(apartment_id),
+                                    ym,
+                                    int(meter_index),
+                                    float(value_float),
+                                )
+                        else:
+                            with uow.step() as conn:
+                                # find closest existing manual value for potential overwrite notice
+                                try:
+                                    rows = conn.execute(
+                                        text(
+                                            """
+                                            SELECT meter_index, value, source
+                                            FROM meter_readings
+                                            WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric'
+                                            """
+                                        ),
+                                        {"aid": int(apartment_id), "ym": str(ym)},
+                                    ).fetchall()
+                                    best = None
+                                    for mi, v, src in (rows or []):
+                                        if v is None or str(src) != "manual":
+                                            continue
+                                        diff = abs(float(v) - float(value_float))
+                                        if (best is None) or (diff < best[0]):
+                                            best = (diff, float(v), int(mi))
+                                    if best:
+                                        prev_manual = True
+                                        prev_manual_value = float(best[1])
+                                except Exception:
+                                    pass
+                            with uow.step() as conn:
+                                assigned_meter_index = _assign_and_write_electric_sorted(
+                                    int(apartment_id),
+                                    ym,
+                                    float(value_float),
+                                    conn=conn,
+                                )
+
+                else:
+                    # water (cold/hot): always meter_index=1
+                    assigned_meter_index = 1
+                    water_write_blocked = False
+                    with uow.step() as conn:
+                        is_water = is_water_context
+                        water_uncertain = False
+                        water_prev_hard_block = False
+                        water_prev_hard_block_reason = None
+                        serial_prev_ref = None
+                        serial_prev_kind = None
+                        if is_water:
+                            prev_map = {}
                             try:
                                 rows = conn.execute(
                                     text(
                                         """
-                                        SELECT meter_index, value, source
+                                        SELECT meter_type, value, source
                                         FROM meter_readings
-                                        WHERE apartment_id=:aid AND ym=:ym AND meter_type='electric'
+                                        WHERE apartment_id=:aid AND ym=:ym AND meter_type IN ('cold','hot') AND meter_index=1
                                         """
                                     ),
                                     {"aid": int(apartment_id), "ym": str(ym)},
                                 ).fetchall()
-                                best = None
-                                for mi, v, src in (rows or []):
-                                    if v is None or str(src) != "manual":
+                                for mt, v, src in (rows or []):
+                                    if v is None:
                                         continue
-                                    diff = abs(float(v) - float(value_float))
-                                    if (best is None) or (diff < best[0]):
-                                        best = (diff, float(v), int(mi))
-                                if best:
-                                    prev_manual = True
-                                    prev_manual_value = float(best[1])
+                                    prev_map[str(mt)] = (float(v), str(src))
                             except Exception:
-                                pass
-                        assigned_meter_index = _assign_and_write_electric_sorted(
-                            int(apartment_id),
-                            ym,
-                            float(value_float),
-                        )
-
-            else:
-                # water (cold/hot): always meter_index=1
-                assigned_meter_index = 1
-                water_write_blocked = False
-                with engine.begin() as conn:
-                    is_water = is_water_context
-                    water_uncertain = False
-                    water_prev_hard_block = False
-                    water_prev_hard_block_reason = None
-                    serial_prev_ref = None
-                    serial_prev_kind = None
-                    if is_water:
-                        prev_map = {}
-                        try:
-                            rows = conn.execute(
-                                text(
-                                    """
-                                    SELECT meter_type, value, source
-                                    FROM meter_readings
-                                    WHERE apartment_id=:aid AND ym=:ym AND meter_type IN ('cold','hot') AND meter_index=1
-                                    """
-                                ),
-                                {"aid": int(apartment_id), "ym": str(ym)},
-                            ).fetchall()
-                            for mt, v, src in (rows or []):
-                                if v is None:
-                                    continue
-                                prev_map[str(mt)] = (float(v), str(src))
-                        except Exception:
-                            prev_map = {}
-                        # hard sanity guard: for water, a sharp drop vs previous month is blocked
-                        # (especially important when OCR type is unknown and serial tail is misread as value)
-                        try:
-                            prev_values = []
-                            # Use previous month baseline (not current month), otherwise a wrong write
-                            # in current month poisons the sanity floor.
-                            prev_ym = _prev_ym(str(ym))
-                            pc = _get_prev_reading(conn, int(apartment_id), prev_ym, "cold", 1)
-                            ph = _get_prev_reading(conn, int(apartment_id), prev_ym, "hot", 1)
-                            if pc is not None:
-                                prev_values.append(float(pc))
-                            if ph is not None:
-                                prev_values.append(float(ph))
-                            # Fallback to current month values only if previous month is absent.
-                            if not prev_values:
-                                prev_values = [float(vs[0]) for vs in prev_map.values() if vs and vs[0] is not None]
-                            if prev_values and value_float is not None:
-                                prev_floor = min(prev_values)
-                                if float(value_float) + 50.0 < float(prev_floor):
-                                    water_prev_hard_block = True
-                                    water_prev_hard_block_reason = {
-                                        "value": float(value_float),
-                                        "prev_floor": float(prev_floor),
-                                        "reason": "sharp_drop_vs_prev",
-                                        "ydisk_path": ydisk_path,
-                                    }
-                                    diag["warnings"].append(
-                                        {"water_prev_hard_block": dict(water_prev_hard_block_reason)}
-                                    )
-                        except Exception:
-                            pass
-                        # --- serial-based routing: if serial matches apartment, force meter_type ---
-                        force_kind = None
-                        force_no_sort = False
-                        try:
-                            if serial_norm:
-                                row = conn.execute(
-                                    text(
-                                        """
-                                        SELECT cold_serial, hot_serial
-                                        FROM apartments
-                                        WHERE id=:aid
-                                        """
-                                    ),
-                                    {"aid": int(apartment_id)},
-                                ).mappings().first()
-                                cold_serial = row.get("cold_serial") if row else None
-                                hot_serial = row.get("hot_serial") if row else None
-
-                                s_last5 = _last5_serial(serial_norm)
-                                cold_last5 = _last5_serial(cold_serial)
-                                hot_last5 = _last5_serial(hot_serial)
-                                cold_match = _serial_last5_matches(s_last5, cold_last5)
-                                hot_match = _serial_last5_matches(s_last5, hot_last5)
-
-                                if cold_match and not hot_match:
-                                    force_kind = "cold"
-                                    force_no_sort = True
-                                elif hot_match and not cold_match:
-                                    force_kind = "hot"
-                                    force_no_sort = True
-                                elif cold_match and hot_match:
-                                    # ambiguous serial tail, keep OCR flow but mark uncertainty
-                                    diag["warnings"].append(
-                                        {
-                                            "serial_ambiguous_route": {
-                                                "serial_last5": s_last5,
-                                                "cold_last5": cold_last5,
-                                                "hot_last5": hot_last5,
-                                            }
+                                prev_map = {}
+                            # hard sanity guard: for water, a sharp drop vs previous month is blocked
+                            # (especially important when OCR type is unknown and serial tail is misread as value)
+                            try:
+                                prev_values = []
+                                # Use previous month baseline (not current month), otherwise a wrong write
+                                # in current month poisons the sanity floor.
+                                prev_ym = _prev_ym(str(ym))
+                                pc = _get_prev_reading(conn, int(apartment_id), prev_ym, "cold", 1)
+                                ph = _get_prev_reading(conn, int(apartment_id), prev_ym, "hot", 1)
+                                if pc is not None:
+                                    prev_values.append(float(pc))
+                                if ph is not None:
+                                    prev_values.append(float(ph))
+                                # Fallback to current month values only if previous month is absent.
+                                if not prev_values:
+                                    prev_values = [float(vs[0]) for vs in prev_map.values() if vs and vs[0] is not None]
+                                if prev_values and value_float is not None:
+                                    prev_floor = min(prev_values)
+                                    if float(value_float) + 50.0 < float(prev_floor):
+                                        water_prev_hard_block = True
+                                        water_prev_hard_block_reason = {
+                                            "value": float(value_float),
+                                            "prev_floor": float(prev_floor),
+                                            "reason": "sharp_drop_vs_prev",
+                                            "ydisk_path": ydisk_path,
                                         }
-                                    )
-                                elif s_last5 and (cold_last5 or hot_last5):
-                                    # serial recognized but doesn't match stored serials -> block and notify
-                                    reason = {
-                                        "reason": "serial_mismatch_route",
-                                        "serial_last5": s_last5,
-                                        "cold_last5": cold_last5,
-                                        "hot_last5": hot_last5,
-                                    }
-                                    diag["warnings"].append({"serial_mismatch": reason})
-                                    # create review flag + notification and block writing
-                                    mt = str(kind or "unknown")
-                                    mi = 1
-                                    exists = conn.execute(
+                                        diag["warnings"].append(
+                                            {"water_prev_hard_block": dict(water_prev_hard_block_reason)}
+                                        )
+                            except Exception:
+                                pass
+                            # --- serial-based routing: if serial matches apartment, force meter_type ---
+                            force_kind = None
+                            force_no_sort = False
+                            try:
+                                if serial_norm:
+                                    row = conn.execute(
                                         text(
                                             """
-                                            SELECT 1
-                                            FROM meter_review_flags
-                                            WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=:mi
-                                              AND status='open' AND reason='serial_mismatch'
-                                            LIMIT 1
+                                            SELECT cold_serial, hot_serial
+                                            FROM apartments
+                                            WHERE id=:aid
                                             """
                                         ),
-                                        {"aid": int(apartment_id), "ym": str(ym), "mt": mt, "mi": int(mi)},
-                                    ).fetchone()
-                                    if not exists:
-                                        conn.execute(
+                                        {"aid": int(apartment_id)},
+                                    ).mappings().first()
+                                    cold_serial = row.get("cold_serial") if row else None
+                                    hot_serial = row.get("hot_serial") if row else None
+
+                                    s_last5 = _last5_serial(serial_norm)
+                                    cold_last5 = _last5_serial(cold_serial)
+                                    hot_last5 = _last5_serial(hot_serial)
+                                    cold_match = _serial_last5_matches(s_last5, cold_last5)
+                                    hot_match = _serial_last5_matches(s_last5, hot_last5)
+
+                                    if cold_match and not hot_match:
+                                        force_kind = "cold"
+                                        force_no_sort = True
+                                    elif hot_match and not cold_match:
+                                        force_kind = "hot"
+                                        force_no_sort = True
+                                    elif cold_match and hot_match:
+                                        # ambiguous serial tail, keep OCR flow but mark uncertainty
+                                        diag["warnings"].append(
+                                            {
+                                                "serial_ambiguous_route": {
+                                                    "serial_last5": s_last5,
+                                                    "cold_last5": cold_last5,
+                                                    "hot_last5": hot_last5,
+                                                }
+                                            }
+                                        )
+                                    elif s_last5 and (cold_last5 or hot_last5):
+                                        # serial recognized but doesn't match stored serials -> block and notify
+                                        reason = {
+                                            "reason": "serial_mismatch_route",
+                                            "serial_last5": s_last5,
+                                            "cold_last5": cold_last5,
+                                            "hot_last5": hot_last5,
+                                        }
+                                        diag["warnings"].append({"serial_mismatch": reason})
+                                        # create review flag + notification and block writing
+                                        mt = str(kind or "unknown")
+                                        mi = 1
+                                        exists = conn.execute(
                                             text(
                                                 """
-                                                INSERT INTO meter_review_flags(
-                                                    apartment_id, ym, meter_type, meter_index, status, reason, comment, created_at, resolved_at
-                                                )
-                                                VALUES(:aid, :ym, :mt, :mi, 'open', 'serial_mismatch', :comment, now(), NULL)
+                                                SELECT 1
+                                                FROM meter_review_flags
+                                                WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=:mi
+                                                  AND status='open' AND reason='serial_mismatch'
+                                                LIMIT 1
                                                 """
                                             ),
-                                            {
-                                                "aid": int(apartment_id),
-                                                "ym": str(ym),
-                                                "mt": mt,
-                                                "mi": int(mi),
-                                                "comment": json.dumps(reason, ensure_ascii=False),
-                                            },
-                                        )
-                                    username = (telegram_username or "").strip().lstrip("@").lower() or "Без username"
-                                    related = json.dumps(
-                                        {"ym": str(ym), "meter_type": mt, "meter_index": int(mi), "ydisk_path": ydisk_path},
-                                        ensure_ascii=False,
-                                    )
-                                    msg = f"Несовпадение серийника ХВС/ГВС. Файл: {ydisk_path}"
-                                    conn.execute(
-                                        text(
-                                            """
-                                            INSERT INTO notifications(
-                                                chat_id, telegram_username, apartment_id, type, message, related, status, created_at
+                                            {"aid": int(apartment_id), "ym": str(ym), "mt": mt, "mi": int(mi)},
+                                        ).fetchone()
+                                        if not exists:
+                                            conn.execute(
+                                                text(
+                                                    """
+                                                    INSERT INTO meter_review_flags(
+                                                        apartment_id, ym, meter_type, meter_index, status, reason, comment, created_at, resolved_at
+                                                    )
+                                                    VALUES(:aid, :ym, :mt, :mi, 'open', 'serial_mismatch', :comment, now(), NULL)
+                                                    """
+                                                ),
+                                                {
+                                                    "aid": int(apartment_id),
+                                                    "ym": str(ym),
+                                                    "mt": mt,
+                                                    "mi": int(mi),
+                                                    "comment": json.dumps(reason, ensure_ascii=False),
+                                                },
                                             )
-                                            VALUES(:chat_id, :username, :apartment_id, 'serial_mismatch', :message, CAST(:related AS JSONB), 'unread', now())
-                                            """
-                                        ),
-                                        {
-                                            "chat_id": str(chat_id),
-                                            "username": username,
-                                            "apartment_id": int(apartment_id),
-                                            "message": msg,
-                                            "related": related,
-                                        },
-                                    )
-                                    if photo_event_id:
-                                        diag_json_str = json.dumps(diag, ensure_ascii=False) if diag is not None else None
+                                        username = (telegram_username or "").strip().lstrip("@").lower() or "Без username"
+                                        related = json.dumps(
+                                            {"ym": str(ym), "meter_type": mt, "meter_index": int(mi), "ydisk_path": ydisk_path},
+                                            ensure_ascii=False,
+                                        )
+                                        msg = f"Несовпадение серийника ХВС/ГВС. Файл: {ydisk_path}"
                                         conn.execute(
                                             text(
                                                 """
-                                                UPDATE photo_events
-                                                SET
-                                                    meter_written = false,
-                                                    stage = 'needs_review',
-                                                    stage_updated_at = now(),
-                                                    diag_json = CASE WHEN :diag_json IS NULL THEN diag_json ELSE CAST(:diag_json AS JSONB) END
-                                                WHERE id = :id
+                                                INSERT INTO notifications(
+                                                    chat_id, telegram_username, apartment_id, type, message, related, status, created_at
+                                                )
+                                                VALUES(:chat_id, :username, :apartment_id, 'serial_mismatch', :message, CAST(:related AS JSONB), 'unread', now())
                                                 """
                                             ),
-                                            {"id": int(photo_event_id), "diag_json": diag_json_str},
+                                            {
+                                                "chat_id": str(chat_id),
+                                                "username": username,
+                                                "apartment_id": int(apartment_id),
+                                                "message": msg,
+                                                "related": related,
+                                            },
                                         )
-                                    return JSONResponse(
-                                        status_code=200,
-                                        content={
+                                        if photo_event_id:
+                                            diag_json_str = json.dumps(diag, ensure_ascii=False) if diag is not None else None
+                                            conn.execute(
+                                                text(
+                                                    """
+                                                    UPDATE photo_events
+                                                    SET
+                                                        meter_written = false,
+                                                        stage = 'needs_review',
+                                                        stage_updated_at = now(),
+                                                        diag_json = CASE WHEN :diag_json IS NULL THEN diag_json ELSE CAST(:diag_json AS JSONB) END
+                                                    WHERE id = :id
+                                                    """
+                                                ),
+                                                {"id": int(photo_event_id), "diag_json": diag_json_str},
+                                            )
+                                        return {
                                             "status": "ok",
                                             "chat_id": str(chat_id),
                                             "telegram_username": telegram_username,
@@ -2672,160 +2861,241 @@ async def photo_event(request: Request, file: UploadFile = File(None)):
                                             "assigned_meter_index": assigned_meter_index,
                                             "ym": ym,
                                             "bill": None,
-                                        },
-                                    )
-                        except Exception:
-                            force_kind = None
-                            force_no_sort = False
+                                        }
+                            except Exception:
+                                force_kind = None
+                                force_no_sort = False
 
-                        # Hard serial+history sanity:
-                        # if serial maps to a specific water meter, keep value near that meter's previous reading.
-                        try:
-                            if force_kind in ("cold", "hot") and value_float is not None:
-                                serial_prev_kind = str(force_kind)
-                                serial_prev_ref = _get_prev_reading(
-                                    conn,
-                                    int(apartment_id),
-                                    _prev_ym(str(ym)),
-                                    serial_prev_kind,
-                                    1,
-                                )
-                                if serial_prev_ref is None:
-                                    serial_prev_ref = _get_last_reading_before(
+                            # Hard serial+history sanity:
+                            # if serial maps to a specific water meter, keep value near that meter's previous reading.
+                            try:
+                                if force_kind in ("cold", "hot") and value_float is not None:
+                                    serial_prev_kind = str(force_kind)
+                                    serial_prev_ref = _get_prev_reading(
                                         conn,
                                         int(apartment_id),
-                                        str(ym),
+                                        _prev_ym(str(ym)),
                                         serial_prev_kind,
                                         1,
                                     )
-                                if serial_prev_ref is not None:
-                                    serial_prev_ref = float(serial_prev_ref)
-                                    cur_delta = abs(float(value_float) - float(serial_prev_ref))
-                                    if cur_delta > float(WATER_SERIAL_HARD_DELTA):
-                                        best_serial = _choose_water_debug_candidate_with_prev(
-                                            debug_candidates,
-                                            prev_value=float(serial_prev_ref),
-                                            serial_norm=serial_norm,
-                                            max_delta=float(WATER_SERIAL_HARD_DELTA),
+                                    if serial_prev_ref is None:
+                                        serial_prev_ref = _get_last_reading_before(
+                                            conn,
+                                            int(apartment_id),
+                                            str(ym),
+                                            serial_prev_kind,
+                                            1,
                                         )
-                                        if best_serial and best_serial.get("reading") is not None:
-                                            old_v = float(value_float)
-                                            value_float = float(best_serial.get("reading"))
-                                            kind = _ocr_to_kind(best_serial.get("type")) or kind
-                                            if isinstance(ocr_data, dict):
-                                                ocr_data["reading"] = float(value_float)
-                                                ocr_data["type"] = best_serial.get("type")
-                                            diag["warnings"].append(
-                                                {
-                                                    "water_serial_prev_corrected": {
-                                                        "meter_type": serial_prev_kind,
-                                                        "prev_ref": float(serial_prev_ref),
-                                                        "from": old_v,
-                                                        "to": float(value_float),
-                                                        "variant": best_serial.get("variant"),
-                                                        "provider": best_serial.get("provider"),
+                                    if serial_prev_ref is not None:
+                                        serial_prev_ref = float(serial_prev_ref)
+                                        cur_delta = abs(float(value_float) - float(serial_prev_ref))
+                                        if cur_delta > float(WATER_SERIAL_HARD_DELTA):
+                                            best_serial = _choose_water_debug_candidate_with_prev(
+                                                debug_candidates,
+                                                prev_value=float(serial_prev_ref),
+                                                serial_norm=serial_norm,
+                                                max_delta=float(WATER_SERIAL_HARD_DELTA),
+                                            )
+                                            if best_serial and best_serial.get("reading") is not None:
+                                                old_v = float(value_float)
+                                                value_float = float(best_serial.get("reading"))
+                                                kind = _ocr_to_kind(best_serial.get("type")) or kind
+                                                if isinstance(ocr_data, dict):
+                                                    ocr_data["reading"] = float(value_float)
+                                                    ocr_data["type"] = best_serial.get("type")
+                                                diag["warnings"].append(
+                                                    {
+                                                        "water_serial_prev_corrected": {
+                                                            "meter_type": serial_prev_kind,
+                                                            "prev_ref": float(serial_prev_ref),
+                                                            "from": old_v,
+                                                            "to": float(value_float),
+                                                            "variant": best_serial.get("variant"),
+                                                            "provider": best_serial.get("provider"),
+                                                        }
                                                     }
+                                                )
+                                            else:
+                                                water_prev_hard_block = True
+                                                water_prev_hard_block_reason = {
+                                                    "value": float(value_float),
+                                                    "prev_ref": float(serial_prev_ref),
+                                                    "meter_type": serial_prev_kind,
+                                                    "reason": "serial_prev_outlier",
+                                                    "threshold": float(WATER_SERIAL_HARD_DELTA),
+                                                    "ydisk_path": ydisk_path,
                                                 }
+                                                diag["warnings"].append(
+                                                    {"water_prev_hard_block": dict(water_prev_hard_block_reason)}
+                                                )
+                            except Exception:
+                                pass
+
+                            # если OCR не уверен в типе, сортируем как max->ХВС, min->ГВС
+                            water_uncertain = is_water_unknown or (kind in ("cold", "hot") and ocr_conf < WATER_TYPE_CONF_MIN)
+                            if water_uncertain:
+                                diag["warnings"].append({"water_type_uncertain": {"confidence": ocr_conf, "ocr_type": ocr_type}})
+                            force_sort = _has_open_water_uncertain_flag(conn, int(apartment_id), str(ym))
+                            # if new value is very close to an existing water reading, overwrite that specific meter
+                            rows = conn.execute(
+                                text(
+                                    """
+                                    SELECT meter_type, value
+                                    FROM meter_readings
+                                    WHERE apartment_id=:aid AND ym=:ym AND meter_type IN ('cold','hot') AND meter_index=1
+                                    """
+                                ),
+                                {"aid": int(apartment_id), "ym": str(ym)},
+                            ).fetchall()
+                            best = None
+                            for mt, v in (rows or []):
+                                if v is None:
+                                    continue
+                                try:
+                                    diff = abs(float(v) - float(value_float))
+                                except Exception:
+                                    continue
+                                if diff <= WATER_RETAKE_THRESHOLD:
+                                    if (best is None) or (diff < best[0]):
+                                        best = (diff, str(mt))
+                            if best:
+                                best_kind = str(best[1])
+                                # If OCR confidently says the other type, don't overwrite by proximity.
+                                if kind in ("cold", "hot") and ocr_conf >= WATER_TYPE_CONF_MIN and best_kind != str(kind):
+                                    reason = {
+                                        "reason": "ocr_type_conflict",
+                                        "ocr_type": str(kind),
+                                        "matched_type": best_kind,
+                                        "value": float(value_float),
+                                        "ydisk_path": ydisk_path,
+                                    }
+                                    diag["warnings"].append({"ocr_type_conflict": reason})
+                                    # notify admin + flag for review
+                                    try:
+                                        exists = conn.execute(
+                                            text(
+                                                """
+                                                SELECT 1
+                                                FROM meter_review_flags
+                                                WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=1
+                                                  AND status='open' AND reason='ocr_type_conflict'
+                                                LIMIT 1
+                                                """
+                                            ),
+                                            {"aid": int(apartment_id), "ym": str(ym), "mt": str(kind)},
+                                        ).fetchone()
+                                        if not exists:
+                                            conn.execute(
+                                                text(
+                                                    """
+                                                    INSERT INTO meter_review_flags(
+                                                        apartment_id, ym, meter_type, meter_index, status, reason, comment, created_at, resolved_at
+                                                    )
+                                                    VALUES(:aid, :ym, :mt, 1, 'open', 'ocr_type_conflict', :comment, now(), NULL)
+                                                    """
+                                                ),
+                                                {
+                                                    "aid": int(apartment_id),
+                                                    "ym": str(ym),
+                                                    "mt": str(kind),
+                                                    "comment": json.dumps(reason, ensure_ascii=False),
+                                                },
                                             )
-                                        else:
-                                            water_prev_hard_block = True
-                                            water_prev_hard_block_reason = {
-                                                "value": float(value_float),
-                                                "prev_ref": float(serial_prev_ref),
-                                                "meter_type": serial_prev_kind,
-                                                "reason": "serial_prev_outlier",
-                                                "threshold": float(WATER_SERIAL_HARD_DELTA),
-                                                "ydisk_path": ydisk_path,
-                                            }
-                                            diag["warnings"].append(
-                                                {"water_prev_hard_block": dict(water_prev_hard_block_reason)}
+                                        username = (telegram_username or "").strip().lstrip("@").lower() or "Без username"
+                                        related = json.dumps(
+                                            {"ym": str(ym), "meter_type": str(kind), "meter_index": 1, "ydisk_path": ydisk_path},
+                                            ensure_ascii=False,
+                                        )
+                                        msg = f"OCR тип конфликтует со значением в месяце: {reason}. Файл: {ydisk_path}"
+                                        conn.execute(
+                                            text(
+                                                """
+                                                INSERT INTO notifications(
+                                                    chat_id, telegram_username, apartment_id, type, message, related, status, created_at
+                                                )
+                                                VALUES(:chat_id, :username, :apartment_id, 'ocr_type_conflict', :message, CAST(:related AS JSONB), 'unread', now())
+                                                """
+                                            ),
+                                            {
+                                                "chat_id": str(chat_id),
+                                                "username": username,
+                                                "apartment_id": int(apartment_id),
+                                                "message": msg,
+                                                "related": related,
+                                            },
+                                        )
+                                    except Exception:
+                                        pass
+                                else:
+                                    force_kind = best_kind
+                                    force_no_sort = True
+                                    diag["warnings"].append({"retake_overwrite": {"meter_type": str(force_kind), "meter_index": 1}})
+
+                            # If serial matched, do not force sort even if uncertain
+                            if force_kind and force_no_sort:
+                                force_sort = False
+
+                            assigned_kind = _write_water_ocr_with_uncertainty(
+                                conn,
+                                int(apartment_id),
+                                str(ym),
+                                float(value_float),
+                                kind if kind in ("cold", "hot") else None,
+                                float(value_float),
+                                bool(water_uncertain),
+                                bool(force_sort),
+                                force_kind=force_kind,
+                                force_no_sort=force_no_sort,
+                            )
+                            kind = assigned_kind
+
+                            # On sharp drop vs previous month: keep review flag, but rollback OCR write.
+                            if water_prev_hard_block:
+                                mt = str(assigned_kind if assigned_kind in ("cold", "hot") else (force_kind or "cold"))
+                                reason = dict(water_prev_hard_block_reason or {})
+                                exists = conn.execute(
+                                    text(
+                                        """
+                                        SELECT 1
+                                        FROM meter_review_flags
+                                        WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=1
+                                          AND status='open' AND reason='water_same_month_drop_block'
+                                        LIMIT 1
+                                        """
+                                    ),
+                                    {"aid": int(apartment_id), "ym": str(ym), "mt": mt},
+                                ).fetchone()
+                                if not exists:
+                                    conn.execute(
+                                        text(
+                                            """
+                                            INSERT INTO meter_review_flags(
+                                                apartment_id, ym, meter_type, meter_index, status, reason, comment, created_at, resolved_at
                                             )
-                        except Exception:
-                            pass
-
-                        # если OCR не уверен в типе, сортируем как max->ХВС, min->ГВС
-                        water_uncertain = is_water_unknown or (kind in ("cold", "hot") and ocr_conf < WATER_TYPE_CONF_MIN)
-                        if water_uncertain:
-                            diag["warnings"].append({"water_type_uncertain": {"confidence": ocr_conf, "ocr_type": ocr_type}})
-                        force_sort = _has_open_water_uncertain_flag(conn, int(apartment_id), str(ym))
-                        # if new value is very close to an existing water reading, overwrite that specific meter
-                        rows = conn.execute(
-                            text(
-                                """
-                                SELECT meter_type, value
-                                FROM meter_readings
-                                WHERE apartment_id=:aid AND ym=:ym AND meter_type IN ('cold','hot') AND meter_index=1
-                                """
-                            ),
-                            {"aid": int(apartment_id), "ym": str(ym)},
-                        ).fetchall()
-                        best = None
-                        for mt, v in (rows or []):
-                            if v is None:
-                                continue
-                            try:
-                                diff = abs(float(v) - float(value_float))
-                            except Exception:
-                                continue
-                            if diff <= WATER_RETAKE_THRESHOLD:
-                                if (best is None) or (diff < best[0]):
-                                    best = (diff, str(mt))
-                        if best:
-                            best_kind = str(best[1])
-                            # If OCR confidently says the other type, don't overwrite by proximity.
-                            if kind in ("cold", "hot") and ocr_conf >= WATER_TYPE_CONF_MIN and best_kind != str(kind):
-                                reason = {
-                                    "reason": "ocr_type_conflict",
-                                    "ocr_type": str(kind),
-                                    "matched_type": best_kind,
-                                    "value": float(value_float),
-                                    "ydisk_path": ydisk_path,
-                                }
-                                diag["warnings"].append({"ocr_type_conflict": reason})
-                                # notify admin + flag for review
+                                            VALUES(:aid, :ym, :mt, 1, 'open', 'water_same_month_drop_block', :comment, now(), NULL)
+                                            """
+                                        ),
+                                        {
+                                            "aid": int(apartment_id),
+                                            "ym": str(ym),
+                                            "mt": mt,
+                                            "comment": json.dumps(reason, ensure_ascii=False),
+                                        },
+                                    )
                                 try:
-                                    exists = conn.execute(
-                                        text(
-                                            """
-                                            SELECT 1
-                                            FROM meter_review_flags
-                                            WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=1
-                                              AND status='open' AND reason='ocr_type_conflict'
-                                            LIMIT 1
-                                            """
-                                        ),
-                                        {"aid": int(apartment_id), "ym": str(ym), "mt": str(kind)},
-                                    ).fetchone()
-                                    if not exists:
-                                        conn.execute(
-                                            text(
-                                                """
-                                                INSERT INTO meter_review_flags(
-                                                    apartment_id, ym, meter_type, meter_index, status, reason, comment, created_at, resolved_at
-                                                )
-                                                VALUES(:aid, :ym, :mt, 1, 'open', 'ocr_type_conflict', :comment, now(), NULL)
-                                                """
-                                            ),
-                                            {
-                                                "aid": int(apartment_id),
-                                                "ym": str(ym),
-                                                "mt": str(kind),
-                                                "comment": json.dumps(reason, ensure_ascii=False),
-                                            },
-                                        )
                                     username = (telegram_username or "").strip().lstrip("@").lower() or "Без username"
                                     related = json.dumps(
-                                        {"ym": str(ym), "meter_type": str(kind), "meter_index": 1, "ydisk_path": ydisk_path},
+                                        {"ym": str(ym), "meter_type": mt, "meter_index": 1, "ydisk_path": ydisk_path},
                                         ensure_ascii=False,
                                     )
-                                    msg = f"OCR тип конфликтует со значением в месяце: {reason}. Файл: {ydisk_path}"
+                                    msg = f"Падение показаний vs прошлый месяц: требуется проверка. Файл: {ydisk_path}"
                                     conn.execute(
                                         text(
                                             """
                                             INSERT INTO notifications(
                                                 chat_id, telegram_username, apartment_id, type, message, related, status, created_at
                                             )
-                                            VALUES(:chat_id, :username, :apartment_id, 'ocr_type_conflict', :message, CAST(:related AS JSONB), 'unread', now())
+                                            VALUES(:chat_id, :username, :apartment_id, 'water_same_month_drop_block', :message, CAST(:related AS JSONB), 'unread', now())
                                             """
                                         ),
                                         {
@@ -2838,427 +3108,371 @@ async def photo_event(request: Request, file: UploadFile = File(None)):
                                     )
                                 except Exception:
                                     pass
-                            else:
-                                force_kind = best_kind
-                                force_no_sort = True
-                                diag["warnings"].append({"retake_overwrite": {"meter_type": str(force_kind), "meter_index": 1}})
-
-                        # If serial matched, do not force sort even if uncertain
-                        if force_kind and force_no_sort:
-                            force_sort = False
-
-                        assigned_kind = _write_water_ocr_with_uncertainty(
-                            conn,
-                            int(apartment_id),
-                            str(ym),
-                            float(value_float),
-                            kind if kind in ("cold", "hot") else None,
-                            float(value_float),
-                            bool(water_uncertain),
-                            bool(force_sort),
-                            force_kind=force_kind,
-                            force_no_sort=force_no_sort,
-                        )
-                        kind = assigned_kind
 
-                        # On sharp drop vs previous month: keep review flag, but rollback OCR write.
-                        if water_prev_hard_block:
-                            mt = str(assigned_kind if assigned_kind in ("cold", "hot") else (force_kind or "cold"))
-                            reason = dict(water_prev_hard_block_reason or {})
-                            exists = conn.execute(
+                                # Rollback current OCR write for this meter/month so bad value is not persisted.
+                                try:
+                                    prev_entry = prev_map.get(mt)
+                                    if prev_entry and prev_entry[0] is not None:
+                                        prev_val, prev_src = prev_entry
+                                        conn.execute(
+                                            text(
+                                                """
+                                                UPDATE meter_readings
+                                                SET value=:value, source=:src
+                                                WHERE apartment_id=:aid
+                                                  AND ym=:ym
+                                                  AND meter_type=:mt
+                                                  AND meter_index=1
+                                                """
+                                            ),
+                                            {
+                                                "aid": int(apartment_id),
+                                                "ym": str(ym),
+                                                "mt": mt,
+                                                "value": float(prev_val),
+                                                "src": str(prev_src or "manual"),
+                                            },
+                                        )
+                                    else:
+                                        conn.execute(
+                                            text(
+                                                """
+                                                DELETE FROM meter_readings
+                                                WHERE apartment_id=:aid
+                                                  AND ym=:ym
+                                                  AND meter_type=:mt
+                                                  AND meter_index=1
+                                                  AND source='ocr'
+                                                  AND abs(value - :value) <= 0.0005
+                                                """
+                                            ),
+                                            {
+                                                "aid": int(apartment_id),
+                                                "ym": str(ym),
+                                                "mt": mt,
+                                                "value": float(value_float),
+                                            },
+                                        )
+                                    refresh_ledger_month(conn, int(apartment_id), str(ym))
+                                except Exception as e:
+                                    diag["warnings"].append({"water_prev_hard_block_rollback_failed": str(e)})
+                                water_write_blocked = True
+
+                            try:
+                                if assigned_kind in prev_map:
+                                    prev_val, prev_src = prev_map[assigned_kind]
+                                    if prev_src == "manual" and abs(float(prev_val) - float(value_float)) > 1e-6:
+                                        _flag_manual_overwrite(
+                                            conn,
+                                            apartment_id=int(apartment_id),
+                                            ym=str(ym),
+                                            meter_type=str(assigned_kind),
+                                            meter_index=1,
+                                            prev_value=float(prev_val),
+                                            new_value=float(value_float),
+                                            ydisk_path=ydisk_path,
+                                            chat_id=str(chat_id),
+                                            telegram_username=telegram_username,
+                                        )
+                            except Exception:
+                                pass
+                        else:
+                            # если OCR не распознал тип — ничего не пишем
+                            raise Exception("water_type_unknown")
+
+                # 6.2) duplicate check
+                try:
+                    tol = 0.0005
+                    with uow.read() as conn:
+                        if kind in ("cold", "hot"):
+                            row = conn.execute(
                                 text(
                                     """
-                                    SELECT 1
-                                    FROM meter_review_flags
-                                    WHERE apartment_id=:aid AND ym=:ym AND meter_type=:mt AND meter_index=1
-                                      AND status='open' AND reason='water_same_month_drop_block'
+                                    SELECT meter_type, meter_index, value
+                                    FROM meter_readings
+                                    WHERE apartment_id=:aid
+                                      AND ym=:ym
+                                      AND source IN ('ocr','manual')
+                                      AND meter_type IN ('cold','hot')
+                                      AND abs(value - :val) <= :tol
+                                      AND NOT (meter_type=:mt AND meter_index=:mi)
+                                    ORDER BY meter_type ASC, meter_index ASC
                                     LIMIT 1
                                     """
                                 ),
-                                {"aid": int(apartment_id), "ym": str(ym), "mt": mt},
+                                {
+                                    "aid": int(apartment_id),
+                                    "ym": str(ym),
+                                    "val": float(value_float),
+                                    "tol": float(tol),
+                                    "mt": str(kind),
+                                    "mi": int(assigned_meter_index),
+                                },
                             ).fetchone()
-                            if not exists:
-                                conn.execute(
-                                    text(
-                                        """
-                                        INSERT INTO meter_review_flags(
-                                            apartment_id, ym, meter_type, meter_index, status, reason, comment, created_at, resolved_at
-                                        )
-                                        VALUES(:aid, :ym, :mt, 1, 'open', 'water_same_month_drop_block', :comment, now(), NULL)
-                                        """
-                                    ),
-                                    {
-                                        "aid": int(apartment_id),
-                                        "ym": str(ym),
-                                        "mt": mt,
-                                        "comment": json.dumps(reason, ensure_ascii=False),
-                                    },
+                        else:
+                            row = conn.execute(
+                                text(
+                                    """
+                                    SELECT meter_type, meter_index, value
+                                    FROM meter_readings
+                                    WHERE apartment_id=:aid
+                                      AND ym=:ym
+                                      AND source IN ('ocr','manual')
+                                      AND meter_type='electric'
+                                      AND abs(value - :val) <= :tol
+                                      AND NOT (meter_type=:mt AND meter_index=:mi)
+                                    ORDER BY meter_type ASC, meter_index ASC
+                                    LIMIT 1
+                                    """
+                                ),
+                                {
+                                    "aid": int(apartment_id),
+                                    "ym": str(ym),
+                                    "val": float(value_float),
+                                    "tol": float(tol),
+                                    "mt": str(kind),
+                                    "mi": int(assigned_meter_index),
+                                },
+                            ).fetchone()
+
+                    if row:
+                        existing_mt = str(row[0])
+                        existing_mi = int(row[1])
+                        diag["warnings"].append(
+                            {
+                                "possible_duplicate": {
+                                    "meter_type": existing_mt,
+                                    "meter_index": existing_mi,
+                                    "ym": str(ym),
+                                    "value": float(value_float),
+                                    "incoming_meter_type": str(kind),
+                                    "incoming_meter_index": int(assigned_meter_index),
+                                }
+                            }
+                        )
+                except Exception as e:
+                    diag["warnings"].append({"duplicate_check_failed": str(e)})
+
+                # 6.3) update statuses
+                try:
+                    with uow.step() as conn:
+                        _upsert_month_statuses(int(apartment_id), ym, UIStatusesPatch(meters_photo=True), conn=conn)
+                except Exception as e:
+                    diag["warnings"].append({"month_status_update_failed": str(e)})
+
+                try:
+                    patch = {}
+                    if kind == "cold":
+                        patch["meters_photo_cold"] = True
+                    elif kind == "hot":
+                        patch["meters_photo_hot"] = True
+                    elif kind == "electric":
+                        patch["meters_photo_electric"] = True
+                    if patch:
+                        with uow.step() as conn:
+                            update_apartment_statuses(int(apartment_id), patch, conn=conn)
+                except Exception as e:
+                    diag["warnings"].append({"apartment_status_update_failed": str(e)})
+
+                wrote_meter = not bool(water_write_blocked)
+
+                # notify if OCR overwrote manual for electric
+                if kind == "electric" and prev_manual and (prev_manual_value is not None):
+                    try:
+                        with uow.step() as conn:
+                            if abs(float(prev_manual_value) - float(value_float)) > 1e-6:
+                                _flag_manual_overwrite(
+                                    conn,
+                                    apartment_id=int(apartment_id),
+                                    ym=str(ym),
+                                    meter_type="electric",
+                                    meter_index=int(assigned_meter_index),
+                                    prev_value=float(prev_manual_value),
+                                    new_value=float(value_float),
+                                    ydisk_path=ydisk_path,
+                                    chat_id=str(chat_id),
+                                    telegram_username=telegram_username,
                                 )
-                            try:
+                    except Exception:
+                        pass
+
+                # 6.35) auto-fill serial number (only if not manually set) + notify on mismatch
+                try:
+                    if serial_norm and kind in ("cold", "hot"):
+                        col = "cold_serial" if kind == "cold" else "hot_serial"
+                        col_src = "cold_serial_source" if kind == "cold" else "hot_serial_source"
+                        with uow.step() as conn:
+                            row = conn.execute(
+                                text(
+                                    f"""
+                                    SELECT {col} AS serial, {col_src} AS src
+                                    FROM apartments
+                                    WHERE id=:aid
+                                    """
+                                ),
+                                {"aid": int(apartment_id)},
+                            ).mappings().first()
+
+                            existing = (row.get("serial") if row else None) or ""
+                            existing_norm = _normalize_serial(existing)
+                            src = (row.get("src") if row else None) or ""
+
+                            if src == "manual" and existing_norm and (existing_norm != serial_norm):
+                                # notify admin about mismatch, do not overwrite
                                 username = (telegram_username or "").strip().lstrip("@").lower() or "Без username"
                                 related = json.dumps(
-                                    {"ym": str(ym), "meter_type": mt, "meter_index": 1, "ydisk_path": ydisk_path},
+                                    {"ym": str(ym), "meter_type": str(kind), "meter_index": 1},
                                     ensure_ascii=False,
                                 )
-                                msg = f"Падение показаний vs прошлый месяц: требуется проверка. Файл: {ydisk_path}"
-                                conn.execute(
+                                # avoid duplicate notifications for same apartment+ym+meter_type
+                                dup = conn.execute(
                                     text(
                                         """
-                                        INSERT INTO notifications(
-                                            chat_id, telegram_username, apartment_id, type, message, related, status, created_at
-                                        )
-                                        VALUES(:chat_id, :username, :apartment_id, 'water_same_month_drop_block', :message, CAST(:related AS JSONB), 'unread', now())
+                                        SELECT 1
+                                        FROM notifications
+                                        WHERE apartment_id=:aid
+                                          AND type='serial_mismatch'
+                                          AND status='unread'
+                                          AND related->>'ym' = :ym
+                                          AND related->>'meter_type' = :mt
+                                        LIMIT 1
                                         """
                                     ),
-                                    {
-                                        "chat_id": str(chat_id),
-                                        "username": username,
-                                        "apartment_id": int(apartment_id),
-                                        "message": msg,
-                                        "related": related,
-                                    },
-                                )
-                            except Exception:
-                                pass
-
-                            # Rollback current OCR write for this meter/month so bad value is not persisted.
-                            try:
-                                prev_entry = prev_map.get(mt)
-                                if prev_entry and prev_entry[0] is not None:
-                                    prev_val, prev_src = prev_entry
-                                    conn.execute(
-                                        text(
-                                            """
-                                            UPDATE meter_readings
-                                            SET value=:value, source=:src
-                                            WHERE apartment_id=:aid
-                                              AND ym=:ym
-                                              AND meter_type=:mt
-                                              AND meter_index=1
-                                            """
-                                        ),
-                                        {
-                                            "aid": int(apartment_id),
-                                            "ym": str(ym),
-                                            "mt": mt,
-                                            "value": float(prev_val),
-                                            "src": str(prev_src or "manual"),
-                                        },
+                                    {"aid": int(apartment_id), "ym": str(ym), "mt": str(kind)},
+                                ).fetchone()
+                                if not dup:
+                                    msg = (
+                                        f"Несовпадение серийного номера {('ХВС' if kind=='cold' else 'ГВС')}: "
+                                        f"OCR={serial_norm}, вручную={existing_norm}"
                                     )
-                                else:
                                     conn.execute(
                                         text(
                                             """
-                                            DELETE FROM meter_readings
-                                            WHERE apartment_id=:aid
-                                              AND ym=:ym
-                                              AND meter_type=:mt
-                                              AND meter_index=1
-                                              AND source='ocr'
-                                              AND abs(value - :value) <= 0.0005
+                                            INSERT INTO notifications(
+                                                chat_id, telegram_username, apartment_id, type, message, related, status, created_at
+                                            )
+                                            VALUES(
+                                                :chat_id, :username, :apartment_id, 'serial_mismatch', :message,
+                                                CAST(:related AS JSONB),
+                                                'unread', now()
+                                            )
                                             """
                                         ),
                                         {
-                                            "aid": int(apartment_id),
-                                            "ym": str(ym),
-                                            "mt": mt,
-                                            "value": float(value_float),
+                                            "chat_id": str(chat_id),
+                                            "username": username,
+                                            "apartment_id": int(apartment_id),
+                                            "message": msg,
+                                            "related": related,
                                         },
                                     )
-                            except Exception as e:
-                                diag["warnings"].append({"water_prev_hard_block_rollback_failed": str(e)})
-                            water_write_blocked = True
-
-                        try:
-                            if assigned_kind in prev_map:
-                                prev_val, prev_src = prev_map[assigned_kind]
-                                if prev_src == "manual" and abs(float(prev_val) - float(value_float)) > 1e-6:
-                                    _flag_manual_overwrite(
-                                        conn,
-                                        apartment_id=int(apartment_id),
-                                        ym=str(ym),
-                                        meter_type=str(assigned_kind),
-                                        meter_index=1,
-                                        prev_value=float(prev_val),
-                                        new_value=float(value_float),
-                                        ydisk_path=ydisk_path,
-                                        chat_id=str(chat_id),
-                                        telegram_username=telegram_username,
-                                    )
-                        except Exception:
-                            pass
-                    else:
-                        # если OCR не распознал тип — ничего не пишем
-                        raise Exception("water_type_unknown")
-
-            # 6.2) duplicate check
-            try:
-                tol = 0.0005
-                with engine.begin() as conn:
-                    if kind in ("cold", "hot"):
-                        row = conn.execute(
-                            text(
-                                """
-                                SELECT meter_type, meter_index, value
-                                FROM meter_readings
-                                WHERE apartment_id=:aid
-                                  AND ym=:ym
-                                  AND source IN ('ocr','manual')
-                                  AND meter_type IN ('cold','hot')
-                                  AND abs(value - :val) <= :tol
-                                  AND NOT (meter_type=:mt AND meter_index=:mi)
-                                ORDER BY meter_type ASC, meter_index ASC
-                                LIMIT 1
-                                """
-                            ),
-                            {
-                                "aid": int(apartment_id),
-                                "ym": str(ym),
-                                "val": float(value_float),
-                                "tol": float(tol),
-                                "mt": str(kind),
-                                "mi": int(assigned_meter_index),
-                            },
-                        ).fetchone()
-                    else:
-                        row = conn.execute(
-                            text(
-                                """
-                                SELECT meter_type, meter_index, value
-                                FROM meter_readings
-                                WHERE apartment_id=:aid
-                                  AND ym=:ym
-                                  AND source IN ('ocr','manual')
-                                  AND meter_type='electric'
-                                  AND abs(value - :val) <= :tol
-                                  AND NOT (meter_type=:mt AND meter_index=:mi)
-                                ORDER BY meter_type ASC, meter_index ASC
-                                LIMIT 1
-                                """
-                            ),
-                            {
-                                "aid": int(apartment_id),
-                                "ym": str(ym),
-                                "val": float(value_float),
-                                "tol": float(tol),
-                                "mt": str(kind),
-                                "mi": int(assigned_meter_index),
-                            },
-                        ).fetchone()
-
-                if row:
-                    existing_mt = str(row[0])
-                    existing_mi = int(row[1])
-                    diag["warnings"].append(
-                        {
-                            "possible_duplicate": {
-                                "meter_type": existing_mt,
-                                "meter_index": existing_mi,
-                                "ym": str(ym),
-                                "value": float(value_float),
-                                "incoming_meter_type": str(kind),
-                                "incoming_meter_index": int(assigned_meter_index),
-                            }
-                        }
-                    )
-            except Exception as e:
-                diag["warnings"].append({"duplicate_check_failed": str(e)})
-
-            # 6.3) update statuses
-            try:
-                _upsert_month_statuses(int(apartment_id), ym, UIStatusesPatch(meters_photo=True))
-            except Exception as e:
-                diag["warnings"].append({"month_status_update_failed": str(e)})
-
-            try:
-                patch = {}
-                if kind == "cold":
-                    patch["meters_photo_cold"] = True
-                elif kind == "hot":
-                    patch["meters_photo_hot"] = True
-                elif kind == "electric":
-                    patch["meters_photo_electric"] = True
-                if patch:
-                    update_apartment_statuses(int(apartment_id), patch)
-            except Exception as e:
-                diag["warnings"].append({"apartment_status_update_failed": str(e)})
 
-            wrote_meter = not bool(water_write_blocked)
-
-            # notify if OCR overwrote manual for electric
-            if kind == "electric" and prev_manual and (prev_manual_value is not None):
-                try:
-                    with engine.begin() as conn:
-                        if abs(float(prev_manual_value) - float(value_float)) > 1e-6:
-                            _flag_manual_overwrite(
-                                conn,
-                                apartment_id=int(apartment_id),
-                                ym=str(ym),
-                                meter_type="electric",
-                                meter_index=int(assigned_meter_index),
-                                prev_value=float(prev_manual_value),
-                                new_value=float(value_float),
-                                ydisk_path=ydisk_path,
-                                chat_id=str(chat_id),
-                                telegram_username=telegram_username,
+                        # auto-fill only if not manually set
+                        with uow.step() as conn:
+                            conn.execute(
+                                text(
+                                    f"""
+                                    UPDATE apartments
+                                    SET {col} = CASE WHEN {col} IS NULL OR {col} = '' THEN :serial ELSE {col} END,
+                                        {col_src} = CASE
+                                            WHEN {col_src} = 'manual' THEN {col_src}
+                                            WHEN {col} IS NULL OR {col} = '' THEN 'auto'
+                                            ELSE {col_src}
+                                        END
+                                    WHERE id = :aid
+                                      AND COALESCE({col_src}, '') <> 'manual'
+                                    """
+                                ),
+                                {"aid": int(apartment_id), "serial": serial_norm},
                             )
                 except Exception:
                     pass
 
-            # 6.35) auto-fill serial number (only if not manually set) + notify on mismatch
-            try:
-                if serial_norm and kind in ("cold", "hot"):
-                    col = "cold_serial" if kind == "cold" else "hot_serial"
-                    col_src = "cold_serial_source" if kind == "cold" else "hot_serial_source"
-                    with engine.begin() as conn:
-                        row = conn.execute(
-                            text(
-                                f"""
-                                SELECT {col} AS serial, {col_src} AS src
-                                FROM apartments
-                                WHERE id=:aid
-                                """
-                            ),
-                            {"aid": int(apartment_id)},
-                        ).mappings().first()
-
-                        existing = (row.get("serial") if row else None) or ""
-                        existing_norm = _normalize_serial(existing)
-                        src = (row.get("src") if row else None) or ""
-
-                        if src == "manual" and existing_norm and (existing_norm != serial_norm):
-                            # notify admin about mismatch, do not overwrite
-                            username = (telegram_username or "").strip().lstrip("@").lower() or "Без username"
-                            related = json.dumps(
-                                {"ym": str(ym), "meter_type": str(kind), "meter_index": 1},
-                                ensure_ascii=False,
+                # 6.4) update photo_events with diag_json
+                if db_ready() and photo_event_id:
+                    try:
+                        diag_json_str = json.dumps(diag, ensure_ascii=False) if diag is not None else None
+                        with uow.step() as conn:
+                            conn.execute(
+                                text("""
+                                    UPDATE photo_events
+                                    SET
+                                        meter_written = :meter_written,
+                                        meter_index = :meter_index,
+                                        meter_kind = COALESCE(:meter_kind, meter_kind),
+                                        meter_value = COALESCE(:meter_value, meter_value),
+                                        stage = :stage,
+                                        stage_updated_at = now(),
+                                        diag_json = CASE WHEN :diag_json IS NULL THEN diag_json ELSE CAST(:diag_json AS JSONB) END
+                                    WHERE id = :id
+                                """),
+                                {
+                                    "id": int(photo_event_id),
+                                    "meter_index": int(assigned_meter_index),
+                                    "meter_kind": str(kind),
+                                    "meter_value": float(value_float),
+                                    "meter_written": bool(wrote_meter),
+                                    "stage": "meter_written" if wrote_meter else "needs_review",
+                                    "diag_json": diag_json_str,
+                                },
                             )
-                            # avoid duplicate notifications for same apartment+ym+meter_type
-                            dup = conn.execute(
-                                text(
-                                    """
-                                    SELECT 1
-                                    FROM notifications
-                                    WHERE apartment_id=:aid
-                                      AND type='serial_mismatch'
-                                      AND status='unread'
-                                      AND related->>'ym' = :ym
-                                      AND related->>'meter_type' = :mt
-                                    LIMIT 1
-                                    """
-                                ),
-                                {"aid": int(apartment_id), "ym": str(ym), "mt": str(kind)},
-                            ).fetchone()
-                            if not dup:
-                                msg = (
-                                    f"Несовпадение серийного номера {('ХВС' if kind=='cold' else 'ГВС')}: "
-                                    f"OCR={serial_norm}, вручную={existing_norm}"
-                                )
-                                conn.execute(
-                                    text(
-                                        """
-                                        INSERT INTO notifications(
-                                            chat_id, telegram_username, apartment_id, type, message, related, status, created_at
-                                        )
-                                        VALUES(
-                                            :chat_id, :username, :apartment_id, 'serial_mismatch', :message,
-                                            CAST(:related AS JSONB),
-                                            'unread', now()
-                                        )
-                                        """
-                                    ),
-                                    {
-                                        "chat_id": str(chat_id),
-                                        "username": username,
-                                        "apartment_id": int(apartment_id),
-                                        "message": msg,
-                                        "related": related,
-                                    },
-                                )
-
-                    # auto-fill only if not manually set
-                    with engine.begin() as conn:
-                        conn.execute(
-                            text(
-                                f"""
-                                UPDATE apartments
-                                SET {col} = CASE WHEN {col} IS NULL OR {col} = '' THEN :serial ELSE {col} END,
-                                    {col_src} = CASE
-                                        WHEN {col_src} = 'manual' THEN {col_src}
-                                        WHEN {col} IS NULL OR {col} = '' THEN 'auto'
-                                        ELSE {col_src}
-                                    END
-                                WHERE id = :aid
-                                  AND COALESCE({col_src}, '') <> 'manual'
-                                """
-                            ),
-                            {"aid": int(apartment_id), "serial": serial_norm},
-                        )
-            except Exception:
-                pass
+                    except Exception as e:
+                        diag["warnings"].append({"photo_event_post_update_failed": str(e)})
 
-            # 6.4) update photo_events with diag_json
-            if db_ready() and photo_event_id:
-                try:
-                    diag_json_str = json.dumps(diag, ensure_ascii=False) if diag is not None else None
-                    with engine.begin() as conn:
-                        conn.execute(
-                            text("""
-                                UPDATE photo_events
-                                SET
-                                    meter_written = :meter_written,
-                                    meter_index = :meter_index,
-                                    meter_kind = COALESCE(:meter_kind, meter_kind),
-                                    meter_value = COALESCE(:meter_value, meter_value),
-                                    stage = :stage,
-                                    stage_updated_at = now(),
-                                    diag_json = CASE WHEN :diag_json IS NULL THEN diag_json ELSE CAST(:diag_json AS JSONB) END
-                                WHERE id = :id
-                            """),
-                            {
-                                "id": int(photo_event_id),
-                                "meter_index": int(assigned_meter_index),
-                                "meter_kind": str(kind),
-                                "meter_value": float(value_float),
-                                "meter_written": bool(wrote_meter),
-                                "stage": "meter_written" if wrote_meter else "needs_review",
-                                "diag_json": diag_json_str,
-                            },
-                        )
-                except Exception as e:
-                    diag["warnings"].append({"photo_event_post_update_failed": str(e)})
+            except Exception as e:
+                diag["errors"].append({"meter_write_failed": str(e)})
+        return None
 
+    early_payload = None
+    if db_ready():
+        try:
+            early_payload = run_unit_of_work(_persist, label="photo_event")
+        except PhotoJobLost:
+            raise
         except Exception as e:
-            diag["errors"].append({"meter_write_failed": str(e)})
+            if job is not None:
+                # Rolled back before written_at committed: let the queue retry the photo with backoff.
+                raise
+            # Rolled back: nothing from this photo is stored.
+            photo_event_id = None
+            wrote_meter = False
+            diag["errors"].append({"photo_event_persist_failed": str(e)})
+    else:
+        early_payload = _persist(None)
+    if ydisk_queued and photo_event_id is None:
+        # Nothing was stored, so nothing was queued either: keep the photo by uploading it inline.
+        try:
+            with ydisk_stage:
+                ydisk_upload(ydisk_path, blob)
+        except Exception as e:
+            diag["errors"].append({"ydisk_upload_error": str(e)})
+    if early_payload is not None:
+        return early_payload
 
-    # 6.5) auto-send sum
+    # 6.5) auto-send sum + 7) bill (for bot and web). The Telegram call runs between two short
+    # transactions so a slow network round-trip never holds a pooled connection.
+    bill = None
     if db_ready() and apartment_id:
         try:
             with engine.begin() as conn:
                 bill = _calc_month_bill(conn, apartment_id=int(apartment_id), ym=str(ym))
                 st = _get_month_bill_state(conn, int(apartment_id), str(ym))
-                if (bill.get("reason") == "ok") and (bill.get("total_rub") is not None) and (not _same_total(st.get("sent_total"), bill.get("total_rub"))):
-                    msg = f"Сумма оплаты по счётчикам за {ym}: {float(bill.get('total_rub')):.2f} ₽"
-                    if _tg_send_message(str(chat_id), msg):
+            if (bill.get("reason") == "ok") and (bill.get("total_rub") is not None) and (not _same_total(st.get("sent_total"), bill.get("total_rub"))):
+                msg = f"Сумма оплаты по счётчикам за {ym}: {float(bill.get('total_rub')):.2f} ₽"
+                if _tg_send_message(str(chat_id), msg):
+                    with engine.begin() as conn:
                         _set_month_bill_state(conn, int(apartment_id), str(ym), sent_at=True, sent_total=bill.get("total_rub"))
-                else:
-                    logger.info(
-                        "tg_send skip ctx=photo_event apartment_id=%s ym=%s reason=%s total=%s sent_total=%s",
-                        int(apartment_id),
-                        str(ym),
-                        str(bill.get("reason")),
-                        bill.get("total_rub"),
-                        st.get("sent_total"),
-                    )
-        except Exception:
-            pass
-
-    # 7) bill (for bot and web)
-    bill = None
-    if db_ready() and apartment_id:
-        try:
-            with engine.begin() as conn:
-                bill = _calc_month_bill(conn, int(apartment_id), ym)
+                        # sent_at changed: return the bill as the bot/web will see it from now on
+                        bill = _calc_month_bill(conn, int(apartment_id), ym)
+            else:
+                logger.info(
+                    "tg_send skip ctx=photo_event apartment_id=%s ym=%s reason=%s total=%s sent_total=%s",
+                    int(apartment_id),
+                    str(ym),
+                    str(bill.get("reason")),
+                    bill.get("total_rub"),
+                    st.get("sent_total"),
+                )
         except Exception as e:
             diag["warnings"].append({"bill_calc_failed": str(e)})
 
@@ -3291,4 +3505,4 @@ async def photo_event(request: Request, file: UploadFile = File(None)):
         len(diag.get("warnings") or []),
         len(diag.get("errors") or []),
     )
-    return JSONResponse(status_code=200, content=payload)
+    return payload
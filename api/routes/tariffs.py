@@ -1,10 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Request
 from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
 import re
 
+from core.bulk_io import parse_number, stream_rows
 from core.config import engine
 from core.db import db_ready, ensure_tables
 from core.schemas import TariffIn
+from core.ledger import reprice_ledger
+from core.tariff_timeline import invalidate_tariffs
+from routes.bulk import _format_or_400, export_response, read_import_body
 
 router = APIRouter()
 
@@ -99,6 +106,23 @@ def get_tariffs():
     }
 
 
+_TARIFF_UPSERT_SQL = text(
+    """
+    INSERT INTO tariffs(month_from, cold, hot, electric, electric_t1, electric_t2, electric_t3, sewer, updated_at)
+    VALUES(:month_from, :cold, :hot, :electric, :e1, :e2, :e3, :sewer, now())
+    ON CONFLICT(month_from) DO UPDATE SET
+      cold=EXCLUDED.cold,
+      hot=EXCLUDED.hot,
+      electric=EXCLUDED.electric,
+      electric_t1=EXCLUDED.electric_t1,
+      electric_t2=EXCLUDED.electric_t2,
+      electric_t3=EXCLUDED.electric_t3,
+      sewer=EXCLUDED.sewer,
+      updated_at=now()
+    """
+)
+
+
 @router.post("/tariffs")
 def upsert_tariff(payload: TariffIn):
     # Accept both month_from and ym_from
@@ -123,21 +147,7 @@ def upsert_tariff(payload: TariffIn):
 
     with engine.begin() as conn:
         conn.execute(
-            text(
-                """
-                INSERT INTO tariffs(month_from, cold, hot, electric, electric_t1, electric_t2, electric_t3, sewer, updated_at)
-                VALUES(:month_from, :cold, :hot, :electric, :e1, :e2, :e3, :sewer, now())
-                ON CONFLICT(month_from) DO UPDATE SET
-                  cold=EXCLUDED.cold,
-                  hot=EXCLUDED.hot,
-                  electric=EXCLUDED.electric,
-                  electric_t1=EXCLUDED.electric_t1,
-                  electric_t2=EXCLUDED.electric_t2,
-                  electric_t3=EXCLUDED.electric_t3,
-                  sewer=EXCLUDED.sewer,
-                  updated_at=now()
-                """
-            ),
+            _TARIFF_UPSERT_SQL,
             {
                 "month_from": ym_from,
                 "cold": float(payload.cold),
@@ -149,4 +159,67 @@ def upsert_tariff(payload: TariffIn):
                 "sewer": float(payload.sewer),
             },
         )
+        reprice_ledger(conn, ym_from)
+    invalidate_tariffs()
     return {"ok": True}
+
+
+TARIFF_COLUMNS = ("month_from", "cold", "hot", "sewer", "electric", "electric_t1", "electric_t2", "electric_t3")
+
+
+def parse_tariff(rec: Dict[str, Any]) -> Dict[str, Any]:
+    """One import row -> upsert params, with the same defaults as POST /tariffs."""
+    if rec.get("__error__"):
+        raise ValueError(str(rec["__error__"]))
+    ym_from = _normalize_ym_any(str(rec.get("month_from") or rec.get("ym_from") or ""))
+    if not ym_from:
+        raise ValueError("month_from is required")
+    electric = parse_number(rec.get("electric"), "electric", required=False)
+    e1 = parse_number(rec.get("electric_t1"), "electric_t1", required=False)
+    if electric is None and e1 is None:
+        raise ValueError("electric or electric_t1 is required")
+    base = electric if electric is not None else e1
+    return {
+        "month_from": ym_from,
+        "cold": parse_number(rec.get("cold"), "cold"),
+        "hot": parse_number(rec.get("hot"), "hot"),
+        "sewer": parse_number(rec.get("sewer"), "sewer"),
+        "electric": base,
+        "e1": e1 if e1 is not None else base,
+        "e2": parse_number(rec.get("electric_t2"), "electric_t2", required=False),
+        "e3": parse_number(rec.get("electric_t3"), "electric_t3", required=False),
+    }
+
+
+def _import_tariffs_tx(rows, dry_run: bool) -> Dict[str, Any]:
+    # last row wins for a repeated month, like sequential POSTs would
+    by_month = {r[1]["month_from"]: r[1] for r in rows}
+    params = [by_month[m] for m in sorted(by_month)]
+    if not dry_run:
+        with engine.begin() as conn:
+            conn.execute(_TARIFF_UPSERT_SQL, params)
+            reprice_ledger(conn, params[0]["month_from"])
+        invalidate_tariffs()
+    return {"rows": len(rows), "months": len(params), "dry_run": bool(dry_run)}
+
+
+@router.post("/tariffs/import")
+async def import_tariffs(request: Request, format: Optional[str] = None, dry_run: bool = False):
+    """Bulk tariffs, CSV (header: month_from,cold,hot,sewer,electric[,electric_t1,electric_t2,electric_t3]) or NDJSON."""
+    if not db_ready():
+        raise HTTPException(status_code=503, detail="db_disabled")
+    ensure_tables()
+    fmt = _format_or_400(format, request.headers.get("content-type"))
+    rows = await read_import_body(request, fmt, lambda rec: (parse_tariff(rec),))
+    summary = await run_in_threadpool(_import_tariffs_tx, rows, bool(dry_run))
+    return {"ok": True, **summary}
+
+
+@router.get("/tariffs/export")
+def export_tariffs(format: str = "csv"):
+    if not db_ready():
+        raise HTTPException(status_code=503, detail="db_disabled")
+    ensure_tables()
+    fmt = _format_or_400(format)
+    sql = f"SELECT {', '.join(TARIFF_COLUMNS)} FROM tariffs ORDER BY month_from ASC"
+    return export_response(stream_rows(engine, sql, {}, TARIFF_COLUMNS, fmt, numeric=TARIFF_COLUMNS[1:]), fmt, "tariffs")
@@ -0,0 +1,92 @@
+import argparse
+import os
+import sys
+import time
+
+from sqlalchemy import event, text
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from core.apartment_list import load_apartment_list  # noqa: E402
+from core.config import engine, logger  # noqa: E402
+from core.db import db_ready, ensure_tables  # noqa: E402
+
+# Response-time benchmark for the admin apartment list loader.
+# Seeds N synthetic apartments inside a transaction that is rolled back at the end, so it is safe to run
+# against a dev database. Prints statements and latency per size: statements stay constant, time grows
+# with rows.
+
+
+def _seed(conn, n: int, ym: str) -> None:
+    for i in range(n):
+        aid = conn.execute(
+            text("INSERT INTO apartments(title, electric_expected) VALUES(:t, 3) RETURNING id"),
+            {"t": f"bench-{i}"},
+        ).scalar_one()
+        conn.execute(
+            text("INSERT INTO apartment_contacts(apartment_id, kind, value, is_active) VALUES(:aid, 'phone', :v, true)"),
+            {"aid": aid, "v": f"bench-{i}"},
+        )
+        conn.execute(
+            text(
+                "INSERT INTO apartment_month_statuses(apartment_id, ym, rent_paid, meters_photo, meters_paid) "
+                "VALUES(:aid, :ym, false, true, false)"
+            ),
+            {"aid": aid, "ym": ym},
+        )
+        for mt, mi in (("cold", 1), ("hot", 1), ("electric", 1), ("electric", 2), ("electric", 3)):
+            conn.execute(
+                text(
+                    "INSERT INTO meter_readings(apartment_id, ym, meter_type, meter_index, value, source) "
+                    "VALUES(:aid, :ym, :mt, :mi, :v, 'ocr')"
+                ),
+                {"aid": aid, "ym": ym, "mt": mt, "mi": mi, "v": float(100 + i)},
+            )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=str, default="50,200,800")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ym", type=str, default="2099-01")
+    args = parser.parse_args()
+
+    if not db_ready():
+        logger.warning("db not ready")
+        return 1
+    ensure_tables()
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    print(f"{'apartments':>10} {'statements':>10} {'best_ms':>9} {'ms/100':>8}")
+    for n in sizes:
+        with engine.connect() as conn:
+            tx = conn.begin()
+            try:
+                _seed(conn, n, args.ym)
+                counter = {"n": 0}
+
+                def _count(*_a, **_kw):
+                    counter["n"] += 1
+
+                event.listen(conn, "before_cursor_execute", _count)
+                best = None
+                rows = 0
+                try:
+                    for _ in range(max(1, args.repeat)):
+                        counter["n"] = 0
+                        t0 = time.perf_counter()
+                        rows = len(load_apartment_list(conn, args.ym))
+                        dt = (time.perf_counter() - t0) * 1000.0
+                        best = dt if best is None else min(best, dt)
+                finally:
+                    event.remove(conn, "before_cursor_execute", _count)
+                print(f"{rows:>10} {counter['n']:>10} {best:>9.1f} {best * 100.0 / max(1, rows):>8.2f}")
+            finally:
+                tx.rollback()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -12,8 +12,9 @@ if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 
 from core.config import engine, logger  # noqa: E402
-from core.db import db_ready, ensure_tables  # noqa: E402
+from core.db import db_ready  # noqa: E402
 from core.integrations import ydisk_ready, ydisk_exists, ydisk_put, ydisk_list, ydisk_delete, ydisk_mkcol  # noqa: E402
+from core.migrations import migrate  # noqa: E402
 
 
 def main() -> int:
@@ -28,7 +29,9 @@ def main() -> int:
     if not db_ready():
         logger.warning("db not ready")
         return 1
-    ensure_tables()
+    applied = migrate()
+    if applied:
+        logger.info("schema migrated: %s", applied)
 
     if not ydisk_ready():
         logger.warning("ydisk not configured")
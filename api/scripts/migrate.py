@@ -0,0 +1,40 @@
+import argparse
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from core.config import engine, logger  # noqa: E402
+from core.db import db_ready  # noqa: E402
+from core.migrations import SCHEMA_VERSION, current_schema_version, migrate, pending_migrations  # noqa: E402
+
+# Show or apply schema migrations (core/migrations.py). API workers apply them on first use as well;
+# running this before a deploy keeps the DDL out of request latency.
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--status", action="store_true", help="print versions only, apply nothing")
+    args = parser.parse_args()
+
+    if not db_ready():
+        logger.warning("db not ready")
+        return 1
+
+    with engine.connect() as conn:
+        version = current_schema_version(conn)
+    print(f"schema version: {version} (code: {SCHEMA_VERSION})")
+    for v, name, _ in pending_migrations(version):
+        print(f"  pending {v}: {name}")
+    if args.status:
+        return 0
+
+    applied = migrate()
+    print(f"applied: {applied}" if applied else "up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,36 @@
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from core.config import engine, logger  # noqa: E402
+from core.db import db_ready, ensure_tables  # noqa: E402
+from core.ledger import rebuild_ledger  # noqa: E402
+
+# Rebuild apartment_month_ledger from meter_readings + tariffs (after a backfill, manual SQL edits,
+# or a change of ledger rules). Runs in one transaction: readers see the old or the new ledger.
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--apartment-id", type=int, default=None)
+    args = parser.parse_args()
+
+    if not db_ready():
+        logger.warning("db not ready")
+        return 1
+    ensure_tables()
+
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        n = rebuild_ledger(conn, args.apartment_id)
+    print(f"ledger rows: {n} in {(time.perf_counter() - t0) * 1000.0:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+
+import pytest
+
+
+class FakeResult:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def scalar(self):
+        row = self.fetchone()
+        return row[0] if row is not None else None
+
+    def mappings(self):
+        return self
+
+    first = fetchone
+    all = fetchall
+
+
+class FakeConn:
+    """Stands in for a connection and its engine: answers statements registered with on(), records the rest.
+
+    sql holds (normalized sql, params) per statement; events holds commit/rollback/savepoint markers in order.
+    """
+
+    def __init__(self):
+        self.sql = []
+        self.events = []
+        self._answers = []
+
+    def on(self, fragment, rows=()):
+        """Answer statements containing fragment with rows (or rows(params) when callable); first match wins."""
+        self._answers.append((fragment, rows))
+        return self
+
+    def execute(self, stmt, params=None):
+        sql = " ".join(str(stmt).split())
+        self.sql.append((sql, params))
+        for fragment, rows in self._answers:
+            if fragment in sql:
+                return FakeResult(rows(params) if callable(rows) else rows)
+        return FakeResult()
+
+    def statements(self):
+        return [sql for sql, _ in self.sql]
+
+    def commit(self):
+        self.events.append("commit")
+
+    def rollback(self):
+        self.events.append("rollback")
+
+    @contextmanager
+    def begin(self):
+        try:
+            yield self
+        except Exception:
+            self.rollback()
+            raise
+        self.commit()
+
+    @contextmanager
+    def begin_nested(self):
+        self.events.append("savepoint")
+        yield self
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def fake_conn():
+    return FakeConn()
@@ -0,0 +1,35 @@
+from core.apartment_list import build_apartment_list_items
+
+
+def _apt(aid, electric_expected=3):
+    return (aid, f"Apt {aid}", None, None, None, None, electric_expected, None, None, None, 25000,
+            "by_actual_monthly", None, None, None, None, None)
+
+
+def test_build_apartment_list_items_derives_completeness_in_memory():
+    data = {
+        "apartments": [_apt(2, electric_expected=1), _apt(1)],
+        "contacts": [(1, "phone", "+79990000000"), (1, "telegram", "tenant1")],
+        "statuses": [(1, True, True, False)],
+        "chats": [(2,)],
+        "readings": [
+            (2, "cold", 1, 10.0, "ocr"),
+            (2, "hot", 1, 5.0, "ocr"),
+            (2, "electric", 1, 100.0, "manual"),
+            (1, "cold", 1, 10.0, "ocr"),
+            (1, "hot", 1, 5.0, "ocr"),
+            (1, "electric", 1, 100.0, "ocr"),
+            (1, "electric", 2, 50.0, "ocr"),
+            (1, "electric", 3, 150.0, "manual"),  # T3 must come from a photo
+        ],
+    }
+    items = build_apartment_list_items(data, "2026-03")
+    assert [it["id"] for it in items] == [2, 1]
+    apt2, apt1 = items
+    assert apt2["statuses"]["all_photos_received"] is True
+    assert apt2["has_active_chat"] is True
+    assert apt2["contacts"] == {"phone": None, "telegram": None}
+    assert apt1["statuses"]["all_photos_received"] is False
+    assert apt1["statuses"]["rent_paid"] is True and apt1["statuses"]["meters_paid"] is False
+    assert apt1["contacts"]["telegram"] == "tenant1"
+    assert apt1["has_active_chat"] is False
@@ -0,0 +1,79 @@
+from decimal import Decimal
+
+from core.billing import (
+    _bill_state_unchanged,
+    _compute_month_bill,
+    month_range,
+)
+from core.tariff_timeline import TariffTimeline
+
+
+def _tariff(month_from, cold):
+    return {
+        "month_from": month_from, "cold": cold, "hot": 200.0, "sewer": 40.0, "electric": 6.0,
+        "electric_t1": 7.0, "electric_t2": 3.0, "electric_t3": 6.0,
+    }
+
+
+def _month(cold, hot, e1, e2, e3, source="ocr"):
+    return {
+        "cold": {1: (Decimal(str(cold)), source)},
+        "hot": {1: (Decimal(str(hot)), source)},
+        "electric": {1: (Decimal(str(e1)), source), 2: (Decimal(str(e2)), source), 3: (Decimal(str(e3)), source)},
+    }
+
+
+def _inputs():
+    return {
+        "electric_expected": {1: 3},
+        "statuses": {},
+        "readings": {
+            (1, "2026-01"): _month(8, 4, 900, 400, 1300),
+            (1, "2026-02"): _month(10, 5, 1000, 500, 1500),
+            (1, "2026-03"): _month(12, 6, 1100, 550, 1650),
+        },
+        "tariffs": TariffTimeline([_tariff("2026-03", 50.0), _tariff("2025-01", 40.0)], {}),
+    }
+
+
+def test_compute_month_bill_totals_and_snapshot():
+    bill, update = _compute_month_bill(_inputs(), 1, "2026-03")
+    # cold 2*50 + hot 1*200 + sewer 3*40 + T1 100*7 + T2 50*3 (T3 is not billed)
+    assert bill["reason"] == "ok"
+    assert bill["total_rub"] == 1270.0
+    # previous month is re-priced with the current month's tariff
+    assert bill["prev_components"]["total_rub"] == 100.0 + 200.0 + 120.0 + 700.0 + 300.0
+    assert update["last_json"]["components"]["total_rub"] == 1270.0
+    assert update["pending"] == {}
+
+
+def test_compute_month_bill_early_reasons():
+    inputs = _inputs()
+    bill, update = _compute_month_bill(inputs, 1, "2026-01")
+    assert (bill["reason"], update) == ("no_prev_month", None)
+
+    inputs["readings"][(1, "2026-03")]["electric"][3] = (Decimal("1650"), "manual")
+    bill, update = _compute_month_bill(inputs, 1, "2026-03")
+    assert bill["missing"] == ["electric_3"] and update is None
+    bill, _ = _compute_month_bill(inputs, 1, "2026-03", allow_missing_t3_photo=True)
+    assert bill["reason"] == "ok"
+
+    inputs["statuses"][(1, "2026-03")] = {"extra_pending": True, "bill": {}}
+    bill, update = _compute_month_bill(inputs, 1, "2026-03", allow_missing_t3_photo=True)
+    assert bill["reason"] == "pending_admin" and bill["total_rub"] is None and update is None
+
+
+def test_bill_state_write_skipped_only_when_snapshot_matches():
+    inputs = _inputs()
+    _bill, update = _compute_month_bill(inputs, 1, "2026-03")
+    assert not _bill_state_unchanged(None, update)
+    stored = {"bill": {"pending": None, "last": update["last_json"]}}
+    assert _bill_state_unchanged(stored, update)
+    stored["bill"]["last"] = dict(update["last_json"], ym="2026-02")
+    assert not _bill_state_unchanged(stored, update)
+
+
+def test_month_range():
+    assert month_range("2025-11", "2026-02") == ["2025-11", "2025-12", "2026-01", "2026-02"]
+    assert month_range("2026-02", "2026-01") == []
+    assert month_range("bad", "2026-01") == []
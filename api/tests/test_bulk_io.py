@@ -0,0 +1,70 @@
+from core.bulk_io import RecordReader, apply_reading, parse_reading, plan_reading_import, validate_records
+
+
+def _values(state):
+    return {k: v["value"] for k, v in state.items()}
+
+
+def test_reader_handles_chunks_split_mid_line_and_semicolons():
+    reader = RecordReader("csv")
+    body = "\ufeffapartment_id;ym;meter_type;meter_index;value\r\n7;2026-01;cold;1;101,5\n7;2026-01;electric;2;4".encode("utf-8")
+    out = []
+    for i in range(0, len(body), 7):
+        out.extend(reader.feed(body[i:i + 7]))
+    out.extend(reader.close())
+    assert [line for line, _ in out] == [2, 3]
+    assert out[0][1]["value"] == "101,5"
+    assert parse_reading(out[0][1]) == (7, "2026-01", "cold", 1, 101.5, "manual")
+    assert parse_reading(out[1][1]) == (7, "2026-01", "electric", 2, 4.0, "manual")
+
+
+def test_validation_reports_lines_and_keeps_good_rows():
+    reader = RecordReader("ndjson")
+    recs = reader.feed(b'{"apartment_id": 1, "ym": "2026-13", "meter_type": "cold", "value": 1}\nnot json\n')
+    recs += reader.feed(b'{"apartment_id": 1, "ym": "2026-02", "meter_type": "hot", "value": 5}\n')
+    rows, errors, n = validate_records(recs, parse_reading)
+    assert n == 2
+    assert errors == [{"line": 1, "error": "ym must be YYYY-MM"}, {"line": 2, "error": "invalid json"}]
+    assert rows == [(3, 1, "2026-02", "hot", 1, 5.0, "manual")]
+
+
+def test_electric_slotting_matches_manual_overwrite_then_sort():
+    state = {}
+    apply_reading(state, "electric", 1, 500.0, "manual", 3)
+    apply_reading(state, "electric", 2, 200.0, "manual", 3)
+    # T2=min, T1=max, T3 auto-filled from T1+T2
+    assert _values(state) == {("electric", 1): 500.0, ("electric", 2): 200.0, ("electric", 3): 700.0}
+    apply_reading(state, "electric", 3, 650.0, "ocr", 3)
+    assert _values(state) == {("electric", 1): 500.0, ("electric", 2): 200.0, ("electric", 3): 650.0}
+
+    two = {}
+    for mi, v in ((1, 10.0), (2, 30.0), (3, 20.0)):
+        apply_reading(two, "electric", mi, v, "manual", 2)
+    assert _values(two) == {("electric", 1): 30.0, ("electric", 2): 10.0}
+
+
+def test_water_sorted_and_ocr_source_kept_for_same_value():
+    state = {("cold", 1): {"value": 50.0, "source": "ocr", "ocr_value": 50.0}}
+    apply_reading(state, "cold", 1, 50.0, "manual", 3)
+    assert state[("cold", 1)]["source"] == "ocr"
+    apply_reading(state, "hot", 1, 80.0, "manual", 3)
+    assert _values(state) == {("cold", 1): 80.0, ("hot", 1): 50.0}
+    assert state[("hot", 1)]["source"] == "ocr"
+
+
+def test_plan_writes_only_changes():
+    existing = {
+        (1, "2026-01"): {
+            ("cold", 1): {"value": 90.0, "source": "manual", "ocr_value": None},
+            ("hot", 1): {"value": 40.0, "source": "manual", "ocr_value": None},
+            ("electric", 1): {"value": 7.0, "source": "manual", "ocr_value": 7.0},
+        }
+    }
+    rows = [
+        (2, 1, "2026-01", "cold", 1, 90.0, "manual"),
+        (3, 1, "2026-01", "electric", 2, 9.0, "manual"),
+    ]
+    plan = plan_reading_import(rows, existing, {1: 2})
+    upserts, deletes = plan[(1, "2026-01")]
+    assert [(k, v["value"]) for k, v in upserts] == [(("electric", 1), 9.0), (("electric", 2), 7.0)]
+    assert deletes == []
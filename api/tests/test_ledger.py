@@ -0,0 +1,85 @@
+import core.ledger as ledger
+import core.meters as meters
+from core.ledger import build_ledger_rows, group_readings
+from core.tariff_timeline import TariffTimeline
+
+
+def _timeline():
+    g = {"month_from": "2025-01", "cold": 50.0, "hot": 200.0, "sewer": 40.0, "electric": 5.0,
+         "electric_t1": 7.0, "electric_t2": 3.0, "electric_t3": 5.0}
+    ov = {"month_from": "2026-02", "cold": 60.0, "hot": None, "sewer": None,
+          "electric_t1": None, "electric_t2": None, "electric_t3": None, "rent": None}
+    return TariffTimeline([g], {1: [ov]})
+
+
+def test_ledger_rows_carry_previous_month_with_readings():
+    readings = [
+        (1, "2025-12", "cold", 1, 8, "ocr"),
+        (1, "2025-12", "hot", 1, 4, "ocr"),
+        (1, "2025-12", "electric", 1, 900, "ocr"),
+        (1, "2025-12", "electric", 2, 400, "ocr"),
+        (1, "2025-12", "electric", 3, 1300, "ocr"),
+        # 2026-01 has no readings; 2026-02 follows 2025-12 directly
+        (1, "2026-02", "cold", 1, 10, "manual"),
+        (1, "2026-02", "hot", 1, 5, "ocr"),
+        (1, "2026-02", "electric", 1, 1000, "ocr"),
+        (1, "2026-02", "electric", 2, 500, "ocr"),
+        (1, "2026-03", "cold", 1, 12, "ocr"),
+    ]
+    rows = build_ledger_rows(1, group_readings(readings)[1], _timeline())
+    assert [r["ym"] for r in rows] == ["2025-12", "2026-02", "2026-03"]
+
+    first, feb, mar = rows
+    assert first["meters"]["cold"]["previous"] is None and first["rub"]["total"] is None
+
+    assert feb["meters"]["cold"] == {"current": 10.0, "previous": 8.0, "delta": 2.0, "source": "manual"}
+    assert feb["meters"]["e3"]["previous"] == 1300.0 and feb["meters"]["e3"]["current"] is None
+    assert feb["rub"]["sewer"] == 3.0 * 40.0
+    assert feb["rub"]["total"] is None  # T3 is missing this month
+    # history accrual: apartment override for cold, T3 not billed
+    assert feb["accrual"] == {"cold": 120.0, "hot": 200.0, "e1": 700.0, "e2": 300.0, "sewer": 120.0}
+
+    assert mar["meters"]["cold"]["delta"] == 2.0
+    assert mar["meters"]["hot"]["previous"] == 5.0 and mar["meters"]["hot"]["delta"] is None
+    assert mar["meters"]["sewer"]["delta"] is None and mar["rub"]["sewer"] is None
+
+
+def test_ledger_seed_supplies_previous_for_incremental_refresh():
+    grouped = group_readings([
+        (1, "2026-01", "cold", 1, 8, "ocr"),
+        (1, "2026-02", "cold", 1, 10, "ocr"),
+    ])[1]
+    seed = grouped.pop("2026-01")
+    rows = build_ledger_rows(1, grouped, _timeline(), seed=seed)
+    assert len(rows) == 1 and rows[0]["meters"]["cold"]["delta"] == 2.0
+
+
+def test_only_outermost_writer_refreshes_ledger(monkeypatch):
+    calls = []
+    monkeypatch.setattr(meters, "refresh_ledger_month", lambda conn, aid, ym: calls.append((aid, ym)))
+
+    @meters._maintains_ledger
+    def inner(conn, apartment_id, ym):
+        return "inner"
+
+    @meters._maintains_ledger
+    def outer(conn, apartment_id: int, ym: str, value: float):
+        inner(conn, apartment_id, ym)
+        return inner(conn, apartment_id, ym)
+
+    assert outer(object(), 5, " 2026-03 ", 1.0) == "inner"
+    assert calls == [(5, "2026-03")]
+    inner(object(), apartment_id="6", ym="2026-04")
+    assert calls[-1] == (6, "2026-04")
+
+
+def test_ledger_writers_lock_the_apartment_before_reading(monkeypatch, fake_conn):
+    monkeypatch.setattr(ledger, "tariff_timeline", lambda conn, verify=False: _timeline())
+    monkeypatch.setattr(ledger, "_load_timeline", lambda conn: _timeline())
+    ledger.refresh_ledger_month(fake_conn, 5, "2026-03")
+    ledger.rebuild_ledger(fake_conn)
+    sql = fake_conn.statements()
+    refresh_lock, rebuild_lock = [i for i, s in enumerate(sql) if "pg_advisory_xact_lock" in s]
+    assert fake_conn.sql[refresh_lock][1] == {"k": ledger._LEDGER_ADVISORY_LOCK_KEY, "aid": 5}
+    assert refresh_lock < min(i for i, s in enumerate(sql) if "FROM meter_readings" in s)
+    assert "ORDER BY id" in sql[rebuild_lock] and sql[rebuild_lock + 1] == "DELETE FROM apartment_month_ledger"
@@ -0,0 +1,62 @@
+import core.db as db_mod
+import core.migrations as mig
+from core.migrations import MIGRATIONS, SCHEMA_VERSION, migrate, pending_migrations
+
+
+def _schema(conn, versions=()):
+    """Backs the schema_version table with a dict the fake connection reads and writes."""
+    db = {"table": bool(versions), "versions": list(versions)}
+
+    def _create(_params):
+        db["table"] = True
+        return []
+
+    def _insert(params):
+        db["versions"].append(params["v"])
+        return []
+
+    conn.on("to_regclass('schema_version')", lambda _params: [(db["table"],)])
+    conn.on("FROM schema_version", lambda _params: [(max(db["versions"], default=0),)])
+    conn.on("CREATE TABLE IF NOT EXISTS schema_version", _create)
+    conn.on("INSERT INTO schema_version", _insert)
+    return db
+
+
+def test_registry_versions_are_unique_and_increasing():
+    versions = [m[0] for m in MIGRATIONS]
+    assert versions == sorted(set(versions))
+    assert versions[0] == 1
+    assert SCHEMA_VERSION == versions[-1]
+    assert all(m[2] for m in MIGRATIONS)
+
+
+def test_up_to_date_schema_runs_no_ddl_and_takes_no_lock(fake_conn):
+    _schema(fake_conn, versions=[m[0] for m in MIGRATIONS])
+    assert migrate(fake_conn) == []
+    assert not any("pg_advisory_lock" in s or "CREATE" in s for s in fake_conn.statements())
+
+
+def test_only_missing_steps_are_applied_in_order(fake_conn):
+    db = _schema(fake_conn, versions=[1, 2])
+    applied = migrate(fake_conn)
+    assert applied == [m[0] for m in pending_migrations(2)]
+    assert db["versions"] == [m[0] for m in MIGRATIONS]
+    log = fake_conn.statements()
+    assert not any("CREATE TABLE IF NOT EXISTS apartments" in s for s in log)
+    assert log.index("SELECT pg_advisory_lock(:k)") < log.index("SELECT pg_advisory_unlock(:k)")
+
+
+def test_fresh_database_gets_every_step(fake_conn):
+    _schema(fake_conn)
+    assert migrate(fake_conn) == [m[0] for m in MIGRATIONS]
+
+
+def test_ensure_tables_is_a_noop_once_version_seen(monkeypatch):
+    calls = []
+    monkeypatch.setattr(db_mod, "db_ready", lambda: True)
+    monkeypatch.setattr(db_mod, "migrate", lambda: calls.append(1) or [])
+    monkeypatch.setattr(db_mod, "_SCHEMA_VERSION_SEEN", 0)
+    db_mod.ensure_tables()
+    db_mod.ensure_tables()
+    assert calls == [1]
+    assert db_mod._SCHEMA_VERSION_SEEN == mig.SCHEMA_VERSION
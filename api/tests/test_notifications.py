@@ -0,0 +1,71 @@
+import asyncio
+
+import core.notifications as hub
+
+
+def _unread(conn, value, max_id=10):
+    state = {"value": value}
+    conn.on("notifications", lambda _params: [(state["value"], max_id)])
+    return state
+
+
+def _reset(monkeypatch, **state):
+    base = {"unread": None, "max_id": 0, "listening": False, "checked_at": 0.0, "last": None}
+    base.update(state)
+    monkeypatch.setattr(hub, "_STATE", base)
+    monkeypatch.setattr(hub, "_SUBSCRIBERS", {})
+
+
+def test_unread_count_is_served_from_cache_while_listening(monkeypatch, fake_conn):
+    _reset(monkeypatch, listening=True)
+    state = _unread(fake_conn, 4)
+    assert hub.unread_count(fake_conn) == 4
+    state["value"] = 9
+    assert hub.unread_count(fake_conn) == 4
+    hub.invalidate_unread_count()
+    assert hub.unread_count(fake_conn) == 9
+
+
+def test_unread_count_falls_back_to_ttl_without_listener(monkeypatch, fake_conn):
+    _reset(monkeypatch)
+    monkeypatch.setattr(hub, "UNREAD_COUNT_TTL_SEC", 0.0)
+    state = _unread(fake_conn, 1)
+    assert hub.unread_count(fake_conn) == 1
+    state["value"] = 2
+    assert hub.unread_count(fake_conn) == 2
+
+
+def test_publish_wakes_long_poll_only_on_change(monkeypatch):
+    _reset(monkeypatch, unread=2, max_id=10, listening=True)
+
+    async def scenario():
+        waiter = asyncio.create_task(hub.wait_for_change("10:2", 5.0))
+        await asyncio.sleep(0.01)
+        hub._publish(2, 10, {"op": "UPDATE"})  # same count, no new row: stays asleep
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        hub._publish(3, 11, {"op": "INSERT", "id": 11})
+        return await asyncio.wait_for(waiter, 1.0)
+
+    snap = asyncio.run(scenario())
+    assert snap == {"unread_count": 3, "seq": "11:3", "last": {"op": "INSERT", "id": 11}}
+    assert hub._SUBSCRIBERS == {}
+
+
+def test_cursor_comes_from_the_table_so_workers_agree(monkeypatch, fake_conn):
+    _unread(fake_conn, 4, max_id=57)
+    seqs = []
+    for _ in range(2):  # two API workers with their own state
+        _reset(monkeypatch, listening=True)
+        hub.unread_count(fake_conn)
+        seqs.append(hub.snapshot()["seq"])
+    assert seqs == ["57:4", "57:4"]
+    # a read notification inserted while the count stays the same still moves the cursor
+    hub._publish(4, 58, {"op": "INSERT", "id": 58})
+    assert hub.snapshot()["seq"] == "58:4"
+
+
+def test_parse_payload_tolerates_garbage():
+    assert hub._parse_payload('{"op": "INSERT", "id": 1}') == {"op": "INSERT", "id": 1}
+    assert hub._parse_payload("not json") == {}
+    assert hub._parse_payload("[1]") == {}
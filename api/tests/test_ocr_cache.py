@@ -0,0 +1,15 @@
+import core.ocr_cache as ocr_cache
+from core.ocr_cache import ocr_result_cache_key
+
+
+def test_ocr_result_cache_key_depends_on_context_and_version():
+    base = ocr_result_cache_key("abc", context_prev_water="878.774", context_serial_hint=None, pipeline_version="v1")
+    assert base == ocr_result_cache_key("abc", context_prev_water="878.774", context_serial_hint=None, pipeline_version="v1")
+    assert base != ocr_result_cache_key("abc", context_prev_water="878.775", context_serial_hint=None, pipeline_version="v1")
+    assert base != ocr_result_cache_key("abc", context_prev_water="878.774", context_serial_hint="12345", pipeline_version="v1")
+    assert base != ocr_result_cache_key("abc", context_prev_water="878.774", context_serial_hint=None, pipeline_version="v2")
+
+
+def test_ocr_health_url_from_recognize_url(monkeypatch):
+    monkeypatch.setattr(ocr_cache, "OCR_URL", "http://ocr-service:8000/recognize")
+    assert ocr_cache._ocr_health_url() == "http://ocr-service:8000/health"
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+import core.ocr_jobs as jobs
+
+
+def _job():
+    return {"id": 7, "attempts": 2, "fields": {"chat_id": "1"}, "photos": []}
+
+
+def test_mark_written_is_fenced_on_attempt(fake_conn):
+    job = {"attempts": 2, "written": False}
+
+    def _fenced(params):
+        if params["attempts"] != job["attempts"] or job["written"]:
+            return []
+        job["written"] = True
+        return [(params["id"],)]
+
+    fake_conn.on("UPDATE ocr_jobs", _fenced)
+    with pytest.raises(jobs.PhotoJobLost):
+        jobs.mark_photo_job_written(fake_conn, 7, attempts=1)  # a run whose lease was taken over
+    jobs.mark_photo_job_written(fake_conn, 7, attempts=2)
+    with pytest.raises(jobs.PhotoJobLost):
+        jobs.mark_photo_job_written(fake_conn, 7, attempts=2)  # replay after the rows were written
+
+
+def test_lease_is_renewed_while_the_handler_runs(monkeypatch):
+    renewed = threading.Event()
+    done = []
+    monkeypatch.setattr(jobs, "OCR_JOB_LEASE_SEC", 0.03)
+    monkeypatch.setattr(jobs, "renew_photo_job_lease", lambda job_id, attempts: renewed.set() or True)
+    monkeypatch.setattr(jobs, "complete_photo_job", lambda job_id, result, attempts: done.append((job_id, result, attempts)))
+
+    def _handler(fields, photos, job):
+        assert renewed.wait(2.0)
+        return {"ok": True}
+
+    jobs.run_photo_job(_handler, _job())
+    assert done == [(7, {"ok": True}, 2)]
+
+
+def test_lost_job_is_dropped_and_failures_are_requeued_by_attempt(monkeypatch):
+    failed = []
+    monkeypatch.setattr(jobs, "renew_photo_job_lease", lambda job_id, attempts: True)
+    monkeypatch.setattr(jobs, "fail_photo_job", lambda job_id, error, attempts: failed.append((job_id, error, attempts)))
+
+    def _lost(fields, photos, job):
+        raise jobs.PhotoJobLost("taken over")
+
+    def _broken(fields, photos, job):
+        raise RuntimeError("ocr down")
+
+    jobs.run_photo_job(_lost, _job())
+    assert failed == []
+    jobs.run_photo_job(_broken, _job())
+    assert failed == [(7, "ocr down", 2)]
@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from core.pagination import cursor_id, cursor_ts, decode_cursor, encode_cursor, keyset_page
+
+
+def test_cursor_round_trip_keeps_timestamp_and_id():
+    ts = datetime(2026, 3, 1, 12, 30, 5, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor("notifications:all", (ts, 42))
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "notifications:all", (cursor_ts, cursor_id)) == [ts, 42]
+
+
+def test_cursor_rejects_other_listing_and_garbage():
+    cursor = encode_cursor("apartments", (10,))
+    assert decode_cursor(None, "apartments", (cursor_id,)) is None
+    for bad in (encode_cursor("rent_history", (10,)), "%%%", cursor[:-3]):
+        with pytest.raises(HTTPException) as e:
+            decode_cursor(bad, "apartments", (cursor_id,))
+        assert e.value.status_code == 400
+    with pytest.raises(HTTPException):
+        decode_cursor(cursor, "apartments", (cursor_ts, cursor_id))
+
+
+def test_cursor_with_mistyped_values_is_a_client_error():
+    for values in (("x",), (1.5,), (True,), (None,)):
+        with pytest.raises(HTTPException) as e:
+            decode_cursor(encode_cursor("apartments", values), "apartments", (cursor_id,))
+        assert e.value.status_code == 400
+    for values in (("not a date", 1), (12, 1), ("2026-03-01T00:00:00+00:00", "1")):
+        with pytest.raises(HTTPException) as e:
+            decode_cursor(encode_cursor("rent_history", values), "rent_history", (cursor_ts, cursor_id))
+        assert e.value.status_code == 400
+
+
+def test_keyset_page_emits_cursor_only_when_more_rows_exist():
+    rows = [{"id": i} for i in (9, 8, 7)]
+    items, cursor = keyset_page(rows, 2, "apartments", lambda r: (r["id"],))
+    assert [r["id"] for r in items] == [9, 8]
+    assert decode_cursor(cursor, "apartments", (cursor_id,)) == [8]
+    items, cursor = keyset_page(rows, 3, "apartments", lambda r: (r["id"],))
+    assert len(items) == 3 and cursor is None
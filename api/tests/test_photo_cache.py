@@ -0,0 +1,40 @@
+import hashlib
+import os
+
+import core.photo_cache as photo_cache
+from core.photo_cache import photo_cache_get, photo_cache_put
+
+
+def _fresh_cache(monkeypatch, tmp_path, max_bytes):
+    monkeypatch.setattr(photo_cache, "PHOTO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(photo_cache, "PHOTO_CACHE_MAX_BYTES", max_bytes)
+    monkeypatch.setattr(photo_cache, "_STATE", {"total_bytes": None})
+
+
+def test_photo_cache_roundtrip_and_rejects_bad_keys(monkeypatch, tmp_path):
+    _fresh_cache(monkeypatch, tmp_path, 10_000)
+    blob = b"\xff\xd8jpeg-bytes"
+    sha = hashlib.sha256(blob).hexdigest()
+    assert photo_cache_get(sha) is None
+    assert photo_cache_put(sha, blob)
+    assert photo_cache_get(sha) == blob
+    assert not photo_cache_put("../../etc/passwd", blob)
+    assert photo_cache_get("../../etc/passwd") is None
+
+
+def test_photo_cache_evicts_least_recently_used(monkeypatch, tmp_path):
+    _fresh_cache(monkeypatch, tmp_path, 250)
+    shas = []
+    for i in range(3):
+        blob = bytes([i]) * 100
+        sha = hashlib.sha256(blob).hexdigest()
+        shas.append(sha)
+        assert photo_cache_put(sha, blob)
+        p = os.path.join(str(tmp_path), sha[:2], sha)
+        os.utime(p, (1000 + i, 1000 + i))
+        if i == 1:
+            # first entry becomes the most recent one
+            os.utime(os.path.join(str(tmp_path), shas[0][:2], shas[0]), (2000, 2000))
+    assert photo_cache_get(shas[0]) is not None
+    assert photo_cache_get(shas[1]) is None
+    assert photo_cache_get(shas[2]) is not None
@@ -0,0 +1,25 @@
+import json
+
+from routes.events import _photo_event_fields
+
+
+def test_photo_event_fields_parse_and_are_json_safe():
+    fields = _photo_event_fields(
+        {"trace_id": "tg-1", "chat_id": "42", "ym": "2026-03", "meter_index": "7", "meter_index_mode": "Explicit"}
+    )
+    assert fields["trace_id"] == "tg-1"
+    assert fields["chat_id"] == "42"
+    assert fields["ym"] == "2026-03"
+    assert fields["meter_index"] == 3
+    assert fields["raw_meter_index"] == "7"
+    assert fields["meter_index_mode"] == "explicit"
+    assert json.loads(json.dumps(fields)) == fields
+
+
+def test_photo_event_fields_invalid_values_fall_back():
+    fields = _photo_event_fields({"ym": "March", "meter_index": "x"})
+    assert fields["chat_id"] == "unknown"
+    assert fields["trace_id"].startswith("evt-")
+    assert fields["meter_index"] == 1
+    assert {"invalid_ym": "March"} in fields["diag"]["warnings"]
+    assert {"invalid_meter_index": "x"} in fields["diag"]["warnings"]
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import core.portfolio as portfolio
+from core.portfolio import build_portfolio, encode_body, etag_matches, parse_fields
+
+
+def _answer_loaders(conn):
+    meters = {"cold": {"current": 12.0, "delta": 2.0}, "hot": {"current": 5.0, "delta": 1.0}}
+    ts = datetime(2026, 2, 3, tzinfo=timezone.utc)
+    flag = {"id": 9, "apartment_id": 2, "ym": "2026-01", "meter_type": "hot", "meter_index": None, "reason": "r", "created_at": ts}
+    conn.on("FROM apartments", [(1, "A"), (2, "B")])
+    conn.on("FROM apartment_month_ledger", [(1, "2026-02", meters)])
+    conn.on("FROM meter_review_flags", [flag])
+
+
+def test_parse_fields_keeps_canonical_order_and_rejects_unknown():
+    assert parse_fields(None) == portfolio.PORTFOLIO_FIELDS
+    assert parse_fields("flags, readings") == ("readings", "flags")
+    with pytest.raises(ValueError):
+        parse_fields("readings,photos")
+
+
+def test_query_count_does_not_depend_on_apartments_or_months(fake_conn):
+    _answer_loaders(fake_conn)
+    items = build_portfolio(fake_conn, [2, 1, 2], ["2026-01", "2026-02", "2026-03"], ("deltas", "flags"))
+    assert len(fake_conn.sql) == 3
+    assert [i["apartment_id"] for i in items] == [1, 2]
+    feb = items[0]["months"][1]
+    assert set(feb) == {"ym", "deltas", "flags"}
+    assert feb["deltas"]["sewer"] == 3.0 and feb["deltas"]["e1"] is None
+    assert items[0]["months"][0]["deltas"]["cold"] is None
+    assert items[1]["months"][0]["flags"][0]["meter_index"] == 1
+
+
+def test_etag_follows_body_and_weak_comparison():
+    body, etag = encode_body({"items": [1]})
+    assert encode_body({"items": [1]}) == (body, etag)
+    assert encode_body({"items": [2]})[1] != etag
+    assert etag_matches(etag, etag)
+    assert etag_matches('"other", ' + etag[2:], etag)
+    assert not etag_matches('"other"', etag) and not etag_matches(None, etag)
@@ -0,0 +1,26 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import core.stages as stages
+from core.stages import run_photo_stage
+
+
+def test_run_photo_stage_runs_off_event_loop_thread():
+    async def main():
+        loop_thread = threading.get_ident()
+        worker_thread = await run_photo_stage(threading.get_ident)
+        return loop_thread, worker_thread
+
+    loop_thread, worker_thread = asyncio.run(main())
+    assert loop_thread != worker_thread
+
+
+def test_run_photo_stage_rejects_when_backlog_full(monkeypatch):
+    monkeypatch.setattr(stages, "PHOTO_EVENT_MAX_PENDING", 0)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run_photo_stage(lambda: None))
+    assert exc.value.status_code == 503
+    assert stages.stage_stats()["photo_event_pending"] == 0
@@ -0,0 +1,78 @@
+import core.tariff_timeline as tt
+from core.tariff_timeline import TariffTimeline, invalidate_tariffs, tariff_timeline
+
+
+def _g(month_from, cold, e1=5.0):
+    return {"month_from": month_from, "cold": cold, "hot": 200.0, "sewer": 40.0, "electric": 5.0,
+            "electric_t1": e1, "electric_t2": 3.0, "electric_t3": 5.0}
+
+
+def _ov(month_from, **kw):
+    row = {"month_from": month_from, "cold": None, "hot": None, "sewer": None,
+           "electric_t1": None, "electric_t2": None, "electric_t3": None, "rent": None}
+    row.update(kw)
+    return row
+
+
+def test_global_lookup_is_latest_not_after_month():
+    tl = TariffTimeline([_g("2026-03", 50.0), _g("2025-01", 40.0)], {})
+    assert tl.global_at("2024-12") is None
+    assert tl.global_at("2026-02")["cold"] == 40.0
+    assert tl.global_at("2026-03")["cold"] == 50.0
+    assert tl.global_at("2030-01")["cold"] == 50.0
+
+
+def test_apartment_override_applies_per_field():
+    tl = TariffTimeline(
+        [_g("2025-01", 40.0)],
+        {7: [_ov("2025-06", cold=45.0, electric_t1=6.0), _ov("2026-01", rent=30000.0)]},
+    )
+    assert tl.apartment_at(7, "2025-03")["cold"] == 40.0
+    assert tl.apartment_at(7, "2025-06") == {"cold": 45.0, "hot": 200.0, "sewer": 40.0, "e1": 6.0, "e2": 3.0}
+    # the latest override row wins even when it only carries rent
+    assert tl.apartment_at(7, "2026-02")["cold"] == 40.0
+    assert tl.apartment_at(8, "2025-06")["cold"] == 40.0
+
+
+def test_timeline_reloads_on_invalidate_and_version_change(monkeypatch):
+    loads = []
+    version = {"v": (1,)}
+
+    def _load(conn):
+        loads.append(1)
+        return TariffTimeline([_g("2025-01", float(len(loads)))], {})
+
+    monkeypatch.setattr(tt, "_load_timeline", _load)
+    monkeypatch.setattr(tt, "_load_version", lambda conn: version["v"])
+    monkeypatch.setattr(tt, "TARIFF_CACHE_TTL_SEC", 0)
+    invalidate_tariffs()
+
+    assert tariff_timeline(None).global_at("2025-01")["cold"] == 1.0
+    assert tariff_timeline(None).global_at("2025-01")["cold"] == 1.0  # same version -> cached
+    version["v"] = (2,)
+    assert tariff_timeline(None).global_at("2025-01")["cold"] == 2.0
+    invalidate_tariffs()
+    assert tariff_timeline(None).global_at("2025-01")["cold"] == 3.0
+    invalidate_tariffs()
+
+
+def test_verify_checks_version_inside_ttl(monkeypatch):
+    loads = []
+    version = {"v": (1,)}
+
+    def _load(conn):
+        loads.append(1)
+        return TariffTimeline([_g("2025-01", float(len(loads)))], {})
+
+    monkeypatch.setattr(tt, "_load_timeline", _load)
+    monkeypatch.setattr(tt, "_load_version", lambda conn: version["v"])
+    monkeypatch.setattr(tt, "TARIFF_CACHE_TTL_SEC", 3600)
+    invalidate_tariffs()
+
+    assert tariff_timeline(None).global_at("2025-01")["cold"] == 1.0
+    version["v"] = (2,)  # changed by another worker
+    assert tariff_timeline(None).global_at("2025-01")["cold"] == 1.0
+    assert tariff_timeline(None, verify=True).global_at("2025-01")["cold"] == 2.0
+    assert tariff_timeline(None, verify=True).global_at("2025-01")["cold"] == 2.0
+    assert len(loads) == 2
+    invalidate_tariffs()
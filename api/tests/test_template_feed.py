@@ -0,0 +1,60 @@
+import core.template_feed as feed
+
+
+class _Resp:
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+        self.ok = 200 <= status_code < 300
+
+
+def _item(**kw):
+    base = {"id": 5, "attempts": 1, "meter_type": "cold", "meter_index": 1, "correct_value": 123.4, "ydisk_path": None, "file_sha256": "ab"}
+    return {**base, **kw}
+
+
+def _patch(monkeypatch, status=200, photo=b"jpeg"):
+    finished, posted = [], []
+    monkeypatch.setattr(feed, "OCR_URL", "http://ocr-service:8000/recognize")
+    monkeypatch.setattr(feed, "photo_cache_get", lambda sha: photo)
+    monkeypatch.setattr(feed, "finish_template_sample", lambda item, state, error=None: finished.append(state))
+
+    def _post(url, files=None, data=None, timeout=None):
+        posted.append((url, data))
+        return _Resp(status)
+
+    monkeypatch.setattr(feed.requests, "post", _post)
+    return finished, posted
+
+
+def test_sample_is_posted_to_learn_endpoint(monkeypatch):
+    finished, posted = _patch(monkeypatch)
+    assert feed.process_template_sample(_item()) == "done"
+    assert posted == [("http://ocr-service:8000/templates/learn", {"meter_type": "cold", "reading": "123.400"})]
+    assert finished == ["done"]
+
+
+def test_uncovered_meters_and_rejected_photos_are_not_retried(monkeypatch):
+    finished, posted = _patch(monkeypatch, status=400)
+    assert feed.process_template_sample(_item(meter_type="hot", meter_index=2)) == "skipped"
+    assert posted == []
+    assert feed.process_template_sample(_item(meter_type="electric", meter_index=3)) == "skipped"
+    assert len(posted) == 1 and finished == ["skipped", "skipped"]
+
+
+def test_missing_photo_or_ocr_errors_retry(monkeypatch):
+    finished, posted = _patch(monkeypatch, status=503, photo=None)
+    assert feed.process_template_sample(_item()) == "pending"
+    assert posted == []
+    monkeypatch.setattr(feed, "photo_cache_get", lambda sha: b"jpeg")
+    assert feed.process_template_sample(_item()) == "pending"
+    assert finished == ["pending", "pending"]
+    assert feed._retry_delay_sec(3) == feed.TEMPLATE_FEED_BACKOFF_SEC * 4
+
+
+def test_done_sample_invalidates_only_its_photo_cache(monkeypatch, fake_conn):
+    monkeypatch.setattr(feed, "engine", fake_conn)
+    feed.finish_template_sample(_item(), "pending", "boom")
+    assert len(fake_conn.sql) == 1
+    feed.finish_template_sample(_item(), "done")
+    assert fake_conn.sql[-1] == ("DELETE FROM ocr_result_cache WHERE file_sha256 = :sha", {"sha": "ab"})
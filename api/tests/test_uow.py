@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy.exc import DBAPIError
+
+import core.uow as uow_mod
+from core.uow import is_serialization_failure, run_unit_of_work
+
+
+class _PgError(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+class _DBAPIWrapped(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.orig = _PgError(pgcode)
+
+
+def test_is_serialization_failure_by_sqlstate():
+    assert is_serialization_failure(_DBAPIWrapped("40001"))
+    assert is_serialization_failure(_DBAPIWrapped("40P01"))
+    assert not is_serialization_failure(_DBAPIWrapped("23505"))
+    assert not is_serialization_failure(ValueError("x"))
+
+
+def test_run_unit_of_work_replays_swallowed_serialization_failure(monkeypatch, fake_conn):
+    monkeypatch.setattr(uow_mod, "engine", fake_conn)
+    monkeypatch.setattr(uow_mod.time, "sleep", lambda _s: None)
+    calls = []
+
+    def work(uow):
+        calls.append(1)
+        try:
+            with uow.step():
+                if len(calls) == 1:
+                    raise _DBAPIWrapped("40001")
+        except Exception:
+            pass  # callers in photo_event swallow step errors
+        return len(calls)
+
+    assert run_unit_of_work(work, retries=2) == 2
+    assert [e for e in fake_conn.events if e != "savepoint"] == ["rollback", "commit"]
+
+
+def test_read_steps_take_no_savepoint_and_a_swallowed_db_error_fails_the_unit(monkeypatch, fake_conn):
+    monkeypatch.setattr(uow_mod, "engine", fake_conn)
+
+    def work(uow):
+        with uow.read():
+            pass
+        with uow.step():
+            pass
+        try:
+            with uow.read():
+                raise DBAPIError("SELECT 1", {}, _PgError("42P01"))
+        except Exception:
+            pass  # swallowed like the photo_event sanity reads
+        return "written"
+
+    with pytest.raises(DBAPIError):
+        run_unit_of_work(work, retries=0)
+    assert fake_conn.events == ["savepoint", "rollback"]
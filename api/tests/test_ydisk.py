@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import core.integrations as integrations
+import core.ydisk_outbox as outbox
+from core.integrations import ydisk_ensure_dirs, ydisk_photo_path
+from core.ydisk_outbox import _retry_delay_sec
+
+
+def test_ydisk_photo_path_layout(monkeypatch):
+    monkeypatch.setattr(integrations, "YANDEX_STORAGE_ROOT", "tenants")
+    path = ydisk_photo_path("42", "@ivan", "cold", "IMG_1.JPG", now=datetime(2026, 3, 5, 7, 8, 9))
+    assert path == "tenants/42/2026-03/2026.03.05-070809__ivan__cold.jpg"
+
+
+def test_ydisk_ensure_dirs_skips_known_folders(monkeypatch):
+    calls = []
+    monkeypatch.setattr(integrations, "ydisk_mkcol", calls.append)
+    monkeypatch.setattr(integrations, "_YDISK_DIRS_KNOWN", set())
+    ydisk_ensure_dirs("tenants/42/2026-03/a.jpg")
+    ydisk_ensure_dirs("tenants/42/2026-03/b.jpg")
+    ydisk_ensure_dirs("tenants/42/2026-04/c.jpg")
+    assert calls == ["tenants", "tenants/42", "tenants/42/2026-03", "tenants/42/2026-04"]
+
+
+def test_ydisk_outbox_backoff_grows_and_caps():
+    assert _retry_delay_sec(1) < _retry_delay_sec(2) < _retry_delay_sec(3)
+    assert _retry_delay_sec(40) == 3600
+
+
+def _outbox(fake_conn, attempts):
+    row = {"id": 3, "status": "running", "attempts": attempts, "photo_event_id": None, "disk_path": "a.jpg", "blob": b"x"}
+
+    def _expire(params):
+        if row["status"] == "running" and row["attempts"] >= params["max_attempts"]:
+            row["status"] = "failed"
+        return []
+
+    def _claim(params):
+        if row["status"] == "running" and row["attempts"] < params["max_attempts"]:
+            row["attempts"] += 1
+            return [dict(row)]
+        return []
+
+    fake_conn.on("SET status='failed'", _expire).on("SET status='running'", _claim)
+    return row
+
+
+def test_ydisk_outbox_expired_lease_is_failed_at_max_attempts(monkeypatch, fake_conn):
+    monkeypatch.setattr(outbox, "engine", fake_conn)
+    row = _outbox(fake_conn, attempts=outbox.YDISK_OUTBOX_MAX_ATTEMPTS)
+    assert outbox.claim_ydisk_upload() is None
+    assert row["status"] == "failed"
+
+
+def test_ydisk_outbox_expired_lease_under_the_cap_is_retried(monkeypatch, fake_conn):
+    monkeypatch.setattr(outbox, "engine", fake_conn)
+    row = _outbox(fake_conn, attempts=outbox.YDISK_OUTBOX_MAX_ATTEMPTS - 1)
+    item = outbox.claim_ydisk_upload()
+    assert item["id"] == 3 and item["attempts"] == outbox.YDISK_OUTBOX_MAX_ATTEMPTS
+    assert row["status"] == "running"
@@ -7,7 +7,15 @@ import time
 import uuid
 import logging
 import hashlib
+import sqlite3
+import asyncio
+import copy
+import fcntl
+import functools
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
 from io import BytesIO
 from datetime import datetime
 from PIL import Image, ImageOps, ImageFilter, ImageEnhance, ImageDraw
@@ -23,6 +31,7 @@ from water_deterministic import (
     make_fixed_cells_sheet_from_row,
     make_water_deterministic_row_variants,
 )
+from stage_planner import StagePlanner
 
 def _env_nonempty(name: str, default: str) -> str:
     v = os.getenv(name)
@@ -72,6 +81,16 @@ OCR_ELECTRIC_TEMPLATE_MATCH = os.getenv("OCR_ELECTRIC_TEMPLATE_MATCH", "1").stri
 OCR_ELECTRIC_TEMPLATE_DB = os.getenv("OCR_ELECTRIC_TEMPLATE_DB", "/app/electric_templates_seed.json").strip()
 OCR_WATER_TEMPLATE_MATCH = os.getenv("OCR_WATER_TEMPLATE_MATCH", "1").strip().lower() in ("1", "true", "yes", "on")
 OCR_WATER_TEMPLATE_DB = os.getenv("OCR_WATER_TEMPLATE_DB", "/app/water_templates_seed.json").strip()
+# Append-only log of templates learned from admin-confirmed readings (POST /templates/learn), merged over the seeds.
+OCR_TEMPLATE_LEARN_LOG = os.getenv("OCR_TEMPLATE_LEARN_LOG", "/app/cache/learned_templates.ndjson").strip()
+try:
+    OCR_TEMPLATE_LEARN_COMPACT_SLACK = int(os.getenv("OCR_TEMPLATE_LEARN_COMPACT_SLACK", "256"))
+except Exception:
+    OCR_TEMPLATE_LEARN_COMPACT_SLACK = 256
+OCR_TEMPLATE_LEARN_COMPACT_SLACK = max(0, min(100000, OCR_TEMPLATE_LEARN_COMPACT_SLACK))
+# Bump when cascade logic changes in a way that can change results for the same photo.
+# API result caches are keyed by the fingerprint derived from it (see _ocr_pipeline_fingerprint).
+OCR_PIPELINE_VERSION = _env_nonempty("OCR_PIPELINE_VERSION", "2026.10.1")
 try:
     OCR_ELECTRIC_BOOTSTRAP_VARIANTS = int(os.getenv("OCR_ELECTRIC_BOOTSTRAP_VARIANTS", "2"))
 except Exception:
@@ -120,6 +139,16 @@ except Exception:
     OCR_SERIES_MAX_FILES = 6
 OCR_SERIES_MAX_FILES = max(2, min(12, OCR_SERIES_MAX_FILES))
 OCR_SERIES_NEIGHBOR_RECOVERY = os.getenv("OCR_SERIES_NEIGHBOR_RECOVERY", "1").strip().lower() in ("1", "true", "yes", "on")
+try:
+    OCR_SERIES_MAX_OPENAI_CALLS = int(os.getenv("OCR_SERIES_MAX_OPENAI_CALLS", "60"))
+except Exception:
+    OCR_SERIES_MAX_OPENAI_CALLS = 60
+OCR_SERIES_MAX_OPENAI_CALLS = max(1, min(200, OCR_SERIES_MAX_OPENAI_CALLS))
+try:
+    OCR_SERIES_MAX_RUNTIME_SEC = float(os.getenv("OCR_SERIES_MAX_RUNTIME_SEC", "70"))
+except Exception:
+    OCR_SERIES_MAX_RUNTIME_SEC = 70.0
+OCR_SERIES_MAX_RUNTIME_SEC = max(5.0, min(600.0, OCR_SERIES_MAX_RUNTIME_SEC))
 try:
     OCR_MAX_OPENAI_CALLS = int(os.getenv("OCR_MAX_OPENAI_CALLS", "4"))
 except Exception:
@@ -130,6 +159,30 @@ try:
 except Exception:
     OCR_MAX_OPENAI_CALLS_QUICK = 3
 OCR_MAX_OPENAI_CALLS_QUICK = max(1, min(30, OCR_MAX_OPENAI_CALLS_QUICK))
+# "adaptive" reorders/skips the planned recognize stages from observed cost and hit rate; "fixed" keeps the
+# legacy order without skips (deterministic; tools/run_ocr_regression.sh runs the service in this mode).
+OCR_STAGE_PLANNER = os.getenv("OCR_STAGE_PLANNER", "adaptive").strip().lower()
+try:
+    OCR_STAGE_PLANNER_MIN_SAMPLES = int(os.getenv("OCR_STAGE_PLANNER_MIN_SAMPLES", "30"))
+except Exception:
+    OCR_STAGE_PLANNER_MIN_SAMPLES = 30
+OCR_STAGE_PLANNER_MIN_SAMPLES = max(1, min(10000, OCR_STAGE_PLANNER_MIN_SAMPLES))
+try:
+    OCR_STAGE_PLANNER_MIN_HIT_RATE = float(os.getenv("OCR_STAGE_PLANNER_MIN_HIT_RATE", "0.03"))
+except Exception:
+    OCR_STAGE_PLANNER_MIN_HIT_RATE = 0.03
+OCR_STAGE_PLANNER_MIN_HIT_RATE = max(0.0, min(0.5, OCR_STAGE_PLANNER_MIN_HIT_RATE))
+try:
+    OCR_STAGE_PLANNER_CALL_COST_MS = float(os.getenv("OCR_STAGE_PLANNER_CALL_COST_MS", "4000"))
+except Exception:
+    OCR_STAGE_PLANNER_CALL_COST_MS = 4000.0
+OCR_STAGE_PLANNER_CALL_COST_MS = max(0.0, min(120000.0, OCR_STAGE_PLANNER_CALL_COST_MS))
+# local stages (no OpenAI calls) at or under this average latency are never skipped
+try:
+    OCR_STAGE_PLANNER_CHEAP_MS = float(os.getenv("OCR_STAGE_PLANNER_CHEAP_MS", "50"))
+except Exception:
+    OCR_STAGE_PLANNER_CHEAP_MS = 50.0
+OCR_STAGE_PLANNER_CHEAP_MS = max(0.0, min(5000.0, OCR_STAGE_PLANNER_CHEAP_MS))
 try:
     OCR_RED_REFINE_REPEATS = int(os.getenv("OCR_RED_REFINE_REPEATS", "2"))
 except Exception:
@@ -151,6 +204,8 @@ try:
 except Exception:
     OCR_OPENAI_CACHE_TTL_SEC = 86400
 OCR_OPENAI_CACHE_TTL_SEC = max(60, min(7 * 86400, OCR_OPENAI_CACHE_TTL_SEC))
+# Empty path keeps the cache in process memory only.
+OCR_OPENAI_CACHE_PATH = os.getenv("OCR_OPENAI_CACHE_PATH", "/app/cache/openai_cache.sqlite3").strip()
 try:
     OCR_OPENAI_QUOTA_COOLDOWN_SEC = int(os.getenv("OCR_OPENAI_QUOTA_COOLDOWN_SEC", "3600"))
 except Exception:
@@ -161,16 +216,59 @@ try:
 except Exception:
     OCR_TESSERACT_TIMEOUT_SEC = 2.5
 OCR_TESSERACT_TIMEOUT_SEC = max(0.5, min(8.0, OCR_TESSERACT_TIMEOUT_SEC))
+try:
+    OCR_TESSERACT_MAX_PROCS = int(os.getenv("OCR_TESSERACT_MAX_PROCS", "4"))
+except Exception:
+    OCR_TESSERACT_MAX_PROCS = 4
+OCR_TESSERACT_MAX_PROCS = max(1, min(32, OCR_TESSERACT_MAX_PROCS))
+try:
+    OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", "8"))
+except Exception:
+    OCR_MAX_CONCURRENCY = 8
+OCR_MAX_CONCURRENCY = max(1, min(64, OCR_MAX_CONCURRENCY))
+try:
+    OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING", "64"))
+except Exception:
+    OCR_MAX_PENDING = 64
+OCR_MAX_PENDING = max(OCR_MAX_CONCURRENCY, min(1000, OCR_MAX_PENDING))
 
 _OPENAI_CACHE_LOCK = threading.Lock()
-_OPENAI_CACHE: dict[str, tuple[float, dict]] = {}
+_OPENAI_CACHE: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+_OPENAI_CACHE_STATS = {"hits": 0, "misses": 0}
+_OPENAI_CACHE_DB_LOCAL = threading.local()
+# disk-cache hits/misses and LRU bumps (key -> hit time) of this worker, written on the next put or flush
+_OPENAI_CACHE_PENDING: dict = {"hits": 0, "misses": 0, "touched": OrderedDict(), "flushed_at": 0.0}
+_OPENAI_CACHE_FLUSH_EVERY = 64
+_OPENAI_CACHE_FLUSH_SEC = 5.0
+_OPENAI_CACHE_DB_FAILED = False
 _OPENAI_BLOCK_UNTIL_TS = 0.0
-_ELECTRIC_TEMPLATE_LOCK = threading.Lock()
-_ELECTRIC_TEMPLATE_MTIME: float = -1.0
-_ELECTRIC_TEMPLATE_ROWS: list[dict] = []
-_WATER_TEMPLATE_LOCK = threading.Lock()
-_WATER_TEMPLATE_MTIME: float = -1.0
-_WATER_TEMPLATE_ROWS: list[dict] = []
+_TEMPLATE_INDEX_LOCK = threading.Lock()
+# kind ("electric" | "water") -> (seed file mtime, index); rebuilt when the file changes
+_TEMPLATE_INDEXES: "dict[str, tuple[tuple, _TemplateIndex]]" = {}
+_LEARNED_TEMPLATE_LOCK = threading.Lock()
+# parsed OCR_TEMPLATE_LEARN_LOG, reloaded when its (mtime_ns, size) changes
+_LEARNED_TEMPLATES: dict = {"stat": None, "rows": {}}
+# The recognize cascade is synchronous (OpenCV, tesseract subprocesses, provider HTTP).
+# It runs on a bounded pool so the event loop stays free for /health and new uploads.
+_OCR_EXECUTOR = ThreadPoolExecutor(max_workers=OCR_MAX_CONCURRENCY, thread_name_prefix="ocr")
+_OCR_PENDING_LOCK = threading.Lock()
+_OCR_PENDING = 0
+# Every pytesseract call forks a tesseract process; all recognize jobs share this many at a time.
+_TESSERACT_SLOTS = threading.BoundedSemaphore(OCR_TESSERACT_MAX_PROCS)
+_STAGE_PLANNER = StagePlanner(
+    mode=OCR_STAGE_PLANNER,
+    min_samples=OCR_STAGE_PLANNER_MIN_SAMPLES,
+    min_hit_rate=OCR_STAGE_PLANNER_MIN_HIT_RATE,
+    call_cost_ms=OCR_STAGE_PLANNER_CALL_COST_MS,
+    cheap_ms=OCR_STAGE_PLANNER_CHEAP_MS,
+)
+# (contexts, started_at, calls_so_far) of the cascade stretch after the planned stages; set per request
+_PLANNER_REST = threading.local()
+_HTTP_SESSION = requests.Session()
+_HTTP_SESSION.mount(
+    "https://",
+    requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(4, OCR_MAX_CONCURRENCY * 2)),
+)
 
 app = FastAPI()
 logger = logging.getLogger("ocr_service")
@@ -178,12 +276,47 @@ logger = logging.getLogger("ocr_service")
 
 @app.get("/health")
 def health() -> dict:
+    with _OCR_PENDING_LOCK:
+        pending = int(_OCR_PENDING)
     return {
         "ok": True,
         "mode": OCR_RUNTIME_MODE,
         "openai_enabled": bool(OCR_OPENAI_ENABLED),
+        "ocr_pending": pending,
+        "ocr_max_concurrency": OCR_MAX_CONCURRENCY,
+        "openai_cache": _openai_cache_stats(),
+        "stage_planner": _STAGE_PLANNER.snapshot(),
+        "pipeline_version": _ocr_pipeline_fingerprint(),
     }
 
+
+def _ocr_pipeline_fingerprint() -> str:
+    """
+    Stable id of everything that decides the recognize result for a given photo:
+    pipeline version, runtime mode/models and the template DB files currently on disk.
+    Learned templates are left out: they change which templates match, not the pipeline, and the API
+    drops the cached results of a learned photo itself.
+    """
+    h = hashlib.sha256()
+    parts = [
+        OCR_PIPELINE_VERSION,
+        OCR_RUNTIME_MODE,
+        str(bool(OCR_OPENAI_ENABLED)),
+        OCR_MODEL_PRIMARY,
+        OCR_MODEL_FALLBACK,
+        OCR_MODEL_ODOMETER,
+    ]
+    for path in (OCR_ELECTRIC_TEMPLATE_DB, OCR_WATER_TEMPLATE_DB):
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}:{int(st.st_mtime)}:{int(st.st_size)}")
+        except Exception:
+            parts.append(f"{path}:missing")
+    for part in parts:
+        h.update(str(part).encode("utf-8", "ignore"))
+        h.update(b"\x1f")
+    return f"{OCR_PIPELINE_VERSION}:{h.hexdigest()[:16]}"
+
 SYSTEM_PROMPT = """Ты — OCR-ассистент для коммунальных счётчиков (вода/электро).
 
 Твоя задача:
@@ -682,34 +815,204 @@ def _openai_cache_key(
     return h.hexdigest()
 
 
+def _openai_cache_db() -> Optional[sqlite3.Connection]:
+    """
+    Per-thread connection to the shared on-disk cache.
+    All uvicorn workers open the same file; WAL keeps readers and the single writer apart.
+    LRU order is a monotonically increasing `seq` handed out by openai_cache_stats, which also counts the
+    rows, so a put evicts the oldest `entries - OCR_OPENAI_CACHE_MAX` rows through the seq index without
+    scanning the table. Gets are plain reads; their seq bumps and hit/miss counts are flushed in batches.
+    """
+    global _OPENAI_CACHE_DB_FAILED
+    if (not OCR_OPENAI_CACHE_PATH) or _OPENAI_CACHE_DB_FAILED:
+        return None
+    conn = getattr(_OPENAI_CACHE_DB_LOCAL, "conn", None)
+    if conn is not None:
+        return conn
+    try:
+        os.makedirs(os.path.dirname(OCR_OPENAI_CACHE_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(OCR_OPENAI_CACHE_PATH, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS openai_cache ("
+            "key TEXT PRIMARY KEY, seq INTEGER NOT NULL, ts REAL NOT NULL, val TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS openai_cache_seq_idx ON openai_cache(seq)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS openai_cache_stats ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), hits INTEGER NOT NULL, misses INTEGER NOT NULL, "
+            "entries INTEGER NOT NULL DEFAULT 0, seq INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cols = {r[1] for r in conn.execute("PRAGMA table_info(openai_cache_stats)").fetchall()}
+            if "entries" not in cols:
+                # cache files from before the counters: seed them once from the table
+                conn.execute("ALTER TABLE openai_cache_stats ADD COLUMN entries INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE openai_cache_stats ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+                conn.execute(
+                    "UPDATE openai_cache_stats SET entries = (SELECT COUNT(*) FROM openai_cache), "
+                    "seq = (SELECT COALESCE(MAX(seq), 0) FROM openai_cache)"
+                )
+            conn.execute("INSERT OR IGNORE INTO openai_cache_stats(id, hits, misses, entries, seq) VALUES (1, 0, 0, 0, 0)")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except Exception as e:
+        logger.warning("openai cache db unavailable path=%s err=%s; using in-process cache", OCR_OPENAI_CACHE_PATH, e)
+        _OPENAI_CACHE_DB_FAILED = True
+        return None
+    _OPENAI_CACHE_DB_LOCAL.conn = conn
+    return conn
+
+
+def _openai_cache_note_get(key: str, hit: bool, now: float) -> bool:
+    """Queue a disk-cache hit/miss for the next flush; returns True when the batch is due."""
+    with _OPENAI_CACHE_LOCK:
+        _OPENAI_CACHE_STATS["hits" if hit else "misses"] += 1
+        pending = _OPENAI_CACHE_PENDING
+        pending["hits" if hit else "misses"] += 1
+        if hit:
+            pending["touched"][key] = now
+            pending["touched"].move_to_end(key)
+        return (
+            len(pending["touched"]) >= _OPENAI_CACHE_FLUSH_EVERY
+            or (pending["hits"] + pending["misses"]) >= _OPENAI_CACHE_FLUSH_EVERY * 4
+            or (now - pending["flushed_at"]) >= _OPENAI_CACHE_FLUSH_SEC
+        )
+
+
+def _openai_cache_apply_pending(conn: sqlite3.Connection, now: float) -> int:
+    """Write the batched counters and LRU bumps inside the caller's write transaction; returns the next seq."""
+    with _OPENAI_CACHE_LOCK:
+        pending = _OPENAI_CACHE_PENDING
+        hits, misses, touched = pending["hits"], pending["misses"], list(pending["touched"].items())
+        pending.update(hits=0, misses=0, flushed_at=now)
+        pending["touched"].clear()
+    seq = int(conn.execute("SELECT seq FROM openai_cache_stats WHERE id = 1").fetchone()[0])
+    conn.executemany(
+        "UPDATE openai_cache SET seq = ?, ts = ? WHERE key = ?",
+        [(seq + i, ts, key) for i, (key, ts) in enumerate(touched, 1)],
+    )
+    seq += len(touched)
+    conn.execute(
+        "UPDATE openai_cache_stats SET hits = hits + ?, misses = misses + ?, seq = ? WHERE id = 1",
+        (hits, misses, seq),
+    )
+    return seq + 1
+
+
+def _openai_cache_flush(conn: sqlite3.Connection) -> None:
+    with _OPENAI_CACHE_LOCK:
+        pending = _OPENAI_CACHE_PENDING
+        if not (pending["hits"] or pending["misses"] or pending["touched"]):
+            return
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _openai_cache_apply_pending(conn, time.time())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except Exception as e:
+        # only counters and LRU recency are lost
+        logger.warning("openai cache flush failed: %s", e)
+
+
 def _openai_cache_get(key: str) -> Optional[dict]:
     if (not OCR_OPENAI_CACHE) or (not key):
         return None
     now = time.time()
+    conn = _openai_cache_db()
+    if conn is not None:
+        try:
+            row = conn.execute("SELECT ts, val FROM openai_cache WHERE key = ?", (key,)).fetchone()
+            # expired rows are left to LRU eviction or the next put of the same key
+            val = json.loads(row[1]) if row is not None and (now - float(row[0])) <= float(OCR_OPENAI_CACHE_TTL_SEC) else None
+            hit = isinstance(val, dict)
+            if _openai_cache_note_get(key, hit, now):
+                _openai_cache_flush(conn)
+            return val if hit else None
+        except Exception as e:
+            logger.warning("openai cache get failed: %s", e)
     with _OPENAI_CACHE_LOCK:
         hit = _OPENAI_CACHE.get(key)
-        if not hit:
-            return None
-        ts, val = hit
-        if (now - ts) > float(OCR_OPENAI_CACHE_TTL_SEC):
+        if hit and (now - hit[0]) > float(OCR_OPENAI_CACHE_TTL_SEC):
             _OPENAI_CACHE.pop(key, None)
+            hit = None
+        if not hit:
+            _OPENAI_CACHE_STATS["misses"] += 1
             return None
-        _OPENAI_CACHE[key] = (now, dict(val))
-        return dict(val)
+        _OPENAI_CACHE[key] = (now, dict(hit[1]))
+        _OPENAI_CACHE.move_to_end(key)
+        _OPENAI_CACHE_STATS["hits"] += 1
+        return dict(hit[1])
 
 
 def _openai_cache_put(key: str, val: dict) -> None:
     if (not OCR_OPENAI_CACHE) or (not key) or (not isinstance(val, dict)):
         return
     now = time.time()
+    conn = _openai_cache_db()
+    if conn is not None:
+        try:
+            payload = json.dumps(val, ensure_ascii=False)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # bumps from recent hits land first, so eviction below sees the current LRU order
+                seq = _openai_cache_apply_pending(conn, now)
+                exists = conn.execute("SELECT 1 FROM openai_cache WHERE key = ?", (key,)).fetchone() is not None
+                conn.execute(
+                    "INSERT INTO openai_cache(key, seq, ts, val) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET seq = excluded.seq, ts = excluded.ts, val = excluded.val",
+                    (key, seq, now, payload),
+                )
+                entries = int(conn.execute("SELECT entries FROM openai_cache_stats WHERE id = 1").fetchone()[0])
+                entries += 0 if exists else 1
+                if entries > OCR_OPENAI_CACHE_MAX:
+                    cur = conn.execute(
+                        "DELETE FROM openai_cache WHERE key IN (SELECT key FROM openai_cache ORDER BY seq ASC LIMIT ?)",
+                        (entries - OCR_OPENAI_CACHE_MAX,),
+                    )
+                    entries -= max(0, int(cur.rowcount))
+                conn.execute("UPDATE openai_cache_stats SET entries = ?, seq = ? WHERE id = 1", (entries, seq))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return
+        except Exception as e:
+            logger.warning("openai cache put failed: %s", e)
     with _OPENAI_CACHE_LOCK:
         _OPENAI_CACHE[key] = (now, dict(val))
-        if len(_OPENAI_CACHE) > OCR_OPENAI_CACHE_MAX:
-            # prune oldest 10%
-            n_drop = max(1, int(OCR_OPENAI_CACHE_MAX * 0.1))
-            old_keys = sorted(_OPENAI_CACHE.items(), key=lambda kv: kv[1][0])[:n_drop]
-            for k, _ in old_keys:
-                _OPENAI_CACHE.pop(k, None)
+        _OPENAI_CACHE.move_to_end(key)
+        while len(_OPENAI_CACHE) > OCR_OPENAI_CACHE_MAX:
+            _OPENAI_CACHE.popitem(last=False)
+
+
+def _openai_cache_stats() -> dict:
+    with _OPENAI_CACHE_LOCK:
+        out = {
+            "enabled": bool(OCR_OPENAI_CACHE),
+            "backend": "memory",
+            "entries": len(_OPENAI_CACHE),
+            "max_entries": OCR_OPENAI_CACHE_MAX,
+            "ttl_sec": OCR_OPENAI_CACHE_TTL_SEC,
+            "worker_hits": int(_OPENAI_CACHE_STATS["hits"]),
+            "worker_misses": int(_OPENAI_CACHE_STATS["misses"]),
+        }
+    conn = _openai_cache_db() if OCR_OPENAI_CACHE else None
+    if conn is not None:
+        try:
+            _openai_cache_flush(conn)
+            entries, hits, misses = conn.execute("SELECT entries, hits, misses FROM openai_cache_stats WHERE id = 1").fetchone()
+            out.update({"backend": "sqlite", "entries": int(entries), "hits": int(hits), "misses": int(misses)})
+        except Exception as e:
+            out["error"] = str(e)[:200]
+    return out
 
 
 def _openai_is_blocked_now() -> bool:
@@ -777,7 +1080,7 @@ def _call_openai_vision(
             req_timeout = float(timeout_sec) if timeout_sec is not None else float(OPENAI_TIMEOUT_SEC)
             req_timeout = max(1.0, min(float(OPENAI_TIMEOUT_SEC), req_timeout))
             connect_timeout = max(2.0, min(8.0, req_timeout))
-            r = requests.post(
+            r = _HTTP_SESSION.post(
                 "https://api.openai.com/v1/chat/completions",
                 headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
                 json=payload,
@@ -1204,7 +1507,7 @@ def _call_google_vision_candidate(image_bytes: bytes) -> Optional[dict]:
             }
         ]
     }
-    r = requests.post(url, json=payload, timeout=30)
+    r = _HTTP_SESSION.post(url, json=payload, timeout=30)
     if not r.ok:
         return None
     data = r.json()
@@ -1243,6 +1546,115 @@ def _call_google_vision_candidate(image_bytes: bytes) -> Optional[dict]:
     }
 
 
+class _Frame:
+    """
+    Decoded image shared by all variant builders within one request.
+    Arrays are decoded lazily, cached and marked read-only: builders must copy before drawing.
+    """
+
+    __slots__ = ("data", "_bgr", "_gray", "_hsv", "_pil", "memo")
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self._bgr = None
+        self._gray = None
+        self._hsv = None
+        self._pil = None
+        self.memo: dict = {}
+
+    @property
+    def bgr(self) -> Optional[np.ndarray]:
+        if self._bgr is None:
+            try:
+                im = cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            except Exception:
+                im = None
+            if im is not None:
+                im.setflags(write=False)
+            self._bgr = im if im is not None else False
+        return None if self._bgr is False else self._bgr
+
+    @property
+    def gray(self) -> Optional[np.ndarray]:
+        if self._gray is None:
+            im = self.bgr
+            g = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY) if im is not None else None
+            if g is not None:
+                g.setflags(write=False)
+            self._gray = g if g is not None else False
+        return None if self._gray is False else self._gray
+
+    @property
+    def hsv(self) -> Optional[np.ndarray]:
+        if self._hsv is None:
+            im = self.bgr
+            hsv = cv2.cvtColor(im, cv2.COLOR_BGR2HSV) if im is not None else None
+            if hsv is not None:
+                hsv.setflags(write=False)
+            self._hsv = hsv if hsv is not None else False
+        return None if self._hsv is False else self._hsv
+
+    def pil_rgb(self) -> Image.Image:
+        # PIL and OpenCV JPEG decoders differ slightly, so PIL-based builders keep their own decode.
+        if self._pil is None:
+            try:
+                self._pil = Image.open(BytesIO(self.data)).convert("RGB")
+            except Exception:
+                self._pil = False
+        if self._pil is False:
+            raise ValueError("image_decode_failed")
+        return self._pil
+
+
+_FRAME_LOCAL = threading.local()
+
+
+@contextmanager
+def _frame_scope():
+    """Enable per-request frame caching for the current pool thread."""
+    prev = getattr(_FRAME_LOCAL, "frames", None)
+    _FRAME_LOCAL.frames = {}
+    try:
+        yield
+    finally:
+        _FRAME_LOCAL.frames = prev
+
+
+def _frame_for(data: bytes) -> _Frame:
+    frames = getattr(_FRAME_LOCAL, "frames", None)
+    if frames is None:
+        return _Frame(data)
+    # The frame holds a reference to `data`, so its id stays unique while the scope lives.
+    fr = frames.get(id(data))
+    if fr is None or fr.data is not data:
+        fr = _Frame(data)
+        frames[id(data)] = fr
+    return fr
+
+
+def _per_frame_memo(fn):
+    """
+    Memoize a bytes -> result builder on the request frame.
+    The cascade calls several builders repeatedly on the same input photo.
+    """
+
+    @functools.wraps(fn)
+    def _wrapped(data, *args, **kwargs):
+        frames = getattr(_FRAME_LOCAL, "frames", None)
+        if frames is None or not isinstance(data, bytes):
+            return fn(data, *args, **kwargs)
+        memo = _frame_for(data).memo
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in memo:
+            memo[key] = fn(data, *args, **kwargs)
+        return copy.deepcopy(memo[key])
+
+    return _wrapped
+
+
+_make_det_row_variants = _per_frame_memo(make_water_deterministic_row_variants)
+
+
 def _encode_jpeg(img: Image.Image, quality: int = 90) -> bytes:
     buf = BytesIO()
     img.save(buf, format="JPEG", quality=quality, optimize=True)
@@ -1252,7 +1664,7 @@ def _encode_jpeg(img: Image.Image, quality: int = 90) -> bytes:
 def _make_variants(img_bytes: bytes) -> list[tuple[str, bytes]]:
     variants: list[tuple[str, bytes]] = []
     try:
-        img = Image.open(BytesIO(img_bytes)).convert("RGB")
+        img = _frame_for(img_bytes).pil_rgb()
     except Exception:
         return [("orig", img_bytes)]
 
@@ -1397,8 +1809,7 @@ def _looks_like_water_meter_face(img_bytes: bytes) -> bool:
     Water meters usually have a dominant circular dial in the frame.
     """
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
     except Exception:
         return False
     if im is None:
@@ -1432,10 +1843,11 @@ def _looks_like_water_meter_face(img_bytes: bytes) -> bool:
     return circles is not None and len(circles[0]) > 0
 
 
+@_per_frame_memo
 def _make_electric_display_variants(img_bytes: bytes) -> list[tuple[str, bytes]]:
     out: list[tuple[str, bytes]] = []
     try:
-        img = Image.open(BytesIO(img_bytes)).convert("RGB")
+        img = _frame_for(img_bytes).pil_rgb()
     except Exception:
         return out
     try:
@@ -1721,23 +2133,189 @@ def _dhash_from_gray(gray: np.ndarray, size: int = 8) -> int:
     if gray.size == 0:
         return 0
     small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
-    bits = 0
-    bit_idx = 0
-    for y in range(size):
-        for x in range(size):
-            if int(small[y, x]) > int(small[y, x + 1]):
-                bits |= (1 << bit_idx)
-            bit_idx += 1
-    return bits
+    # bit (y * size + x) is set when pixel (y, x) is brighter than its right neighbour
+    bits = np.packbits(small[:, :-1] > small[:, 1:], bitorder="little")
+    return int.from_bytes(bits.tobytes(), "little")
+
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_HASH64_MASK = (1 << 64) - 1
+
+
+def _popcount64(x: np.ndarray) -> np.ndarray:
+    """Per-element bit count of a contiguous uint64 array (np.bitwise_count only exists in NumPy 2)."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.uint32)
+
+
+class _TemplateIndex:
+    """
+    Template rows of one seed file with their dHashes packed into an (n_rows, n_keys) uint64 matrix,
+    so a lookup is one XOR + popcount over the whole DB instead of a Python loop over rows.
+    Learned rows are kept apart in by_sha: they only answer for the exact photo they were learned from.
+    """
+
+    __slots__ = ("rows", "keys", "hashes", "by_sha")
+
+    def __init__(self, rows: list[dict], keys: tuple[str, ...], by_sha: Optional[dict[str, dict]] = None) -> None:
+        self.rows = rows
+        self.keys = keys
+        self.by_sha = dict(by_sha or {})
+        self.hashes = np.array(
+            [[int(r["hashes"].get(k, 0)) & _HASH64_MASK for k in keys] for r in rows],
+            dtype=np.uint64,
+        ).reshape(len(rows), len(keys))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def nearest(self, query: dict[str, int]) -> Optional[tuple[float, dict, float]]:
+        """(best distance, best row, second-best distance); distance is the Hamming sum over all keys."""
+        if not self.rows:
+            return None
+        q = np.array([int(query.get(k, 0)) & _HASH64_MASK for k in self.keys], dtype=np.uint64)
+        d = _popcount64(np.bitwise_xor(self.hashes, q)).sum(axis=1)
+        # argmin keeps the first of equal distances, like the stable sort this replaced
+        i = int(np.argmin(d))
+        second = float(np.partition(d, 1)[1]) if len(d) > 1 else 1e9
+        return float(d[i]), self.rows[i], second
+
+
+def _parse_learned_log(lines: list[str]) -> dict[str, list[dict]]:
+    """Learned template entries per kind; a later entry for the same photo (sha256) replaces the earlier one."""
+    by_key: "dict[tuple, dict]" = {}
+    for line in lines:
+        try:
+            e = json.loads(line)
+        except Exception:
+            continue
+        if not isinstance(e, dict) or not e.get("sha256") or not e.get("kind"):
+            continue
+        key = (str(e["kind"]), str(e["sha256"]))
+        by_key.pop(key, None)
+        by_key[key] = e
+    out: dict[str, list[dict]] = {}
+    for (kind, _), e in by_key.items():
+        out.setdefault(kind, []).append(e)
+    return out
 
 
-def _hamming64(a: int, b: int) -> int:
-    return int((int(a) ^ int(b)).bit_count())
+def _learned_log_lines() -> list[str]:
+    try:
+        with open(OCR_TEMPLATE_LEARN_LOG, "r", encoding="utf-8") as f:
+            return [ln for ln in f.read().splitlines() if ln.strip()]
+    except Exception:
+        return []
+
+
+def _learned_template_rows(kind: str) -> tuple[Optional[tuple[int, int]], list[dict]]:
+    """(log stat, learned raw rows of one kind); the log is re-read only when it changes on disk."""
+    if not OCR_TEMPLATE_LEARN_LOG:
+        return None, []
+    try:
+        st = os.stat(OCR_TEMPLATE_LEARN_LOG)
+        stat = (int(st.st_mtime_ns), int(st.st_size))
+    except Exception:
+        return None, []
+    with _LEARNED_TEMPLATE_LOCK:
+        if _LEARNED_TEMPLATES["stat"] != stat:
+            _LEARNED_TEMPLATES["rows"] = _parse_learned_log(_learned_log_lines())
+            _LEARNED_TEMPLATES["stat"] = stat
+        return stat, list(_LEARNED_TEMPLATES["rows"].get(kind, []))
+
+
+@contextmanager
+def _learned_log_locked():
+    # Both uvicorn workers append to the same file; an flock on a sidecar file serializes append vs compaction.
+    os.makedirs(os.path.dirname(OCR_TEMPLATE_LEARN_LOG) or ".", exist_ok=True)
+    with open(OCR_TEMPLATE_LEARN_LOG + ".lock", "a") as lock_f:
+        fcntl.flock(lock_f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_f.fileno(), fcntl.LOCK_UN)
+
+
+def _append_learned_template(entry: dict) -> dict:
+    """
+    Append one learned template to the log. When superseded entries outnumber live ones by more than
+    OCR_TEMPLATE_LEARN_COMPACT_SLACK, the log is rewritten with live entries only (atomic replace).
+    """
+    line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+    with _learned_log_locked():
+        with open(OCR_TEMPLATE_LEARN_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        lines = _learned_log_lines()
+        live = [e for rows in _parse_learned_log(lines).values() for e in rows]
+        compacted = (len(lines) - len(live)) > OCR_TEMPLATE_LEARN_COMPACT_SLACK
+        if compacted:
+            live.sort(key=lambda e: float(e.get("ts") or 0))
+            tmp = f"{OCR_TEMPLATE_LEARN_LOG}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for e in live:
+                    f.write(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n")
+            os.replace(tmp, OCR_TEMPLATE_LEARN_LOG)
+    return {"rows": len(live), "compacted": compacted}
+
+
+def _load_template_index(kind: str, path: str, keys: tuple[str, ...], row_fields) -> Optional[_TemplateIndex]:
+    """
+    Index of a template seed JSON ({"rows": [...]} or a bare list) plus the learned rows of the same kind,
+    rebuilt when either file changes. Seed rows match by dHash distance; learned rows are keyed by the photo
+    sha256 only, so a corrected photo never answers for next month's photo of the same meter.
+    row_fields(raw_row, reading) returns the per-meter-type row dict (without hashes).
+    """
+    try:
+        seed_mtime: Optional[float] = os.stat(path).st_mtime
+    except Exception:
+        seed_mtime = None
+    learned_stat, learned = _learned_template_rows(kind)
+    if seed_mtime is None and not learned:
+        with _TEMPLATE_INDEX_LOCK:
+            _TEMPLATE_INDEXES.pop(kind, None)
+        return None
+    version = (seed_mtime, learned_stat)
+    with _TEMPLATE_INDEX_LOCK:
+        cached = _TEMPLATE_INDEXES.get(kind)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        raw = None
+        if seed_mtime is not None:
+            try:
+                raw = json.loads(open(path, "r", encoding="utf-8").read())
+            except Exception:
+                raw = None
+        raw_rows = raw.get("rows") if isinstance(raw, dict) else raw
+        seed_rows = raw_rows if isinstance(raw_rows, list) else []
+        rows: list[dict] = []
+        for r in seed_rows:
+            if not isinstance(r, dict):
+                continue
+            reading = _normalize_reading(r.get("reading"))
+            hashes = r.get("hashes")
+            if reading is None or not isinstance(hashes, dict):
+                continue
+            row_hashes: dict[str, int] = {}
+            for key in keys:
+                try:
+                    row_hashes[key] = int(str(hashes.get(key, "0")), 16)
+                except Exception:
+                    row_hashes[key] = 0
+            rows.append({**row_fields(r, reading), "hashes": row_hashes})
+        by_sha: dict[str, dict] = {}
+        for r in learned:
+            reading = _normalize_reading(r.get("reading"))
+            if reading is not None:
+                by_sha[str(r["sha256"])] = row_fields(r, reading)
+        index = _TemplateIndex(rows, keys, by_sha)
+        _TEMPLATE_INDEXES[kind] = (version, index)
+        return index
 
 
 def _electric_template_hashes(img_bytes: bytes) -> dict[str, int]:
     try:
-        img = Image.open(BytesIO(img_bytes)).convert("RGB")
+        img = _frame_for(img_bytes).pil_rgb()
     except Exception:
         return {}
     arr = np.array(img)
@@ -1761,78 +2339,49 @@ def _electric_template_hashes(img_bytes: bytes) -> dict[str, int]:
     }
 
 
-def _load_electric_template_rows() -> list[dict]:
-    global _ELECTRIC_TEMPLATE_MTIME, _ELECTRIC_TEMPLATE_ROWS
-    path = OCR_ELECTRIC_TEMPLATE_DB
-    if not OCR_ELECTRIC_TEMPLATE_MATCH or not path:
-        return []
-    try:
-        st = os.stat(path)
-    except Exception:
-        with _ELECTRIC_TEMPLATE_LOCK:
-            _ELECTRIC_TEMPLATE_MTIME = -1.0
-            _ELECTRIC_TEMPLATE_ROWS = []
-        return []
-    with _ELECTRIC_TEMPLATE_LOCK:
-        if st.st_mtime == _ELECTRIC_TEMPLATE_MTIME:
-            return list(_ELECTRIC_TEMPLATE_ROWS)
-        try:
-            raw = json.loads(open(path, "r", encoding="utf-8").read())
-        except Exception:
-            _ELECTRIC_TEMPLATE_MTIME = st.st_mtime
-            _ELECTRIC_TEMPLATE_ROWS = []
-            return []
-        raw_rows = raw.get("rows") if isinstance(raw, dict) else raw
-        rows: list[dict] = []
-        if isinstance(raw_rows, list):
-            for r in raw_rows:
-                if not isinstance(r, dict):
-                    continue
-                reading = _normalize_reading(r.get("reading"))
-                hashes = r.get("hashes")
-                if reading is None or not isinstance(hashes, dict):
-                    continue
-                row_hashes: dict[str, int] = {}
-                for key in ("full", "lcd_wide", "lcd_mid", "lcd_tight"):
-                    try:
-                        row_hashes[key] = int(str(hashes.get(key, "0")), 16)
-                    except Exception:
-                        row_hashes[key] = 0
-                rows.append(
-                    {
-                        "reading": reading,
-                        "type": _sanitize_type(r.get("type", "Электро")),
-                        "serial": r.get("serial"),
-                        "hashes": row_hashes,
-                    }
-                )
-        _ELECTRIC_TEMPLATE_MTIME = st.st_mtime
-        _ELECTRIC_TEMPLATE_ROWS = rows
-        return list(rows)
+_ELECTRIC_TEMPLATE_KEYS = ("full", "lcd_wide", "lcd_mid", "lcd_tight")
 
 
+def _electric_template_index() -> Optional[_TemplateIndex]:
+    if not OCR_ELECTRIC_TEMPLATE_MATCH or not OCR_ELECTRIC_TEMPLATE_DB:
+        return None
+    return _load_template_index(
+        "electric",
+        OCR_ELECTRIC_TEMPLATE_DB,
+        _ELECTRIC_TEMPLATE_KEYS,
+        lambda r, reading: {
+            "reading": reading,
+            "type": _sanitize_type(r.get("type", "Электро")),
+            "serial": r.get("serial"),
+        },
+    )
+
+
+@_per_frame_memo
 def _electric_template_candidates(img_bytes: bytes) -> list[dict]:
-    rows = _load_electric_template_rows()
-    if not rows:
+    index = _electric_template_index()
+    if index is None:
+        return []
+    learned = index.by_sha.get(hashlib.sha256(img_bytes).hexdigest())
+    if learned is not None:
+        return [
+            {
+                "type": "Электро",
+                "reading": _normalize_reading(learned.get("reading")),
+                "serial": learned.get("serial"),
+                "confidence": 0.95,
+                "notes": "template_learned_photo_match",
+                "note2": "",
+                "variant": "electric_template",
+                "provider": "det-electric:learned",
+            }
+        ]
+    if not index:
         return []
     qh = _electric_template_hashes(img_bytes)
     if not qh:
         return []
-    scored: list[tuple[float, dict]] = []
-    for row in rows:
-        rh = row.get("hashes") or {}
-        d = (
-            _hamming64(qh.get("full", 0), rh.get("full", 0))
-            + _hamming64(qh.get("lcd_wide", 0), rh.get("lcd_wide", 0))
-            + _hamming64(qh.get("lcd_mid", 0), rh.get("lcd_mid", 0))
-            + _hamming64(qh.get("lcd_tight", 0), rh.get("lcd_tight", 0))
-        )
-        scored.append((float(d), row))
-    if not scored:
-        return []
-    scored.sort(key=lambda x: x[0])
-    best_d, best_row = scored[0]
-    second_d = scored[1][0] if len(scored) > 1 else 1e9
+    best_d, best_row, second_d = index.nearest(qh)
     # Acceptance tuned for recompressed JPEG paths (docker cp / messaging apps).
     if best_d > 40.0:
         return []
@@ -1855,7 +2404,7 @@ def _electric_template_candidates(img_bytes: bytes) -> list[dict]:
 
 def _water_template_hashes(img_bytes: bytes) -> dict[str, int]:
     try:
-        img = Image.open(BytesIO(img_bytes)).convert("RGB")
+        img = _frame_for(img_bytes).pil_rgb()
     except Exception:
         return {}
     arr = np.array(img)
@@ -1878,78 +2427,52 @@ def _water_template_hashes(img_bytes: bytes) -> dict[str, int]:
     }
 
 
-def _load_water_template_rows() -> list[dict]:
-    global _WATER_TEMPLATE_MTIME, _WATER_TEMPLATE_ROWS
-    path = OCR_WATER_TEMPLATE_DB
-    if not OCR_WATER_TEMPLATE_MATCH or not path:
-        return []
-    try:
-        st = os.stat(path)
-    except Exception:
-        with _WATER_TEMPLATE_LOCK:
-            _WATER_TEMPLATE_MTIME = -1.0
-            _WATER_TEMPLATE_ROWS = []
-        return []
-    with _WATER_TEMPLATE_LOCK:
-        if st.st_mtime == _WATER_TEMPLATE_MTIME:
-            return list(_WATER_TEMPLATE_ROWS)
-        try:
-            raw = json.loads(open(path, "r", encoding="utf-8").read())
-        except Exception:
-            _WATER_TEMPLATE_MTIME = st.st_mtime
-            _WATER_TEMPLATE_ROWS = []
-            return []
-        raw_rows = raw.get("rows") if isinstance(raw, dict) else raw
-        rows: list[dict] = []
-        if isinstance(raw_rows, list):
-            for r in raw_rows:
-                if not isinstance(r, dict):
-                    continue
-                reading = _normalize_reading(r.get("reading"))
-                hashes = r.get("hashes")
-                if reading is None or not isinstance(hashes, dict):
-                    continue
-                row_hashes: dict[str, int] = {}
-                for key in ("full", "mid", "center"):
-                    try:
-                        row_hashes[key] = int(str(hashes.get(key, "0")), 16)
-                    except Exception:
-                        row_hashes[key] = 0
-                rows.append(
-                    {
-                        "filename": r.get("filename"),
-                        "reading": reading,
-                        "type": _sanitize_type(r.get("type", "unknown")),
-                        "serial": r.get("serial"),
-                        "hashes": row_hashes,
-                    }
-                )
-        _WATER_TEMPLATE_MTIME = st.st_mtime
-        _WATER_TEMPLATE_ROWS = rows
-        return list(rows)
+_WATER_TEMPLATE_KEYS = ("full", "mid", "center")
+
+
+def _water_template_index() -> Optional[_TemplateIndex]:
+    if not OCR_WATER_TEMPLATE_MATCH or not OCR_WATER_TEMPLATE_DB:
+        return None
+    return _load_template_index(
+        "water",
+        OCR_WATER_TEMPLATE_DB,
+        _WATER_TEMPLATE_KEYS,
+        lambda r, reading: {
+            "filename": r.get("filename"),
+            "reading": reading,
+            "type": _sanitize_type(r.get("type", "unknown")),
+            "serial": r.get("serial"),
+        },
+    )
 
 
+@_per_frame_memo
 def _water_template_candidates(img_bytes: bytes) -> list[dict]:
-    rows = _load_water_template_rows()
-    if not rows:
+    index = _water_template_index()
+    if index is None:
+        return []
+    learned = index.by_sha.get(hashlib.sha256(img_bytes).hexdigest())
+    if learned is not None:
+        return [
+            {
+                "type": learned.get("type") or "unknown",
+                "reading": _normalize_reading(learned.get("reading")),
+                "serial": learned.get("serial"),
+                "confidence": 0.95,
+                "notes": "template_learned_photo_match_water",
+                "note2": "",
+                "variant": "water_template",
+                "provider": "det-water:learned",
+                "black_digits": None,
+                "red_digits": None,
+            }
+        ]
+    if not index:
         return []
     qh = _water_template_hashes(img_bytes)
     if not qh:
         return []
-    scored: list[tuple[float, dict]] = []
-    for row in rows:
-        rh = row.get("hashes") or {}
-        d = (
-            _hamming64(qh.get("full", 0), rh.get("full", 0))
-            + _hamming64(qh.get("mid", 0), rh.get("mid", 0))
-            + _hamming64(qh.get("center", 0), rh.get("center", 0))
-        )
-        scored.append((float(d), row))
-    if not scored:
-        return []
-    scored.sort(key=lambda x: x[0])
-    best_d, best_row = scored[0]
-    second_d = scored[1][0] if len(scored) > 1 else 1e9
+    best_d, best_row, second_d = index.nearest(qh)
     if best_d > 36.0:
         return []
     if (second_d - best_d) < 6.0:
@@ -1972,6 +2495,8 @@ def _water_template_candidates(img_bytes: bytes) -> list[dict]:
 
 
 _DRUM_TEMPLATE_CACHE: Optional[dict[int, list[np.ndarray]]] = None
+_DRUM_TEMPLATE_BANK: Optional[tuple[np.ndarray, np.ndarray]] = None
+_DRUM_TILE = (44, 72)  # (w, h) of rendered templates and resized slot probes
 
 
 def _build_drum_digit_templates() -> dict[int, list[np.ndarray]]:
@@ -1984,7 +2509,7 @@ def _build_drum_digit_templates() -> dict[int, list[np.ndarray]]:
         cv2.FONT_HERSHEY_DUPLEX,
         cv2.FONT_HERSHEY_TRIPLEX,
     )
-    w, h = 44, 72
+    w, h = _DRUM_TILE
     for d in range(10):
         txt = str(d)
         for font in fonts:
@@ -2002,42 +2527,77 @@ def _build_drum_digit_templates() -> dict[int, list[np.ndarray]]:
     return templates
 
 
-def _drum_recognize_slot(slot_bgr: np.ndarray, templates: dict[int, list[np.ndarray]]) -> tuple[Optional[int], float, float]:
+def _zero_mean_unit_rows(rows: np.ndarray) -> np.ndarray:
+    """
+    Flattened tiles centred and scaled to unit norm, so the dot product of two rows equals
+    cv2.matchTemplate(..., TM_CCOEFF_NORMED) on same-size tiles. Flat tiles score 0, as in OpenCV.
+    """
+    x = rows.astype(np.float32)
+    x -= x.mean(axis=1, keepdims=True)
+    norm = np.linalg.norm(x, axis=1, keepdims=True)
+    return np.divide(x, norm, out=np.zeros_like(x), where=norm > 1e-6)
+
+
+def _drum_template_bank() -> tuple[np.ndarray, np.ndarray]:
+    """(normalized template matrix (n, w*h), digit of each row), rows in _build_drum_digit_templates order."""
+    global _DRUM_TEMPLATE_BANK
+    if _DRUM_TEMPLATE_BANK is not None:
+        return _DRUM_TEMPLATE_BANK
+    templates = _build_drum_digit_templates()
+    tiles = [t.reshape(-1) for d in range(10) for t in templates[d]]
+    digits = np.array([d for d in range(10) for _ in templates[d]], dtype=np.int64)
+    _DRUM_TEMPLATE_BANK = (_zero_mean_unit_rows(np.stack(tiles)), digits)
+    return _DRUM_TEMPLATE_BANK
+
+
+def _drum_slot_probes(slot_bgr: np.ndarray) -> Optional[list[np.ndarray]]:
     if slot_bgr.size == 0:
-        return None, 0.0, 0.0
+        return None
     g = cv2.cvtColor(slot_bgr, cv2.COLOR_BGR2GRAY)
     g = cv2.GaussianBlur(g, (3, 3), 0)
     g = cv2.createCLAHE(clipLimit=2.8, tileGridSize=(4, 4)).apply(g)
     b = cv2.threshold(g, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-    probes = (
-        cv2.resize(b, (44, 72), interpolation=cv2.INTER_CUBIC),
-        cv2.resize(255 - b, (44, 72), interpolation=cv2.INTER_CUBIC),
-    )
-    best = (-2.0, None)
-    second = (-2.0, None)
-    for p in probes:
-        for digit, arr in templates.items():
-            for t in arr:
-                score = float(cv2.matchTemplate(p, t, cv2.TM_CCOEFF_NORMED)[0, 0])
-                if score > best[0]:
-                    second = best
-                    best = (score, digit)
-                elif score > second[0]:
-                    second = (score, digit)
-    if best[1] is None:
-        return None, 0.0, 0.0
-    # Map matcher score to practical confidence range.
-    conf = max(0.0, min(1.0, (best[0] - 0.12) / 0.55))
-    margin = max(0.0, best[0] - max(-1.0, second[0]))
-    return int(best[1]), float(conf), float(margin)
+    return [
+        cv2.resize(b, _DRUM_TILE, interpolation=cv2.INTER_CUBIC).reshape(-1),
+        cv2.resize(255 - b, _DRUM_TILE, interpolation=cv2.INTER_CUBIC).reshape(-1),
+    ]
+
+
+def _drum_recognize_slots(slots: list[np.ndarray]) -> list[tuple[Optional[int], float, float]]:
+    """
+    (digit, confidence, margin) per slot. Both probes of every slot are scored against the whole
+    template bank with one matrix product; best/second are taken over all probe x template scores.
+    """
+    probes = [_drum_slot_probes(s) for s in slots]
+    stacked = [p for pair in probes if pair is not None for p in pair]
+    if not stacked:
+        return [(None, 0.0, 0.0) for _ in slots]
+    bank, digits = _drum_template_bank()
+    scores = _zero_mean_unit_rows(np.stack(stacked)) @ bank.T
+    out: list[tuple[Optional[int], float, float]] = []
+    row = 0
+    for pair in probes:
+        if pair is None:
+            out.append((None, 0.0, 0.0))
+            continue
+        sc = scores[row : row + 2].ravel()
+        row += 2
+        # argmax keeps the first maximum in probe -> digit -> template order
+        i = int(np.argmax(sc))
+        best = float(sc[i])
+        second = float(np.partition(sc, -2)[-2]) if sc.size > 1 else -2.0
+        # Map matcher score to practical confidence range.
+        conf = max(0.0, min(1.0, (best - 0.12) / 0.55))
+        margin = max(0.0, best - max(-1.0, second))
+        out.append((int(digits[i % len(digits)]), float(conf), float(margin)))
+    return out
 
 
 def _electric_drum_candidates(img_bytes: bytes) -> list[dict]:
     if not OCR_ELECTRIC_DRUM_ENABLED:
         return []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        img = _frame_for(img_bytes).bgr
     except Exception:
         return []
     if img is None:
@@ -2046,7 +2606,7 @@ def _electric_drum_candidates(img_bytes: bytes) -> list[dict]:
     if h < 120 or w < 120:
         return []
 
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    hsv = _frame_for(img_bytes).hsv
     red_mask = cv2.inRange(hsv, (0, 70, 55), (15, 255, 255)) | cv2.inRange(hsv, (160, 70, 55), (179, 255, 255))
     red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8), iterations=1)
     red_mask = cv2.medianBlur(red_mask, 5)
@@ -2054,7 +2614,6 @@ def _electric_drum_candidates(img_bytes: bytes) -> list[dict]:
     if not cnts:
         return []
 
-    templates = _build_drum_digit_templates()
     out: list[dict] = []
     for c in cnts:
         x, y, bw, bh = cv2.boundingRect(c)
@@ -2079,20 +2638,12 @@ def _electric_drum_candidates(img_bytes: bytes) -> list[dict]:
         band = cv2.resize(band, (slot_w * 6 * 3, max(20, (y2 - y1) * 3)), interpolation=cv2.INTER_CUBIC)
         sw = max(8, band.shape[1] // 6)
 
-        digits: list[str] = []
-        confs: list[float] = []
-        margins: list[float] = []
-        for i in range(6):
-            slot = band[:, i * sw : (i + 1) * sw]
-            d, dc, dm = _drum_recognize_slot(slot, templates)
-            if d is None:
-                digits = []
-                break
-            digits.append(str(d))
-            confs.append(dc)
-            margins.append(dm)
-        if len(digits) != 6:
+        slots = _drum_recognize_slots([band[:, i * sw : (i + 1) * sw] for i in range(6)])
+        if any(d is None for d, _, _ in slots):
             continue
+        digits = [str(d) for d, _, _ in slots]
+        confs = [dc for _, dc, _ in slots]
+        margins = [dm for _, _, dm in slots]
 
         int_part = "".join(digits[:5]).lstrip("0") or "0"
         frac_digit = digits[5]
@@ -2186,8 +2737,7 @@ def _electric_tesseract_candidates(img_bytes: bytes) -> list[dict]:
     if not OCR_ELECTRIC_TESSERACT_ENABLED or pytesseract is None:
         return []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        img = _frame_for(img_bytes).bgr
     except Exception:
         return []
     if img is None:
@@ -2223,14 +2773,12 @@ def _electric_tesseract_candidates(img_bytes: bytes) -> list[dict]:
             ("inv", inv),
         ]
         for vname, arr2d in variants:
-            try:
-                data = pytesseract.image_to_data(
-                    arr2d,
-                    output_type=pytesseract.Output.DICT,
-                    config="--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789.,",
-                    timeout=OCR_TESSERACT_TIMEOUT_SEC,
-                )
-            except Exception:
+            data = _tesseract_data(
+                arr2d,
+                config="--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789.,",
+                timeout=OCR_TESSERACT_TIMEOUT_SEC,
+            )
+            if data is None:
                 continue
             txt = " ".join([str(t or "") for t in data.get("text", [])]).strip()
             vals = _electric_parse_numeric_text(txt)
@@ -2265,6 +2813,7 @@ def _electric_tesseract_candidates(img_bytes: bytes) -> list[dict]:
     return out
 
 
+@_per_frame_memo
 def _electric_deterministic_candidates(img_bytes: bytes) -> list[dict]:
     if not OCR_ELECTRIC_DETERMINISTIC and not OCR_ELECTRIC_TEMPLATE_MATCH:
         return []
@@ -2284,7 +2833,7 @@ def _electric_deterministic_candidates(img_bytes: bytes) -> list[dict]:
     if not OCR_ELECTRIC_DETERMINISTIC:
         return out
     try:
-        img = Image.open(BytesIO(img_bytes)).convert("RGB")
+        img = _frame_for(img_bytes).pil_rgb()
     except Exception:
         return out
     w, h = img.size
@@ -2363,12 +2912,11 @@ def _clamp_box(x1: int, y1: int, x2: int, y2: int, w: int, h: int) -> tuple[int,
 def _make_water_dial_variants(img_bytes: bytes) -> list[tuple[str, bytes]]:
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
-        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        gray = _frame_for(img_bytes).gray
         gray = cv2.medianBlur(gray, 5)
         circles = cv2.HoughCircles(
             gray,
@@ -2433,12 +2981,11 @@ def _make_water_circle_row_variants(img_bytes: bytes) -> list[tuple[str, bytes]]
     """
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
-        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        gray = _frame_for(img_bytes).gray
         gray = cv2.medianBlur(gray, 5)
         circles = cv2.HoughCircles(
             gray,
@@ -2492,12 +3039,11 @@ def _make_water_circle_odometer_strips(img_bytes: bytes) -> list[tuple[str, byte
     """
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
-        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        gray = _frame_for(img_bytes).gray
         gray = cv2.medianBlur(gray, 5)
         circles = cv2.HoughCircles(
             gray,
@@ -2553,12 +3099,11 @@ def _make_water_meter_face_variants(img_bytes: bytes) -> list[tuple[str, bytes]]
     """
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
-        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        gray = _frame_for(img_bytes).gray
         gray = cv2.medianBlur(gray, 5)
         circles = cv2.HoughCircles(
             gray,
@@ -2609,12 +3154,11 @@ def _make_water_blackhat_row_variants(img_bytes: bytes) -> list[tuple[str, bytes
     """
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
-        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        gray = _frame_for(img_bytes).gray
         clahe = cv2.createCLAHE(clipLimit=2.4, tileGridSize=(8, 8))
         g = clahe.apply(gray)
 
@@ -2714,12 +3258,11 @@ def _make_water_black_cells_sheet_from_row(row_bytes: bytes) -> Optional[bytes]:
     Это снижает ошибки 0/1 на тёмных фото.
     """
     try:
-        arr = np.frombuffer(row_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(row_bytes).bgr
         if im is None:
             return None
         h, w = im.shape[:2]
-        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        gray = _frame_for(row_bytes).gray
         gray = cv2.GaussianBlur(gray, (3, 3), 0)
         bw = cv2.adaptiveThreshold(
             gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 31, 7
@@ -2865,12 +3408,11 @@ def _make_water_digit_cells_sheet_from_row(row_bytes: bytes) -> Optional[tuple[b
     Возвращает (sheet_bytes, red_len).
     """
     try:
-        arr = np.frombuffer(row_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(row_bytes).bgr
         if im is None:
             return None
         h, w = im.shape[:2]
-        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        gray = _frame_for(row_bytes).gray
         gray = cv2.GaussianBlur(gray, (3, 3), 0)
         bw = cv2.adaptiveThreshold(
             gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 31, 7
@@ -2997,8 +3539,7 @@ def _make_water_digit_cells_sheet_from_row(row_bytes: bytes) -> Optional[tuple[b
 def _make_black_focus_variants_from_row(row_bytes: bytes) -> list[tuple[str, bytes]]:
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(row_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(row_bytes).bgr
         if im is None:
             return out
         pil = Image.fromarray(cv2.cvtColor(im, cv2.COLOR_BGR2RGB))
@@ -3025,8 +3566,7 @@ def _make_black_focus_variants_from_row(row_bytes: bytes) -> list[tuple[str, byt
 def _make_red_focus_variants_from_crop(crop_bytes: bytes, *, prefix: str = "row_red") -> list[tuple[str, bytes]]:
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(crop_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(crop_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
@@ -3159,55 +3699,113 @@ def _reading_from_digits(black: Optional[str], red: Optional[str]) -> Optional[f
         return None
 
 
-def _tesseract_single_digit(tile_bgr: np.ndarray) -> tuple[Optional[str], float]:
-    if pytesseract is None or tile_bgr.size == 0:
-        return None, 0.0
-    best_digit: Optional[str] = None
-    best_conf = 0.0
+def _tesseract_data(arr2d: np.ndarray, *, config: str, timeout: float) -> Optional[dict]:
+    """pytesseract.image_to_data (DICT) within the shared process limit; None when busy past timeout or on error."""
+    if pytesseract is None:
+        return None
+    if not _TESSERACT_SLOTS.acquire(timeout=timeout):
+        return None
     try:
-        gray = cv2.cvtColor(tile_bgr, cv2.COLOR_BGR2GRAY)
+        return pytesseract.image_to_data(arr2d, output_type=pytesseract.Output.DICT, config=config, timeout=timeout)
     except Exception:
-        return None, 0.0
+        return None
+    finally:
+        _TESSERACT_SLOTS.release()
+
+
+_DIGIT_PAGE_CELL_H = 96
+_DIGIT_PAGE_GAP = 56
+_DIGIT_PAGE_PAD = 32
+
+
+def _binarize_digit_tile(tile_bgr: np.ndarray) -> Optional[np.ndarray]:
+    if tile_bgr.size == 0:
+        return None
     try:
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
-        arr2d = cv2.adaptiveThreshold(
-            clahe, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 7
-        )
+        gray = cv2.cvtColor(tile_bgr, cv2.COLOR_BGR2GRAY)
     except Exception:
-        arr2d = gray
+        return None
     try:
-        data = pytesseract.image_to_data(
-            arr2d,
-            output_type=pytesseract.Output.DICT,
-            config="--oem 3 --psm 10 -c tessedit_char_whitelist=0123456789",
-            timeout=min(0.8, OCR_TESSERACT_TIMEOUT_SEC),
-        )
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+        return cv2.adaptiveThreshold(clahe, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 7)
     except Exception:
-        return None, 0.0
-    txts = data.get("text", []) or []
-    confs = data.get("conf", []) or []
-    for t, c in zip(txts, confs):
+        return gray
+
+
+def _compose_digit_page(groups: list[list[Optional[np.ndarray]]]) -> tuple[np.ndarray, dict[tuple[int, int], tuple[int, int, int, int]]]:
+    """
+    Lay single-digit tiles out on one white page: one line per group, tiles scaled to a common height
+    and separated by gaps wide enough that tesseract keeps each tile a separate word.
+    Returns the page and the box (x1, y1, x2, y2) of every placed tile keyed by (group, tile) index.
+    """
+    ch, gap, pad = _DIGIT_PAGE_CELL_H, _DIGIT_PAGE_GAP, _DIGIT_PAGE_PAD
+    boxes: dict[tuple[int, int], tuple[int, int, int, int]] = {}
+    scaled: dict[tuple[int, int], np.ndarray] = {}
+    width = 0
+    for gi, tiles in enumerate(groups):
+        x = pad
+        for ti, tile in enumerate(tiles):
+            if tile is None or tile.size == 0:
+                continue
+            tw = max(8, int(round(tile.shape[1] * ch / float(max(1, tile.shape[0])))))
+            scaled[(gi, ti)] = cv2.resize(tile, (tw, ch), interpolation=cv2.INTER_AREA)
+            y = pad + gi * (ch + gap)
+            boxes[(gi, ti)] = (x, y, x + tw, y + ch)
+            x += tw + gap
+        width = max(width, x - gap + pad)
+    page = np.full((pad * 2 + max(1, len(groups)) * (ch + gap) - gap, max(width, pad * 2 + 1)), 255, dtype=np.uint8)
+    for key, (x1, y1, x2, y2) in boxes.items():
+        page[y1:y2, x1:x2] = scaled[key]
+    return page, boxes
+
+
+def _digits_by_box(data: dict, boxes: dict[tuple[int, int], tuple[int, int, int, int]]) -> dict[tuple[int, int], tuple[str, float]]:
+    """Best (last digit of word, confidence 0..1) per tile; a word belongs to the tile holding its centre."""
+    out: dict[tuple[int, int], tuple[str, float]] = {}
+    cols = ("text", "conf", "left", "top", "width", "height")
+    for t, c, left, top, bw, bh in zip(*(data.get(k, []) or [] for k in cols)):
         s = "".join(ch for ch in str(t or "") if ch.isdigit())
         if not s:
             continue
-        d = s[-1]
         try:
             cf = float(c)
+            cx = float(left) + float(bw) / 2.0
+            cy = float(top) + float(bh) / 2.0
         except Exception:
-            cf = 0.0
-        if cf > best_conf:
-            best_conf = cf
-            best_digit = d
-    # Normalize tesseract confidence range (0..100) to (0..1).
-    return best_digit, _clamp_confidence(best_conf / 100.0)
+            continue
+        for key, (x1, y1, x2, y2) in boxes.items():
+            if x1 <= cx < x2 and y1 <= cy < y2:
+                if cf > 0 and cf / 100.0 > out.get(key, ("", 0.0))[1]:
+                    out[key] = (s[-1], _clamp_confidence(cf / 100.0))
+                break
+    return out
 
 
-def _read_water_cells_sheet_tesseract(sheet_bytes: bytes, *, red_len: int) -> Optional[dict]:
-    if pytesseract is None:
-        return None
+def _tesseract_digit_cells(groups: list[list[Optional[np.ndarray]]]) -> list[list[tuple[Optional[str], float]]]:
+    """
+    (digit, confidence) for every BGR tile of every group from a single tesseract run over a composed
+    page, instead of one --psm 10 process per tile.
+    """
+    empty = [[(None, 0.0) for _ in tiles] for tiles in groups]
+    binarized = [[_binarize_digit_tile(t) if t is not None else None for t in tiles] for tiles in groups]
+    if pytesseract is None or not any(t is not None for tiles in binarized for t in tiles):
+        return empty
+    page, boxes = _compose_digit_page(binarized)
+    data = _tesseract_data(
+        page,
+        config="--oem 3 --psm 11 -c tessedit_char_whitelist=0123456789",
+        timeout=OCR_TESSERACT_TIMEOUT_SEC,
+    )
+    if data is None:
+        return empty
+    found = _digits_by_box(data, boxes)
+    return [[found.get((gi, ti), (None, 0.0)) for ti in range(len(tiles))] for gi, tiles in enumerate(groups)]
+
+
+def _water_cells_sheet_tiles(sheet_bytes: bytes, red_len: int) -> Optional[list[np.ndarray]]:
+    """Cell crops of a cells sheet: 5 black (B1..B5) then up to 3 red (R1..R3), by the sheet layout."""
     try:
-        arr = np.frombuffer(sheet_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(sheet_bytes).bgr
     except Exception:
         return None
     if im is None:
@@ -3225,42 +3823,28 @@ def _read_water_cells_sheet_tesseract(sheet_bytes: bytes, *, red_len: int) -> Op
     inset_x = 16
     inset_y = 16
 
-    digits_b: list[str] = []
-    conf_b: list[float] = []
-    digits_r: list[str] = []
-    conf_r: list[float] = []
-
-    def _cell_box(i: int, y0: int) -> tuple[int, int, int, int]:
+    def _cell(i: int, y0: int) -> np.ndarray:
         x0 = margin + i * (tile_w + gap)
         x1 = max(0, x0 + inset_x)
         y1 = max(0, y0 + inset_y)
         x2 = min(w, x0 + tile_w - inset_x)
         y2 = min(h, y0 + tile_h - inset_y)
-        return x1, y1, max(x1 + 1, x2), max(y1 + 1, y2)
+        return im[y1:max(y1 + 1, y2), x1:max(x1 + 1, x2)]
 
-    for i in range(5):
-        x1, y1, x2, y2 = _cell_box(i, y_black)
-        d, c = _tesseract_single_digit(im[y1:y2, x1:x2])
-        if not d:
-            return None
-        digits_b.append(d)
-        conf_b.append(c)
+    return [_cell(i, y_black) for i in range(5)] + [_cell(i, y_red) for i in range(max(0, min(3, int(red_len))))]
 
-    for i in range(max(0, min(3, int(red_len)))):
-        x1, y1, x2, y2 = _cell_box(i, y_red)
-        d, c = _tesseract_single_digit(im[y1:y2, x1:x2])
-        if not d:
-            continue
-        digits_r.append(d)
-        conf_r.append(c)
 
-    black_digits = "".join(digits_b)
-    red_digits = "".join(digits_r) if len(digits_r) >= 2 else None
+def _water_cells_sheet_result(cells: list[tuple[Optional[str], float]]) -> Optional[dict]:
+    black, red = cells[:5], [(d, c) for d, c in cells[5:] if d]
+    if len(black) < 5 or not all(d for d, _ in black):
+        return None
+    black_digits = "".join(d for d, _ in black)
+    red_digits = "".join(d for d, _ in red) if len(red) >= 2 else None
     reading = _reading_from_digits(black_digits, red_digits)
     if reading is None:
         return None
-    mean_b = float(sum(conf_b) / max(1, len(conf_b)))
-    mean_r = float(sum(conf_r) / max(1, len(conf_r))) if conf_r else 0.0
+    mean_b = float(sum(c for _, c in black) / 5)
+    mean_r = float(sum(c for _, c in red) / len(red)) if red else 0.0
     conf = _clamp_confidence((mean_b * 0.82) + (mean_r * 0.18))
     return {
         "type": "unknown",
@@ -3273,12 +3857,20 @@ def _read_water_cells_sheet_tesseract(sheet_bytes: bytes, *, red_len: int) -> Op
     }
 
 
+def _read_water_cells_sheets_tesseract(sheets: list[tuple[bytes, int]]) -> list[Optional[dict]]:
+    """Local per-cell read of several (sheet_bytes, red_len) cells sheets with one tesseract run."""
+    if pytesseract is None or not sheets:
+        return [None for _ in sheets]
+    tiles = [_water_cells_sheet_tiles(b, red_len) for b, red_len in sheets]
+    cells = _tesseract_digit_cells([t or [] for t in tiles])
+    return [_water_cells_sheet_result(c) if t else None for t, c in zip(tiles, cells)]
+
+
 def _read_water_row_tesseract(row_bytes: bytes) -> Optional[dict]:
     if pytesseract is None:
         return None
     try:
-        arr = np.frombuffer(row_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(row_bytes).bgr
     except Exception:
         return None
     if im is None:
@@ -3314,14 +3906,12 @@ def _read_water_row_tesseract(row_bytes: bytes) -> Optional[dict]:
     best: Optional[dict] = None
     for arr2d in variants[:2]:
         psm = 7
-        try:
-            data = pytesseract.image_to_data(
-                arr2d,
-                output_type=pytesseract.Output.DICT,
-                config=f"--oem 3 --psm {psm} -c tessedit_char_whitelist=0123456789",
-                timeout=min(1.0, OCR_TESSERACT_TIMEOUT_SEC),
-            )
-        except Exception:
+        data = _tesseract_data(
+            arr2d,
+            config=f"--oem 3 --psm {psm} -c tessedit_char_whitelist=0123456789",
+            timeout=min(1.0, OCR_TESSERACT_TIMEOUT_SEC),
+        )
+        if data is None:
             continue
         txt = "".join(str(t or "") for t in (data.get("text", []) or []))
         digits = "".join(ch for ch in txt if ch.isdigit())
@@ -3374,18 +3964,19 @@ def _local_water_quick_candidate(
 ) -> Optional[dict]:
     rows = row_variants
     if rows is None:
-        rows = make_water_deterministic_row_variants(img_bytes, max_variants=4)
+        rows = _make_det_row_variants(img_bytes, max_variants=4)
     if not rows:
         return None
-    best: Optional[dict] = None
+    packed_rows: list[tuple[str, bytes, tuple[bytes, int]]] = []
     for lbl, src in rows[:4]:
         packed = _make_water_digit_cells_sheet_from_row(src)
         if not packed:
             packed = make_fixed_cells_sheet_from_row(src, black_len=5, red_len=3)
-        if not packed:
-            continue
-        sheet_bytes, red_len = packed
-        det = _read_water_cells_sheet_tesseract(sheet_bytes, red_len=red_len)
+        if packed:
+            packed_rows.append((lbl, src, packed))
+    local_reads = _read_water_cells_sheets_tesseract([p for _, _, p in packed_rows])
+    best: Optional[dict] = None
+    for (lbl, src, _), det in zip(packed_rows, local_reads):
         if det is None:
             det = _read_water_row_tesseract(src)
             if det is None:
@@ -3494,11 +4085,11 @@ def _is_strict_water_odometer_candidate(item: dict) -> bool:
     return True
 
 
+@_per_frame_memo
 def _make_water_top_strip_variants(img_bytes: bytes) -> list[tuple[str, bytes]]:
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
@@ -3630,6 +4221,7 @@ def _detect_water_odometer_rects(im: np.ndarray) -> list[tuple[float, tuple[tupl
     return out[:4]
 
 
+@_per_frame_memo
 def _make_water_roi_row_variants(img_bytes: bytes) -> list[tuple[str, bytes]]:
     """
     ROI-first: ищем прямоугольное окно барабана цифр по морфологии/контурам,
@@ -3637,8 +4229,7 @@ def _make_water_roi_row_variants(img_bytes: bytes) -> list[tuple[str, bytes]]:
     """
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         rects = _detect_water_odometer_rects(im)
@@ -3682,15 +4273,15 @@ def _make_water_roi_row_variants(img_bytes: bytes) -> list[tuple[str, bytes]]:
     return out[:12]
 
 
+@_per_frame_memo
 def _make_water_odometer_window_variants(img_bytes: bytes) -> list[tuple[str, bytes]]:
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
-        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        gray = _frame_for(img_bytes).gray
         gray = cv2.medianBlur(gray, 5)
         circles = cv2.HoughCircles(
             gray,
@@ -3748,6 +4339,7 @@ def _make_water_odometer_window_variants(img_bytes: bytes) -> list[tuple[str, by
     return out[:9]
 
 
+@_per_frame_memo
 def _make_water_global_strip_variants(img_bytes: bytes) -> list[tuple[str, bytes]]:
     """
     Глобальные кропы барабана (без опоры на круг/контуры).
@@ -3755,8 +4347,7 @@ def _make_water_global_strip_variants(img_bytes: bytes) -> list[tuple[str, bytes
     """
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
@@ -3795,12 +4386,11 @@ def _make_water_counter_box_variants(img_bytes: bytes) -> list[tuple[str, bytes]
     """
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
-        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        gray = _frame_for(img_bytes).gray
         # Keep edges of printed digits sharper for odometer window detection.
         gray = cv2.GaussianBlur(gray, (3, 3), 0)
         bw = cv2.adaptiveThreshold(
@@ -3899,6 +4489,7 @@ def _make_water_counter_box_variants(img_bytes: bytes) -> list[tuple[str, bytes]
     return out[:6]
 
 
+@_per_frame_memo
 def _make_water_counter_row_variants(img_bytes: bytes) -> list[tuple[str, bytes]]:
     """
     Детектор конкретно строки барабана (последовательность прямоугольных окон цифр).
@@ -3906,12 +4497,11 @@ def _make_water_counter_row_variants(img_bytes: bytes) -> list[tuple[str, bytes]
     """
     out: list[tuple[str, bytes]] = []
     try:
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        im = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        im = _frame_for(img_bytes).bgr
         if im is None:
             return out
         h, w = im.shape[:2]
-        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+        gray = _frame_for(img_bytes).gray
         gray = cv2.GaussianBlur(gray, (5, 5), 0)
         bw = cv2.adaptiveThreshold(
             gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 41, 11
@@ -4077,8 +4667,7 @@ def _make_water_odometer_sheet(img_bytes: bytes) -> Optional[bytes]:
         # 1) ROI-first candidates from rectified row detector
         roi_variants = _make_water_roi_row_variants(img_bytes)
         for _label, b in roi_variants:
-            arr2 = np.frombuffer(b, dtype=np.uint8)
-            im2 = cv2.imdecode(arr2, cv2.IMREAD_COLOR)
+            im2 = _frame_for(b).bgr
             if im2 is None:
                 continue
             p = Image.fromarray(cv2.cvtColor(im2, cv2.COLOR_BGR2RGB)).resize(
@@ -4093,8 +4682,7 @@ def _make_water_odometer_sheet(img_bytes: bytes) -> Optional[bytes]:
         if len(tiles) < 4:
             odo_windows = _make_water_odometer_window_variants(img_bytes)
             for _label, b in odo_windows:
-                arr2 = np.frombuffer(b, dtype=np.uint8)
-                im2 = cv2.imdecode(arr2, cv2.IMREAD_COLOR)
+                im2 = _frame_for(b).bgr
                 if im2 is None:
                     continue
                 p = Image.fromarray(cv2.cvtColor(im2, cv2.COLOR_BGR2RGB)).resize(
@@ -5190,6 +5778,47 @@ def _water_suspicious_layout_fixes(item: dict) -> list[dict]:
     return out
 
 
+class _OcrSharedBudget:
+    """
+    OpenAI call counter + deadline shared by several recognize jobs of one request.
+    Jobs run on different pool threads, so every access is locked.
+    """
+
+    def __init__(self, *, max_calls: int, runtime_sec: float) -> None:
+        self._lock = threading.Lock()
+        self.max_calls = int(max_calls)
+        self.calls = 0
+        self.deadline = time.monotonic() + float(runtime_sec)
+
+    def remaining_sec(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def take_call(self) -> bool:
+        with self._lock:
+            if self.calls >= self.max_calls:
+                return False
+            self.calls += 1
+            return True
+
+
+async def _run_ocr_job(fn, *args, **kwargs):
+    """
+    Run a synchronous OCR job on the bounded pool.
+    Rejects new work with 503 when the backlog is already full.
+    """
+    global _OCR_PENDING
+    with _OCR_PENDING_LOCK:
+        if _OCR_PENDING >= OCR_MAX_PENDING:
+            raise HTTPException(status_code=503, detail="ocr_busy")
+        _OCR_PENDING += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_OCR_EXECUTOR, lambda: fn(*args, **kwargs))
+    finally:
+        with _OCR_PENDING_LOCK:
+            _OCR_PENDING -= 1
+
+
 @app.post("/recognize")
 async def recognize(
     file: UploadFile = File(...),
@@ -5197,6 +5826,52 @@ async def recognize(
     context_prev_water: Optional[str] = Form(None),
     context_serial_hint: Optional[str] = Form(None),
 ):
+    img = await file.read()
+    if not img:
+        raise HTTPException(status_code=400, detail="empty_file")
+    return await _run_ocr_job(
+        _recognize_sync,
+        img,
+        filename=file.filename,
+        content_type=file.content_type,
+        trace_id=trace_id,
+        context_prev_water=context_prev_water,
+        context_serial_hint=context_serial_hint,
+    )
+
+
+def _planner_contexts(serial_hints: list[str], prev_water: list[float]) -> list[str]:
+    """Stage planner contexts of a request, most specific first."""
+    out: list[str] = []
+    if len(serial_hints) == 1:
+        out.append(f"serial:{serial_hints[0]}")
+    if serial_hints or prev_water:
+        out.append("water")
+    out.append("any")
+    return out
+
+
+def _recognize_sync(img: bytes, **kwargs) -> dict:
+    _PLANNER_REST.mark = None
+    with _frame_scope():
+        out = _recognize_cascade(img, **kwargs)
+    mark, _PLANNER_REST.mark = _PLANNER_REST.mark, None
+    if mark is not None:
+        contexts, rest_t0, rest_calls = mark
+        _STAGE_PLANNER.record_rest(contexts, ms=(time.monotonic() - rest_t0) * 1000.0, calls=rest_calls())
+    return out
+
+
+def _recognize_cascade(
+    img: bytes,
+    *,
+    filename: Optional[str] = None,
+    content_type: Optional[str] = None,
+    trace_id: Optional[str] = None,
+    context_prev_water: Optional[str] = None,
+    context_serial_hint: Optional[str] = None,
+    shared_budget: Optional[_OcrSharedBudget] = None,
+) -> dict:
     started_at = time.monotonic()
     req_trace_id = (str(trace_id or "").strip() or f"ocr-{uuid.uuid4().hex[:12]}")
     context_prev_values = _parse_context_prev_water(context_prev_water)
@@ -5214,6 +5889,8 @@ async def recognize(
     odo_reserve_sec = 4.0 if OCR_WATER_DIGIT_FIRST else 0.0
 
     def _time_budget_left(min_remaining_sec: float = 0.0) -> bool:
+        if shared_budget is not None and shared_budget.remaining_sec() <= max(0.0, min_remaining_sec):
+            return False
         budget = max(1.0, OCR_MAX_RUNTIME_SEC - max(0.0, min_remaining_sec))
         return (time.monotonic() - started_at) < budget
 
@@ -5233,8 +5910,12 @@ async def recognize(
             raise TimeoutError("ocr_openai_call_budget_exceeded")
         # Hard per-call guard: never start a long provider call near request deadline.
         remaining = OCR_MAX_RUNTIME_SEC - (time.monotonic() - started_at)
+        if shared_budget is not None:
+            remaining = min(remaining, shared_budget.remaining_sec())
         if remaining <= 0.9:
             raise TimeoutError("ocr_runtime_budget_exceeded")
+        if shared_budget is not None and not shared_budget.take_call():
+            raise TimeoutError("ocr_series_openai_call_budget_exceeded")
         vision_calls += 1
         call_timeout = max(1.0, min(float(OPENAI_TIMEOUT_SEC), remaining - 0.4))
         if max_call_timeout_sec is not None:
@@ -5249,9 +5930,6 @@ async def recognize(
             timeout_sec=call_timeout,
         )
 
-    img = await file.read()
-    if not img:
-        raise HTTPException(status_code=400, detail="empty_file")
     img = _prepare_input_image_for_ocr(img)
 
     if not OCR_OPENAI_ENABLED:
@@ -5343,12 +6021,12 @@ async def recognize(
             "trace_id": req_trace_id,
         }
 
-    mime = _guess_mime(file.filename, file.content_type)
+    mime = _guess_mime(filename, content_type)
     logger.info(
         "ocr_recognize start trace_id=%s filename=%s content_type=%s mime=%s size_bytes=%s",
         req_trace_id,
-        file.filename,
-        file.content_type,
+        filename,
+        content_type,
         mime,
         len(img),
     )
@@ -5365,7 +6043,7 @@ async def recognize(
     pre_det_row_variants: list[tuple[str, bytes]] = []
     if OCR_WATER_DIGIT_FIRST and (not OCR_WATER_ECO) and _time_budget_left(odo_reserve_sec):
         try:
-            pre_det_row_variants = make_water_deterministic_row_variants(img, max_variants=pre_det_limit)
+            pre_det_row_variants = _make_det_row_variants(img, max_variants=pre_det_limit)
         except Exception:
             pre_det_row_variants = []
     water_row_hint = len(pre_det_row_variants) > 0
@@ -5378,7 +6056,7 @@ async def recognize(
             water_face_hint,
             water_row_hint,
         )
-    if OCR_WATER_TEMPLATE_MATCH and OCR_WATER_ECO:
+    def _probe_water_template() -> Optional[dict]:
         try:
             wt_rows = _water_template_candidates(img)
         except Exception:
@@ -5409,7 +6087,9 @@ async def recognize(
                     out["timings_ms"] = dict(stage_ms)
                     out["openai_calls"] = 0
                 return out
-    if OCR_WATER_ECO and OCR_WATER_DIGIT_FIRST and water_row_hint and _time_budget_left(2.0):
+        return None
+
+    def _probe_water_local_quick() -> Optional[dict]:
         quick_local = _local_water_quick_candidate(img, row_variants=pre_det_row_variants)
         if quick_local is not None and _is_ok_water_digits(quick_local):
             out = {
@@ -5435,9 +6115,11 @@ async def recognize(
                 out["timings_ms"] = dict(stage_ms)
                 out["openai_calls"] = 0
             return out
-    # Cheap and stable early exit for previously seen electric displays.
-    # Prevents expensive OpenAI calls and avoids occasional decimal/scale drift.
-    if OCR_ELECTRIC_TEMPLATE_MATCH and (not skip_electric_bootstrap):
+        return None
+
+    def _probe_electric_template() -> Optional[dict]:
+        # Cheap and stable early exit for previously seen electric displays.
+        # Prevents expensive OpenAI calls and avoids occasional decimal/scale drift.
         try:
             et_rows = _electric_template_candidates(img)
         except Exception:
@@ -5468,8 +6150,10 @@ async def recognize(
                     out["timings_ms"] = dict(stage_ms)
                     out["openai_calls"] = 0
                 return out
-    # AUTO mode: try deterministic electric path before expensive OpenAI bootstrap.
-    if OCR_RUNTIME_MODE == "auto" and OCR_ELECTRIC_DETERMINISTIC and (not skip_electric_bootstrap):
+        return None
+
+    def _probe_electric_deterministic() -> Optional[dict]:
+        # Try the deterministic electric path before expensive OpenAI bootstrap.
         try:
             auto_det_rows = _electric_deterministic_candidates(img)
         except Exception:
@@ -5500,11 +6184,70 @@ async def recognize(
                     out["timings_ms"] = dict(stage_ms)
                     out["openai_calls"] = 0
                 return out
+        return None
+
+    planner_ctx = _planner_contexts(context_serial_hints, context_prev_values)
+
+    def _planner_allows(stage: str) -> bool:
+        max_calls = OCR_MAX_OPENAI_CALLS_QUICK if quick_serial_mode else OCR_MAX_OPENAI_CALLS
+        remaining_sec = OCR_MAX_RUNTIME_SEC - (time.monotonic() - started_at)
+        if shared_budget is not None:
+            remaining_sec = min(remaining_sec, shared_budget.remaining_sec())
+        return _STAGE_PLANNER.allow(
+            stage,
+            planner_ctx,
+            remaining_ms=remaining_sec * 1000.0,
+            remaining_calls=max_calls - vision_calls,
+        )
+
+    def _planner_record(stage: str, t0: float, calls0: int, hit: bool) -> None:
+        _STAGE_PLANNER.record(
+            stage,
+            planner_ctx,
+            ms=(time.monotonic() - t0) * 1000.0,
+            calls=vision_calls - calls0,
+            hit=hit,
+        )
+
+    # Local early exits (no OpenAI calls), in planner order: cheapest expected path to a confident answer first.
+    early_probes = {
+        name: fn
+        for name, enabled, fn in (
+            ("water_template", OCR_WATER_TEMPLATE_MATCH and OCR_WATER_ECO, _probe_water_template),
+            ("water_local_quick", OCR_WATER_ECO and OCR_WATER_DIGIT_FIRST and water_row_hint, _probe_water_local_quick),
+            ("electric_template", OCR_ELECTRIC_TEMPLATE_MATCH and (not skip_electric_bootstrap), _probe_electric_template),
+            (
+                "electric_deterministic",
+                OCR_RUNTIME_MODE == "auto" and OCR_ELECTRIC_DETERMINISTIC and (not skip_electric_bootstrap),
+                _probe_electric_deterministic,
+            ),
+        )
+        if enabled
+    }
+    # checked when the stage is about to start, after whatever the planner ran before it
+    probe_start_ok = {"water_local_quick": lambda: _time_budget_left(2.0)}
+    for name in _STAGE_PLANNER.order(list(early_probes), planner_ctx):
+        if not probe_start_ok.get(name, lambda: True)() or not _planner_allows(name):
+            continue
+        probe_t0, probe_calls0 = time.monotonic(), vision_calls
+        out = early_probes[name]()
+        _planner_record(name, probe_t0, probe_calls0, out is not None)
+        if out is not None:
+            return out
 
     # Electric bootstrap:
     # When digit-first water mode is enabled, generic passes are mostly skipped.
     # Probe a few generic variants first and early-return on confident electric reads.
-    if OCR_ELECTRIC_BOOTSTRAP and (not skip_electric_bootstrap) and variants and _time_budget_left(odo_reserve_sec):
+    bootstrap_t0: Optional[float] = None
+    bootstrap_calls0 = vision_calls
+    if (
+        OCR_ELECTRIC_BOOTSTRAP
+        and (not skip_electric_bootstrap)
+        and variants
+        and _time_budget_left(odo_reserve_sec)
+        and _planner_allows("electric_bootstrap")
+    ):
+        bootstrap_t0 = time.monotonic()
         electric_variants: list[tuple[str, bytes]] = []
         preferred = ("middle_band", "focused_crop", "center_crop_strong", "orig", "contrast", "lowlight_enhanced")
         seen_ev: set[str] = set()
@@ -5770,7 +6513,13 @@ async def recognize(
                 e_provider,
                 True,
             )
+            _planner_record("electric_bootstrap", bootstrap_t0, bootstrap_calls0, True)
             return out
+    if bootstrap_t0 is not None:
+        _planner_record("electric_bootstrap", bootstrap_t0, bootstrap_calls0, False)
+    # every planned stage missed: what the rest costs is the planner's yardstick for running them
+    rest_calls0 = vision_calls
+    _PLANNER_REST.mark = (planner_ctx, time.monotonic(), lambda: vision_calls - rest_calls0)
 
     # Serial-targeted pass for scenes with multiple water meters in one photo.
     # Try to read only the meter whose serial tail matches context hint.
@@ -5811,7 +6560,7 @@ async def recognize(
         # In quick mode keep just one source to limit latency.
         try:
             det_limit = 1 if quick_serial_mode else 2
-            det_target_sources = make_water_deterministic_row_variants(img, max_variants=det_limit)
+            det_target_sources = _make_det_row_variants(img, max_variants=det_limit)
             for lbl, vb in det_target_sources:
                 _push_target_source(f"st_{lbl}", vb, "image/jpeg")
         except Exception:
@@ -5898,7 +6647,7 @@ async def recognize(
     if OCR_WATER_DIGIT_FIRST and variants and (not serial_target_hit):
         pre_sources: list[tuple[str, bytes]] = []
         if not quick_serial_mode:
-            pre_sources = make_water_deterministic_row_variants(img, max_variants=1)
+            pre_sources = _make_det_row_variants(img, max_variants=1)
         if pre_sources:
             pre_label, pre_bytes = pre_sources[0]
             pre_mime = "image/jpeg"
@@ -6184,7 +6933,7 @@ async def recognize(
     if not candidates:
         fallback_sources: list[tuple[str, bytes, str, str, str]] = []
         if not quick_serial_mode:
-            det_fallback = make_water_deterministic_row_variants(img, max_variants=2)
+            det_fallback = _make_det_row_variants(img, max_variants=2)
             for lbl, b in det_fallback:
                 fallback_sources.append(
                     (
@@ -6455,7 +7204,7 @@ async def recognize(
     odo_variants: list[tuple[str, bytes]] = []
     if not OCR_WATER_DIGIT_FIRST:
         odo_variants = _make_water_odometer_window_variants(img)
-    det_row_variants = pre_det_row_variants or make_water_deterministic_row_variants(img, max_variants=(4 if OCR_WATER_ECO else 12))
+    det_row_variants = pre_det_row_variants or _make_det_row_variants(img, max_variants=(4 if OCR_WATER_ECO else 12))
     if OCR_WATER_ECO:
         roi_row_variants = []
         global_variants = _make_water_global_strip_variants(img)[:2]
@@ -6630,12 +7379,25 @@ async def recognize(
         cells_valid: list[dict] = []
         local_det_strong_hit = False
 
-        for src_label, src_bytes in row_sources:
+        row_packs: list[Optional[tuple[bytes, int]]] = []
+        for _, src_bytes in row_sources:
+            # the per-row budget check below cannot cut the batched local read short, so only rows packed
+            # while there is budget left go onto the page
             if not _time_budget_left(4.0):
                 break
             packed = _make_water_digit_cells_sheet_from_row(src_bytes)
             if not packed:
                 packed = make_fixed_cells_sheet_from_row(src_bytes, black_len=5, red_len=3)
+            row_packs.append(packed or None)
+        row_sources = row_sources[: len(row_packs)]
+        # Local per-cell OCR of all row sources in one tesseract run: cheap and often enough for clear drum windows.
+        sheets = [p for p in row_packs if p]
+        reads = iter(_read_water_cells_sheets_tesseract(sheets) if _time_budget_left(4.0) else [None] * len(sheets))
+        local_reads = [next(reads) if p else None for p in row_packs]
+
+        for (src_label, src_bytes), packed, local_cells in zip(row_sources, row_packs, local_reads):
+            if not _time_budget_left(4.0):
+                break
             if not packed:
                 candidates.append(
                     {
@@ -6654,8 +7416,6 @@ async def recognize(
                 continue
             sheet_bytes, red_len = packed
             variant_image_map.setdefault(f"cells_row_{src_label}", sheet_bytes)
-            # Local per-cell OCR first: cheap and often enough for clear drum windows.
-            local_cells = _read_water_cells_sheet_tesseract(sheet_bytes, red_len=red_len)
             if local_cells is not None:
                 lc_type = _sanitize_type(local_cells.get("type", "unknown"))
                 lc_reading = _normalize_reading(local_cells.get("reading"))
@@ -7590,6 +8350,51 @@ async def recognize(
     return out
 
 
+def _learn_template_sync(img: bytes, *, meter_type: str, reading: float, serial: Optional[str]) -> dict:
+    with _frame_scope():
+        if meter_type == "electric":
+            kind, hashes, type_ = "electric", _electric_template_hashes(img), "Электро"
+        else:
+            kind, hashes, type_ = "water", _water_template_hashes(img), ("ХВС" if meter_type == "cold" else "ГВС")
+    if not hashes:
+        raise HTTPException(status_code=400, detail="image_decode_failed")
+    entry = {
+        "kind": kind,
+        "reading": reading,
+        "type": type_,
+        "serial": (str(serial).strip() or None) if serial else None,
+        "hashes": {k: f"{int(v):016x}" for k, v in hashes.items()},
+        "sha256": hashlib.sha256(img).hexdigest(),
+        "ts": time.time(),
+    }
+    return {"ok": True, "kind": kind, **_append_learned_template(entry)}
+
+
+@app.post("/templates/learn")
+async def learn_template(
+    file: UploadFile = File(...),
+    meter_type: str = Form(...),
+    reading: str = Form(...),
+    serial: Optional[str] = Form(None),
+):
+    """
+    Add an admin-confirmed (photo, reading) pair to the template store. Both template indexes pick it up
+    on their next lookup, so a repeat of this photo takes the template early match without OpenAI calls.
+    """
+    if not OCR_TEMPLATE_LEARN_LOG:
+        raise HTTPException(status_code=503, detail="template_learning_disabled")
+    mt = str(meter_type or "").strip().lower()
+    if mt not in ("electric", "cold", "hot"):
+        raise HTTPException(status_code=400, detail="invalid_meter_type")
+    value = _normalize_reading(reading)
+    if value is None or value < 0:
+        raise HTTPException(status_code=400, detail="invalid_reading")
+    img = await file.read()
+    if not img:
+        raise HTTPException(status_code=400, detail="empty_file")
+    return await _run_ocr_job(_learn_template_sync, img, meter_type=mt, reading=float(value), serial=serial)
+
+
 @app.post("/recognize-series")
 async def recognize_series(
     files: list[UploadFile] = File(...),
@@ -7608,17 +8413,26 @@ async def recognize_series(
     req_trace_id = (str(trace_id or "").strip() or f"ocrs-{uuid.uuid4().hex[:12]}")
     prev_values = _parse_context_prev_water(context_prev_water)
     serial_hints = _parse_context_serial_hints(context_serial_hint)
-    series_items: list[dict] = []
+    # All files share one OpenAI call budget and deadline and run concurrently on the pool,
+    # so series latency tracks the slowest photo instead of the sum of all photos.
+    budget = _OcrSharedBudget(max_calls=OCR_SERIES_MAX_OPENAI_CALLS, runtime_sec=OCR_SERIES_MAX_RUNTIME_SEC)
 
-    for idx, upl in enumerate(files, start=1):
+    async def _one(idx: int, upl: UploadFile) -> dict:
         item_trace = f"{req_trace_id}-f{idx}"
         name = str(upl.filename or f"file_{idx}").strip() or f"file_{idx}"
         try:
-            item_res = await recognize(
-                file=upl,
+            img = await upl.read()
+            if not img:
+                raise HTTPException(status_code=400, detail="empty_file")
+            item_res = await _run_ocr_job(
+                _recognize_sync,
+                img,
+                filename=upl.filename,
+                content_type=upl.content_type,
                 trace_id=item_trace,
                 context_prev_water=context_prev_water,
                 context_serial_hint=context_serial_hint,
+                shared_budget=budget,
             )
             rec = dict(item_res or {})
         except Exception as e:
@@ -7631,7 +8445,11 @@ async def recognize_series(
                 "trace_id": item_trace,
             }
         rec["filename"] = name
-        series_items.append(rec)
+        return rec
+
+    series_items: list[dict] = list(
+        await asyncio.gather(*(_one(idx, upl) for idx, upl in enumerate(files, start=1)))
+    )
 
     # Neighbor recovery is safe mainly for context-aware water batches.
     # For generic/electric batches without context it can produce wrong carry-over values.
@@ -0,0 +1,153 @@
+"""
+Cost-aware planning for the optional stages of the recognize cascade.
+
+Each planned stage is an independent attempt that either yields a confident answer (hit) or falls through
+to the rest of the cascade. Per stage and request context the planner keeps run/hit counts plus moving
+averages of latency and OpenAI calls, and from those:
+- orders stages by expected cost to a confident answer, (ms + calls * call_cost_ms) / P(hit),
+  which is the optimal order for independent attempts;
+- skips a stage only when its cost, ms + calls * call_cost_ms, exceeds P(hit) times the cost of the rest
+  of the cascade (the "rest" pseudo-stage, recorded whenever the planned stages all miss), re-trying it
+  every `explore_every`-th time so the estimate can recover; local stages under `cheap_ms` always run,
+  and until the rest has samples a stage is skipped only below `min_hit_rate`;
+- skips a stage whose expected latency or OpenAI calls do not fit the request's remaining budget.
+
+Contexts go from specific to general (e.g. ["serial:123456", "water", "any"]); decisions use the most
+specific context with at least `min_samples` runs, and every run is recorded in all of them.
+Mode "fixed" keeps the caller's order and never skips (deterministic, for tests and evaluation runs).
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+REST_STAGE = "rest"
+
+
+class StageStats:
+    __slots__ = ("runs", "hits", "ms", "calls", "skipped")
+
+    def __init__(self) -> None:
+        self.runs = 0
+        self.hits = 0
+        self.ms = 0.0
+        self.calls = 0.0
+        self.skipped = 0
+
+    def hit_rate(self) -> float:
+        # Laplace-smoothed so a short losing streak does not read as "never hits"
+        return (self.hits + 1.0) / (self.runs + 2.0)
+
+    def as_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "hits": self.hits,
+            "ms": round(self.ms, 1),
+            "openai_calls": round(self.calls, 2),
+            "skipped": self.skipped,
+        }
+
+
+class StagePlanner:
+    def __init__(
+        self,
+        *,
+        mode: str = "adaptive",
+        min_samples: int = 30,
+        min_hit_rate: float = 0.03,
+        explore_every: int = 20,
+        call_cost_ms: float = 4000.0,
+        cheap_ms: float = 50.0,
+        alpha: float = 0.1,
+        max_keys: int = 2048,
+    ) -> None:
+        self.mode = "fixed" if str(mode).strip().lower() == "fixed" else "adaptive"
+        self.min_samples = max(1, int(min_samples))
+        self.min_hit_rate = max(0.0, float(min_hit_rate))
+        self.explore_every = max(1, int(explore_every))
+        self.call_cost_ms = max(0.0, float(call_cost_ms))
+        self.cheap_ms = max(0.0, float(cheap_ms))
+        self.alpha = min(1.0, max(0.01, float(alpha)))
+        self.max_keys = max(16, int(max_keys))
+        self._lock = threading.Lock()
+        self._stats: "OrderedDict[tuple[str, str], StageStats]" = OrderedDict()
+
+    def record(self, stage: str, contexts: Sequence[str], *, ms: float, calls: int, hit: bool) -> None:
+        with self._lock:
+            for ctx in contexts:
+                st = self._stats.get((stage, ctx))
+                if st is None:
+                    st = self._stats[(stage, ctx)] = StageStats()
+                    while len(self._stats) > self.max_keys:
+                        self._stats.popitem(last=False)
+                else:
+                    self._stats.move_to_end((stage, ctx))
+                a = 1.0 if st.runs == 0 else self.alpha
+                st.ms += a * (float(ms) - st.ms)
+                st.calls += a * (float(calls) - st.calls)
+                st.runs += 1
+                st.hits += 1 if hit else 0
+
+    def record_rest(self, contexts: Sequence[str], *, ms: float, calls: int) -> None:
+        """What the cascade spent after every planned stage missed or was skipped."""
+        self.record(REST_STAGE, contexts, ms=ms, calls=calls, hit=True)
+
+    def _decisive(self, stage: str, contexts: Sequence[str]) -> Optional[StageStats]:
+        for ctx in contexts:
+            st = self._stats.get((stage, ctx))
+            if st is not None and st.runs >= self.min_samples:
+                return st
+        return None
+
+    def run_cost(self, st: StageStats) -> float:
+        return st.ms + st.calls * self.call_cost_ms
+
+    def expected_cost(self, st: StageStats) -> float:
+        return self.run_cost(st) / st.hit_rate()
+
+    def order(self, stages: Sequence[str], contexts: Sequence[str]) -> list[str]:
+        """Stages cheapest-to-answer first; the given order until every stage has enough samples."""
+        stages = list(stages)
+        if self.mode == "fixed":
+            return stages
+        with self._lock:
+            stats = [self._decisive(s, contexts) for s in stages]
+            if any(st is None for st in stats):
+                return stages
+            costs = {s: self.expected_cost(st) for s, st in zip(stages, stats)}
+        return sorted(stages, key=lambda s: costs[s])
+
+    def allow(self, stage: str, contexts: Sequence[str], *, remaining_ms: float, remaining_calls: int) -> bool:
+        if self.mode == "fixed":
+            return True
+        with self._lock:
+            st = self._decisive(stage, contexts)
+            if st is None:
+                return True
+            # Hard budgets: a stage that cannot finish or would exhaust the call budget is not started.
+            if st.ms > float(remaining_ms) or (st.calls >= 0.5 and st.calls > float(remaining_calls)):
+                st.skipped += 1
+                return False
+            if st.calls < 0.5 and st.ms <= self.cheap_ms:
+                return True
+            # Worth running when cost <= P(hit) * what a hit saves, i.e. the rest of the cascade.
+            rest = self._decisive(REST_STAGE, contexts)
+            if rest is not None:
+                worth = self.run_cost(st) <= st.hit_rate() * self.run_cost(rest)
+            else:
+                worth = st.hits / float(st.runs) >= self.min_hit_rate
+            if worth:
+                return True
+            st.skipped += 1
+            return st.skipped % self.explore_every == 0
+
+    def snapshot(self, *, with_serial: bool = False) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "stages": {
+                    f"{stage}@{ctx}": st.as_dict()
+                    for (stage, ctx), st in self._stats.items()
+                    if with_serial or not ctx.startswith("serial:")
+                },
+            }
@@ -1,4 +1,20 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import app as ocr_app
 from app import (
+    _frame_for,
+    _frame_scope,
+    _per_frame_memo,
+    _run_ocr_job,
+    _OcrSharedBudget,
     _parse_context_serial_hints,
     _serial_hint_tails,
     _pick_water_candidate_by_serial,
@@ -572,3 +588,311 @@ def test_has_red_disagreement_for_integer():
         {"reading": 999.243, "red_digits": "243", "confidence": 0.95, "type": "unknown"},
     ]
     assert _has_red_disagreement_for_integer(cands, 999) is True
+
+
+def test_run_ocr_job_runs_off_event_loop_thread():
+    async def _go():
+        loop_thread = threading.get_ident()
+        worker_thread = await _run_ocr_job(threading.get_ident)
+        return loop_thread, worker_thread
+
+    loop_thread, worker_thread = asyncio.run(_go())
+    assert worker_thread != loop_thread
+
+
+def test_shared_budget_caps_calls_across_threads():
+    budget = _OcrSharedBudget(max_calls=5, runtime_sec=30.0)
+    taken: list[bool] = []
+
+    def _worker():
+        for _ in range(4):
+            taken.append(budget.take_call())
+
+    threads = [threading.Thread(target=_worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(1 for x in taken if x) == 5
+    assert budget.remaining_sec() > 0
+
+
+def test_frame_scope_decodes_once_and_memoizes_builders():
+    ok, enc = cv2.imencode(".jpg", np.full((40, 60, 3), 120, dtype=np.uint8))
+    assert ok
+    data = enc.tobytes()
+    calls: list[int] = []
+
+    @_per_frame_memo
+    def _builder(b: bytes, *, n: int = 1) -> list[dict]:
+        calls.append(n)
+        return [{"n": n, "h": int(_frame_for(b).gray.shape[0])}]
+
+    with _frame_scope():
+        fr = _frame_for(data)
+        assert _frame_for(data) is fr
+        assert fr.bgr is not None and not fr.bgr.flags.writeable
+        first = _builder(data, n=2)
+        first[0]["n"] = 99
+        assert _builder(data, n=2) == [{"n": 2, "h": 40}]
+    assert calls == [2]
+    # Outside of a request scope nothing is cached.
+    assert _frame_for(data) is not _frame_for(data)
+
+
+def _fresh_openai_cache(monkeypatch, tmp_path, **overrides):
+    monkeypatch.setattr(ocr_app, "OCR_OPENAI_CACHE", True)
+    monkeypatch.setattr(ocr_app, "OCR_OPENAI_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(ocr_app, "_OPENAI_CACHE_DB_LOCAL", threading.local())
+    monkeypatch.setattr(ocr_app, "_OPENAI_CACHE_PENDING", {"hits": 0, "misses": 0, "touched": OrderedDict(), "flushed_at": 0.0})
+    for k, v in overrides.items():
+        monkeypatch.setattr(ocr_app, k, v)
+
+
+def test_openai_disk_cache_lru_eviction_and_stats(monkeypatch, tmp_path):
+    _fresh_openai_cache(monkeypatch, tmp_path, OCR_OPENAI_CACHE_MAX=3)
+    for k in ("a", "b", "c"):
+        ocr_app._openai_cache_put(k, {"reading": k})
+    assert ocr_app._openai_cache_get("a") == {"reading": "a"}
+    ocr_app._openai_cache_put("d", {"reading": "d"})
+    # "b" is least recently used after "a" was touched.
+    assert ocr_app._openai_cache_get("b") is None
+    assert ocr_app._openai_cache_get("a") == {"reading": "a"}
+    stats = ocr_app._openai_cache_stats()
+    assert stats["backend"] == "sqlite"
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["entries"] <= 3
+
+    # A second worker (new connection, same file) sees the same entries.
+    monkeypatch.setattr(ocr_app, "_OPENAI_CACHE_DB_LOCAL", threading.local())
+    assert ocr_app._openai_cache_get("d") == {"reading": "d"}
+
+
+def test_openai_disk_cache_hits_do_not_shrink_capacity(monkeypatch, tmp_path):
+    _fresh_openai_cache(monkeypatch, tmp_path, OCR_OPENAI_CACHE_MAX=3)
+    for k in ("a", "b", "c"):
+        ocr_app._openai_cache_put(k, {"reading": k})
+    for _ in range(5):
+        assert ocr_app._openai_cache_get("a") == {"reading": "a"}
+    ocr_app._openai_cache_put("d", {"reading": "d"})
+    assert ocr_app._openai_cache_stats()["entries"] == 3
+    assert [ocr_app._openai_cache_get(k) is not None for k in ("a", "b", "c", "d")] == [True, False, True, True]
+
+
+def test_openai_disk_cache_ttl(monkeypatch, tmp_path):
+    _fresh_openai_cache(monkeypatch, tmp_path, OCR_OPENAI_CACHE_TTL_SEC=60)
+    ocr_app._openai_cache_put("k", {"reading": 1})
+    real_time = ocr_app.time.time
+    monkeypatch.setattr(ocr_app.time, "time", lambda: real_time() + 120)
+    assert ocr_app._openai_cache_get("k") is None
+
+
+def test_openai_disk_cache_gets_are_reads_until_the_batch_is_flushed(monkeypatch, tmp_path):
+    _fresh_openai_cache(monkeypatch, tmp_path, OCR_OPENAI_CACHE_MAX=2, _OPENAI_CACHE_FLUSH_SEC=3600.0)
+    ocr_app._openai_cache_put("a", {"reading": "a"})
+    ocr_app._openai_cache_put("b", {"reading": "b"})
+    db = sqlite3.connect(str(tmp_path / "cache.sqlite3"))
+    before = db.execute("SELECT hits, misses, seq FROM openai_cache_stats").fetchone()
+    assert ocr_app._openai_cache_get("a") == {"reading": "a"}
+    assert ocr_app._openai_cache_get("zzz") is None
+    assert db.execute("SELECT hits, misses, seq FROM openai_cache_stats").fetchone() == before
+    # the put flushes the pending bump first, so "b" is the one evicted
+    ocr_app._openai_cache_put("c", {"reading": "c"})
+    assert db.execute("SELECT entries, hits, misses FROM openai_cache_stats").fetchone() == (2, 1, 1)
+    assert sorted(r[0] for r in db.execute("SELECT key FROM openai_cache")) == ["a", "c"]
+
+
+def test_dhash_matches_reference_bit_layout():
+    rng = np.random.default_rng(7)
+    gray = rng.integers(0, 255, size=(37, 53), dtype=np.uint8)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    ref = 0
+    for y in range(8):
+        for x in range(8):
+            if int(small[y, x]) > int(small[y, x + 1]):
+                ref |= 1 << (y * 8 + x)
+    assert ocr_app._dhash_from_gray(gray) == ref
+
+
+def test_template_index_nearest_and_mtime_reload(monkeypatch, tmp_path):
+    path = tmp_path / "water.json"
+    rows = [
+        {"reading": "1.5", "type": "ХВС", "hashes": {"full": "ffffffffffffffff", "mid": "0", "center": "0"}},
+        {"reading": "2", "type": "ГВС", "hashes": {"full": "f0", "mid": "1", "center": "0"}},
+        {"reading": None, "hashes": {"full": "0"}},
+    ]
+    path.write_text(json.dumps({"rows": rows}), encoding="utf-8")
+    monkeypatch.setattr(ocr_app, "_TEMPLATE_INDEXES", {})
+    index = ocr_app._load_template_index("water", str(path), ocr_app._WATER_TEMPLATE_KEYS, lambda r, v: {"reading": v})
+    assert len(index) == 2
+    assert ocr_app._load_template_index("water", str(path), ocr_app._WATER_TEMPLATE_KEYS, lambda r, v: {}) is index
+    best_d, best_row, second_d = index.nearest({"full": 0xFFFFFFFFFFFFFFFF, "mid": 0, "center": 3})
+    assert (best_d, best_row["reading"], second_d) == (2.0, 1.5, 63.0)
+
+    path.write_text(json.dumps(rows[1:2]), encoding="utf-8")
+    os.utime(path, (1, 1))
+    index = ocr_app._load_template_index("water", str(path), ocr_app._WATER_TEMPLATE_KEYS, lambda r, v: {"reading": v})
+    assert len(index) == 1 and index.nearest({"full": 0xF0})[2] == 1e9
+
+
+def test_drum_batched_scores_match_opencv_template_matching():
+    rng = np.random.default_rng(3)
+    slots = [rng.integers(0, 255, (50, 30, 3), dtype=np.uint8), np.zeros((0, 0, 3), dtype=np.uint8)]
+    img = np.full((60, 36, 3), 210, dtype=np.uint8)
+    cv2.putText(img, "7", (4, 48), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (20, 20, 20), 3)
+    slots.append(img)
+    got = ocr_app._drum_recognize_slots(slots)
+    assert got[1] == (None, 0.0, 0.0)
+    assert got[2][0] == 7
+
+    bank, digits = ocr_app._drum_template_bank()
+    templates = ocr_app._build_drum_digit_templates()
+    flat = [(d, t) for d in range(10) for t in templates[d]]
+    assert len(flat) == bank.shape[0] and list(digits) == [d for d, _ in flat]
+    for slot, (digit, conf, margin) in ((slots[0], got[0]), (slots[2], got[2])):
+        scores = [
+            (float(cv2.matchTemplate(p.reshape(72, 44), t, cv2.TM_CCOEFF_NORMED)[0, 0]), d)
+            for p in ocr_app._drum_slot_probes(slot)
+            for d, t in flat
+        ]
+        ranked = sorted((s for s, _ in scores), reverse=True)
+        assert digit == max(scores, key=lambda x: x[0])[1]
+        assert abs(margin - (ranked[0] - ranked[1])) < 1e-4
+        assert abs(conf - max(0.0, min(1.0, (ranked[0] - 0.12) / 0.55))) < 1e-4
+
+
+class _FakeTesseract:
+    """Answers image_to_data with one word per tile box registered by the test."""
+
+    class Output:
+        DICT = "dict"
+
+    def __init__(self):
+        self.calls = 0
+        self.words: list[tuple[str, float, tuple[int, int, int, int]]] = []
+
+    def image_to_data(self, arr2d, output_type=None, config="", timeout=0):
+        self.calls += 1
+        data = {"text": [], "conf": [], "left": [], "top": [], "width": [], "height": []}
+        for text, conf, (x1, y1, x2, y2) in self.words:
+            for k, v in zip(data, (text, conf, x1 + 2, y1 + 3, x2 - x1 - 4, y2 - y1 - 6)):
+                data[k].append(v)
+        return data
+
+
+def test_digit_cells_are_read_from_one_composed_page(monkeypatch):
+    fake = _FakeTesseract()
+    monkeypatch.setattr(ocr_app, "pytesseract", fake)
+    tile = np.full((60, 40, 3), 200, dtype=np.uint8)
+    groups = [[tile, tile, np.zeros((0, 0, 3), dtype=np.uint8)], [tile]]
+    page, boxes = ocr_app._compose_digit_page([[ocr_app._binarize_digit_tile(t) for t in g] for g in groups])
+    assert sorted(boxes) == [(0, 0), (0, 1), (1, 0)]
+    (_, _, ax2, _), (bx1, _, _, _) = boxes[(0, 0)], boxes[(0, 1)]
+    assert bx1 - ax2 == ocr_app._DIGIT_PAGE_GAP and page[0, 0] == 255
+    fake.words = [("7", 91.0, boxes[(0, 0)]), ("", 95.0, boxes[(0, 1)]), ("12", 60.0, boxes[(1, 0)]), ("3", 40.0, boxes[(1, 0)])]
+    out = ocr_app._tesseract_digit_cells(groups)
+    assert fake.calls == 1
+    assert out == [[("7", 0.91), (None, 0.0), (None, 0.0)], [("2", 0.6)]]
+
+
+def test_tesseract_calls_share_bounded_slots(monkeypatch):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+    fake = _FakeTesseract()
+
+    def _slow(*a, **k):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        threading.Event().wait(0.02)
+        with lock:
+            active[0] -= 1
+        return {"text": []}
+
+    fake.image_to_data = _slow
+    monkeypatch.setattr(ocr_app, "pytesseract", fake)
+    monkeypatch.setattr(ocr_app, "_TESSERACT_SLOTS", threading.BoundedSemaphore(2))
+    results: list = []
+    threads = [
+        threading.Thread(target=lambda: results.append(ocr_app._tesseract_data(np.zeros((4, 4), np.uint8), config="", timeout=2.0)))
+        for _ in range(6)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2 and results == [{"text": []}] * 6
+
+
+def test_learned_templates_by_photo_and_compact(monkeypatch, tmp_path):
+    seed = tmp_path / "electric.json"
+    log = tmp_path / "learned.ndjson"
+    hashes = {"full": "ff", "lcd_wide": "0", "lcd_mid": "0", "lcd_tight": "0"}
+    seed.write_text(json.dumps([{"reading": "10", "hashes": hashes}, {"reading": "20", "hashes": {**hashes, "full": "0"}}]), encoding="utf-8")
+    monkeypatch.setattr(ocr_app, "OCR_TEMPLATE_LEARN_LOG", str(log))
+    monkeypatch.setattr(ocr_app, "OCR_TEMPLATE_LEARN_COMPACT_SLACK", 1)
+    monkeypatch.setattr(ocr_app, "_TEMPLATE_INDEXES", {})
+    monkeypatch.setattr(ocr_app, "_LEARNED_TEMPLATES", {"stat": None, "rows": {}})
+
+    def _index():
+        return ocr_app._load_template_index("electric", str(seed), ocr_app._ELECTRIC_TEMPLATE_KEYS, lambda r, v: {"reading": v})
+
+    assert [r["reading"] for r in _index().rows] == [10.0, 20.0]
+    assert ocr_app._append_learned_template({"kind": "electric", "reading": 11, "hashes": hashes, "sha256": "a", "ts": 1}) == {"rows": 1, "compacted": False}
+    ocr_app._append_learned_template({"kind": "water", "reading": 5, "hashes": {"full": "1"}, "sha256": "a", "ts": 2})
+    ocr_app._append_learned_template({"kind": "electric", "reading": 30, "hashes": hashes, "sha256": "b", "ts": 3})
+    # same photo confirmed again with another value: the later entry wins
+    assert ocr_app._append_learned_template({"kind": "electric", "reading": 12, "hashes": hashes, "sha256": "a", "ts": 4}) == {"rows": 3, "compacted": False}
+    index = _index()
+    # learned rows never join the distance index, even with hashes identical to a seed row
+    assert [r["reading"] for r in index.rows] == [10.0, 20.0]
+    assert {k: r["reading"] for k, r in index.by_sha.items()} == {"a": 12.0, "b": 30.0}
+
+    res = ocr_app._append_learned_template({"kind": "electric", "reading": 13, "hashes": hashes, "sha256": "a", "ts": 5})
+    assert res == {"rows": 3, "compacted": True}
+    lines = log.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(ln)["reading"] for ln in lines] == [5, 30, 13]
+    assert _index().by_sha["a"]["reading"] == 13.0
+    fingerprint = ocr_app._ocr_pipeline_fingerprint()
+    ocr_app._append_learned_template({"kind": "electric", "reading": 14, "hashes": hashes, "sha256": "a", "ts": 6})
+    assert ocr_app._ocr_pipeline_fingerprint() == fingerprint
+
+
+def _electric_display_jpeg(text: str) -> bytes:
+    img = np.full((240, 360, 3), 70, dtype=np.uint8)
+    cv2.rectangle(img, (40, 80), (300, 160), (150, 190, 160), -1)
+    cv2.putText(img, text, (55, 145), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (20, 20, 20), 5)
+    ok, enc = cv2.imencode(".jpg", img)
+    assert ok
+    return enc.tobytes()
+
+
+def test_electric_template_match_and_learn_on_photo(monkeypatch, tmp_path):
+    photo = _electric_display_jpeg("04217")
+    hashes = ocr_app._electric_template_hashes(photo)
+    assert set(hashes) == set(ocr_app._ELECTRIC_TEMPLATE_KEYS)
+    seed = tmp_path / "electric.json"
+    inverted = {k: f"{(~int(v)) & ocr_app._HASH64_MASK:016x}" for k, v in hashes.items()}
+    seed.write_text(
+        json.dumps([{"reading": "4217", "hashes": {k: f"{int(v):016x}" for k, v in hashes.items()}}, {"reading": "1", "hashes": inverted}]),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(ocr_app, "OCR_ELECTRIC_TEMPLATE_MATCH", True)
+    monkeypatch.setattr(ocr_app, "OCR_ELECTRIC_TEMPLATE_DB", str(seed))
+    monkeypatch.setattr(ocr_app, "OCR_TEMPLATE_LEARN_LOG", str(tmp_path / "learned.ndjson"))
+    monkeypatch.setattr(ocr_app, "_TEMPLATE_INDEXES", {})
+    monkeypatch.setattr(ocr_app, "_LEARNED_TEMPLATES", {"stat": None, "rows": {}})
+    with _frame_scope():
+        rows = ocr_app._electric_template_candidates(photo)
+    assert [r["reading"] for r in rows] == [4217.0]
+
+    res = ocr_app._learn_template_sync(photo, meter_type="electric", reading=4218.0, serial=None)
+    assert res["ok"] and res["kind"] == "electric" and res["rows"] == 1
+    with _frame_scope():
+        assert [r["reading"] for r in ocr_app._electric_template_candidates(photo)] == [4218.0]
+    # a re-encoded copy of the photo is a different sha256: only the seed row may answer
+    ok, enc = cv2.imencode(".jpg", cv2.imdecode(np.frombuffer(photo, np.uint8), cv2.IMREAD_COLOR), [cv2.IMWRITE_JPEG_QUALITY, 80])
+    assert ok
+    with _frame_scope():
+        assert [r["reading"] for r in ocr_app._electric_template_candidates(enc.tobytes())] == [4217.0]
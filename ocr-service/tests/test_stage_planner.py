@@ -0,0 +1,65 @@
+from stage_planner import StagePlanner
+
+CTX = ["serial:123456", "water", "any"]
+
+
+def _feed(planner, stage, n, *, ms, calls=0, hits=0, contexts=CTX):
+    for i in range(n):
+        planner.record(stage, contexts, ms=ms, calls=calls, hit=i < hits)
+
+
+def test_fixed_mode_keeps_order_and_never_skips():
+    planner = StagePlanner(mode="fixed", min_samples=2)
+    _feed(planner, "slow", 10, ms=5000.0, calls=3)
+    _feed(planner, "fast", 10, ms=10.0, hits=10)
+    assert planner.order(["slow", "fast"], CTX) == ["slow", "fast"]
+    assert planner.allow("slow", CTX, remaining_ms=1.0, remaining_calls=0)
+
+
+def test_adaptive_orders_by_expected_cost_once_all_stages_have_samples():
+    planner = StagePlanner(min_samples=5, call_cost_ms=1000.0)
+    _feed(planner, "openai", 10, ms=200.0, calls=1, hits=9)
+    assert planner.order(["openai", "template"], CTX) == ["openai", "template"]
+    _feed(planner, "template", 10, ms=50.0, hits=5)
+    assert planner.order(["openai", "template"], CTX) == ["template", "openai"]
+
+
+def test_low_hit_rate_is_skipped_with_periodic_exploration():
+    planner = StagePlanner(min_samples=5, min_hit_rate=0.1, explore_every=4)
+    _feed(planner, "quick", 20, ms=300.0)
+    allowed = [planner.allow("quick", CTX, remaining_ms=1e6, remaining_calls=5) for _ in range(8)]
+    assert allowed == [False, False, False, True] * 2
+
+
+def test_rarely_hitting_stage_runs_while_cheaper_than_its_share_of_the_rest():
+    planner = StagePlanner(min_samples=5, min_hit_rate=0.1, explore_every=1000, call_cost_ms=4000.0)
+    _feed(planner, "template", 40, ms=20.0)  # local and under cheap_ms: never skipped
+    _feed(planner, "quick", 40, ms=300.0, hits=1)
+    _feed(planner, "slow", 40, ms=3000.0, calls=1, hits=2)
+    assert planner.allow("template", CTX, remaining_ms=1e6, remaining_calls=5)
+    assert not planner.allow("quick", CTX, remaining_ms=1e6, remaining_calls=5)  # no rest samples yet
+    for _ in range(5):
+        planner.record_rest(CTX, ms=2000.0, calls=2)
+    # rest costs 10 s; quick: 300 ms <= P(hit) ~0.05 * 10 s, slow: 7 s > ~0.07 * 10 s
+    assert planner.allow("quick", CTX, remaining_ms=1e6, remaining_calls=5)
+    assert not planner.allow("slow", CTX, remaining_ms=1e6, remaining_calls=5)
+
+
+def test_hard_budget_skips_stage_that_cannot_fit():
+    planner = StagePlanner(min_samples=3)
+    _feed(planner, "bootstrap", 5, ms=3000.0, calls=2, hits=5)
+    assert planner.allow("bootstrap", CTX, remaining_ms=10000.0, remaining_calls=2)
+    assert not planner.allow("bootstrap", CTX, remaining_ms=2000.0, remaining_calls=2)
+    assert not planner.allow("bootstrap", CTX, remaining_ms=10000.0, remaining_calls=1)
+
+
+def test_decisions_fall_back_from_specific_to_general_context():
+    planner = StagePlanner(min_samples=5, min_hit_rate=0.1, explore_every=1000)
+    # the stage never hits for water meters in general, but always for this serial
+    _feed(planner, "template", 60, ms=300.0, contexts=["water", "any"])
+    _feed(planner, "template", 5, ms=300.0, hits=5, contexts=["serial:123456", "water", "any"])
+    assert planner.allow("template", CTX, remaining_ms=1e6, remaining_calls=0)
+    assert not planner.allow("template", ["serial:999999", "water", "any"], remaining_ms=1e6, remaining_calls=0)
+    snap = planner.snapshot()
+    assert set(snap["stages"]) == {"template@water", "template@any"}
+    assert snap["stages"]["template@any"]["runs"] == 65
@@ -36,6 +36,10 @@ API_BASE = os.getenv("API_BASE", "http://api:8000").strip()
 HTTP_CONNECT_TIMEOUT = 10
 HTTP_READ_TIMEOUT_PHOTO = 180
 HTTP_READ_TIMEOUT_FAST = 25
+# Async photo events: API stores the photo as an OCR job and answers at once; bot polls job status.
+PHOTO_EVENT_ASYNC = os.getenv("PHOTO_EVENT_ASYNC", "1").strip().lower() in ("1", "true", "yes", "on")
+PHOTO_JOB_POLL_SEC = float(os.getenv("PHOTO_JOB_POLL_SEC", "2"))
+PHOTO_JOB_WAIT_SEC = float(os.getenv("PHOTO_JOB_WAIT_SEC", "300"))
 
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher(bot)
@@ -405,8 +409,12 @@ async def _post_photo_event(
         "meter_index": str(meter_index),
         "meter_index_mode": "explicit",
     }
+    if PHOTO_EVENT_ASYNC:
+        data["async"] = "1"
     resp = await _http_post(url, data=data, files=files, read_timeout=HTTP_READ_TIMEOUT_PHOTO)
     payload = resp.json() if resp.ok else None
+    if resp.status_code == 202 and isinstance(payload, dict) and payload.get("job_id") is not None:
+        resp, payload = await _wait_photo_job(int(payload["job_id"]))
     return {
         "status_code": resp.status_code,
         "ok": resp.ok,
@@ -417,6 +425,28 @@ async def _post_photo_event(
     }
 
 
+async def _wait_photo_job(job_id: int) -> Tuple[requests.Response, dict]:
+    """Poll /events/photo/jobs/{id} until the OCR job finishes; returns the status response + photo_event payload."""
+    url = f"{API_BASE}/events/photo/jobs/{job_id}"
+    deadline = asyncio.get_running_loop().time() + PHOTO_JOB_WAIT_SEC
+    while asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(PHOTO_JOB_POLL_SEC)
+        try:
+            resp = await _http_get(url, read_timeout=HTTP_READ_TIMEOUT_FAST)
+        except Exception:
+            continue
+        if not resp.ok:
+            continue
+        js = resp.json()
+        status = str((js or {}).get("status") or "")
+        if status == "done" and isinstance(js.get("result"), dict):
+            return resp, js["result"]
+        if status == "failed":
+            raise RuntimeError(f"photo_job_failed:{js.get('error')}")
+    # Same handling as a slow synchronous call: the job keeps running server-side.
+    raise requests.exceptions.ReadTimeout(f"photo_job_{job_id}_still_running")
+
+
 async def _fetch_bill(chat_id: int, ym: str) -> Optional[dict]:
     url = f"{API_BASE}/bot/chats/{chat_id}/bill"
     try:
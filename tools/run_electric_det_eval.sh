@@ -33,6 +33,7 @@ from PIL import Image
 app.OCR_ELECTRIC_DETERMINISTIC = True
 app.OCR_ELECTRIC_TEMPLATE_MATCH = True
 app.OCR_ELECTRIC_TEMPLATE_DB = "/tmp/electric_templates.json"
+app.OCR_TEMPLATE_LEARN_LOG = ""
 
 truth = json.loads(Path("/tmp/electric_truth.json").read_text(encoding="utf-8"))
 base = Path("/tmp/electro_eval")
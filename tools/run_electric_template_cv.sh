@@ -34,6 +34,7 @@ from PIL import Image
 app.OCR_ELECTRIC_TEMPLATE_MATCH = True
 app.OCR_ELECTRIC_DETERMINISTIC = False
 app.OCR_ELECTRIC_TEMPLATE_DB = "/tmp/electric_templates_cv.json"
+app.OCR_TEMPLATE_LEARN_LOG = ""
 
 truth = json.loads(Path("/tmp/electric_truth.json").read_text(encoding="utf-8"))
 base = Path("/tmp/electro_eval")
@@ -93,8 +94,7 @@ def build_template_file(train_filenames: list[str]) -> None:
     Path("/tmp/electric_templates_cv.json").write_text(
         json.dumps({"version": 1, "rows": rows}, ensure_ascii=False), encoding="utf-8"
     )
-    app._ELECTRIC_TEMPLATE_MTIME = -1.0
-    app._ELECTRIC_TEMPLATE_ROWS = []
+    app._TEMPLATE_INDEXES.pop("electric", None)
 
 
 def classify(expected: float, got) -> tuple[str, float]:
@@ -27,6 +27,9 @@ if [[ ! -f "$WATER_TRUTH" ]]; then
   exit 2
 fi
 
+# The adaptive stage planner depends on the service's request history; regression runs use the fixed order.
+export OCR_STAGE_PLANNER="${OCR_STAGE_PLANNER:-fixed}"
+
 cd "$ROOT"
 docker compose -p "$PROJECT" up -d --no-deps ocr-service >/dev/null
 
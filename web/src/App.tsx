@@ -1,4 +1,4 @@
-import React, { useEffect, useMemo, useState } from "react";
+import React, { useEffect, useMemo, useRef, useState } from "react";
 import * as XLSX from "xlsx-js-style";
 import MetersTable from "./components/MetersTable";
 
@@ -141,7 +141,7 @@ type NotificationItem = {
   related?: any;
 };
 
-type NotificationsResp = { ok: boolean; items: NotificationItem[]; unread_count: number };
+type NotificationsResp = { ok: boolean; items: NotificationItem[]; unread_count: number; next_cursor?: string | null };
 
 type ApartmentCardResp = {
   ok: boolean;
@@ -343,7 +343,7 @@ export default function App() {
   const [settingsOpen, setSettingsOpen] = useState(false);
   const [notifOpen, setNotifOpen] = useState(false);
   const [notifications, setNotifications] = useState<NotificationItem[]>([]);
-  const [notifOffset, setNotifOffset] = useState(0);
+  const [notifCursor, setNotifCursor] = useState<string | null>(null);
   const [notifHasMore, setNotifHasMore] = useState(true);
   const [notifLoading, setNotifLoading] = useState(false);
   const [unreadCount, setUnreadCount] = useState(0);
@@ -604,18 +604,19 @@ export default function App() {
   async function loadNotifications(reset: boolean = false) {
     if (notifLoading) return;
     const limit = 30;
-    const offset = reset ? 0 : notifOffset;
+    const cursor = reset ? null : notifCursor;
     try {
       setNotifLoading(true);
-      const data = await apiGet<NotificationsResp>(`/admin/notifications?status=all&limit=${limit}&offset=${offset}`);
+      const q = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
+      const data = await apiGet<NotificationsResp>(`/admin/notifications?status=all&limit=${limit}${q}`);
       setUnreadCount(Number(data.unread_count || 0));
       if (reset) {
         setNotifications(data.items || []);
       } else {
         setNotifications((prev) => [...prev, ...(data.items || [])]);
       }
-      setNotifOffset(offset + (data.items?.length || 0));
-      setNotifHasMore((data.items?.length || 0) >= limit);
+      setNotifCursor(data.next_cursor || null);
+      setNotifHasMore(!!data.next_cursor);
     } catch (e: any) {
       setErr(String(e?.message ?? e));
     } finally {
@@ -1295,6 +1296,24 @@ export default function App() {
     refreshUnreadCount().catch(() => {});
   }, []);
 
+  // Колокольчик: сервер пушит счётчик непрочитанных (SSE), EventSource сам переподключается.
+  const notifOpenRef = useRef(notifOpen);
+  notifOpenRef.current = notifOpen;
+  useEffect(() => {
+    if (typeof EventSource === "undefined") return;
+    const es = new EventSource(`/api/admin/notifications/stream`);
+    es.addEventListener("unread", (ev) => {
+      try {
+        const data = JSON.parse((ev as MessageEvent).data);
+        setUnreadCount(Number(data.unread_count || 0));
+        if (data.last?.op === "INSERT" && notifOpenRef.current) loadNotifications(true);
+      } catch {
+        // ignore malformed events
+      }
+    });
+    return () => es.close();
+  }, []);
+
   useEffect(() => {
     if (selectedId != null) {
       loadHistory(selectedId);